@@ -1,10 +1,13 @@
 from fastapi import APIRouter, Request, Depends, HTTPException, BackgroundTasks
 from app.dependencies import get_payment_service
 from app.services.payment_service import PaymentService
+from services.webhook_signature import SIGNATURE_HEADER, WebhookSignatureVerifier
+import json
 import logging
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
+webhook_verifier = WebhookSignatureVerifier.from_env()
 
 @router.post("/square")
 async def square_webhook(request: Request, background_tasks: BackgroundTasks, payment_service: PaymentService = Depends(get_payment_service)):
@@ -13,25 +16,22 @@ async def square_webhook(request: Request, background_tasks: BackgroundTasks, pa
         # Get the raw body for signature verification
         body = await request.body()
         
-        # Get the signature header
-        signature = request.headers.get('X-Square-Signature')
-        
-        # Parse the webhook data
-        webhook_data = await request.json()
-        
-        # Verify the webhook is authentic
-        # (this should be implemented in the payment service)
-        is_valid = await payment_service.verify_webhook_signature(signature, body)
-        
-        if not is_valid:
+        # Verify the webhook is authentic before parsing it
+        signature = request.headers.get(SIGNATURE_HEADER)
+        if webhook_verifier is None or not webhook_verifier.verify(signature, body, str(request.url)):
             logger.error("Invalid Square webhook signature")
             raise HTTPException(status_code=401, detail="Invalid signature")
         
+        # Parse the webhook data
+        webhook_data = json.loads(body)
+        
         # Process the webhook in the background
         background_tasks.add_task(payment_service.process_payment_webhook, webhook_data)
         
         # Always return 200 to acknowledge receipt, even if processing fails
         return {"status": "received"}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception(f"Error processing Square webhook: {str(e)}")
         # Still return 200 to prevent retries, but log the error
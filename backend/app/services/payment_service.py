@@ -56,7 +56,7 @@ class PaymentService:
                 'payment_amount': payment.get('amount_money', {}).get('amount', 0),
                 'payment_currency': payment.get('amount_money', {}).get('currency', 'USD'),
                 'payment_date': datetime.now().isoformat()
-            })
+            }, expected_status=['pending'])
             
             # Then execute it
             success = await request_service.execute_approved_request(request_id)
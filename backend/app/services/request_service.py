@@ -60,35 +60,26 @@ async def _execute_team_transfer(self, request_data: dict) -> bool:
             return False
         
         # Update the request status to completed
-        await self._update_request_status(request_data.get('request_id'), 'completed')
+        await self._update_request_status(request_data.get('request_id'), 'completed', expected_status=['approved'])
         return True
     except Exception as e:
         logger.exception(f"Error executing team transfer: {str(e)}")
         return False 
 
-async def _update_request_status(self, request_id: str, status: str, metadata: dict = None) -> bool:
-    """Update the status of a request"""
+async def _update_request_status(self, request_id: str, status: str, metadata: dict = None, expected_status: list = None) -> bool:
+    """Update the status of a request in one atomic call (see transition_request_status)"""
     try:
-        update_data = {
-            'status': status,
-            'updated_at': datetime.now().isoformat()
-        }
-        
-        if metadata:
-            # If we have existing metadata, merge it
-            request = await self.get_request(request_id)
-            existing_metadata = request.get('metadata', {}) if request else {}
-            
-            if existing_metadata and isinstance(existing_metadata, dict):
-                existing_metadata.update(metadata)
-                update_data['metadata'] = existing_metadata
-            else:
-                update_data['metadata'] = metadata
-        
-        result = await self.supabase.table('team_change_requests').update(update_data).eq('request_id', request_id).execute()
+        # Metadata is merged into the row server-side; with expected_status the
+        # row is only changed while its current status is one of those
+        result = await self.supabase.rpc('transition_request_status', {
+            'p_request_id': request_id,
+            'p_status': status,
+            'p_expected_status': expected_status,
+            'p_metadata': metadata or None
+        }).execute()
         
-        if not result.data:
-            logger.error(f"Failed to update request status: {result.error}")
+        if not result.data or not result.data.get('transitioned'):
+            logger.error(f"Failed to update request status: {result.error or result.data}")
             return False
             
         return True
@@ -117,7 +108,7 @@ async def _execute_team_rebrand(self, request_data: dict) -> bool:
             return False
         
         # Update the request status to completed
-        await self._update_request_status(request_data.get('request_id'), 'completed')
+        await self._update_request_status(request_data.get('request_id'), 'completed', expected_status=['approved'])
         return True
     except Exception as e:
         logger.exception(f"Error executing team rebrand: {str(e)}")
@@ -148,7 +139,7 @@ async def _execute_online_id_change(self, request_data: dict) -> bool:
         }).eq('team_id', team_id).eq('player_id', player_id).execute()
         
         # Update the request status to completed (even if no rows were updated)
-        await self._update_request_status(request_data.get('request_id'), 'completed')
+        await self._update_request_status(request_data.get('request_id'), 'completed', expected_status=['approved'])
         return True
     except Exception as e:
         logger.exception(f"Error executing online ID change: {str(e)}")
@@ -200,7 +191,7 @@ async def _execute_roster_change(self, request_data: dict) -> bool:
                 return False
         
         # Update the request status to completed
-        await self._update_request_status(request_data.get('request_id'), 'completed')
+        await self._update_request_status(request_data.get('request_id'), 'completed', expected_status=['approved'])
         return True
     except Exception as e:
         logger.exception(f"Error executing roster change: {str(e)}")
@@ -240,7 +231,7 @@ async def _execute_league_registration(self, request_data: dict) -> bool:
                 }).execute()
         
         # Update the request status to completed
-        await self._update_request_status(request_data.get('request_id'), 'completed')
+        await self._update_request_status(request_data.get('request_id'), 'completed', expected_status=['approved'])
         return True
     except Exception as e:
         logger.exception(f"Error executing league registration: {str(e)}")
@@ -280,7 +271,7 @@ async def _execute_tournament_registration(self, request_data: dict) -> bool:
                 }).execute()
         
         # Update the request status to completed
-        await self._update_request_status(request_data.get('request_id'), 'completed')
+        await self._update_request_status(request_data.get('request_id'), 'completed', expected_status=['approved'])
         return True
     except Exception as e:
         logger.exception(f"Error executing tournament registration: {str(e)}")
@@ -327,7 +318,7 @@ async def _execute_team_creation(self, request_data: dict) -> bool:
             # Don't return false here, we want to continue
         
         # Update the request status to completed
-        await self._update_request_status(request_data.get('request_id'), 'completed')
+        await self._update_request_status(request_data.get('request_id'), 'completed', expected_status=['approved'])
         return True
     except Exception as e:
         logger.exception(f"Error executing team creation: {str(e)}")
@@ -0,0 +1,111 @@
+"""
+Shared helpers for the benchmark scripts: latency summaries and JSON result files.
+"""
+
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100.0 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize_latencies(latencies_ms: List[float]) -> Dict[str, float]:
+    """min/mean/p50/p95/p99/max of a list of latencies in milliseconds"""
+    values = sorted(latencies_ms)
+    if not values:
+        return {"min": 0.0, "mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    return {
+        "min": round(values[0], 3),
+        "mean": round(sum(values) / len(values), 3),
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "max": round(values[-1], 3),
+    }
+
+
+def git_revision() -> Dict[str, Any]:
+    """Commit and dirty flag of the working tree, so results can be lined up with history"""
+    def run(*args) -> Optional[str]:
+        try:
+            return subprocess.check_output(["git", *args], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                           stderr=subprocess.DEVNULL, text=True).strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    commit = run("rev-parse", "HEAD")
+    status = run("status", "--porcelain", "--untracked-files=no")
+    return {"commit": commit, "dirty": bool(status)}
+
+
+def write_results(name: str, settings: Dict[str, Any], results: Dict[str, Any], output: Optional[str] = None) -> str:
+    """
+    Write a benchmark run to JSON and return the path.
+    By default results land in benchmarks/results/<name>-<commit>-<timestamp>.json
+    """
+    revision = git_revision()
+    started = datetime.now(timezone.utc)
+    document = {
+        "benchmark": name,
+        "git": revision,
+        "recorded_at": started.isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "settings": settings,
+        "results": results,
+    }
+
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        commit = (revision["commit"] or "nogit")[:10]
+        output = os.path.join(RESULTS_DIR, f"{name}-{commit}-{started.strftime('%Y%m%dT%H%M%S')}.json")
+
+    with open(output, "w", encoding="utf-8") as results_file:
+        json.dump(document, results_file, indent=2, sort_keys=True)
+    return output
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as results_file:
+        return json.load(results_file)
+
+
+def format_comparison(baseline: Dict[str, Any], current: Dict[str, Any], metrics: List[str]) -> str:
+    """
+    Side-by-side table of two result documents; metrics are dotted paths such as "latency_ms.p99"
+    """
+    def lookup(entry: Dict[str, Any], path: str) -> Optional[float]:
+        for part in path.split("."):
+            if not isinstance(entry, dict) or part not in entry:
+                return None
+            entry = entry[part]
+        return entry
+
+    lines = [
+        f"baseline {(baseline['git']['commit'] or '?')[:10]} vs current {(current['git']['commit'] or '?')[:10]}",
+        f"{'case':<28}{'metric':<18}{'baseline':>12}{'current':>12}{'change':>10}",
+    ]
+    for case, result in current["results"].items():
+        before = baseline["results"].get(case)
+        if before is None:
+            continue
+        for metric in metrics:
+            old, new = lookup(before, metric), lookup(result, metric)
+            if old is None or new is None:
+                continue
+            change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+            lines.append(f"{case:<28}{metric:<18}{old:>12.2f}{new:>12.2f}{change:>10}")
+    return "\n".join(lines)
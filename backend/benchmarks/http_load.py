@@ -0,0 +1,432 @@
+#!/usr/bin/env python
+"""
+HTTP load benchmark for main:app.
+
+Starts the fake Square and fake Supabase servers from tests/, runs the API
+under uvicorn pointed at them, seeds teams, items and requests, and then
+drives each endpoint with concurrent closed-loop clients. Reports requests
+per second and p50/p95/p99 latency per endpoint and writes the run to JSON
+so results can be compared across commits.
+
+Usage (from the backend directory):
+    python -m benchmarks.http_load [--duration 15] [--concurrency 32] [--endpoints payments,get_request]
+    python -m benchmarks.http_load --compare benchmarks/results/http_load-<commit>-<time>.json
+
+Options:
+    --duration          Measured seconds per endpoint
+    --warmup            Unmeasured seconds per endpoint before measuring
+    --concurrency       Concurrent clients per endpoint
+    --endpoints         Comma-separated subset of the scenarios below
+    --square-latency-ms Simulated Square latency (with --square-jitter-ms)
+    --supabase-latency-ms Simulated Supabase latency
+    --app-url           Use an already running API instead of starting one (for webhook_square it
+                        needs SQUARE_WEBHOOK_SIGNATURE_KEY/NOTIFICATION_URL set as in this file)
+    --output            Where to write the JSON results
+    --compare           Print the change against an earlier results file
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Dict, Any, List, Callable, Optional, Tuple
+
+import httpx
+
+from benchmarks.common import summarize_latencies, write_results, load_results, format_comparison
+from services.webhook_signature import SIGNATURE_HEADER
+from tests.fake_square_server import sign_webhook
+from tests.fake_supabase_server import FAKE_SUPABASE_KEY
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+# One line per request would drown the summary
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TRANSFER_ITEM_ID = "1001"
+REBRAND_ITEM_ID = "1002"
+REGISTRATION_ITEM_ID = "1003"
+WEBHOOK_SIGNATURE_KEY = "benchmark-webhook-signature-key"
+# Signed as if Square had this URL on file; it need not be the address the API listens on
+WEBHOOK_NOTIFICATION_URL = "https://benchmark.invalid/api/webhook/square"
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    # Builds (path, json body) for the n-th request
+    build: Callable[[int, "SeedData"], Tuple[str, Optional[Dict[str, Any]]]]
+    # Extra headers computed from (path, serialized body), e.g. a signature
+    headers: Optional[Callable[[str, bytes], Dict[str, str]]] = None
+
+
+class SeedData:
+    """Rows loaded into the fake Supabase before the run"""
+    def __init__(self, teams: int = 200, requests: int = 2000):
+        self.team_ids = [str(uuid.uuid4()) for _ in range(teams)]
+        self.captain_ids = [str(uuid.uuid4()) for _ in range(teams)]
+        self.tournament_id = str(uuid.uuid4())
+        self.request_ids = [str(uuid.uuid4()) for _ in range(requests)]
+
+    def tables(self) -> Dict[str, List[Dict[str, Any]]]:
+        return {
+            "items": [
+                {"id": str(uuid.uuid4()), "item_id": TRANSFER_ITEM_ID, "item_name": "Team Transfer", "current_price": 15.0},
+                {"id": str(uuid.uuid4()), "item_id": REBRAND_ITEM_ID, "item_name": "Team Rebrand", "current_price": 10.0},
+                {"id": str(uuid.uuid4()), "item_id": REGISTRATION_ITEM_ID, "item_name": "Tournament Registration", "current_price": 25.0},
+            ],
+            "teams": [
+                {"id": team_id, "name": f"Team {index}", "captain_id": captain_id}
+                for index, (team_id, captain_id) in enumerate(zip(self.team_ids, self.captain_ids))
+            ],
+            "tournaments": [{"id": self.tournament_id, "name": "Benchmark Cup", "status": "registration"}],
+            "team_change_requests": [
+                {
+                    "id": request_id,
+                    "team_id": self.team_ids[index % len(self.team_ids)],
+                    "request_type": "team_transfer",
+                    "requested_by": self.captain_ids[index % len(self.captain_ids)],
+                    "status": "pending",
+                    "item_id": TRANSFER_ITEM_ID,
+                    "old_value": self.captain_ids[index % len(self.captain_ids)],
+                    "new_value": str(uuid.uuid4()),
+                    "metadata": {},
+                }
+                for index, request_id in enumerate(self.request_ids)
+            ],
+        }
+
+    def team(self, n: int) -> Tuple[str, str]:
+        index = n % len(self.team_ids)
+        return self.team_ids[index], self.captain_ids[index]
+
+
+def payment_data(amount: float) -> Dict[str, Any]:
+    return {"source_id": "cnon:card-nonce-ok", "amount": amount, "idempotency_key": str(uuid.uuid4())}
+
+
+def build_payment(n: int, seed: SeedData):
+    return "/api/payments", {
+        "sourceId": "cnon:card-nonce-ok",
+        "amount": 15.0,
+        "idempotencyKey": str(uuid.uuid4()),
+        "referenceId": f"{TRANSFER_ITEM_ID}-{uuid.uuid4().hex}",
+        "note": "Benchmark payment",
+    }
+
+
+def build_transfer(n: int, seed: SeedData):
+    team_id, captain_id = seed.team(n)
+    return "/api/team/transfer", {
+        "team_id": team_id,
+        "requested_by": captain_id,
+        "old_captain_id": captain_id,
+        "new_captain_id": str(uuid.uuid4()),
+        "item_id": TRANSFER_ITEM_ID,
+        "requires_payment": True,
+        "payment_data": payment_data(15.0),
+    }
+
+
+def build_rebrand(n: int, seed: SeedData):
+    team_id, captain_id = seed.team(n)
+    return "/api/team/rebrand", {
+        "team_id": team_id,
+        "requested_by": captain_id,
+        "old_name": f"Team {n}",
+        "new_name": f"Team {n} Reloaded",
+        "item_id": REBRAND_ITEM_ID,
+        "requires_payment": True,
+        "payment_data": payment_data(10.0),
+    }
+
+
+def build_tournament_registration(n: int, seed: SeedData):
+    team_id, captain_id = seed.team(n)
+    return "/api/tournament/register", {
+        "team_id": team_id,
+        "requested_by": captain_id,
+        "tournament_id": seed.tournament_id,
+        "player_ids": [captain_id, str(uuid.uuid4()), str(uuid.uuid4())],
+        "requires_payment": True,
+        "payment_data": payment_data(25.0),
+    }
+
+
+def build_webhook(n: int, seed: SeedData):
+    request_id = seed.request_ids[n % len(seed.request_ids)]
+    payment_id = uuid.uuid4().hex
+    return "/api/webhook/square", {
+        "merchant_id": "BENCHMARK",
+        "type": "payment.updated",
+        "event_id": str(uuid.uuid4()),
+        "created_at": "2025-05-01T00:00:00Z",
+        "data": {
+            "type": "payment",
+            "id": payment_id,
+            "object": {
+                "payment": {
+                    "id": payment_id,
+                    "status": "COMPLETED",
+                    "reference_id": f"{TRANSFER_ITEM_ID}-{request_id.replace('-', '')}",
+                    "amount_money": {"amount": 1500, "currency": "USD"},
+                }
+            }
+        }
+    }
+
+
+def webhook_headers(path: str, body: bytes) -> Dict[str, str]:
+    # The API under test is started with this key and notification URL, so the signature checks out
+    return {
+        "Content-Type": "application/json",
+        SIGNATURE_HEADER: sign_webhook(WEBHOOK_SIGNATURE_KEY, WEBHOOK_NOTIFICATION_URL, body),
+    }
+
+
+def build_get_request(n: int, seed: SeedData):
+    return f"/api/requests/{seed.request_ids[n % len(seed.request_ids)]}", None
+
+
+SCENARIOS = {
+    "payments": Scenario("payments", "POST", build_payment),
+    "team_transfer": Scenario("team_transfer", "POST", build_transfer),
+    "team_rebrand": Scenario("team_rebrand", "POST", build_rebrand),
+    "tournament_register": Scenario("tournament_register", "POST", build_tournament_registration),
+    "webhook_square": Scenario("webhook_square", "POST", build_webhook, webhook_headers),
+    "get_request": Scenario("get_request", "GET", build_get_request),
+}
+
+
+# ------------- SERVER PROCESSES -------------
+def start_process(args: List[str], env: Dict[str, str], log_path: str) -> subprocess.Popen:
+    log_file = open(log_path, "w")
+    process = subprocess.Popen([sys.executable, *args], cwd=BACKEND_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+    process.log_path = log_path
+    return process
+
+
+def wait_until_ready(url: str, process: Optional[subprocess.Popen], timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Process serving {url} exited with code {process.returncode}; see {process.log_path}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+def start_stack(args, work_dir: str) -> Tuple[str, List[subprocess.Popen]]:
+    """
+    Start fake Square, fake Supabase and the API; returns the API URL and the processes
+    """
+    processes = []
+    square_url = f"http://127.0.0.1:{args.square_port}"
+    supabase_url = f"http://127.0.0.1:{args.supabase_port}"
+    base_env = {**os.environ, "PYTHONPATH": BACKEND_DIR}
+
+    processes.append(start_process(
+        ["-m", "tests.fake_square_server", "--port", str(args.square_port),
+         "--latency-distribution", "normal" if args.square_jitter_ms else "fixed",
+         "--latency-ms", str(args.square_latency_ms), "--latency-jitter-ms", str(args.square_jitter_ms),
+         "--seed", "1"],
+        base_env, os.path.join(work_dir, "fake_square.log")
+    ))
+    processes.append(start_process(
+        ["-m", "tests.fake_supabase_server", "--port", str(args.supabase_port),
+         "--latency-ms", str(args.supabase_latency_ms), "--latency-jitter-ms", str(args.supabase_jitter_ms),
+         "--seed", "1"],
+        base_env, os.path.join(work_dir, "fake_supabase.log")
+    ))
+    wait_until_ready(f"{square_url}/_fake/state", processes[0])
+    wait_until_ready(f"{supabase_url}/_fake/state", processes[1])
+
+    if args.app_url:
+        return args.app_url.rstrip("/"), processes
+
+    app_env = {
+        **base_env,
+        "SUPABASE_URL": supabase_url,
+        "SUPABASE_ANON_KEY": FAKE_SUPABASE_KEY,
+        "SUPABASE_SERVICE_ROLE_KEY": FAKE_SUPABASE_KEY,
+        "SQUARE_BASE_URL": square_url,
+        "SQUARE_ACCESS_TOKEN": "benchmark-token",
+        "SQUARE_ENVIRONMENT": "sandbox",
+        "SQUARE_LOCATION_ID": "BENCHMARK-LOCATION",
+        "SQUARE_APP_ID": "sandbox-benchmark",
+        "PAYMENT_SPOOL_PATH": os.path.join(work_dir, "payments.jsonl"),
+        "LOG_LEVEL": args.app_log_level,
+        "SQUARE_WEBHOOK_SIGNATURE_KEY": WEBHOOK_SIGNATURE_KEY,
+        "SQUARE_WEBHOOK_NOTIFICATION_URL": WEBHOOK_NOTIFICATION_URL,
+    }
+    processes.append(start_process(
+        ["-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(args.app_port),
+         "--log-level", "warning", "--no-access-log"],
+        app_env, os.path.join(work_dir, "app.log")
+    ))
+    app_url = f"http://127.0.0.1:{args.app_port}"
+    wait_until_ready(f"{app_url}/ping", processes[-1], timeout=60.0)
+    return app_url, processes
+
+
+def stop_stack(processes: List[subprocess.Popen]):
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+# ------------- LOAD GENERATION -------------
+async def run_scenario(client: httpx.AsyncClient,
+                       scenario: Scenario,
+                       seed: SeedData,
+                       concurrency: int,
+                       warmup: float,
+                       duration: float) -> Dict[str, Any]:
+    """
+    Closed-loop load: each client sends its next request as soon as the last one answers
+    """
+    latencies: List[float] = []
+    status_codes: Dict[str, int] = {}
+    transport_errors = 0
+    counter = 0
+    measure_from = time.perf_counter() + warmup
+    stop_at = measure_from + duration
+
+    async def worker():
+        nonlocal counter, transport_errors
+        while True:
+            sent_at = time.perf_counter()
+            if sent_at >= stop_at:
+                return
+            counter += 1
+            path, body = scenario.build(counter, seed)
+            try:
+                if scenario.headers is not None:
+                    content = json.dumps(body).encode("utf-8")
+                    response = await client.request(scenario.method, path, content=content,
+                                                    headers=scenario.headers(path, content))
+                else:
+                    response = await client.request(scenario.method, path, json=body)
+                status = str(response.status_code)
+            except httpx.HTTPError:
+                status = None
+            finished_at = time.perf_counter()
+            if sent_at < measure_from:
+                continue
+            if status is None:
+                transport_errors += 1
+                continue
+            latencies.append((finished_at - sent_at) * 1000)
+            status_codes[status] = status_codes.get(status, 0) + 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    completed = len(latencies)
+    errors = transport_errors + sum(count for status, count in status_codes.items() if not status.startswith("2"))
+    return {
+        "method": scenario.method,
+        "concurrency": concurrency,
+        "duration_s": duration,
+        "requests": completed,
+        "errors": errors,
+        "status_codes": status_codes,
+        "transport_errors": transport_errors,
+        "rps": round(completed / duration, 2) if duration else 0.0,
+        "latency_ms": summarize_latencies(latencies),
+    }
+
+
+async def run_benchmark(app_url: str, supabase_url: str, args) -> Dict[str, Any]:
+    seed = SeedData(teams=args.teams, requests=args.seed_requests)
+    async with httpx.AsyncClient(timeout=30.0) as admin:
+        response = await admin.post(f"{supabase_url}/_fake/seed", json=seed.tables())
+        response.raise_for_status()
+
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=app_url, limits=limits, timeout=args.request_timeout) as client:
+        for name in args.endpoints:
+            logger.info(f"Running {name} for {args.duration}s at concurrency {args.concurrency}")
+            result = await run_scenario(client, SCENARIOS[name], seed, args.concurrency, args.warmup, args.duration)
+            latency = result["latency_ms"]
+            logger.info(
+                f"{name}: {result['rps']} req/s, p50 {latency['p50']}ms, p95 {latency['p95']}ms, "
+                f"p99 {latency['p99']}ms, errors {result['errors']}/{result['requests']}"
+            )
+            results[name] = result
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="HTTP load benchmark for the MGL API")
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--request-timeout", type=float, default=30.0)
+    parser.add_argument("--endpoints", default=",".join(SCENARIOS))
+    parser.add_argument("--teams", type=int, default=200)
+    parser.add_argument("--seed-requests", type=int, default=2000)
+    parser.add_argument("--square-latency-ms", type=float, default=120.0)
+    parser.add_argument("--square-jitter-ms", type=float, default=40.0)
+    parser.add_argument("--supabase-latency-ms", type=float, default=8.0)
+    parser.add_argument("--supabase-jitter-ms", type=float, default=3.0)
+    parser.add_argument("--square-port", type=int, default=8090)
+    parser.add_argument("--supabase-port", type=int, default=8091)
+    parser.add_argument("--app-port", type=int, default=8092)
+    parser.add_argument("--app-url", default=None)
+    parser.add_argument("--app-log-level", default="WARNING")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--compare", default=None)
+    args = parser.parse_args()
+
+    args.endpoints = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    unknown = [name for name in args.endpoints if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown endpoints: {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+    return args
+
+
+def main():
+    args = parse_args()
+    work_dir = tempfile.mkdtemp(prefix="mgl-http-load-")
+    logger.info(f"Server logs go to {work_dir}")
+
+    processes = []
+    try:
+        app_url, processes = start_stack(args, work_dir)
+        results = asyncio.run(run_benchmark(app_url, f"http://127.0.0.1:{args.supabase_port}", args))
+    finally:
+        stop_stack(processes)
+
+    settings = {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+    path = write_results("http_load", settings, results, args.output)
+    logger.info(f"Results written to {path}")
+
+    if args.compare:
+        print(format_comparison(load_results(args.compare), load_results(path), ["rps", "latency_ms.p50", "latency_ms.p95", "latency_ms.p99"]))
+
+
+if __name__ == "__main__":
+    main()
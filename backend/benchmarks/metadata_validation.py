@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Microbenchmark for the client-side payments metadata validator.
+
+Times validate_payment_metadata() and prepare_payment_row() on valid,
+invalid and NULL metadata and reports the cost per record, to compare
+against the network round trip a rejected insert used to cost.
+
+Usage (from the backend directory):
+    python -m benchmarks.metadata_validation [--records 200000] [--repeat 5]
+"""
+
+import argparse
+import logging
+import timeit
+
+from benchmarks.common import write_results, load_results, format_comparison
+from services.payment_metadata import validate_payment_metadata, prepare_payment_row
+
+# prepare_payment_row logs every rejected row; that is not what is being measured
+logging.getLogger("services.payment_metadata").setLevel(logging.ERROR)
+
+CASES = {
+    "valid": {
+        "transaction_details": {"processor_response": "R2ZVZ6", "authorization_code": "Yx3kd9KQz1cO3tQy1Nd9uAXAB"},
+        "payment_method": {"type": "visa", "last_four": "1111"},
+        "square_payment_id": "Yx3kd9KQz1cO3tQy1Nd9uAXAB",
+        "event_type": "tournament",
+        "team_id": "5eaab345-4035-4536-a5d2-938926a8b4da",
+    },
+    "missing_keys": {
+        "transaction_details": {"processor_response": "R2ZVZ6"},
+        "payment_method": {"type": "visa"},
+    },
+    "wrong_types": {"transaction_details": "R2ZVZ6", "payment_method": None},
+    "null": None,
+}
+
+
+def run(records: int, repeat: int):
+    results = {}
+    for name, metadata in CASES.items():
+        row = {"payment_id": "Yx3kd9KQz1cO3tQy1Nd9uAXAB", "amount": 15.0, "metadata": metadata}
+        for label, statement in (("validate", lambda: validate_payment_metadata(metadata)),
+                                 ("prepare_row", lambda: prepare_payment_row(row))):
+            best = min(timeit.repeat(statement, number=records, repeat=repeat))
+            per_record_us = best / records * 1_000_000
+            results[f"{label}/{name}"] = {"records": records, "best_seconds": round(best, 6), "us_per_record": round(per_record_us, 4)}
+            print(f"{label:<12} {name:<14} {per_record_us:8.3f} us/record")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the payments metadata validator")
+    parser.add_argument("--records", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--compare", default=None)
+    args = parser.parse_args()
+
+    results = run(args.records, args.repeat)
+    path = write_results("metadata_validation", {"records": args.records, "repeat": args.repeat}, results, args.output)
+    print(f"Results written to {path}")
+
+    if args.compare:
+        print(format_comparison(load_results(args.compare), load_results(path), ["us_per_record"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+Microbenchmark for the payment reference codec.
+
+Times decoding each reference format with services.payment_reference
+against the per-character check and uuid.UUID exception handling that
+routes/webhooks.py used before, plus the note fallback (precompiled
+search vs re.findall) and batch decoding of a reconciliation page in
+which payments share references with their retries.
+
+Usage (from the backend directory):
+    python -m benchmarks.reference_codec [--records 200000] [--repeat 5]
+"""
+
+import argparse
+import re
+import timeit
+import uuid
+
+from benchmarks.common import write_results, load_results, format_comparison
+from services.payment_reference import decode_references, extract_request_id_from_reference, find_request_id_in_note
+
+REQUEST_ID = "98ddd206-fe9b-46c7-9e56-2625080a86fb"
+CASES = {
+    "item": "1002-98ddd206fe9b46c79e562625080a86fb",
+    "uuid": REQUEST_ID,
+    "legacy_date": "03222025-1002-aab75524-ecac78cd-98ddd206",
+    "unknown": "backend-test-with-nonce",
+}
+NOTE = f"Team Rebrand for request {REQUEST_ID} (captain approved)"
+
+
+def previous_extract(reference_id):
+    """The decoder as it was in routes/webhooks.py, kept as the baseline"""
+    if not reference_id:
+        return None
+    parts = reference_id.split('-')
+    if len(parts) == 2:
+        short_id = parts[1]
+        if len(short_id) == 32 and all(c in '0123456789abcdefABCDEF' for c in short_id):
+            reconstructed = f"{short_id[0:8]}-{short_id[8:12]}-{short_id[12:16]}-{short_id[16:20]}-{short_id[20:]}"
+            try:
+                return str(uuid.UUID(reconstructed))
+            except ValueError:
+                pass
+    try:
+        return str(uuid.UUID(reference_id))
+    except ValueError:
+        pass
+    return None
+
+
+def previous_note(note):
+    uuid_pattern = r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}'
+    matches = re.findall(uuid_pattern, note, re.IGNORECASE)
+    return matches[0] if matches else None
+
+
+def time_case(results, name, records, repeat, statement, number=None):
+    """Time statement; it handles one record per call unless number=1 runs a whole page of records"""
+    best = min(timeit.repeat(statement, number=number or records, repeat=repeat))
+    per_record_us = best / records * 1_000_000
+    results[name] = {"records": records, "best_seconds": round(best, 6), "us_per_record": round(per_record_us, 4)}
+    print(f"{name:<28} {per_record_us:8.3f} us/record")
+
+
+def run(records: int, repeat: int):
+    results = {}
+    for name, reference_id in CASES.items():
+        assert previous_extract(reference_id) == extract_request_id_from_reference(reference_id)
+        time_case(results, f"previous/{name}", records, repeat, lambda: previous_extract(reference_id))
+        time_case(results, f"codec/{name}", records, repeat, lambda: extract_request_id_from_reference(reference_id))
+
+    time_case(results, "previous/note", records, repeat, lambda: previous_note(NOTE))
+    time_case(results, "codec/note", records, repeat, lambda: find_request_id_in_note(NOTE))
+
+    # A reconciliation page where each reference appears four times (retried charges):
+    # one decode per payment vs one per distinct reference
+    page = [f"1002-{uuid.uuid4().hex}" for _ in range(records // 4)] * 4
+    time_case(results, "previous/page", records, repeat,
+              lambda: [previous_extract(reference_id) for reference_id in page], number=1)
+    time_case(results, "codec/page", records, repeat, lambda: decode_references(page), number=1)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the payment reference codec")
+    parser.add_argument("--records", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--compare", default=None)
+    args = parser.parse_args()
+
+    results = run(args.records, args.repeat)
+    path = write_results("reference_codec", {"records": args.records, "repeat": args.repeat}, results, args.output)
+    print(f"Results written to {path}")
+
+    if args.compare:
+        print(format_comparison(load_results(args.compare), load_results(path), ["us_per_record"]))
+
+
+if __name__ == "__main__":
+    main()
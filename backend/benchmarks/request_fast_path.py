@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+"""
+Benchmark for the single-write fast path in RequestService.process_request.
+
+Runs process_request against the fake Supabase server (started as a
+subprocess with simulated latency) and the fake Square app, once with the
+multi-step path (insert pending, then a status transition) and once with
+the fast path (one insert in the final status). Reports requests per second,
+latency and database writes per request for a request without payment and
+one paid inline by card. Paid requests take the multi-step path in both
+modes (the row has to exist before the card is charged), so the "paid" case
+is the baseline the fast path is measured against.
+
+Usage (from the backend directory):
+    python -m benchmarks.request_fast_path [--requests 300] [--supabase-latency-ms 8]
+    python -m benchmarks.request_fast_path --compare benchmarks/results/request_fast_path-<commit>-<time>.json
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+import uuid
+from typing import Dict, Any
+
+import httpx
+from supabase import create_client
+
+from benchmarks.common import summarize_latencies, write_results, load_results, format_comparison
+from benchmarks.http_load import BACKEND_DIR, start_process, wait_until_ready, stop_stack
+from services.outbound_guard import OutboundGuard
+from services.payment_engine import PaymentConfig, PaymentEngine
+from services.payment_service import PaymentService
+from services.request_service import RequestService
+from services.square_gateway import SquareGateway
+from services.supabase_data import SupabaseData
+from tests.fake_square_server import FakeSquareConfig, create_fake_square_app
+from tests.fake_supabase_server import FAKE_SUPABASE_KEY
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("benchmarks.request_fast_path")
+logger.setLevel(logging.INFO)
+
+MODES = {"multi_step": False, "fast_path": True}
+
+
+def build_request(paid: bool) -> Dict[str, Any]:
+    request = {
+        "request_type": "team_rebrand",
+        "requested_by": str(uuid.uuid4()),
+        "team_id": str(uuid.uuid4()),
+        "item_id": "1002",
+        "old_name": "Old Name",
+        "new_name": f"Team {uuid.uuid4().hex[:8]}",
+    }
+    if paid:
+        request["requires_payment"] = True
+        request["payment_data"] = {"source_id": "cnon:card-nonce-ok", "amount": 5.0}
+    return request
+
+
+def database_writes(calls: Dict[str, int]) -> int:
+    # Inserts, updates and RPCs against the request table; payments rows are the same in both modes
+    return sum(count for name, count in calls.items()
+               if name in ("POST /rest/v1/team_change_requests", "PATCH /rest/v1/team_change_requests")
+               or name.startswith("POST /rest/v1/rpc/transition_request"))
+
+
+async def run_case(service: RequestService, supabase_url: str, paid: bool, requests: int) -> Dict[str, Any]:
+    async with httpx.AsyncClient(base_url=supabase_url) as admin:
+        before = (await admin.get("/_fake/state")).json()["calls"]
+
+        latencies = []
+        errors = 0
+        started = time.perf_counter()
+        for _ in range(requests):
+            request_started = time.perf_counter()
+            try:
+                await service.process_request(build_request(paid))
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - request_started) * 1000)
+        elapsed = time.perf_counter() - started
+
+        after = (await admin.get("/_fake/state")).json()["calls"]
+
+    return {
+        "requests": requests,
+        "errors": errors,
+        "rps": round(requests / elapsed, 1),
+        "latency_ms": summarize_latencies(latencies),
+        "writes_per_request": round((database_writes(after) - database_writes(before)) / requests, 2),
+    }
+
+
+async def run_benchmark(supabase_url: str, args) -> Dict[str, Any]:
+    square_app = create_fake_square_app(FakeSquareConfig(latency_ms=args.square_latency_ms, seed=1))
+    gateway = SquareGateway(access_token="benchmark-token", base_url="http://fake-square",
+                            transport=httpx.ASGITransport(app=square_app))
+    engine = PaymentEngine(PaymentConfig("benchmark-token", "sandbox", "BENCHMARK-LOCATION", "sandbox-benchmark"),
+                           gateway=gateway, guard=OutboundGuard("square"))
+    supabase = create_client(supabase_url, FAKE_SUPABASE_KEY)
+    supabase_data = SupabaseData(supabase_url, FAKE_SUPABASE_KEY)
+    payment_service = PaymentService(engine, supabase)
+
+    results = {}
+    try:
+        for case, paid in (("no_payment", False), ("paid", True)):
+            for mode, fast_path in MODES.items():
+                service = RequestService(supabase_data, payment_service, supabase_guard=OutboundGuard("supabase"), fast_path=fast_path)
+                result = await run_case(service, supabase_url, paid, args.requests)
+                logger.info(
+                    f"{case}/{mode}: {result['rps']} req/s, p50 {result['latency_ms']['p50']}ms, "
+                    f"{result['writes_per_request']} writes/request, errors {result['errors']}/{result['requests']}"
+                )
+                results[f"{case}/{mode}"] = result
+    finally:
+        await engine.aclose()
+        await supabase_data.aclose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the multi-step and fast request paths")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--supabase-latency-ms", type=float, default=8.0)
+    parser.add_argument("--square-latency-ms", type=float, default=0.0)
+    parser.add_argument("--supabase-port", type=int, default=8091)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--compare", default=None)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="mgl-request-fast-path-")
+    supabase_url = f"http://127.0.0.1:{args.supabase_port}"
+    process = start_process(
+        ["-m", "tests.fake_supabase_server", "--port", str(args.supabase_port),
+         "--latency-ms", str(args.supabase_latency_ms), "--seed", "1"],
+        {**os.environ, "PYTHONPATH": BACKEND_DIR}, os.path.join(work_dir, "fake_supabase.log")
+    )
+    try:
+        wait_until_ready(f"{supabase_url}/_fake/state", process)
+        results = asyncio.run(run_benchmark(supabase_url, args))
+    finally:
+        stop_stack([process])
+
+    settings = {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+    path = write_results("request_fast_path", settings, results, args.output)
+    logger.info(f"Results written to {path}")
+
+    for case in ("no_payment", "paid"):
+        before, after = results[f"{case}/multi_step"], results[f"{case}/fast_path"]
+        print(f"{case:<11} {before['rps']:>8} -> {after['rps']:>8} req/s  "
+              f"({before['writes_per_request']} -> {after['writes_per_request']} writes/request)")
+
+    if args.compare:
+        print(format_comparison(load_results(args.compare), load_results(path), ["rps", "latency_ms.p50", "writes_per_request"]))
+
+
+if __name__ == "__main__":
+    main()
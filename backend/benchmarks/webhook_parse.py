@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Microbenchmark for reading Square webhook bodies.
+
+Compares, per event type, what the webhook path cost before (decode the
+body to str, json.loads all of it, then look at "type") with the fast path
+in services.webhook_payload: a substring scan rules out event types that
+are not handled, and only handled ones are parsed, with orjson when it is
+installed. The "mix" case follows a day of traffic where most deliveries
+are events nothing acts on.
+
+Bodies come from benchmarks/fixtures/square_webhooks.json: Square's
+documented event shapes at the sizes our account sends (0.5-2 KB).
+
+Usage (from the backend directory):
+    python -m benchmarks.webhook_parse [--records 100000] [--repeat 5]
+"""
+
+import argparse
+import json
+import os
+import timeit
+
+from benchmarks.common import write_results, load_results, format_comparison
+from services import webhook_payload
+from services.webhook_payload import HANDLED_EVENT_TYPES, may_be_handled, peek_event
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "square_webhooks.json")
+# Share of deliveries per event type in the mix
+MIX = {"payment.created": 3, "payment.updated": 3, "order.updated": 6, "refund.updated": 1, "customer.created": 1}
+
+
+def previous_parse(body: bytes):
+    """The webhook path as it was: decode, parse everything, then check the type"""
+    payload = json.loads(body.decode("utf-8"))
+    return payload if payload["type"] in HANDLED_EVENT_TYPES else None
+
+
+def fast_parse(body: bytes):
+    if not may_be_handled(body):
+        peek_event(body)
+        return None
+    return webhook_payload.loads(body)
+
+
+def stdlib_fast_parse(body: bytes):
+    if not may_be_handled(body):
+        peek_event(body)
+        return None
+    return json.loads(body)
+
+
+def run(records: int, repeat: int):
+    with open(FIXTURES, "r", encoding="utf-8") as fixtures_file:
+        bodies = {name: json.dumps(event).encode("utf-8") for name, event in json.load(fixtures_file).items()}
+    cases = dict(bodies)
+    cases["mix"] = [body for name, body in bodies.items() for _ in range(MIX.get(name, 0))]
+
+    parsers = {"previous": previous_parse, f"fast_{webhook_payload.JSON_BACKEND}": fast_parse}
+    if webhook_payload.JSON_BACKEND != "json":
+        parsers["fast_json"] = stdlib_fast_parse
+
+    results = {}
+    for case, body in cases.items():
+        batch = body if isinstance(body, list) else [body]
+        for parse in parsers.values():
+            assert all((parse(item) is None) == (previous_parse(item) is None) for item in batch)
+        for label, parse in parsers.items():
+            number = max(records // len(batch), 1)
+            best = min(timeit.repeat(lambda: [parse(item) for item in batch], number=number, repeat=repeat))
+            per_event_us = best / (number * len(batch)) * 1_000_000
+            size = sum(len(item) for item in batch) // len(batch)
+            results[f"{label}/{case}"] = {"records": number * len(batch), "bytes": size,
+                                          "best_seconds": round(best, 6), "us_per_event": round(per_event_us, 4)}
+            print(f"{label:<14} {case:<18} {size:>6} B {per_event_us:8.3f} us/event")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time Square webhook body parsing")
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--compare", default=None)
+    args = parser.parse_args()
+
+    results = run(args.records, args.repeat)
+    settings = {"records": args.records, "repeat": args.repeat, "json_backend": webhook_payload.JSON_BACKEND}
+    path = write_results("webhook_parse", settings, results, args.output)
+    print(f"Results written to {path}")
+
+    if args.compare:
+        print(format_comparison(load_results(args.compare), load_results(path), ["us_per_event"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,11 @@
 from fastapi import Depends
 from typing import Optional
-import os
 
 from services.request_service import RequestService
 from services.payment_service import PaymentService
 
 # Global instances
 _request_service: Optional[RequestService] = None
-_payment_service: Optional[PaymentService] = None
 
 async def get_request_service():
     """
@@ -18,45 +16,42 @@ async def get_request_service():
     if _request_service is None:
         import main
         
-        # Get environment variables
-        square_location_id = os.environ.get("SQUARE_LOCATION_ID")
-        square_app_id = os.environ.get("SQUARE_APP_ID")
-        
-        # Create payment service
-        payment_service = PaymentService(
-            square_client=main.square_client,
-            supabase=main.supabase_client,
-            square_location_id=square_location_id,
-            square_app_id=square_app_id
-        )
-        
-        # Create request service
+        # Create request service on top of the shared payment service
         _request_service = RequestService(
-            supabase=main.supabase_client,
-            payment_service=payment_service
+            supabase=main.supabase_data,
+            payment_service=main.payment_service
         )
     
     return _request_service
 
-async def get_payment_service():
+async def get_request_status_hub():
     """
-    Get or create a PaymentService instance
+    Get the process-wide hub that fans out request status changes
     """
-    global _payment_service
+    import main
     
-    if _payment_service is None:
-        import main
-        
-        # Get environment variables
-        square_location_id = os.environ.get("SQUARE_LOCATION_ID")
-        square_app_id = os.environ.get("SQUARE_APP_ID")
-        
-        # Create payment service
-        _payment_service = PaymentService(
-            square_client=main.square_client,
-            supabase=main.supabase_client,
-            square_location_id=square_location_id,
-            square_app_id=square_app_id
-        )
+    return main.request_status_hub
+
+async def get_webhook_inbox():
+    """
+    Get the durable inbox the webhook endpoint appends to
+    """
+    import main
+    
+    return main.webhook_inbox
+
+async def get_webhook_verifier():
+    """
+    Get the Square webhook signature verifier, or None when unsigned webhooks are allowed for development
+    """
+    import main
+    
+    return main.webhook_verifier
+
+async def get_payment_service():
+    """
+    Get the shared PaymentService instance
+    """
+    import main
     
-    return _payment_service 
\ No newline at end of file
+    return main.payment_service 
@@ -1,6 +1,6 @@
 from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from square.client import Client
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 import os
 import logging
@@ -15,11 +15,23 @@ import pathlib
 # Import routes
 from routes.payments import router as payments_router
 from routes.requests import router as requests_router
-from routes.webhooks import router as webhooks_router
+from routes.webhooks import router as webhooks_router, dispatch_square_event
 from routes.events import router as events_router
 
 # Import services
 from services.payment_service import PaymentService
+from services.idempotency_store import IdempotencyStore
+from services.payment_writer import PaymentRecordWriter
+from services.payment_engine import get_payment_engine
+from services.square_gateway import SquareAPIError
+from services.outbound_guard import DependencyUnavailableError, get_guard, all_guards
+from services.supabase_data import SupabaseData
+from services.request_events import PostgresStatusListener, RequestStatusHub
+from services.webhook_dedupe import WebhookEventDeduper
+from services.webhook_inbox import WebhookInbox, WebhookInboxWorker
+from services.webhook_payload import JSON_BACKEND as WEBHOOK_JSON_BACKEND
+from services.webhook_signature import WebhookSignatureVerifier, unsigned_webhooks_allowed
+from dependencies import get_request_service
 
 # Configure logging
 def setup_logging():
@@ -132,30 +144,66 @@ else:
 # Log environment variables
 logger.debug(f"SUPABASE_URL: {os.environ.get('SUPABASE_URL')}")
 logger.debug(f"SUPABASE_ANON_KEY: {os.environ.get('SUPABASE_ANON_KEY') and 'Set (hidden)' or 'Not set'}")
+logger.debug(f"SUPABASE_SERVICE_ROLE_KEY: {os.environ.get('SUPABASE_SERVICE_ROLE_KEY') and 'Set (hidden)' or 'Not set'}")
 
 # Global clients
-square_client = Client(
-    access_token=os.environ.get('SQUARE_ACCESS_TOKEN'),
-    environment=os.environ.get('SQUARE_ENVIRONMENT', 'sandbox')
-)
+payment_engine = get_payment_engine()
 
 # Create Supabase client with error handling
 supabase_url = os.environ.get('SUPABASE_URL')
 supabase_key = os.environ.get('SUPABASE_ANON_KEY')
+# The definer functions behind the webhook inbox, status transitions and idempotency keys
+# are only executable by the service role
+supabase_service_key = os.environ.get('SUPABASE_SERVICE_ROLE_KEY')
 
-if not supabase_url or not supabase_key:
+if not supabase_url or not supabase_key or not supabase_service_key:
     logger.error("Supabase environment variables not set")
     logger.error(f"ENV path tried: {env_path}, exists: {env_path.exists()}")
-    raise ValueError("SUPABASE_URL and SUPABASE_ANON_KEY environment variables must be set")
+    raise ValueError("SUPABASE_URL, SUPABASE_ANON_KEY and SUPABASE_SERVICE_ROLE_KEY environment variables must be set")
 
 supabase_client = create_client(supabase_url, supabase_key)
+# Awaitable PostgREST access with pooled connections for the request and webhook paths
+supabase_data = SupabaseData.from_env(supabase_url, supabase_service_key)
 
 # Create global payment service
+idempotency_store = IdempotencyStore(
+    supabase_data,
+    max_entries=int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', '2048')),
+    ttl_seconds=int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', str(24 * 60 * 60)))
+)
+
+payment_writer = PaymentRecordWriter(
+    supabase_client,
+    spool_path=os.environ.get('PAYMENT_SPOOL_PATH', str(backend_dir / 'spool' / 'payments.jsonl')),
+    batch_size=int(os.environ.get('PAYMENT_WRITE_BATCH_SIZE', '50')),
+    flush_interval=float(os.environ.get('PAYMENT_WRITE_FLUSH_SECONDS', '1.0'))
+)
+
+# Request status streams: one LISTEN connection per process fans out to every open stream
+request_status_hub = RequestStatusHub(
+    max_subscribers=int(os.environ.get('REQUEST_STREAM_MAX_SUBSCRIBERS', '10000')),
+    queue_size=int(os.environ.get('REQUEST_STREAM_QUEUE_SIZE', '8'))
+)
+request_status_dsn = os.environ.get('SUPABASE_DB_URL')
+request_status_listener = PostgresStatusListener(request_status_hub, request_status_dsn) if request_status_dsn else None
+
+# Square webhooks are stored here and drained by scripts/run_webhook_worker.py
+webhook_inbox = WebhookInbox(supabase_data)
+# Single-process setups can drain the inbox in the API process instead
+webhook_inbox_worker = None
+# Square signs every webhook; unsigned or forged bodies are refused before they reach the inbox
+webhook_verifier = WebhookSignatureVerifier.from_env()
+if webhook_verifier is None:
+    if not unsigned_webhooks_allowed():
+        logger.error("SQUARE_WEBHOOK_SIGNATURE_KEY is not set")
+        raise ValueError("SQUARE_WEBHOOK_SIGNATURE_KEY must be set (SQUARE_WEBHOOK_ALLOW_UNSIGNED=true skips the check outside production)")
+    logger.warning("SQUARE_WEBHOOK_ALLOW_UNSIGNED is set: Square webhook signatures are NOT checked")
+
 payment_service = PaymentService(
-    square_client=square_client,
+    payment_engine=payment_engine,
     supabase=supabase_client,
-    square_location_id=os.environ.get('SQUARE_LOCATION_ID'),
-    square_app_id=os.environ.get('SQUARE_APP_ID')
+    idempotency_store=idempotency_store,
+    payment_writer=payment_writer
 )
 
 app = FastAPI(
@@ -176,6 +224,24 @@ app.add_middleware(
 )
 # ------------- END CORS CONFIGURATION -------------
 
+# ------------- OVERLOAD HANDLING -------------
+@app.exception_handler(DependencyUnavailableError)
+async def dependency_unavailable_handler(request: Request, exc: DependencyUnavailableError):
+    """Answer straight away with a 503 while a dependency's circuit is open or its limit is reached"""
+    logger.warning(f"Rejecting {request.method} {request.url.path}: {str(exc)}")
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": str(max(int(round(exc.retry_after)), 1))},
+        content={
+            "detail": {
+                "message": "Service temporarily unavailable, please retry",
+                "dependency": exc.dependency,
+                "reason": exc.reason
+            }
+        }
+    )
+# ------------- END OVERLOAD HANDLING -------------
+
 # Include routers
 app.include_router(payments_router, prefix="/api", tags=["payments"])
 app.include_router(requests_router, prefix="/api", tags=["requests"])
@@ -254,13 +320,8 @@ async def create_payment(request: PaymentRequest):
     logger.info(f"Payment request received: {request}")
     
     try:
-        # Log environment variables for debugging
-        logger.info(f"SQUARE_ENVIRONMENT: {os.getenv('SQUARE_ENVIRONMENT')}")
-        logger.info(f"SQUARE_LOCATION_ID: {os.getenv('SQUARE_LOCATION_ID')}")
-        
         # Check for access token without logging the full token (security)
-        access_token = os.getenv('SQUARE_ACCESS_TOKEN')
-        if not access_token:
+        if not payment_engine.config.access_token:
             logger.error("SQUARE_ACCESS_TOKEN is missing")
             raise HTTPException(
                 status_code=500,
@@ -270,51 +331,20 @@ async def create_payment(request: PaymentRequest):
                 }
             )
         
-        logger.info(f"SQUARE_ACCESS_TOKEN present: {bool(access_token)}")
-        
         # Generate idempotency key if not provided
         idempotency_key = request.idempotencyKey or str(uuid.uuid4())
         logger.info(f"Using idempotency key: {idempotency_key}")
         
-        # Convert amount to cents (integer)
-        amount_in_cents = int(request.amount * 100)
-        
-        # Create payment body
-        body = {
-            "source_id": request.sourceId,
-            "amount_money": {
-                "amount": amount_in_cents,
-                "currency": "USD"
-            },
-            "idempotency_key": idempotency_key,
-            "location_id": os.getenv('SQUARE_LOCATION_ID')
-        }
-        
-        # Add optional fields if present
-        if request.note:
-            body["note"] = request.note
-        if request.referenceId:
-            body["reference_id"] = request.referenceId
-        
-        logger.info(f"Calling Square API with body: {json.dumps(body, default=str)}")
-        
-        # Create Square client for this request
-        client = Client(
-            access_token=access_token,
-            environment=os.getenv('SQUARE_ENVIRONMENT', 'sandbox')
-        )
-        
-        logger.info("Calling Square API to create payment")
-        result = client.payments.create_payment(body)
-        
-        if result.is_success():
-            payment = result.body["payment"]
-            logger.info(f"Payment successful! ID: {payment['id']}")
-            
-            # Return the payment details
-            return {"payment": payment}
-        else:
-            errors = result.errors
+        try:
+            payment = await payment_engine.charge(
+                request.sourceId,
+                request.amount,
+                idempotency_key=idempotency_key,
+                note=request.note,
+                reference_id=request.referenceId
+            )
+        except SquareAPIError as api_error:
+            errors = api_error.errors
             logger.error(f"Square API Error: {errors}")
             
             # Format errors for client
@@ -330,7 +360,12 @@ async def create_payment(request: PaymentRequest):
                     "square_errors": errors
                 }
             )
-    except HTTPException:
+        
+        logger.info(f"Payment successful! ID: {payment['id']}")
+        
+        # Return the payment details
+        return {"payment": payment}
+    except (HTTPException, DependencyUnavailableError):
         raise
     except Exception as e:
         logger.exception(f"Exception in payment processing: {str(e)}")
@@ -410,14 +445,31 @@ async def debug_info(request: Request):
             "has_location_id": bool(os.getenv('SQUARE_LOCATION_ID')),
             "has_access_token": bool(os.getenv('SQUARE_ACCESS_TOKEN'))
         },
+        "payment_engine": payment_engine.stats(),
+        "idempotency_store": idempotency_store.stats(),
+        "payment_writer": payment_writer.stats(),
+        "request_status_hub": request_status_hub.stats(),
+        "request_status_listener": request_status_listener.stats() if request_status_listener else None,
+        "webhook_inbox_worker": webhook_inbox_worker.stats() if webhook_inbox_worker else None,
+        "webhook_signatures": webhook_verifier.stats() if webhook_verifier else None,
+        "outbound_guards": {name: guard.stats() for name, guard in all_guards().items()},
         "routes": routes_info
     }
+
+@app.get("/debug/guards")
+async def debug_guards():
+    """Circuit breaker state and concurrency limit for each outbound dependency"""
+    # Create both up front so the endpoint lists them before the first call
+    get_guard("square")
+    get_guard("supabase")
+    return {name: guard.stats() for name, guard in all_guards().items()}
 # ------------- END DEBUG ENDPOINTS -------------
 
 # ------------- STARTUP EVENT -------------
 @app.on_event("startup")
 async def startup_event():
     """Log important information on startup"""
+    global webhook_inbox_worker
     logger.info("Starting Square Payment API...")
     
     # Log registered routes
@@ -435,4 +487,44 @@ async def startup_event():
     logger.info(f"SQUARE_ENVIRONMENT: {os.getenv('SQUARE_ENVIRONMENT')}")
     logger.info(f"Has SQUARE_LOCATION_ID: {'Yes' if os.getenv('SQUARE_LOCATION_ID') else 'No'}")
     logger.info(f"Has SQUARE_ACCESS_TOKEN: {'Yes' if os.getenv('SQUARE_ACCESS_TOKEN') else 'No'}")
+    if WEBHOOK_JSON_BACKEND != "orjson":
+        logger.warning("orjson is not installed (see requirements.txt); Square webhooks are parsed with json")
+    
+    # Start the payment write-behind queue, replaying anything left from a previous run
+    replay = os.getenv('PAYMENT_SPOOL_REPLAY', 'true').lower() != 'false'
+    payment_writer.start(replay=replay)
+    
+    # Without a database URL, status streams re-read the request on each heartbeat instead
+    if request_status_listener:
+        request_status_listener.start()
+    else:
+        logger.warning("SUPABASE_DB_URL not set; request status streams will poll instead of listening")
+    
+    # Normally the inbox is drained by scripts/run_webhook_worker.py, away from API traffic
+    if os.getenv('WEBHOOK_INBOX_DRAIN_IN_PROCESS', 'false').lower() == 'true':
+        request_service = await get_request_service()
+        webhook_inbox_worker = WebhookInboxWorker(
+            webhook_inbox,
+            lambda payload: dispatch_square_event(payload, request_service),
+            batch_size=int(os.getenv('WEBHOOK_INBOX_BATCH_SIZE', '50')),
+            concurrency=int(os.getenv('WEBHOOK_INBOX_CONCURRENCY', '8')),
+            deduper=WebhookEventDeduper(
+                supabase_data,
+                max_entries=int(os.getenv('WEBHOOK_DEDUPE_ENTRIES', '10000')),
+                ttl_seconds=int(os.getenv('WEBHOOK_DEDUPE_TTL_SECONDS', str(7 * 24 * 60 * 60)))
+            )
+        )
+        webhook_inbox_worker.start()
+        logger.info("Draining the webhook inbox in the API process")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush queued payment records and release pooled and listening connections"""
+    await payment_writer.stop()
+    if request_status_listener:
+        await request_status_listener.stop()
+    if webhook_inbox_worker:
+        await webhook_inbox_worker.stop()
+    await payment_engine.aclose()
+    await supabase_data.aclose()
 # ------------- END STARTUP EVENT -------------
\ No newline at end of file
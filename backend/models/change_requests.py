@@ -0,0 +1,91 @@
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+from typing import Annotated, Any, Dict, List, Literal, Optional, Union
+
+class ChangeRequestBase(BaseModel):
+    request_type: str
+    team_id: str
+    requested_by: str
+    requires_payment: bool = False
+    metadata: Optional[Dict[str, Any]] = None
+    payment_data: Optional[Dict[str, Any]] = None
+    # Set by the client to make a bulk submission's IDs known up front
+    request_id: Optional[str] = None
+
+    def to_request_data(self) -> Dict[str, Any]:
+        """
+        The plain dict RequestService stores and executes; no further checks are needed
+        """
+        return self.model_dump()
+
+class TeamTransferRequest(ChangeRequestBase):
+    request_type: Literal["team_transfer"] = "team_transfer"
+    new_captain_id: str
+    old_captain_id: str
+    item_id: str
+
+class RosterChangeRequest(ChangeRequestBase):
+    request_type: Literal["roster_change"] = "roster_change"
+    player_id: str
+    new_role: Optional[str] = None
+    operation: Literal["add", "remove", "update"] = "update"
+
+class TournamentRegistrationRequest(ChangeRequestBase):
+    request_type: Literal["tournament_registration"] = "tournament_registration"
+    tournament_id: str
+    player_ids: List[str]
+
+class LeagueRegistrationRequest(ChangeRequestBase):
+    request_type: Literal["league_registration"] = "league_registration"
+    league_id: str
+    season: Optional[int] = 1
+    player_ids: List[str]
+
+class TeamRebrandRequest(ChangeRequestBase):
+    request_type: Literal["team_rebrand"] = "team_rebrand"
+    old_name: str
+    new_name: str
+    item_id: str
+
+class OnlineIdChangeRequest(ChangeRequestBase):
+    request_type: Literal["online_id_change"] = "online_id_change"
+    player_id: str
+    old_online_id: Optional[str] = None
+    new_online_id: str
+    platform: str
+
+class TeamCreationRequest(ChangeRequestBase):
+    request_type: Literal["team_creation"] = "team_creation"
+    team_name: str
+    captain_id: str
+    league_id: Optional[str] = None
+
+# Any change request; request_type picks the model, so only that one is tried
+ChangeRequest = Annotated[
+    Union[
+        TeamTransferRequest,
+        RosterChangeRequest,
+        TournamentRegistrationRequest,
+        LeagueRegistrationRequest,
+        TeamRebrandRequest,
+        OnlineIdChangeRequest,
+        TeamCreationRequest,
+    ],
+    Field(discriminator="request_type")
+]
+
+_change_request_adapter = TypeAdapter(ChangeRequest)
+
+def parse_change_request(raw: Union[bytes, str, Dict[str, Any]]) -> ChangeRequestBase:
+    """
+    Validate a change request in one pass, straight from the raw JSON body
+    when there is one; raises pydantic.ValidationError (a ValueError)
+    """
+    if isinstance(raw, (bytes, str)):
+        return _change_request_adapter.validate_json(raw)
+    return _change_request_adapter.validate_python(raw)
+
+def validation_messages(error: ValidationError) -> List[str]:
+    """
+    One "field.path: message" line per problem, for per-item error reporting
+    """
+    return [f"{'.'.join(str(part) for part in detail['loc'])}: {detail['msg']}" for detail in error.errors()]
@@ -1,19 +1,26 @@
 from fastapi import APIRouter, HTTPException, Depends, Request
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 import logging
 import uuid
 import json
 import os
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
 # Import the payment service
 from services.payment_service import PaymentService
+from services.idempotency_store import IdempotencyKeyReusedError
+from services.outbound_guard import DependencyUnavailableError
 from dependencies import get_request_service
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Charges per batch request, and how many of them may be with Square at once
+PAYMENT_BATCH_MAX_CHARGES = int(os.getenv("PAYMENT_BATCH_MAX_CHARGES", "200"))
+PAYMENT_BATCH_CONCURRENCY = int(os.getenv("PAYMENT_BATCH_CONCURRENCY", "8"))
+
 class PaymentRequest(BaseModel):
     sourceId: str
     amount: float
@@ -62,7 +69,8 @@ async def create_payment(request: PaymentRequest, req: Request):
         payment_data = {
             "source_id": request.sourceId,
             "amount": request.amount,
-            "idempotency_key": request.idempotencyKey or str(uuid.uuid4()),
+            # Left empty when the client sent no key; the engine generates one
+            "idempotency_key": request.idempotencyKey,
             "note": request.note,
             "reference_id": request.referenceId
         }
@@ -76,6 +84,14 @@ async def create_payment(request: PaymentRequest, req: Request):
         try:
             result = await payment_service.process_payment(payment_data)
             return {"success": True, "payment": result}
+        except IdempotencyKeyReusedError as e:
+            logger.warning(f"Rejected payment with reused idempotency key: {str(e)}")
+            raise HTTPException(
+                status_code=409,
+                detail={"message": str(e)}
+            )
+        except DependencyUnavailableError:
+            raise
         except Exception as e:
             logger.exception(f"Payment service error: {str(e)}")
             raise HTTPException(
@@ -83,8 +99,8 @@ async def create_payment(request: PaymentRequest, req: Request):
                 detail={"message": f"Payment processing error: {str(e)}"}
             )
             
-    except HTTPException as he:
-        raise he
+    except (HTTPException, DependencyUnavailableError):
+        raise
     except Exception as e:
         logger.exception(f"Unexpected error: {str(e)}")
         raise HTTPException(
@@ -92,6 +108,51 @@ async def create_payment(request: PaymentRequest, req: Request):
             detail={"message": f"Unexpected error: {str(e)}"}
         )
 
+class BatchPaymentRequest(BaseModel):
+    charges: List[PaymentRequest] = Field(..., min_length=1)
+    maxConcurrency: Optional[int] = Field(None, ge=1, le=PAYMENT_BATCH_CONCURRENCY)
+
+@router.post("/payments/batch")
+async def create_payment_batch(request: BatchPaymentRequest):
+    """
+    Charge many payments in one request (e.g. a league registering its teams).
+
+    Responds with newline-delimited JSON: one line per charge, in the order
+    the charges finish, each carrying the index of its charge, then a final
+    {"summary": ...} line once the payments rows have been stored.
+    """
+    if len(request.charges) > PAYMENT_BATCH_MAX_CHARGES:
+        raise HTTPException(
+            status_code=413,
+            detail={"message": f"A batch may contain at most {PAYMENT_BATCH_MAX_CHARGES} charges"}
+        )
+
+    # Import here to avoid circular imports
+    from main import payment_service
+
+    charges = []
+    for charge in request.charges:
+        metadata = dict(charge.metadata or {})
+        if metadata.get('season') is None:
+            metadata['season'] = charge.season or 1
+        charges.append({
+            "source_id": charge.sourceId,
+            "amount": charge.amount,
+            "idempotency_key": charge.idempotencyKey,
+            "note": charge.note,
+            "reference_id": charge.referenceId,
+            "metadata": metadata
+        })
+
+    max_concurrency = PAYMENT_BATCH_CONCURRENCY if request.maxConcurrency is None else request.maxConcurrency
+    logger.info(f"Processing batch of {len(charges)} payments with up to {max_concurrency} in flight")
+
+    async def stream_results():
+        async for item in payment_service.process_payment_batch(charges, max_concurrency=max_concurrency):
+            yield json.dumps(item, default=str) + "\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
 @router.post("/payments/test")
 async def test_payment(request: PaymentRequest):
     """Test endpoint for payment processing without making real API calls"""
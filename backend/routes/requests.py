@@ -1,74 +1,52 @@
-from fastapi import APIRouter, HTTPException, Depends, Body
-from pydantic import BaseModel, Field
+from fastapi import APIRouter, HTTPException, Depends, Body, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
 from typing import Dict, Any, List, Optional
 import uuid
 import logging
 import json
+import os
 
 # Import the dependency to get the RequestService
-from dependencies import get_request_service
+from dependencies import get_request_service, get_request_status_hub
+from models.change_requests import (
+    LeagueRegistrationRequest,
+    OnlineIdChangeRequest,
+    RosterChangeRequest,
+    TeamCreationRequest,
+    TeamRebrandRequest,
+    TeamTransferRequest,
+    TournamentRegistrationRequest,
+    parse_change_request,
+    validation_messages,
+)
+from services.request_events import RESYNC_EVENT, RequestStatusHub, SubscriberLimitError
+from services.request_history import etag_matches, history_etag
 from services.request_service import RequestService
+from services.request_states import FAILED, TERMINAL_STATUSES
+from services.outbound_guard import DependencyUnavailableError
 
 # Add this at the top with other imports
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-class RequestBase(BaseModel):
-    request_type: str
-    team_id: str
-    requested_by: str
-    requires_payment: bool = False
-    metadata: Optional[Dict[str, Any]] = None
+# Largest number of requests accepted by one bulk submission
+REQUEST_BULK_MAX_ITEMS = int(os.getenv("REQUEST_BULK_MAX_ITEMS", "500"))
+# Page size of a team's request history, and the most one page may ask for
+REQUEST_HISTORY_DEFAULT_LIMIT = int(os.getenv("REQUEST_HISTORY_DEFAULT_LIMIT", "50"))
+REQUEST_HISTORY_MAX_LIMIT = int(os.getenv("REQUEST_HISTORY_MAX_LIMIT", "200"))
+# Status streams: comment sent on a quiet stream (and status re-read without a listener), browser reconnect delay
+REQUEST_STREAM_HEARTBEAT_SECONDS = float(os.getenv("REQUEST_STREAM_HEARTBEAT_SECONDS", "15"))
+REQUEST_STREAM_RETRY_MS = int(os.getenv("REQUEST_STREAM_RETRY_MS", "3000"))
+# A stream ends here; a failed request is only retried by the admin scripts
+STREAM_FINAL_STATUSES = TERMINAL_STATUSES | {FAILED}
 
-class TeamTransferRequest(RequestBase):
-    request_type: str = "team_transfer"
-    new_captain_id: str
-    old_captain_id: str
-    item_id: str
-    payment_data: Optional[Dict[str, Any]] = None
-
-class RosterChangeRequest(RequestBase):
-    request_type: str = "roster_change"
-    player_id: str
-    new_role: Optional[str] = None
-    operation: str = "update"  # "add", "remove", "update"
-    payment_data: Optional[Dict[str, Any]] = None
-
-class TournamentRegistrationRequest(RequestBase):
-    request_type: str = "tournament_registration"
-    tournament_id: str
-    player_ids: List[str]
-    payment_data: Optional[Dict[str, Any]] = None
-
-class LeagueRegistrationRequest(RequestBase):
-    request_type: str = "league_registration"
-    league_id: str
-    season: Optional[int] = 1
-    player_ids: List[str]
-    payment_data: Optional[Dict[str, Any]] = None
-
-class TeamRebrandRequest(RequestBase):
-    request_type: str = "team_rebrand"
-    old_name: str
-    new_name: str
-    item_id: str
-    payment_data: Optional[Dict[str, Any]] = None
-
-class OnlineIdChangeRequest(RequestBase):
-    request_type: str = "online_id_change"
-    player_id: str
-    old_online_id: Optional[str] = None
-    new_online_id: str
-    platform: str
-    payment_data: Optional[Dict[str, Any]] = None
-
-class TeamCreationRequest(RequestBase):
-    request_type: str = "team_creation"
-    team_name: str
-    captain_id: str
-    league_id: Optional[str] = None
-    payment_data: Optional[Dict[str, Any]] = None
+class BulkRequestSubmission(BaseModel):
+    # Each envelope is validated on its own against the model for its request_type
+    requests: List[Dict[str, Any]] = Field(..., min_length=1)
+    # All or nothing: one invalid request means none are written
+    atomic: bool = False
 
 @router.post("/team/transfer", response_model=Dict[str, Any])
 async def transfer_team(
@@ -77,18 +55,19 @@ async def transfer_team(
 ):
     try:
         # Log the complete request data
-        request_dict = request.dict()
-        logger.info(f"Team transfer request received: {json.dumps(request_dict, default=str)}")
+        logger.info(f"Team transfer request received: {request.model_dump_json()}")
         
         # Ensure item_id is present
-        if "item_id" not in request_dict or not request_dict["item_id"]:
+        if not request.item_id:
             logger.error("Missing item_id in team transfer request")
             raise HTTPException(status_code=400, detail="Missing required field: item_id")
         
         # Process the request
-        result = await request_service.process_request(request_dict)
+        result = await request_service.process_request(request)
         logger.info(f"Team transfer request processed successfully: {json.dumps(result, default=str)}")
         return result
+    except DependencyUnavailableError:
+        raise
     except Exception as e:
         logger.error(f"Error processing team transfer request: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -99,8 +78,10 @@ async def update_roster(
     request_service: RequestService = Depends(get_request_service)
 ):
     try:
-        result = await request_service.process_request(request.dict())
+        result = await request_service.process_request(request)
         return result
+    except DependencyUnavailableError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -110,8 +91,10 @@ async def register_tournament(
     request_service: RequestService = Depends(get_request_service)
 ):
     try:
-        result = await request_service.process_request(request.dict())
+        result = await request_service.process_request(request)
         return result
+    except DependencyUnavailableError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -121,8 +104,10 @@ async def register_league(
     request_service: RequestService = Depends(get_request_service)
 ):
     try:
-        result = await request_service.process_request(request.dict())
+        result = await request_service.process_request(request)
         return result
+    except DependencyUnavailableError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -133,36 +118,37 @@ async def rebrand_team(
 ):
     try:
         # Log the complete request data
-        request_dict = request.dict()
-        logger.info(f"Team rebrand request received: {json.dumps(request_dict, default=str)}")
+        logger.info(f"Team rebrand request received: {request.model_dump_json()}")
         
         # Ensure item_id is present
-        if not request_dict.get("item_id"):
+        if not request.item_id:
             logger.error("Missing item_id in team rebrand request")
             raise HTTPException(status_code=400, detail="Missing required field: item_id")
         
         # Verify the item_id exists in the items table
         try:
-            item_query = request_service.supabase.table("items").select("*").eq("item_id", request_dict["item_id"])
-            item_response = item_query.execute()
+            item_query = request_service.supabase.table("items").select("*").eq("item_id", request.item_id)
+            item_response = await item_query.execute()
             
             if not item_response.data:
-                logger.error(f"Invalid item_id in team rebrand request: {request_dict['item_id']}")
-                raise HTTPException(status_code=400, detail=f"Invalid item_id: {request_dict['item_id']}")
+                logger.error(f"Invalid item_id in team rebrand request: {request.item_id}")
+                raise HTTPException(status_code=400, detail=f"Invalid item_id: {request.item_id}")
                 
             # Update the item price if it doesn't match
             item_price = item_response.data[0]["current_price"]
-            if "payment_data" in request_dict and request_dict["payment_data"] and "amount" in request_dict["payment_data"]:
-                if request_dict["payment_data"]["amount"] != item_price:
-                    logger.warning(f"Price mismatch: Request price {request_dict['payment_data']['amount']} doesn't match item price {item_price}")
-                    request_dict["payment_data"]["amount"] = item_price
+            if request.payment_data and "amount" in request.payment_data:
+                if request.payment_data["amount"] != item_price:
+                    logger.warning(f"Price mismatch: Request price {request.payment_data['amount']} doesn't match item price {item_price}")
+                    request.payment_data["amount"] = item_price
         except Exception as e:
             logger.error(f"Error validating item_id: {str(e)}")
         
         # Process the request
-        result = await request_service.process_request(request_dict)
+        result = await request_service.process_request(request)
         logger.info(f"Team rebrand request processed successfully: {json.dumps(result, default=str)}")
         return result
+    except DependencyUnavailableError:
+        raise
     except Exception as e:
         logger.error(f"Error processing team rebrand request: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -173,8 +159,10 @@ async def change_online_id(
     request_service: RequestService = Depends(get_request_service)
 ):
     try:
-        result = await request_service.process_request(request.dict())
+        result = await request_service.process_request(request)
         return result
+    except DependencyUnavailableError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -184,10 +172,60 @@ async def create_team(
     request_service: RequestService = Depends(get_request_service)
 ):
     try:
-        result = await request_service.process_request(request.dict())
+        result = await request_service.process_request(request)
         return result
+    except DependencyUnavailableError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/requests", response_model=Dict[str, Any])
+async def submit_request(
+    http_request: Request,
+    request_service: RequestService = Depends(get_request_service)
+):
+    """
+    Submit a change request of any type. The raw body is parsed and validated in
+    one pass against the model its request_type selects.
+    """
+    try:
+        request = parse_change_request(await http_request.body())
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=validation_messages(e))
+    
+    try:
+        return await request_service.process_request(request)
+    except DependencyUnavailableError:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing {request.request_type} request: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/requests/bulk", response_model=Dict[str, Any])
+async def submit_requests_bulk(
+    submission: BulkRequestSubmission,
+    request_service: RequestService = Depends(get_request_service)
+):
+    """
+    Submit many change requests of mixed types; the valid ones are written in one
+    insert and each request gets its own result (see RequestService.process_requests_bulk)
+    """
+    if len(submission.requests) > REQUEST_BULK_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many requests in one submission ({len(submission.requests)} > {REQUEST_BULK_MAX_ITEMS})"
+        )
+    
+    try:
+        outcome = await request_service.process_requests_bulk(submission.requests, atomic=submission.atomic)
+    except DependencyUnavailableError:
+        raise
     except Exception as e:
+        logger.error(f"Error processing bulk request submission: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
+    
+    logger.info(f"Bulk request submission: {json.dumps(outcome['summary'])}")
+    return outcome
 
 @router.get("/requests/{request_id}", response_model=Dict[str, Any])
 async def get_request(
@@ -202,33 +240,100 @@ async def get_request(
             
         return request
     except Exception as e:
-        if isinstance(e, HTTPException):
+        if isinstance(e, (HTTPException, DependencyUnavailableError)):
             raise e
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/requests/{request_id}/events")
+async def stream_request_status(
+    request_id: str,
+    http_request: Request,
+    request_service: RequestService = Depends(get_request_service),
+    hub: RequestStatusHub = Depends(get_request_status_hub)
+):
+    """
+    Server-sent events with the request's status: the current one straight
+    away, then each change until the request reaches a final status
+    """
+    try:
+        # Subscribe before reading, so a change between the two is not missed
+        subscription = hub.subscribe(request_id)
+    except SubscriberLimitError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    try:
+        request = await request_service.get_request(request_id)
+    except BaseException:
+        hub.unsubscribe(subscription)
+        raise
+    if not request:
+        hub.unsubscribe(subscription)
+        raise HTTPException(status_code=404, detail=f"Request with ID {request_id} not found")
+    
+    async def events():
+        current = request
+        try:
+            yield f"retry: {REQUEST_STREAM_RETRY_MS}\n\n"
+            yield status_event(current)
+            while current.get("status") not in STREAM_FINAL_STATUSES:
+                event = await subscription.next(REQUEST_STREAM_HEARTBEAT_SECONDS)
+                if await http_request.is_disconnected():
+                    break
+                if event is None and hub.live:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None or event is RESYNC_EVENT:
+                    # No listener, or it may have missed changes: read the row instead
+                    latest = await request_service.get_request(request_id)
+                    if not latest or latest.get("status") == current.get("status"):
+                        yield ": keep-alive\n\n"
+                        continue
+                    event = latest
+                current = event
+                yield status_event(current)
+        finally:
+            hub.unsubscribe(subscription)
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def status_event(request: Dict[str, Any]) -> str:
+    data = {field: request.get(field) for field in ("id", "status", "previous_status", "updated_at", "last_error")}
+    return f"event: status\ndata: {json.dumps(data, default=str)}\n\n"
+
 @router.get("/team/{team_id}/requests", response_model=List[Dict[str, Any]])
 async def get_team_requests(
     team_id: str,
     status: Optional[str] = None,
+    limit: int = Query(REQUEST_HISTORY_DEFAULT_LIMIT, ge=1, le=REQUEST_HISTORY_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
     request_service: RequestService = Depends(get_request_service)
 ):
+    """
+    A team's requests, newest first, a page at a time. The next page's cursor is
+    returned in X-Next-Cursor; fields= picks the columns (metadata and
+    webhook_data only when asked for). A poll whose If-None-Match matches the
+    page's ETag gets 304 with no body.
+    """
     try:
-        # Build query
-        query = request_service.supabase.table("team_change_requests").select("*").eq("team_id", team_id)
-        
-        # Add status filter if provided
-        if status:
-            query = query.eq("status", status)
-            
-        # Execute query
-        result = await query.order("created_at", desc=True).execute()
-        
-        if hasattr(result, 'error') and result.error is not None:
-            raise Exception(f"Failed to get team requests: {result.error}")
-            
-        return result.data
+        rows, next_cursor = await request_service.list_team_requests(team_id, status, limit, cursor, fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except DependencyUnavailableError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    
+    # Serialized once: the bytes are both the body and what the ETag is taken over
+    body = json.dumps(rows, default=str, separators=(",", ":")).encode("utf-8")
+    headers = {"ETag": history_etag(body, next_cursor), "Cache-Control": "private, no-cache"}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @router.post("/approve_transfer", response_model=dict)
 async def approve_transfer_request(
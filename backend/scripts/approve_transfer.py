@@ -17,10 +17,15 @@ import sys
 import argparse
 import asyncio
 import logging
-from datetime import datetime
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.request_status import transition_request_status
+from services.request_states import APPROVED, COMPLETED, FAILED, PENDING, PROCESSING
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -69,14 +74,10 @@ async def approve_and_process_transfer(request_id: str):
             return True
         
         # Update request status to approved
-        approve_result = supabase.table("team_change_requests").update({
-            "status": "approved",
-            "updated_at": datetime.now().isoformat()
-        }).eq("id", request_id).eq("status", "pending").execute()
-        
-        # Check if data is available from update
-        approve_data = getattr(approve_result, 'data', None)
-        if not approve_data or len(approve_data) == 0:
+        approve_result = transition_request_status(supabase, request_id, APPROVED, expected_status=[PENDING])
+        
+        # Check whether the guarded transition went through
+        if not approve_result or not approve_result.get("transitioned"):
             logger.error(f"Request {request_id} could not be approved (may not be in pending status)")
             return False
         
@@ -95,10 +96,7 @@ async def approve_and_process_transfer(request_id: str):
         logger.info(f"Executing team transfer: team_id={team_id}, new_captain_id={new_captain_id}, old_captain_id={old_captain_id}")
         
         # Update request status to processing
-        process_result = supabase.table("team_change_requests").update({
-            "status": "processing",
-            "updated_at": datetime.now().isoformat()
-        }).eq("id", request_id).execute()
+        process_result = transition_request_status(supabase, request_id, PROCESSING, expected_status=[APPROVED])
         
         # Continue even if update fails
         
@@ -119,11 +117,9 @@ async def approve_and_process_transfer(request_id: str):
                 logger.error(f"Error executing team transfer: {rpc_error}")
                 
                 # Update request with error
-                error_update = supabase.table("team_change_requests").update({
-                    "status": "failed",
-                    "last_error": str(rpc_error),
-                    "processing_attempts": request.get('processing_attempts', 0) + 1
-                }).eq("id", request_id).execute()
+                error_update = transition_request_status(
+                    supabase, request_id, FAILED, last_error=str(rpc_error), increment_attempts=True
+                )
                 
                 return False
             
@@ -133,22 +129,20 @@ async def approve_and_process_transfer(request_id: str):
             logger.error(f"Exception during team transfer execution: {str(e)}")
             
             # Update request with error
-            error_update = supabase.table("team_change_requests").update({
-                "status": "failed",
-                "last_error": str(e),
-                "processing_attempts": request.get('processing_attempts', 0) + 1
-            }).eq("id", request_id).execute()
+            error_update = transition_request_status(
+                supabase, request_id, FAILED, last_error=str(e), increment_attempts=True
+            )
             
             return False
         
         # Update request status to completed
-        complete_result = supabase.table("team_change_requests").update({
-            "status": "completed",
-            "processed_at": datetime.now().isoformat()
-        }).eq("id", request_id).execute()
+        try:
+            transition_request_status(supabase, request_id, COMPLETED, expected_status=[PROCESSING])
+            complete_error = None
+        except Exception as e:
+            complete_error = str(e)
         
         # Check for errors in update result, but continue on error
-        complete_error = getattr(complete_result, 'error', None)
         if complete_error:
             logger.error(f"Error completing request {request_id}: {complete_error}")
             # Team transfer was successful but status update failed
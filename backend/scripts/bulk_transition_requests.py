@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+Utility script to move many team change requests to a new status at once.
+
+Requests are picked by ID or by their current status (and optionally type),
+then moved with one guarded statement per batch instead of one update per
+row. Only moves the request state machine allows are applied; a request
+whose status changed after it was selected is skipped and reported.
+
+Usage:
+    python bulk_transition_requests.py --status STATUS (--request-id ID ... | --from-status STATUS) [--dry-run]
+
+Options:
+    --status        Status to move the requests to
+    --request-id    ID of a request to move (repeatable)
+    --from-status   Move every request currently in this status
+    --request-type  Only requests of this type (with --from-status)
+    --reason        Stored as last_error and under metadata.admin_transition
+    --batch-size    Requests per statement (default: 500)
+    --dry-run       List the requests that would be moved without changing them
+"""
+
+import os
+import sys
+import argparse
+import asyncio
+import json
+import logging
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from supabase import create_client
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.request_states import FAILED, REQUEST_STATUSES, IllegalTransitionError, can_transition
+from services.request_status import transition_request_statuses
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+def select_requests(supabase, args):
+    query = supabase.table("team_change_requests").select("id, status, request_type")
+    if args.request_id:
+        query = query.in_("id", args.request_id)
+    else:
+        query = query.eq("status", args.from_status)
+        if args.request_type:
+            query = query.eq("request_type", args.request_type)
+    response = query.execute()
+    return response.data or []
+
+async def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description="Move many team change requests to a new status")
+    parser.add_argument("--status", required=True, choices=sorted(REQUEST_STATUSES), help="Status to move the requests to")
+    selection = parser.add_mutually_exclusive_group(required=True)
+    selection.add_argument("--request-id", action="append", help="ID of a request to move (repeatable)")
+    selection.add_argument("--from-status", choices=sorted(REQUEST_STATUSES), help="Move every request currently in this status")
+    parser.add_argument("--request-type", type=str, default=None, help="Only requests of this type (with --from-status)")
+    parser.add_argument("--reason", type=str, default=None, help="Why the requests are being moved")
+    parser.add_argument("--batch-size", type=int, default=500, help="Requests per statement")
+    parser.add_argument("--dry-run", action="store_true", help="List the requests without moving them")
+
+    args = parser.parse_args()
+
+    supabase_url = os.getenv('SUPABASE_URL')
+    supabase_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+    if not supabase_url or not supabase_key:
+        logger.error("Missing required environment variables (SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY)")
+        sys.exit(1)
+
+    supabase = create_client(supabase_url, supabase_key)
+    requests = select_requests(supabase, args)
+
+    movable = [request for request in requests if can_transition(request["status"], args.status)]
+    illegal = [request["id"] for request in requests if request not in movable]
+    if illegal:
+        logger.warning(f"{len(illegal)} requests cannot move to '{args.status}' from their current status")
+    if args.dry_run or not movable:
+        print(json.dumps({"would_transition": [request["id"] for request in movable], "illegal": illegal}, indent=2))
+        return
+
+    metadata = {
+        "admin_transition": {
+            "reason": args.reason,
+            "at": datetime.now(timezone.utc).isoformat()
+        }
+    }
+    try:
+        outcome = transition_request_statuses(
+            supabase,
+            [
+                {
+                    "id": request["id"],
+                    "status": args.status,
+                    # Guard on the status we saw, so a request that moved meanwhile is skipped
+                    "current_status": request["status"],
+                    "expected_status": [request["status"]],
+                    "metadata": metadata,
+                    "last_error": args.reason if args.status == FAILED else None
+                }
+                for request in movable
+            ],
+            batch_size=args.batch_size
+        )
+    except IllegalTransitionError as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+    print(json.dumps({**outcome, "illegal": illegal}, indent=2))
+
+if __name__ == "__main__":
+    asyncio.run(main())
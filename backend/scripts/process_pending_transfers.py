@@ -18,10 +18,15 @@ import sys
 import argparse
 import asyncio
 import logging
-from datetime import datetime
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.request_status import transition_request_status
+from services.request_states import COMPLETED, FAILED, PENDING, PROCESSING
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -82,10 +87,7 @@ async def process_single_transfer(request_id: str):
         logger.info(f"Executing team transfer: team_id={team_id}, new_captain_id={new_captain_id}, old_captain_id={old_captain_id}")
         
         # Update request status to processing
-        update_result = supabase.table("team_change_requests").update({
-            "status": "processing",
-            "updated_at": datetime.now().isoformat()
-        }).eq("id", request_id).execute()
+        update_result = transition_request_status(supabase, request_id, PROCESSING)
         
         # Continue even if update fails
         
@@ -107,11 +109,9 @@ async def process_single_transfer(request_id: str):
                 logger.error(f"Error executing team transfer: {rpc_error}")
                 
                 # Update request with error
-                error_update = supabase.table("team_change_requests").update({
-                    "status": "failed",
-                    "last_error": str(rpc_error),
-                    "processing_attempts": request.get('processing_attempts', 0) + 1
-                }).eq("id", request_id).execute()
+                error_update = transition_request_status(
+                    supabase, request_id, FAILED, last_error=str(rpc_error), increment_attempts=True
+                )
                 
                 return False
             
@@ -121,22 +121,20 @@ async def process_single_transfer(request_id: str):
             logger.error(f"Exception during team transfer execution: {str(e)}")
             
             # Update request with error
-            error_update = supabase.table("team_change_requests").update({
-                "status": "failed",
-                "last_error": str(e),
-                "processing_attempts": request.get('processing_attempts', 0) + 1
-            }).eq("id", request_id).execute()
+            error_update = transition_request_status(
+                supabase, request_id, FAILED, last_error=str(e), increment_attempts=True
+            )
             
             return False
         
         # Update request status to completed
-        complete_result = supabase.table("team_change_requests").update({
-            "status": "completed",
-            "processed_at": datetime.now().isoformat()
-        }).eq("id", request_id).execute()
+        try:
+            transition_request_status(supabase, request_id, COMPLETED, expected_status=[PROCESSING])
+            complete_error = None
+        except Exception as e:
+            complete_error = str(e)
         
         # Check for errors in update result, but continue on error
-        complete_error = getattr(complete_result, 'error', None)
         if complete_error:
             logger.error(f"Error updating request status to completed: {complete_error}")
             # Team transfer was successful but status update failed
@@ -155,7 +153,7 @@ async def process_all_transfers():
     
     try:
         # Get all pending team transfer requests
-        response = supabase.table("team_change_requests").select("id").eq("request_type", "team_transfer").eq("status", "pending").execute()
+        response = supabase.table("team_change_requests").select("id").eq("request_type", "team_transfer").eq("status", PENDING).execute()
         
         # Check if data is available
         data = getattr(response, 'data', None)
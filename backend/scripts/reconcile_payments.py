@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Utility script to reconcile Square payments with the database.
+
+Walks Square ListPayments for a time window and settles team change requests
+that are still pending because their payment.updated webhook never arrived,
+backfills missing payments rows and corrects stale payment statuses. By
+default the window starts where the previous run stopped, so the script can
+run from cron.
+
+Usage:
+    python reconcile_payments.py [--begin ISO_TIME] [--end ISO_TIME] [--dry-run]
+
+Options:
+    --begin         Start of the window (default: stored high-water mark minus the overlap)
+    --end           End of the window (default: now)
+    --overlap       Seconds to re-read before the high-water mark (default: 900)
+    --batch-size    Rows per bulk query or correction batch (default: 100)
+    --dry-run       Report the corrections without writing them or moving the high-water mark
+"""
+
+import os
+import sys
+import argparse
+import asyncio
+import json
+import logging
+from datetime import datetime
+from dotenv import load_dotenv
+from supabase import create_client
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.payment_engine import get_payment_engine
+from services.payment_reconciler import PaymentReconciler
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+def parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+async def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description="Reconcile Square payments with team change requests")
+    parser.add_argument("--begin", type=parse_time, default=None, help="Start of the window (ISO 8601)")
+    parser.add_argument("--end", type=parse_time, default=None, help="End of the window (ISO 8601)")
+    parser.add_argument("--overlap", type=int, default=15 * 60, help="Seconds to re-read before the high-water mark")
+    parser.add_argument("--batch-size", type=int, default=100, help="Rows per bulk query or correction batch")
+    parser.add_argument("--dry-run", action="store_true", help="Report corrections without applying them")
+
+    args = parser.parse_args()
+
+    supabase_url = os.getenv('SUPABASE_URL')
+    supabase_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+    if not supabase_url or not supabase_key:
+        logger.error("Missing required environment variables (SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY)")
+        sys.exit(1)
+
+    payment_engine = get_payment_engine()
+    reconciler = PaymentReconciler(
+        create_client(supabase_url, supabase_key),
+        payment_engine,
+        batch_size=args.batch_size,
+        overlap_seconds=args.overlap
+    )
+
+    try:
+        stats = await reconciler.run(begin_time=args.begin, end_time=args.end, dry_run=args.dry_run)
+    finally:
+        await payment_engine.aclose()
+
+    print(json.dumps(stats, indent=2))
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Utility script to write spooled payment records to the payments table.
+
+The API queues payment rows in a local spool file per worker process
+(payments.<pid>.jsonl) before writing them to Supabase in batches. This
+script drains the spools left behind by crashed or stopped workers without
+starting the API; spools of workers that are still running are left alone.
+
+Usage:
+    python replay_payment_spool.py [--spool-path PATH] [--batch-size N]
+
+Options:
+    --spool-path    Spool path the API was given (default: PAYMENT_SPOOL_PATH or backend/spool/payments.jsonl)
+    --batch-size    Number of rows per insert (default: 50)
+"""
+
+import os
+import sys
+import argparse
+import asyncio
+import logging
+from dotenv import load_dotenv
+from supabase import create_client
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.payment_writer import PaymentRecordWriter
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_SPOOL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "spool", "payments.jsonl")
+
+async def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description="Replay spooled payment records")
+    parser.add_argument("--spool-path", type=str, default=os.getenv('PAYMENT_SPOOL_PATH', DEFAULT_SPOOL_PATH), help="Spool path the API was given")
+    parser.add_argument("--batch-size", type=int, default=50, help="Number of rows per insert")
+    
+    args = parser.parse_args()
+    
+    supabase_url = os.getenv('SUPABASE_URL')
+    supabase_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY') or os.getenv('SUPABASE_ANON_KEY')
+    if not supabase_url or not supabase_key:
+        logger.error("Missing required environment variables (SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY)")
+        sys.exit(1)
+    
+    writer = PaymentRecordWriter(
+        create_client(supabase_url, supabase_key),
+        spool_path=args.spool_path,
+        batch_size=args.batch_size
+    )
+    
+    count = writer.replay()
+    await writer.flush()
+    
+    stats = writer.stats()
+    logger.info(f"Replayed {count} records: {stats['written']} written, {stats['dead_lettered']} dead-lettered")
+    if stats["queued"]:
+        logger.error(f"Supabase is unreachable; {stats['queued']} records are still in {writer.spool_path}")
+        sys.exit(1)
+    if stats["dead_lettered"]:
+        logger.error(f"Some records could not be written, see {writer.dead_letter_path}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+Run a request execution worker.
+
+Claims payment_complete and ready_for_execution team change requests and
+executes them, with a concurrency cap per request type. Run as many worker
+processes as needed; they share the table through row claims and never
+execute the same request twice. Refuses to start unless
+app.settings.request_executor is 'worker' in the database, so the status
+triggers no longer execute requests too.
+Stops on SIGINT/SIGTERM after the requests it already claimed finish.
+
+Usage:
+    python run_request_worker.py [--type-limit TYPE=N ...] [--default-limit N]
+
+Options:
+    --worker-id       Name recorded in claimed_by (default: host-pid-random)
+    --request-type    Only execute this request type (repeatable; default: all)
+    --type-limit      Concurrency cap for one request type, as TYPE=N (repeatable)
+    --default-limit   Concurrency cap for types without --type-limit (default: 4)
+    --poll-interval   Seconds between polls while idle (default: 1.0)
+    --lease-seconds   How long a claim holds before another worker may retry it (default: 300)
+    --max-attempts    Claims per request before it is failed (default: 3)
+"""
+
+import os
+import sys
+import argparse
+import asyncio
+import json
+import logging
+import signal
+from dotenv import load_dotenv
+from supabase import create_client
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.payment_engine import get_payment_engine
+from services.payment_service import PaymentService
+from services.request_service import RequestService
+from services.request_worker import RequestExecutionWorker
+from services.supabase_data import SupabaseData
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+def parse_type_limit(value: str):
+    request_type, _, limit = value.partition("=")
+    if request_type not in RequestService.ACTION_TYPES or not limit.isdigit():
+        raise argparse.ArgumentTypeError(f"Expected TYPE=N with TYPE one of {', '.join(RequestService.ACTION_TYPES)}")
+    return request_type, int(limit)
+
+async def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description="Execute team change requests claimed from the database")
+    parser.add_argument("--worker-id", type=str, default=None, help="Name recorded in claimed_by")
+    parser.add_argument("--request-type", action="append", choices=RequestService.ACTION_TYPES, help="Only execute this request type (repeatable)")
+    parser.add_argument("--type-limit", action="append", type=parse_type_limit, default=[], help="Concurrency cap for one request type, as TYPE=N")
+    parser.add_argument("--default-limit", type=int, default=4, help="Concurrency cap for the other request types")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between polls while idle")
+    parser.add_argument("--lease-seconds", type=int, default=300, help="How long a claim holds")
+    parser.add_argument("--max-attempts", type=int, default=3, help="Claims per request before it is failed")
+
+    args = parser.parse_args()
+
+    supabase_url = os.getenv('SUPABASE_URL')
+    supabase_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+    if not supabase_url or not supabase_key:
+        logger.error("Missing required environment variables (SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY)")
+        sys.exit(1)
+
+    supabase_data = SupabaseData.from_env(supabase_url, supabase_key)
+    payment_engine = get_payment_engine()
+    request_service = RequestService(supabase_data, PaymentService(payment_engine, create_client(supabase_url, supabase_key)))
+    worker = RequestExecutionWorker(
+        supabase_data,
+        request_service,
+        worker_id=args.worker_id,
+        request_types=args.request_type,
+        type_limits=dict(args.type_limit),
+        default_limit=args.default_limit,
+        poll_interval=args.poll_interval,
+        lease_seconds=args.lease_seconds,
+        max_attempts=args.max_attempts
+    )
+
+    try:
+        await worker.check_executor_mode()
+    except Exception as e:
+        logger.error(f"Not starting: {str(e)}")
+        await payment_engine.aclose()
+        await supabase_data.aclose()
+        sys.exit(1)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    logger.info(f"Starting request worker {worker.worker_id} with limits {json.dumps(worker.type_limits)}")
+    worker.start()
+    try:
+        await stop.wait()
+        logger.info("Stopping: waiting for claimed requests to finish")
+        await worker.stop()
+    finally:
+        await payment_engine.aclose()
+        await supabase_data.aclose()
+
+    print(json.dumps(worker.stats(), indent=2))
+
+if __name__ == "__main__":
+    asyncio.run(main())
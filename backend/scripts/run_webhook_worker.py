@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""
+Run a webhook inbox worker.
+
+The Square webhook endpoint only stores each event in webhook_inbox and
+acknowledges it. This worker claims stored events in batches and processes
+them: payment status changes are applied to their team change requests.
+Run as many worker processes as needed; they share the inbox through row
+claims and never process the same event at the same time. Copies of an
+event Square delivered more than once are dropped by event_id. Failed events
+are retried with backoff and set aside as dead after --max-attempts.
+Stops on SIGINT/SIGTERM after the batch in hand finishes.
+
+Usage:
+    python run_webhook_worker.py [--batch-size N] [--concurrency N]
+
+Options:
+    --worker-id       Name recorded in claimed_by (default: host-pid-random)
+    --batch-size      Events claimed per poll (default: 50)
+    --concurrency     Events processed at the same time (default: 8)
+    --poll-interval   Seconds between polls while idle (default: 1.0)
+    --lease-seconds   How long a claim holds before another worker may retry it (default: 120)
+    --max-attempts    Attempts per event before it is dead (default: 5)
+    --retry-seconds   Delay before the first retry, doubled per attempt (default: 5)
+    --stats-interval  Seconds between stats log lines (default: 60)
+    --dedupe-entries  Event IDs remembered in memory (default: 10000)
+    --dedupe-hours    How long an event ID is remembered (default: 168)
+"""
+
+import os
+import sys
+import argparse
+import asyncio
+import json
+import logging
+import signal
+from dotenv import load_dotenv
+from supabase import create_client
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from routes.webhooks import dispatch_square_event
+from services.payment_engine import get_payment_engine
+from services.payment_service import PaymentService
+from services.request_service import RequestService
+from services.supabase_data import SupabaseData
+from services.webhook_dedupe import WebhookEventDeduper
+from services.webhook_inbox import WebhookInbox, WebhookInboxWorker
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+async def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description="Process Square webhook events stored in the webhook inbox")
+    parser.add_argument("--worker-id", type=str, default=None, help="Name recorded in claimed_by")
+    parser.add_argument("--batch-size", type=int, default=50, help="Events claimed per poll")
+    parser.add_argument("--concurrency", type=int, default=8, help="Events processed at the same time")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between polls while idle")
+    parser.add_argument("--lease-seconds", type=int, default=120, help="How long a claim holds")
+    parser.add_argument("--max-attempts", type=int, default=5, help="Attempts per event before it is dead")
+    parser.add_argument("--retry-seconds", type=int, default=5, help="Delay before the first retry")
+    parser.add_argument("--stats-interval", type=float, default=60.0, help="Seconds between stats log lines")
+    parser.add_argument("--dedupe-entries", type=int, default=10000, help="Event IDs remembered in memory")
+    parser.add_argument("--dedupe-hours", type=float, default=168.0, help="How long an event ID is remembered")
+
+    args = parser.parse_args()
+
+    supabase_url = os.getenv('SUPABASE_URL')
+    supabase_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+    if not supabase_url or not supabase_key:
+        logger.error("Missing required environment variables (SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY)")
+        sys.exit(1)
+
+    supabase_data = SupabaseData.from_env(supabase_url, supabase_key)
+    payment_engine = get_payment_engine()
+    request_service = RequestService(supabase_data, PaymentService(payment_engine, create_client(supabase_url, supabase_key)))
+    worker = WebhookInboxWorker(
+        WebhookInbox(supabase_data),
+        lambda payload: dispatch_square_event(payload, request_service),
+        worker_id=args.worker_id,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        poll_interval=args.poll_interval,
+        lease_seconds=args.lease_seconds,
+        max_attempts=args.max_attempts,
+        retry_base_seconds=args.retry_seconds,
+        lag_interval=args.stats_interval,
+        deduper=WebhookEventDeduper(
+            supabase_data,
+            max_entries=args.dedupe_entries,
+            ttl_seconds=int(args.dedupe_hours * 3600)
+        )
+    )
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    logger.info(f"Starting webhook worker {worker.worker_id} (batch {args.batch_size}, concurrency {args.concurrency})")
+    worker.start()
+    try:
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), args.stats_interval)
+            except asyncio.TimeoutError:
+                logger.info(f"Webhook worker stats: {json.dumps(worker.stats(), default=str)}")
+        logger.info("Stopping: waiting for the current batch to finish")
+        await worker.stop()
+    finally:
+        await payment_engine.aclose()
+        await supabase_data.aclose()
+
+    print(json.dumps(worker.stats(), indent=2, default=str))
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -24,8 +24,10 @@ logger = logging.getLogger(__name__)
 
 # Import Supabase client and other services
 from database import create_supabase_client
+from services.payment_engine import get_payment_engine
 from services.payment_service import PaymentService
 from services.request_service import RequestService
+from services.supabase_data import SupabaseData
 
 async def get_item_id(supabase, item_name):
     """Get item ID for a given item name"""
@@ -47,8 +49,8 @@ async def get_item_id(supabase, item_name):
 async def test_team_rebrand(args):
     """Test team rebrand request"""
     supabase = create_supabase_client()
-    payment_service = PaymentService(supabase)
-    request_service = RequestService(supabase, payment_service)
+    payment_service = PaymentService(get_payment_engine(), supabase)
+    request_service = RequestService(SupabaseData.from_env(os.environ["SUPABASE_URL"], os.environ["SUPABASE_ANON_KEY"]), payment_service)
     
     team_id = args.team_id
     user_id = args.user_id
@@ -125,8 +127,8 @@ async def test_team_rebrand(args):
 async def test_team_transfer(args):
     """Test team transfer request"""
     supabase = create_supabase_client()
-    payment_service = PaymentService(supabase)
-    request_service = RequestService(supabase, payment_service)
+    payment_service = PaymentService(get_payment_engine(), supabase)
+    request_service = RequestService(SupabaseData.from_env(os.environ["SUPABASE_URL"], os.environ["SUPABASE_ANON_KEY"]), payment_service)
     
     team_id = args.team_id
     user_id = args.user_id
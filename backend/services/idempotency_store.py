@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Callable, Awaitable
+
+from .outbound_guard import OutboundGuard, get_guard
+from .supabase_data import SupabaseData
+
+# Definer functions from supabase/migrations/20250512000000_payment_idempotency_functions.sql;
+# the table itself is closed to the API's key by row-level security
+GET_FUNCTION = "get_payment_idempotency_key"
+RECORD_FUNCTION = "record_payment_idempotency_key"
+
+
+class IdempotencyKeyReusedError(Exception):
+    """
+    Raised when an idempotency key comes back with different payment parameters
+    """
+
+
+class IdempotencyStore:
+    """
+    Remembers the result of each payment submission by idempotency key.
+
+    Lookups go to a bounded in-process LRU first and fall back to the
+    payment_idempotency_keys table through its definer functions, so a retried or double-clicked
+    submission gets the recorded result without another Square round trip.
+    Submissions that arrive while the first attempt is still running wait
+    on that attempt instead of starting their own. Failed attempts are not
+    recorded, so the client can retry them.
+    """
+    def __init__(self,
+                 supabase: Optional[SupabaseData],
+                 max_entries: int = 2048,
+                 ttl_seconds: int = 24 * 60 * 60,
+                 guard: Optional[OutboundGuard] = None):
+        self.supabase = supabase
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.guard = guard or get_guard("supabase")
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._counters = {
+            "hits": 0,
+            "durable_hits": 0,
+            "misses": 0,
+            "in_flight_waits": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "durable_errors": 0,
+        }
+        self.logger = logging.getLogger(__name__)
+
+    @staticmethod
+    def fingerprint(payment_data: Dict[str, Any]) -> str:
+        """
+        Hash of the parameters that must match for a key to be replayed
+        """
+        material = json.dumps(
+            [payment_data.get("source_id"), payment_data.get("amount"), payment_data.get("reference_id")],
+            default=str
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    async def run(self,
+                  key: str,
+                  fingerprint: str,
+                  operation: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        Return the recorded result for key, or run operation once and record it
+        """
+        cached = self._get_local(key)
+        if cached is not None:
+            self._counters["hits"] += 1
+            return self._checked(key, fingerprint, cached)
+
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            self._counters["in_flight_waits"] += 1
+            self.logger.info(f"Idempotency key {key} is already in flight, waiting for the first attempt")
+            stored_fingerprint, result = await asyncio.shield(pending)
+            return self._checked(key, fingerprint, (stored_fingerprint, result))
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            durable = await self._get_durable(key)
+            if durable is not None:
+                self._counters["durable_hits"] += 1
+                self._put_local(key, durable[0], durable[1])
+                future.set_result(durable)
+                return self._checked(key, fingerprint, durable)
+
+            self._counters["misses"] += 1
+            result = await operation()
+
+            self._put_local(key, fingerprint, result)
+            await self._put_durable(key, fingerprint, result)
+            future.set_result((fingerprint, result))
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+                # Nobody else may be waiting; mark the exception as retrieved
+                future.exception()
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+
+    def _checked(self, key: str, fingerprint: str, entry: tuple) -> Dict[str, Any]:
+        stored_fingerprint, result = entry
+        if stored_fingerprint and stored_fingerprint != fingerprint:
+            raise IdempotencyKeyReusedError(f"Idempotency key {key} was already used with different payment parameters")
+        self.logger.info(f"Returning recorded result for idempotency key {key}")
+        return result
+
+    def _get_local(self, key: str) -> Optional[tuple]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, fingerprint, result = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self._counters["expirations"] += 1
+            return None
+
+        self._entries.move_to_end(key)
+        return fingerprint, result
+
+    def _put_local(self, key: str, fingerprint: str, result: Dict[str, Any]):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, fingerprint, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    async def _get_durable(self, key: str) -> Optional[tuple]:
+        if self.supabase is None:
+            return None
+
+        try:
+            with self.guard.guarded():
+                response = await self.supabase.rpc(GET_FUNCTION, {"p_key": key}).execute()
+        except Exception as e:
+            self._counters["durable_errors"] += 1
+            self.logger.error(f"Error reading idempotency key {key}: {str(e)}")
+            return None
+
+        row = response.data
+        if isinstance(row, list):
+            row = row[0] if row else None
+        if not row:
+            return None
+        return row.get("fingerprint"), row.get("result")
+
+    async def _put_durable(self, key: str, fingerprint: str, result: Dict[str, Any]):
+        if self.supabase is None:
+            return
+
+        try:
+            with self.guard.guarded():
+                await self.supabase.rpc(RECORD_FUNCTION, {
+                    "p_key": key,
+                    "p_fingerprint": fingerprint,
+                    "p_result": result,
+                    "p_ttl_seconds": self.ttl_seconds,
+                }).execute()
+        except Exception as e:
+            # The in-process entry still protects this worker; log and move on
+            self._counters["durable_errors"] += 1
+            self.logger.error(f"Error recording idempotency key {key}: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Snapshot of the cache counters
+        """
+        lookups = self._counters["hits"] + self._counters["durable_hits"] + self._counters["misses"]
+        return {
+            **self._counters,
+            "entries": len(self._entries),
+            "in_flight": len(self._in_flight),
+            "hit_ratio": (self._counters["hits"] + self._counters["durable_hits"]) / lookups if lookups else 0.0,
+        }
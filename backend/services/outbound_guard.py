@@ -0,0 +1,279 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, Any, Optional, Callable
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class DependencyUnavailableError(Exception):
+    """
+    Raised instead of calling a dependency that is failing or saturated.
+    Routes turn it into a 503 with a Retry-After header.
+    """
+    def __init__(self, dependency: str, reason: str, retry_after: float = 1.0):
+        self.dependency = dependency
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(f"{dependency} is unavailable ({reason}), retry in {retry_after:.0f}s")
+
+
+def _any_exception(error: BaseException) -> bool:
+    return True
+
+
+class _Permit:
+    """
+    One admitted call; records its latency and outcome on exit
+    """
+    __slots__ = ("guard", "started", "probe")
+
+    def __init__(self, guard: "OutboundGuard", probe: bool):
+        self.guard = guard
+        self.probe = probe
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed_ms = (time.perf_counter() - self.started) * 1000
+        failed = exc is not None and self.guard.is_failure(exc)
+        self.guard._release(self, elapsed_ms, failed)
+        return False
+
+
+class OutboundGuard:
+    """
+    Circuit breaker and adaptive concurrency limit for one external dependency.
+
+    The breaker opens after failure_threshold consecutive failures, rejects
+    every call for open_seconds, then lets half_open_max_calls probes
+    through; a successful probe closes it again and a failed one re-opens it.
+
+    The concurrency limit follows AIMD: every call that finishes under
+    latency_target_ms grows the limit by roughly one per limit's worth of
+    calls, and a failure or a slow call shrinks it by backoff_ratio. Calls
+    beyond the limit are rejected straight away, so an overloaded
+    dependency produces fast 503s instead of a queue of stuck requests.
+
+        with guard.guarded():
+            payment = await gateway.create_payment(body)
+
+    is_failure decides which exceptions count against the dependency;
+    a declined card is an answer, not an outage.
+    """
+    def __init__(self,
+                 name: str,
+                 failure_threshold: int = 5,
+                 open_seconds: float = 30.0,
+                 half_open_max_calls: int = 1,
+                 initial_limit: int = 20,
+                 min_limit: int = 1,
+                 max_limit: int = 200,
+                 latency_target_ms: float = 1000.0,
+                 backoff_ratio: float = 0.9,
+                 is_failure: Optional[Callable[[BaseException], bool]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target_ms = latency_target_ms
+        self.backoff_ratio = backoff_ratio
+        self.is_failure = is_failure or _any_exception
+        self.clock = clock
+        self.logger = logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self._in_flight = 0
+        self._probes_in_flight = 0
+        self._consecutive_failures = 0
+        self._ewma_latency_ms = 0.0
+        self._counters = {
+            "admitted": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "slow": 0,
+            "rejected_open": 0,
+            "rejected_limit": 0,
+            "opened": 0,
+        }
+
+    @classmethod
+    def from_env(cls, name: str, **defaults) -> "OutboundGuard":
+        """
+        Build a guard whose settings can be overridden with <NAME>_GUARD_* variables
+        """
+        prefix = f"{name.upper()}_GUARD_"
+        settings = dict(defaults)
+        for key, cast in (("failure_threshold", int), ("open_seconds", float), ("initial_limit", int),
+                          ("min_limit", int), ("max_limit", int), ("latency_target_ms", float)):
+            value = os.environ.get(prefix + key.upper())
+            if value:
+                settings[key] = cast(value)
+        return cls(name, **settings)
+
+    # ------------- ADMISSION -------------
+    def guarded(self) -> _Permit:
+        """
+        Admit one call or raise DependencyUnavailableError
+        """
+        with self._lock:
+            probe = False
+            if self._state == OPEN:
+                remaining = self._opened_at + self.open_seconds - self.clock()
+                if remaining > 0:
+                    self._counters["rejected_open"] += 1
+                    raise DependencyUnavailableError(self.name, "circuit_open", remaining)
+                self._transition(HALF_OPEN)
+
+            if self._state == HALF_OPEN:
+                if self._probes_in_flight >= self.half_open_max_calls:
+                    self._counters["rejected_open"] += 1
+                    raise DependencyUnavailableError(self.name, "circuit_half_open", 1.0)
+                self._probes_in_flight += 1
+                probe = True
+            elif self._in_flight >= int(self._limit):
+                self._counters["rejected_limit"] += 1
+                raise DependencyUnavailableError(self.name, "concurrency_limit", 1.0)
+
+            self._in_flight += 1
+            self._counters["admitted"] += 1
+        return _Permit(self, probe)
+
+    def check(self):
+        """
+        Raise DependencyUnavailableError if a call would be rejected right now, without admitting one
+        """
+        with self._lock:
+            if self._state == OPEN:
+                remaining = self._opened_at + self.open_seconds - self.clock()
+                if remaining > 0:
+                    self._counters["rejected_open"] += 1
+                    raise DependencyUnavailableError(self.name, "circuit_open", remaining)
+            elif self._state == CLOSED and self._in_flight >= int(self._limit):
+                self._counters["rejected_limit"] += 1
+                raise DependencyUnavailableError(self.name, "concurrency_limit", 1.0)
+
+    # ------------- OUTCOMES -------------
+    def _release(self, permit: _Permit, elapsed_ms: float, failed: bool):
+        with self._lock:
+            self._in_flight -= 1
+            if permit.probe:
+                self._probes_in_flight -= 1
+            self._ewma_latency_ms = elapsed_ms if not self._ewma_latency_ms else 0.8 * self._ewma_latency_ms + 0.2 * elapsed_ms
+
+            slow = elapsed_ms > self.latency_target_ms
+            if failed:
+                self._counters["failed"] += 1
+                self._consecutive_failures += 1
+                self._decrease_limit()
+                if permit.probe or self._consecutive_failures >= self.failure_threshold:
+                    self._transition(OPEN)
+                return
+
+            self._counters["succeeded"] += 1
+            self._consecutive_failures = 0
+            if permit.probe:
+                self._transition(CLOSED)
+            if slow:
+                self._counters["slow"] += 1
+                self._decrease_limit()
+            else:
+                self._limit = min(self._limit + 1.0 / self._limit, float(self.max_limit))
+
+    def _decrease_limit(self):
+        self._limit = max(self._limit * self.backoff_ratio, float(self.min_limit))
+
+    def _transition(self, state: str):
+        if state == self._state:
+            if state == OPEN:
+                self._opened_at = self.clock()
+            return
+
+        self.logger.warning(f"Circuit for {self.name} moved from {self._state} to {state} (limit {int(self._limit)})")
+        self._state = state
+        if state == OPEN:
+            self._opened_at = self.clock()
+            self._counters["opened"] += 1
+        elif state == CLOSED:
+            self._consecutive_failures = 0
+
+    # ------------- INTROSPECTION -------------
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and self.clock() >= self._opened_at + self.open_seconds:
+                return HALF_OPEN
+            return self._state
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Snapshot of the breaker state, the current limit and the counters
+        """
+        state = self.state
+        with self._lock:
+            retry_after = max(self._opened_at + self.open_seconds - self.clock(), 0.0) if state == OPEN else 0.0
+            return {
+                "name": self.name,
+                "state": state,
+                "limit": int(self._limit),
+                "in_flight": self._in_flight,
+                "consecutive_failures": self._consecutive_failures,
+                "ewma_latency_ms": round(self._ewma_latency_ms, 2),
+                "latency_target_ms": self.latency_target_ms,
+                "retry_after_seconds": round(retry_after, 2),
+                **self._counters,
+            }
+
+
+def _square_failure(error: BaseException) -> bool:
+    # Declines and validation errors mean Square answered; only 5xx, 429 and transport errors count
+    from .square_gateway import SquareAPIError
+    if isinstance(error, SquareAPIError):
+        return error.status_code >= 500 or error.status_code == 429
+    return True
+
+
+def _supabase_failure(error: BaseException) -> bool:
+    # Constraint violations and bad filters come back as errors too; only count lost or timed out calls
+    import httpx
+    return isinstance(error, (httpx.TransportError, OSError))
+
+
+_guards: Dict[str, OutboundGuard] = {}
+_guards_lock = threading.Lock()
+
+_GUARD_DEFAULTS = {
+    "square": {"latency_target_ms": 2000.0, "initial_limit": 20, "max_limit": 100, "is_failure": _square_failure},
+    "supabase": {"latency_target_ms": 500.0, "initial_limit": 40, "max_limit": 200, "is_failure": _supabase_failure},
+}
+
+def get_guard(name: str) -> OutboundGuard:
+    """
+    Get or create the process-wide guard for a dependency
+    """
+    guard = _guards.get(name)
+    if guard is None:
+        with _guards_lock:
+            guard = _guards.get(name)
+            if guard is None:
+                guard = OutboundGuard.from_env(name, **_GUARD_DEFAULTS.get(name, {}))
+                _guards[name] = guard
+    return guard
+
+def all_guards() -> Dict[str, OutboundGuard]:
+    """
+    Every guard created so far, by dependency name
+    """
+    return dict(_guards)
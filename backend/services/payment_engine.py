@@ -0,0 +1,192 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Any, Optional
+
+from .outbound_guard import OutboundGuard, DependencyUnavailableError, get_guard
+from .square_gateway import SquareGateway, SquareAPIError
+
+
+@dataclass(frozen=True)
+class PaymentConfig:
+    """
+    Square settings, read from the environment once per process
+    """
+    access_token: Optional[str]
+    environment: str
+    location_id: Optional[str]
+    app_id: Optional[str]
+    timeout: float = 10.0
+    # Overrides the Square host, e.g. to point at tests/fake_square_server.py
+    base_url: Optional[str] = None
+
+    @classmethod
+    def from_env(cls) -> "PaymentConfig":
+        return cls(
+            access_token=os.environ.get("SQUARE_ACCESS_TOKEN"),
+            environment=os.environ.get("SQUARE_ENVIRONMENT", "sandbox"),
+            location_id=os.environ.get("SQUARE_LOCATION_ID"),
+            app_id=os.environ.get("SQUARE_APP_ID"),
+            timeout=float(os.environ.get("SQUARE_TIMEOUT_SECONDS", "10")),
+            base_url=os.environ.get("SQUARE_BASE_URL") or None,
+        )
+
+
+@lru_cache(maxsize=1)
+def get_payment_config() -> PaymentConfig:
+    """
+    Get the process-wide payment configuration
+    """
+    return PaymentConfig.from_env()
+
+
+class PaymentEngine:
+    """
+    The single hot path for charging cards through Square.
+
+    main.create_payment, PaymentService and SquarePaymentHandler all go
+    through charge()/charge_sync(), so body construction, timing and error
+    accounting happen in one place and share the gateway's warm connections.
+    Every call is admitted by the "square" OutboundGuard first, so a failing
+    or saturated Square raises DependencyUnavailableError straight away.
+    """
+    def __init__(self,
+                 config: PaymentConfig,
+                 gateway: Optional[SquareGateway] = None,
+                 guard: Optional[OutboundGuard] = None):
+        self.config = config
+        self.gateway = gateway or SquareGateway(
+            access_token=config.access_token,
+            environment=config.environment,
+            base_url=config.base_url,
+            timeout=config.timeout
+        )
+        self.guard = guard or get_guard("square")
+        self.logger = logging.getLogger(__name__)
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "charges": 0,
+            "succeeded": 0,
+            "declined": 0,
+            "errored": 0,
+            "rejected": 0,
+            "total_ms": 0.0,
+            "max_ms": 0.0,
+        }
+
+    def build_payment_body(self,
+                           source_id: str,
+                           amount: float,
+                           idempotency_key: Optional[str] = None,
+                           note: Optional[str] = None,
+                           reference_id: Optional[str] = None,
+                           currency: str = "USD") -> Dict[str, Any]:
+        """
+        Build a CreatePayment body; amount is in dollars
+        """
+        body = {
+            "source_id": source_id,
+            "amount_money": {
+                "amount": int(round(amount * 100)),  # Convert to cents
+                "currency": currency
+            },
+            "idempotency_key": idempotency_key or str(uuid.uuid4()),
+            "location_id": self.config.location_id
+        }
+
+        # Add optional fields if present
+        if note:
+            body["note"] = note
+        if reference_id:
+            body["reference_id"] = reference_id
+
+        return body
+
+    def _record(self, outcome: str, started: float, body: Dict[str, Any]):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            self._stats["charges"] += 1
+            self._stats[outcome] += 1
+            self._stats["total_ms"] += elapsed_ms
+            self._stats["max_ms"] = max(self._stats["max_ms"], elapsed_ms)
+        self.logger.info(
+            f"Square charge {outcome} in {elapsed_ms:.1f}ms "
+            f"(idempotency_key={body['idempotency_key']}, reference_id={body.get('reference_id')})"
+        )
+
+    async def charge(self, source_id: str, amount: float, timeout: Optional[float] = None, **options) -> Dict[str, Any]:
+        """
+        Charge a card and return the Square payment object.
+        Raises SquareAPIError when Square rejects the payment and
+        DependencyUnavailableError when the call is not admitted.
+        """
+        body = self.build_payment_body(source_id, amount, **options)
+        started = time.perf_counter()
+        try:
+            with self.guard.guarded():
+                payment = await self.gateway.create_payment(body, timeout=timeout)
+        except DependencyUnavailableError:
+            self._record("rejected", started, body)
+            raise
+        except SquareAPIError:
+            self._record("declined", started, body)
+            raise
+        except Exception:
+            self._record("errored", started, body)
+            raise
+        self._record("succeeded", started, body)
+        return payment
+
+    def charge_sync(self, source_id: str, amount: float, timeout: Optional[float] = None, **options) -> Dict[str, Any]:
+        """
+        Blocking variant of charge() for scripts and other sync callers
+        """
+        body = self.build_payment_body(source_id, amount, **options)
+        started = time.perf_counter()
+        try:
+            with self.guard.guarded():
+                payment = self.gateway.create_payment_sync(body, timeout=timeout)
+        except DependencyUnavailableError:
+            self._record("rejected", started, body)
+            raise
+        except SquareAPIError:
+            self._record("declined", started, body)
+            raise
+        except Exception:
+            self._record("errored", started, body)
+            raise
+        self._record("succeeded", started, body)
+        return payment
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Snapshot of the charge counters and latencies
+        """
+        with self._stats_lock:
+            snapshot = dict(self._stats)
+        snapshot["avg_ms"] = snapshot["total_ms"] / snapshot["charges"] if snapshot["charges"] else 0.0
+        return snapshot
+
+    async def aclose(self):
+        await self.gateway.aclose()
+
+
+_payment_engine: Optional[PaymentEngine] = None
+_payment_engine_lock = threading.Lock()
+
+def get_payment_engine() -> PaymentEngine:
+    """
+    Get or create the process-wide PaymentEngine
+    """
+    global _payment_engine
+
+    if _payment_engine is None:
+        with _payment_engine_lock:
+            if _payment_engine is None:
+                _payment_engine = PaymentEngine(get_payment_config())
+
+    return _payment_engine
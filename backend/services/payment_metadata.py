@@ -0,0 +1,66 @@
+import logging
+from typing import Dict, Any, Callable, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Mirrors the valid_metadata_structure CHECK constraint and the
+# validate_payment_metadata() trigger on public.payments
+# (supabase/migrations/20250308180601_violet_haze.sql): when metadata is not
+# NULL each section must be a JSON object holding the listed keys.
+PAYMENT_METADATA_RULES: Dict[str, Tuple[str, ...]] = {
+    "transaction_details": ("processor_response", "authorization_code"),
+    "payment_method": ("type", "last_four"),
+}
+
+_NO_ERRORS: Tuple[str, ...] = ()
+
+
+def compile_metadata_validator(rules: Dict[str, Sequence[str]]) -> Callable[[Any], Tuple[str, ...]]:
+    """
+    Build a validator for one set of rules; it returns the violations, or () when the metadata is valid
+    """
+    sections = tuple((name, frozenset(keys), tuple(keys)) for name, keys in rules.items())
+
+    def validate(metadata: Any) -> Tuple[str, ...]:
+        if metadata is None:
+            return _NO_ERRORS
+        if not isinstance(metadata, dict):
+            return ("metadata must be an object",)
+
+        errors = None
+        for name, required, ordered in sections:
+            section = metadata.get(name)
+            if not isinstance(section, dict):
+                problem = f"{name} must be an object"
+            elif not required <= section.keys():
+                problem = f"{name} is missing {', '.join(key for key in ordered if key not in section)}"
+            else:
+                continue
+            if errors is None:
+                errors = []
+            errors.append(problem)
+
+        return tuple(errors) if errors else _NO_ERRORS
+
+    return validate
+
+
+validate_payment_metadata = compile_metadata_validator(PAYMENT_METADATA_RULES)
+
+
+def prepare_payment_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Check a payments row's metadata before it leaves the process.
+
+    Metadata the database would reject is replaced with NULL, which the
+    constraint accepts, so the row goes out once instead of being bounced.
+    """
+    errors = validate_payment_metadata(row.get("metadata"))
+    if errors:
+        logger.warning(f"Dropping invalid metadata for payment {row.get('payment_id')}: {'; '.join(errors)}")
+        row = {**row, "metadata": None}
+    return row
+
+
+def is_valid_payment_metadata(metadata: Optional[Any]) -> bool:
+    return not validate_payment_metadata(metadata)
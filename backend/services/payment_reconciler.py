@@ -0,0 +1,283 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional, Iterable
+
+from supabase import Client as SupabaseClient
+
+from .payment_engine import PaymentEngine
+from .payment_metadata import prepare_payment_row
+from .payment_reference import decode_references
+from .payment_service import PaymentService
+from .request_states import FAILED, PAYMENT_COMPLETE, PENDING
+from .request_status import transition_request_statuses
+
+# Square payment statuses and the request status each one settles a pending request into
+PAID_PAYMENT_STATUSES = {"COMPLETED"}
+FAILED_PAYMENT_STATUSES = {"FAILED", "CANCELED"}
+RECONCILABLE_REQUEST_STATUS = PENDING
+PAID_REQUEST_STATUS = PAYMENT_COMPLETE
+FAILED_REQUEST_STATUS = FAILED
+# Definer functions for reconciliation_state, which row-level security closes to direct access
+GET_HIGH_WATER_MARK_FUNCTION = "get_reconciliation_high_water_mark"
+SAVE_HIGH_WATER_MARK_FUNCTION = "save_reconciliation_high_water_mark"
+
+
+def _chunks(values: List[Any], size: int) -> Iterable[List[Any]]:
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _isoformat(moment: datetime) -> str:
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class PaymentReconciler:
+    """
+    Catches team_change_requests and payments up with what Square recorded.
+
+    A run walks ListPayments for a time window page by page, bulk-loads the
+    matching payments and team_change_requests rows with a handful of IN
+    queries, diffs them in memory and writes the corrections back in
+    batches: one upsert per batch of missing payments rows and one
+    statement each for payment status and request status corrections.
+
+    Runs are incremental. The end of each successful window is stored as
+    the high-water mark in reconciliation_state (through definer functions,
+    as row-level security closes the table), and the next run starts
+    overlap_seconds before it so payments updated around the boundary are
+    seen twice rather than not at all.
+    """
+    def __init__(self,
+                 supabase: SupabaseClient,
+                 payment_engine: PaymentEngine,
+                 state_name: str = "square_payments",
+                 page_size: int = 100,
+                 batch_size: int = 100,
+                 overlap_seconds: int = 15 * 60,
+                 initial_lookback_seconds: int = 24 * 60 * 60):
+        self.supabase = supabase
+        self.payment_engine = payment_engine
+        self.state_name = state_name
+        self.page_size = page_size
+        self.batch_size = batch_size
+        self.overlap_seconds = overlap_seconds
+        self.initial_lookback_seconds = initial_lookback_seconds
+        self.logger = logging.getLogger(__name__)
+
+    # ------------- HIGH-WATER MARK -------------
+    def get_high_water_mark(self) -> Optional[datetime]:
+        """
+        End of the last fully reconciled window, if there has been one
+        """
+        response = self.supabase.rpc(GET_HIGH_WATER_MARK_FUNCTION, {"p_name": self.state_name}).execute()
+        if hasattr(response, 'error') and response.error is not None:
+            raise Exception(f"Failed to read reconciliation high-water mark: {response.error}")
+        if not response.data:
+            return None
+        return datetime.fromisoformat(response.data.replace("Z", "+00:00"))
+
+    def _save_high_water_mark(self, end_time: datetime, stats: Dict[str, Any]):
+        response = self.supabase.rpc(SAVE_HIGH_WATER_MARK_FUNCTION, {
+            "p_name": self.state_name,
+            "p_high_water_mark": end_time.isoformat(),
+            "p_stats": stats
+        }).execute()
+        if hasattr(response, 'error') and response.error is not None:
+            raise Exception(f"Failed to store reconciliation high-water mark: {response.error}")
+
+    # ------------- RUN -------------
+    async def run(self,
+                  begin_time: Optional[datetime] = None,
+                  end_time: Optional[datetime] = None,
+                  dry_run: bool = False) -> Dict[str, Any]:
+        """
+        Reconcile one window and return the counters for it.
+        Without begin_time the window starts at the stored high-water mark.
+        """
+        end_time = end_time or datetime.now(timezone.utc)
+        if begin_time is None:
+            high_water_mark = self.get_high_water_mark()
+            if high_water_mark is not None:
+                begin_time = high_water_mark - timedelta(seconds=self.overlap_seconds)
+            else:
+                begin_time = end_time - timedelta(seconds=self.initial_lookback_seconds)
+
+        self.logger.info(f"Reconciling Square payments from {_isoformat(begin_time)} to {_isoformat(end_time)}")
+        stats = {
+            "begin_time": begin_time.isoformat(),
+            "end_time": end_time.isoformat(),
+            "pages": 0,
+            "square_payments": 0,
+            "payments_inserted": 0,
+            "payment_statuses_corrected": 0,
+            "requests_paid": 0,
+            "requests_failed": 0,
+            "requests_skipped": 0,
+            "unmatched_payments": 0,
+            "dry_run": dry_run,
+        }
+
+        square_payments = await self._list_payments(begin_time, end_time, stats)
+        if square_payments:
+            payment_rows = self._load_payment_rows([payment["id"] for payment in square_payments])
+            request_rows = self._load_request_rows(square_payments)
+            plan = self.diff(square_payments, payment_rows, request_rows)
+            stats["unmatched_payments"] = len(plan["unmatched"])
+
+            if dry_run:
+                stats["payments_inserted"] = len(plan["payment_inserts"])
+                stats["payment_statuses_corrected"] = len(plan["payment_status_corrections"])
+                stats["requests_paid"] = sum(1 for c in plan["request_corrections"] if c["status"] == PAID_REQUEST_STATUS)
+                stats["requests_failed"] = sum(1 for c in plan["request_corrections"] if c["status"] == FAILED_REQUEST_STATUS)
+            else:
+                self._apply(plan, stats)
+
+        if not dry_run:
+            self._save_high_water_mark(end_time, stats)
+
+        self.logger.info(f"Reconciliation finished: {stats}")
+        return stats
+
+    async def _list_payments(self, begin_time: datetime, end_time: datetime, stats: Dict[str, Any]) -> List[Dict[str, Any]]:
+        payments: Dict[str, Dict[str, Any]] = {}
+        cursor = None
+        while True:
+            with self.payment_engine.guard.guarded():
+                page = await self.payment_engine.gateway.list_payments(
+                    begin_time=_isoformat(begin_time),
+                    end_time=_isoformat(end_time),
+                    cursor=cursor,
+                    limit=self.page_size
+                )
+            stats["pages"] += 1
+            for payment in page.get("payments", []):
+                payments[payment["id"]] = payment
+            cursor = page.get("cursor")
+            if not cursor:
+                break
+
+        stats["square_payments"] = len(payments)
+        return list(payments.values())
+
+    # ------------- BULK LOADS -------------
+    def _select_in(self, table: str, columns: str, column: str, values: List[Any]) -> List[Dict[str, Any]]:
+        rows = []
+        for chunk in _chunks(sorted(set(values)), self.batch_size):
+            response = self.supabase.table(table).select(columns).in_(column, chunk).execute()
+            if hasattr(response, 'error') and response.error is not None:
+                raise Exception(f"Failed to load {table} rows: {response.error}")
+            rows.extend(response.data or [])
+        return rows
+
+    def _load_payment_rows(self, payment_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        rows = self._select_in("payments", "payment_id, status", "payment_id", payment_ids)
+        return {row["payment_id"]: row for row in rows}
+
+    def _load_request_rows(self, square_payments: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        decoded = decode_references(payment.get("reference_id") for payment in square_payments)
+        request_ids = [request_id for request_id in dict.fromkeys(decoded.values()) if request_id]
+        columns = "id, status, request_type, requested_by, payment_reference"
+        rows = self._select_in("team_change_requests", columns, "id", request_ids) if request_ids else []
+        rows += self._select_in("team_change_requests", columns, "payment_reference",
+                                [payment["id"] for payment in square_payments])
+        return {row["id"]: row for row in rows}
+
+    # ------------- DIFF -------------
+    def diff(self,
+             square_payments: List[Dict[str, Any]],
+             payment_rows: Dict[str, Dict[str, Any]],
+             request_rows: Dict[str, Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Work out the corrections for one window without touching the database
+        """
+        requests_by_reference = {
+            row["payment_reference"]: row for row in request_rows.values() if row.get("payment_reference")
+        }
+        payment_inserts = []
+        payment_status_corrections = []
+        unmatched = []
+        settled: Dict[str, Dict[str, Any]] = {}
+        decoded = decode_references(payment.get("reference_id") for payment in square_payments)
+
+        for payment in square_payments:
+            request_id = decoded.get(payment.get("reference_id"))
+            request = request_rows.get(request_id) if request_id else None
+            request = request or requests_by_reference.get(payment["id"])
+            if request is None:
+                unmatched.append(payment["id"])
+
+            row = payment_rows.get(payment["id"])
+            if row is None:
+                # Rows need an owner, so only payments we can tie to a request are backfilled
+                if request is not None and payment.get("status") in PAID_PAYMENT_STATUSES:
+                    record = PaymentService.build_payment_record({
+                        "source_id": payment.get("source_type"),
+                        "location_id": payment.get("location_id"),
+                        **payment
+                    })
+                    record["user_id"] = request["requested_by"]
+                    record["payment_method"] = (payment.get("source_type") or "card").lower()
+                    payment_inserts.append(prepare_payment_row(record))
+            elif row.get("status") != payment.get("status"):
+                payment_status_corrections.append({"payment_id": payment["id"], "status": payment.get("status")})
+
+            if request is None or request.get("status") != RECONCILABLE_REQUEST_STATUS:
+                continue
+
+            # A request can have a failed attempt and then a successful one; the success wins
+            status = payment.get("status")
+            current = settled.get(request["id"])
+            if status in PAID_PAYMENT_STATUSES:
+                settled[request["id"]] = {"status": PAID_REQUEST_STATUS, "payment": payment}
+            elif status in FAILED_PAYMENT_STATUSES and current is None:
+                settled[request["id"]] = {"status": FAILED_REQUEST_STATUS, "payment": payment}
+
+        request_corrections = [
+            {
+                "id": request_id,
+                "status": outcome["status"],
+                "expected_status": [RECONCILABLE_REQUEST_STATUS],
+                "payment_reference": outcome["payment"]["id"],
+                "metadata": {
+                    "reconciliation": {
+                        "payment_id": outcome["payment"]["id"],
+                        "payment_status": outcome["payment"].get("status"),
+                        "reconciled_at": datetime.now(timezone.utc).isoformat()
+                    }
+                }
+            }
+            for request_id, outcome in settled.items()
+        ]
+
+        return {
+            "payment_inserts": payment_inserts,
+            "payment_status_corrections": payment_status_corrections,
+            "request_corrections": request_corrections,
+            "unmatched": unmatched,
+        }
+
+    # ------------- APPLY -------------
+    def _apply(self, plan: Dict[str, List[Dict[str, Any]]], stats: Dict[str, Any]):
+        for batch in _chunks(plan["payment_inserts"], self.batch_size):
+            response = self.supabase.table("payments") \
+                .upsert(batch, on_conflict="payment_id", ignore_duplicates=True) \
+                .execute()
+            if hasattr(response, 'error') and response.error is not None:
+                raise Exception(f"Failed to insert reconciled payments: {response.error}")
+            stats["payments_inserted"] += len(batch)
+
+        for batch in _chunks(plan["payment_status_corrections"], self.batch_size):
+            response = self.supabase.rpc("apply_payment_status_corrections", {"p_corrections": batch}).execute()
+            if hasattr(response, 'error') and response.error is not None:
+                raise Exception(f"Failed to correct payment statuses: {response.error}")
+            stats["payment_statuses_corrected"] += response.data or 0
+
+        # Every request correction goes out as one guarded bulk transition per batch;
+        # rows that moved on since they were loaded are skipped by the expected_status check
+        outcome = transition_request_statuses(self.supabase, plan["request_corrections"], batch_size=self.batch_size)
+        for row in outcome["transitioned"]:
+            if row["status"] == PAID_REQUEST_STATUS:
+                stats["requests_paid"] += 1
+            elif row["status"] == FAILED_REQUEST_STATUS:
+                stats["requests_failed"] += 1
+        stats["requests_skipped"] += len(outcome["skipped"])
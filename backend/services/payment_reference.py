@@ -0,0 +1,103 @@
+import re
+from datetime import date
+from typing import Dict, Iterable, NamedTuple, Optional
+
+# ------------- FORMATS -------------
+# "1002-98ddd206fe9b46c79e562625080a86fb": item ID, then the request UUID without hyphens.
+# Built the same way by the frontend (RequestService.ts, TeamActionProcessor.tsx).
+ITEM_FORMAT = "item"
+# "03222025-1002-aab75524-ecac78cd-98ddd206": MMDDYYYY, item ID, then three 8-hex segments.
+# No longer produced; the segments are too short to recover the request UUID from.
+LEGACY_DATE_FORMAT = "legacy_date"
+# A bare request UUID, with or without hyphens
+UUID_FORMAT = "uuid"
+
+_ITEM_RE = re.compile(r"([^-]+)-([0-9a-fA-F]{32})")
+_LEGACY_DATE_RE = re.compile(r"(\d{8})-([^-]+)-([0-9a-fA-F]{8})-([0-9a-fA-F]{8})-([0-9a-fA-F]{8})")
+_CANONICAL_UUID_RE = re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}")
+_UUID_RE = re.compile(
+    r"(?:urn:uuid:)?\{?([0-9a-fA-F]{8})-?([0-9a-fA-F]{4})-?([0-9a-fA-F]{4})-?([0-9a-fA-F]{4})-?([0-9a-fA-F]{12})\}?"
+)
+# A hyphenated UUID anywhere in free text, such as a payment note
+_NOTE_UUID_RE = _CANONICAL_UUID_RE
+
+
+class PaymentReference(NamedTuple):
+    format: str
+    request_id: Optional[str]
+    item_id: Optional[str] = None
+    created_on: Optional[date] = None
+
+
+def _uuid_from_hex(hex_id: str) -> str:
+    hex_id = hex_id.lower()
+    return f"{hex_id[0:8]}-{hex_id[8:12]}-{hex_id[12:16]}-{hex_id[16:20]}-{hex_id[20:]}"
+
+
+def encode_reference(item_id: str, request_id: str) -> str:
+    """
+    The Square reference_id for a request's payment: "<item_id>-<request UUID without hyphens>"
+    """
+    if "-" in str(item_id):
+        raise ValueError(f"Item ID cannot contain '-': {item_id}")
+    match = _UUID_RE.fullmatch(request_id or "")
+    if match is None:
+        raise ValueError(f"Request ID is not a UUID: {request_id}")
+    return f"{item_id}-{''.join(match.groups()).lower()}"
+
+
+def decode_reference(reference_id: Optional[str]) -> Optional[PaymentReference]:
+    """
+    Parse any reference format we have issued; None when it is none of them
+    """
+    if not reference_id:
+        return None
+
+    match = _ITEM_RE.fullmatch(reference_id)
+    if match is not None:
+        return PaymentReference(ITEM_FORMAT, _uuid_from_hex(match.group(2)), match.group(1))
+
+    if _CANONICAL_UUID_RE.fullmatch(reference_id) is not None:
+        return PaymentReference(UUID_FORMAT, reference_id.lower())
+    match = _UUID_RE.fullmatch(reference_id)
+    if match is not None:
+        return PaymentReference(UUID_FORMAT, _uuid_from_hex("".join(match.groups())))
+
+    match = _LEGACY_DATE_RE.fullmatch(reference_id)
+    if match is not None:
+        stamp = match.group(1)
+        try:
+            created_on = date(int(stamp[4:]), int(stamp[:2]), int(stamp[2:4]))
+        except ValueError:
+            return None
+        return PaymentReference(LEGACY_DATE_FORMAT, None, match.group(2), created_on)
+    return None
+
+
+def extract_request_id_from_reference(reference_id: Optional[str]) -> Optional[str]:
+    """
+    The request UUID a Square reference_id points at, or None
+    """
+    reference = decode_reference(reference_id)
+    return reference.request_id if reference is not None else None
+
+
+def decode_references(reference_ids: Iterable[Optional[str]]) -> Dict[str, Optional[str]]:
+    """
+    Request UUID for each distinct reference_id, for reconciling a page of payments at once
+    """
+    decoded: Dict[str, Optional[str]] = {}
+    for reference_id in reference_ids:
+        if reference_id and reference_id not in decoded:
+            decoded[reference_id] = extract_request_id_from_reference(reference_id)
+    return decoded
+
+
+def find_request_id_in_note(note: Optional[str]) -> Optional[str]:
+    """
+    The first UUID written in a payment note, or None
+    """
+    if not note:
+        return None
+    match = _NOTE_UUID_RE.search(note)
+    return match.group(0).lower() if match is not None else None
@@ -1,19 +1,48 @@
-from square.client import Client
 from supabase import Client as SupabaseClient
+import asyncio
 import logging
+import time
 from datetime import datetime
 import json
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from .idempotency_store import IdempotencyKeyReusedError, IdempotencyStore
+from .payment_metadata import is_valid_payment_metadata, prepare_payment_row
+from .payment_engine import PaymentEngine
+from .payment_writer import PaymentRecordWriter
+from .outbound_guard import DependencyUnavailableError
+from .square_gateway import SquareAPIError
 
 class PaymentService:
-    def __init__(self, square_client: Client, supabase: SupabaseClient, square_location_id: str, square_app_id: str):
-        self.square_client = square_client
+    def __init__(self,
+                 payment_engine: PaymentEngine,
+                 supabase: SupabaseClient,
+                 idempotency_store: Optional[IdempotencyStore] = None,
+                 payment_writer: Optional[PaymentRecordWriter] = None):
+        self.payment_engine = payment_engine
         self.supabase = supabase
-        self.square_location_id = square_location_id
-        self.square_app_id = square_app_id
+        self.idempotency_store = idempotency_store
+        self.payment_writer = payment_writer
+        self.square_location_id = payment_engine.config.location_id
+        self.square_app_id = payment_engine.config.app_id
+        self._batch_tasks = set()
         self.logger = logging.getLogger(__name__)
 
     async def process_payment(self, payment_data: dict) -> dict:
         print("[Backend] PaymentService.process_payment received reference_id:", payment_data.get("reference_id"))
+        idempotency_key = payment_data.get("idempotency_key")
+        
+        # Replay the recorded result for client-supplied keys we have already seen
+        if self.idempotency_store and idempotency_key:
+            return await self.idempotency_store.run(
+                idempotency_key,
+                IdempotencyStore.fingerprint(payment_data),
+                lambda: self._process_payment(payment_data)
+            )
+        
+        return await self._process_payment(payment_data)
+
+    async def _process_payment(self, payment_data: dict) -> dict:
         try:
             # Log the payment request
             self.logger.info(f"Processing payment: amount={payment_data['amount']}, reference={payment_data.get('reference_id')}")
@@ -30,56 +59,122 @@ class PaymentService:
                 # So we continue without re-raising
             
             # Format the response for the frontend
-            formatted_result = {
-                "id": payment_result.get("id", "unknown"),
-                "status": payment_result.get("status", "COMPLETED"),
-                "receiptUrl": payment_result.get("receipt_url"),
-                "amount": payment_data["amount"],
-                "created_at": payment_result.get("created_at"),
-                "card_details": payment_result.get("card_details", {})
-            }
-            
-            return formatted_result
+            return self.format_payment_result(payment_result, payment_data)
             
         except Exception as e:
             self.logger.error(f"Payment processing error: {str(e)}")
             raise
 
+    @staticmethod
+    def format_payment_result(payment_result: dict, payment_data: dict) -> dict:
+        """
+        Shape a Square payment for the frontend
+        """
+        return {
+            "id": payment_result.get("id", "unknown"),
+            "status": payment_result.get("status", "COMPLETED"),
+            "receiptUrl": payment_result.get("receipt_url"),
+            "amount": payment_data["amount"],
+            "created_at": payment_result.get("created_at"),
+            "card_details": payment_result.get("card_details", {})
+        }
+
+    # ------------- BATCH CHARGES -------------
+    async def process_payment_batch(self, charges: List[dict], max_concurrency: int = 5) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Charge many payments with at most max_concurrency in flight.
+
+        Yields one result per charge as soon as it finishes, then a final
+        {"summary": ...} once the payments rows for the whole batch have been
+        written with one multi-row insert. The batch runs in its own task, so
+        a caller that stops reading does not abandon charges already sent to
+        Square or the rows that record them.
+        """
+        results: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(self._run_payment_batch(charges, max(1, max_concurrency), results))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+
+        while True:
+            item = await results.get()
+            yield item
+            if "summary" in item:
+                return
+
+    async def _run_payment_batch(self, charges: List[dict], max_concurrency: int, results: asyncio.Queue):
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(max_concurrency)
+        rows: List[Dict[str, Any]] = []
+        counts = {"succeeded": 0, "failed": 0}
+
+        async def charge_one(payment_data: dict) -> dict:
+            payment_result = await self.create_square_payment(payment_data)
+            rows.append(prepare_payment_row(self.build_payment_record(payment_result)))
+            return self.format_payment_result(payment_result, payment_data)
+
+        async def run(index: int, payment_data: dict):
+            async with semaphore:
+                item: Dict[str, Any] = {"index": index, "referenceId": payment_data.get("reference_id")}
+                try:
+                    idempotency_key = payment_data.get("idempotency_key")
+                    if self.idempotency_store and idempotency_key:
+                        # A replayed charge was stored by the request that made it
+                        payment = await self.idempotency_store.run(
+                            idempotency_key,
+                            IdempotencyStore.fingerprint(payment_data),
+                            lambda: charge_one(payment_data)
+                        )
+                    else:
+                        payment = await charge_one(payment_data)
+                    item.update(success=True, payment=payment)
+                    counts["succeeded"] += 1
+                except Exception as e:
+                    if isinstance(e, IdempotencyKeyReusedError):
+                        error_type = "idempotency_key_reused"
+                    elif isinstance(e, DependencyUnavailableError):
+                        error_type = "dependency_unavailable"
+                    else:
+                        error_type = "payment_failed"
+                    self.logger.warning(f"Batch charge {index} failed: {str(e)}")
+                    item.update(success=False, error={"type": error_type, "message": str(e)})
+                    counts["failed"] += 1
+            await results.put(item)
+
+        summary: Dict[str, Any] = {"total": len(charges), "stored": 0}
+        try:
+            await asyncio.gather(*(run(index, payment_data) for index, payment_data in enumerate(charges)))
+            summary["stored"] = await self.store_payment_records(rows)
+        except Exception as e:
+            self.logger.error(f"Payment batch failed: {str(e)}", exc_info=True)
+            summary["error"] = str(e)
+        finally:
+            summary.update(counts)
+            summary["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            self.logger.info(f"Payment batch finished: {summary}")
+            await results.put({"summary": summary})
+
     async def create_square_payment(self, payment_data: dict) -> dict:
         try:
             # Extract the original metadata if provided
             original_metadata = payment_data.get("metadata", {})
             
-            body = {
-                "source_id": payment_data["source_id"],
-                "amount_money": {
-                    "amount": int(payment_data["amount"] * 100),  # Convert to cents
-                    "currency": "USD"
-                },
-                "idempotency_key": payment_data["idempotency_key"],
-                "location_id": self.square_location_id
-            }
-
-            # Add optional fields if present
-            if payment_data.get("note"):
-                body["note"] = payment_data["note"]
-            if payment_data.get("reference_id"):
-                body["reference_id"] = payment_data["reference_id"]
-            
-            # Make the Square API call
-            self.logger.info(f"Calling Square API with body: {json.dumps(body, default=str)}")
-            result = self.square_client.payments.create_payment(body)
-            
-            if not result.is_success():
-                errors = result.errors
-                self.logger.error(f"Square payment failed: {errors}")
+            self.logger.info(f"Calling Square API for reference_id: {payment_data.get('reference_id')}")
+            try:
+                payment = await self.payment_engine.charge(
+                    payment_data["source_id"],
+                    payment_data["amount"],
+                    idempotency_key=payment_data.get("idempotency_key"),
+                    note=payment_data.get("note"),
+                    reference_id=payment_data.get("reference_id")
+                )
+            except SquareAPIError as api_error:
+                self.logger.error(f"Square payment failed: {api_error.errors}")
                 error_details = []
-                for error in errors:
+                for error in api_error.errors:
                     error_details.append(f"{error.get('category')}: {error.get('detail')}")
                 
                 raise Exception(f"Square payment failed: {', '.join(error_details)}")
             
-            payment = result.body.get("payment", {})
             self.logger.info(f"Square payment successful, ID: {payment.get('id')}")
             
             # Add the original metadata to the result so we can access it when storing the payment
@@ -87,16 +182,7 @@ class PaymentService:
             
             # Log information about the metadata for debugging
             if original_metadata:
-                # Check if the metadata has the proper structure
-                has_valid_structure = (
-                    isinstance(original_metadata, dict) and
-                    "transaction_details" in original_metadata and
-                    "payment_method" in original_metadata and
-                    isinstance(original_metadata["transaction_details"], dict) and
-                    isinstance(original_metadata["payment_method"], dict)
-                )
-                
-                if has_valid_structure:
+                if is_valid_payment_metadata(original_metadata):
                     self.logger.info("Received well-formed metadata structure from frontend")
                 else:
                     self.logger.warning("Metadata received but does not have the required structure")
@@ -109,59 +195,73 @@ class PaymentService:
             self.logger.error(f"Error creating Square payment: {str(e)}")
             raise
 
-    async def store_payment_record(self, payment_result: dict) -> None:
-        try:
-            # Check if original_metadata was passed from the frontend
-            original_metadata = payment_result.get("original_metadata", {})
-            
-            # Extract card details if available
-            card_details = payment_result.get("card_details", {})
-            card = card_details.get("card", {})
-            card_brand = card.get("card_brand", "UNKNOWN")
-            last_four = card.get("last_4", "0000")
-            
-            # Create a guaranteed valid metadata structure based on our database requirements
-            metadata = {
-                "transaction_details": {
-                    "processor_response": payment_result.get("id", f"square-{datetime.now().timestamp()}"),
-                    "authorization_code": payment_result.get("id", f"auth-{datetime.now().timestamp()}")
-                },
-                "payment_method": {
-                    "type": card_brand.lower() if card_brand else "square",
-                    "last_four": last_four
-                }
+    @staticmethod
+    def build_payment_record(payment_result: dict) -> dict:
+        """
+        Build a payments row from a Square payment object
+        """
+        # Check if original_metadata was passed from the frontend
+        original_metadata = payment_result.get("original_metadata", {})
+        
+        # Extract card details if available
+        card_details = payment_result.get("card_details", {})
+        card = card_details.get("card", {})
+        card_brand = card.get("card_brand", "UNKNOWN")
+        last_four = card.get("last_4", "0000")
+        
+        # Create a guaranteed valid metadata structure based on our database requirements
+        metadata = {
+            "transaction_details": {
+                "processor_response": payment_result.get("id", f"square-{datetime.now().timestamp()}"),
+                "authorization_code": payment_result.get("id", f"auth-{datetime.now().timestamp()}")
+            },
+            "payment_method": {
+                "type": card_brand.lower() if card_brand else "square",
+                "last_four": last_four
             }
+        }
+        
+        # Add team ID and event data if available in original metadata
+        if original_metadata:
+            # Try both camelCase and snake_case versions
+            team_id = original_metadata.get("team_id") or original_metadata.get("teamId")
+            event_id = original_metadata.get("event_id") or original_metadata.get("eventId")
+            event_type = original_metadata.get("event_type") or original_metadata.get("type")
             
-            # Add team ID and event data if available in original metadata
-            if original_metadata:
-                # Try both camelCase and snake_case versions
-                team_id = original_metadata.get("team_id") or original_metadata.get("teamId")
-                event_id = original_metadata.get("event_id") or original_metadata.get("eventId")
-                event_type = original_metadata.get("event_type") or original_metadata.get("type")
-                
-                if team_id:
-                    metadata["team_id"] = team_id
-                if event_id:
-                    metadata["event_id"] = event_id
-                if event_type:
-                    metadata["event_type"] = event_type
-            
+            if team_id:
+                metadata["team_id"] = team_id
+            if event_id:
+                metadata["event_id"] = event_id
+            if event_type:
+                metadata["event_type"] = event_type
+        
+        return {
+            "payment_id": payment_result["id"],
+            "amount": float(payment_result["amount_money"]["amount"]) / 100,  # Convert back to dollars
+            "currency": payment_result["amount_money"]["currency"],
+            "status": payment_result["status"],
+            "source_id": payment_result["source_id"],
+            "location_id": payment_result["location_id"],
+            "created_at": datetime.now().isoformat(),
+            "metadata": metadata,
+            "reference_id": payment_result.get("reference_id")
+        }
+
+    async def store_payment_record(self, payment_result: dict) -> None:
+        try:
             # Store in payments table
-            payment_data = {
-                "payment_id": payment_result["id"],
-                "amount": float(payment_result["amount_money"]["amount"]) / 100,  # Convert back to dollars
-                "currency": payment_result["amount_money"]["currency"],
-                "status": payment_result["status"],
-                "source_id": payment_result["source_id"],
-                "location_id": payment_result["location_id"],
-                "created_at": datetime.now().isoformat(),
-                "metadata": metadata,
-                "reference_id": payment_result.get("reference_id")
-            }
+            payment_data = prepare_payment_row(self.build_payment_record(payment_result))
+            metadata = payment_data["metadata"]
 
             # Log the exact metadata we're using
             self.logger.info(f"Using validated metadata structure: {json.dumps(metadata, default=str)}")
             
+            # Hand the row to the write-behind queue so checkout doesn't wait on the insert
+            if self.payment_writer is not None:
+                spool_id = await self.payment_writer.submit(payment_data)
+                self.logger.info(f"Queued payment record {payment_data['payment_id']} for storage (spool ID: {spool_id})")
+                return
+            
             # Insert into Supabase
             self.logger.info(f"Storing payment in Supabase")
             result = self.supabase.table("payments").insert(payment_data).execute()
@@ -176,4 +276,21 @@ class PaymentService:
             self.logger.error(f"Database error: {str(e)}")
             # Don't raise here - payment was successful, storage failure shouldn't affect the user
             # But log it for monitoring
-            self.logger.error("Failed to store payment record in database")
\ No newline at end of file
+            self.logger.error("Failed to store payment record in database")
+
+    async def store_payment_records(self, rows: List[Dict[str, Any]]) -> int:
+        """
+        Write already prepared payments rows with one multi-row insert
+        """
+        if not rows:
+            return 0
+        if self.payment_writer is not None:
+            return await self.payment_writer.write_many(rows)
+
+        result = await asyncio.to_thread(
+            lambda: self.supabase.table("payments").upsert(rows, on_conflict="payment_id", ignore_duplicates=True).execute()
+        )
+        if hasattr(result, 'error') and result.error is not None:
+            raise Exception(f"Failed to store payment records: {result.error}")
+        self.logger.info(f"Stored {len(rows)} payment records in one insert")
+        return len(rows)
@@ -0,0 +1,419 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import uuid
+from typing import Dict, Any, List, Optional
+
+import httpx
+from postgrest.exceptions import APIError
+from supabase import Client as SupabaseClient
+
+from .outbound_guard import DependencyUnavailableError, OutboundGuard, get_guard
+
+# Longest wait between flushes while Supabase is unreachable
+MAX_OUTAGE_BACKOFF_SECONDS = 30.0
+MIN_OUTAGE_BACKOFF_SECONDS = 0.1
+# PostgREST could not reach the database (PGRST000-003), or Postgres lost the connection (class 08)
+_UNREACHABLE_CODES = ("PGRST000", "PGRST001", "PGRST002", "PGRST003")
+_UNREACHABLE_SQLSTATE_PREFIXES = ("08", "57P")
+
+
+def _is_outage(error: BaseException) -> bool:
+    """
+    Whether error says Supabase could not be reached, as opposed to it rejecting the rows
+    """
+    if isinstance(error, (DependencyUnavailableError, httpx.TransportError)):
+        return True
+    if isinstance(error, APIError):
+        code = str(error.code or "")
+        # A gateway error page has no JSON body, so the code is the HTTP status
+        if code.isdigit() and len(code) == 3:
+            return code.startswith("5")
+        return code in _UNREACHABLE_CODES or code.startswith(_UNREACHABLE_SQLSTATE_PREFIXES)
+    return False
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running under another user
+        return True
+    return True
+
+
+class PaymentRecordWriter:
+    """
+    Write-behind persistence for rows in the payments table.
+
+    submit() appends the row to a local append-only spool file and returns
+    straight away; a background task then writes queued rows to Supabase in
+    multi-row batches, flushing when batch_size rows are waiting or every
+    flush_interval seconds. A row is only dropped from the spool once its
+    batch is acknowledged, so rows written before a crash are picked up by
+    replay() on the next start. Spool writes and their fsync run in a
+    worker thread, off the event loop.
+
+    Each process has its own spool next to spool_path, named after its pid
+    (payments.jsonl -> payments.<pid>.jsonl), so uvicorn workers never
+    compact or replay each other's rows. replay() adopts the spools of
+    processes that are no longer running: it renames one to claim it, so
+    only one live worker replays it, and copies the unacknowledged rows
+    into its own spool before deleting it.
+
+    Spool lines are either {"spool_id": ..., "record": {...}} or
+    {"ack": [spool_id, ...]}. The spool is truncated whenever every row is
+    acknowledged; under steady traffic that may never happen, so after
+    compact_after acknowledgements it is rewritten with only the rows still
+    unacknowledged. Rows that still fail after max_retries are moved to a
+    .dead.jsonl file next to the spool instead of being dropped.
+
+    Only errors the database returns for the rows are retried, bisected
+    and dead-lettered. While Supabase is unreachable (the guard is open or
+    the connection fails) batches stay queued and spooled, and flushing
+    backs off until it answers again.
+    """
+    def __init__(self,
+                 supabase: SupabaseClient,
+                 spool_path: str,
+                 table_name: str = "payments",
+                 batch_size: int = 50,
+                 flush_interval: float = 1.0,
+                 max_retries: int = 5,
+                 retry_backoff: float = 0.5,
+                 fsync: bool = True,
+                 compact_after: int = 10000,
+                 guard: Optional[OutboundGuard] = None,
+                 pid: Optional[int] = None):
+        self.supabase = supabase
+        self.pid = pid if pid is not None else os.getpid()
+        # Shared by every process; the spool of an older version that wrote a single file
+        self.legacy_spool_path = spool_path
+        self._spool_stem = os.path.splitext(spool_path)[0]
+        self.spool_path = f"{self._spool_stem}.{self.pid}.jsonl"
+        self.dead_letter_path = f"{self._spool_stem}.{self.pid}.dead.jsonl"
+        self.table_name = table_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.fsync = fsync
+        self.compact_after = compact_after
+        # A rejection by the guard is an outage: the batch stays queued until it admits calls again
+        self.guard = guard or get_guard("supabase")
+        self.logger = logging.getLogger(__name__)
+
+        self._pending: List[Dict[str, Any]] = []
+        self._unacked = 0
+        self._acked_since_compaction = 0
+        self._spool_lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        # Seconds to wait before the next flush while Supabase is unreachable; 0 when it answers
+        self._outage_backoff = 0.0
+        self._counters = {
+            "submitted": 0,
+            "written": 0,
+            "batches": 0,
+            "retries": 0,
+            "dead_lettered": 0,
+            "replayed": 0,
+            "compactions": 0,
+            "deferred_batches": 0,
+        }
+
+        spool_dir = os.path.dirname(spool_path)
+        if spool_dir and not os.path.exists(spool_dir):
+            os.makedirs(spool_dir)
+
+    # ------------- SPOOL -------------
+    def _append_lines(self, path: str, entries: List[Dict[str, Any]]):
+        data = "".join(json.dumps(entry, default=str) + "\n" for entry in entries)
+        with self._spool_lock:
+            with open(path, "a", encoding="utf-8") as spool:
+                spool.write(data)
+                spool.flush()
+                if self.fsync:
+                    os.fsync(spool.fileno())
+
+    def _read_spool(self, path: str) -> List[Dict[str, Any]]:
+        with self._spool_lock:
+            return self._unacked_entries(path)
+
+    def _unacked_entries(self, path: str) -> List[Dict[str, Any]]:
+        # Callers hold _spool_lock
+        if not os.path.exists(path):
+            return []
+
+        entries = {}
+        acked = set()
+        with open(path, "r", encoding="utf-8") as spool:
+            for line in spool:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-write
+                    self.logger.warning("Skipping unreadable line in payment spool")
+                    continue
+                if "ack" in entry:
+                    acked.update(entry["ack"])
+                else:
+                    entries[entry["spool_id"]] = entry
+
+        return [entry for spool_id, entry in entries.items() if spool_id not in acked]
+
+    def _compact_spool(self):
+        with self._spool_lock:
+            if not os.path.exists(self.spool_path):
+                return
+            if self._unacked == 0:
+                # Every row in this process's spool has been acknowledged; start a fresh file
+                open(self.spool_path, "w").close()
+                return
+
+            # Appends wait on the lock, so nothing lands between the read and the swap
+            entries = self._unacked_entries(self.spool_path)
+            temporary_path = f"{self.spool_path}.compacting"
+            with open(temporary_path, "w", encoding="utf-8") as spool:
+                spool.write("".join(json.dumps(entry, default=str) + "\n" for entry in entries))
+                spool.flush()
+                if self.fsync:
+                    os.fsync(spool.fileno())
+            os.replace(temporary_path, self.spool_path)
+
+    def _orphaned_spools(self) -> List[str]:
+        """
+        Spool files left by processes that are no longer running
+        """
+        directory = os.path.dirname(self._spool_stem) or "."
+        prefix = os.path.basename(self._spool_stem) + "."
+        paths = [self.legacy_spool_path] if os.path.exists(self.legacy_spool_path) else []
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if not name.startswith(prefix) or not name.endswith(".jsonl") or name.endswith(".dead.jsonl"):
+                continue
+            owner = name[len(prefix):].split(".", 1)[0]
+            if not owner.isdigit() or path == self.spool_path:
+                continue
+            # A pid equal to ours is a predecessor's leftover claim, not a sibling
+            if int(owner) != self.pid and _process_alive(int(owner)):
+                continue
+            paths.append(path)
+        return paths
+
+    def _adopt_orphaned_spools(self) -> List[Dict[str, Any]]:
+        claimed = []
+        for path in self._orphaned_spools():
+            claimed_path = f"{self._spool_stem}.{self.pid}.claimed-{uuid.uuid4().hex}.jsonl"
+            try:
+                os.rename(path, claimed_path)
+            except FileNotFoundError:
+                # Another worker claimed it first
+                continue
+            claimed.append(claimed_path)
+
+        entries = [entry for path in claimed for entry in self._read_spool(path)]
+        if entries:
+            # Durable in this process's spool before the claimed files go
+            self._append_lines(self.spool_path, entries)
+        for path in claimed:
+            os.remove(path)
+        return entries
+
+    # ------------- PUBLIC API -------------
+    async def submit(self, record: Dict[str, Any]) -> str:
+        """
+        Durably queue a payments row and return its spool ID
+        """
+        entry = {"spool_id": str(uuid.uuid4()), "record": record}
+        # Counted before the write so a concurrent compaction never truncates it
+        self._unacked += 1
+        try:
+            await asyncio.to_thread(self._append_lines, self.spool_path, [entry])
+        except BaseException:
+            self._unacked -= 1
+            raise
+        self._enqueue([entry])
+        self._counters["submitted"] += 1
+        return entry["spool_id"]
+
+    async def write_many(self, records: List[Dict[str, Any]]) -> int:
+        """
+        Durably spool rows that belong together and write them in one multi-row insert
+        """
+        entries = [{"spool_id": str(uuid.uuid4()), "record": record} for record in records]
+        if not entries:
+            return 0
+        self._unacked += len(entries)
+        try:
+            await asyncio.to_thread(self._append_lines, self.spool_path, entries)
+        except BaseException:
+            self._unacked -= len(entries)
+            raise
+        self._counters["submitted"] += len(entries)
+        # Same retry, bisection and dead-letter handling as the background batches
+        unwritten = await self._write_batch(entries)
+        if unwritten:
+            # Spooled already; the background flusher writes them once Supabase is back
+            self._enqueue(unwritten)
+        return len(entries)
+
+    def replay(self) -> int:
+        """
+        Queue every row that was never acknowledged, from this process's spool
+        (left by an earlier process with the same pid) and from the spools of
+        processes that are no longer running. Meant for startup: it reads and
+        writes the spool files inline.
+        """
+        entries = self._read_spool(self.spool_path) + self._adopt_orphaned_spools()
+        if entries:
+            self.logger.info(f"Replaying {len(entries)} unwritten payment records into {self.spool_path}")
+            self._unacked += len(entries)
+            self._enqueue(entries)
+            self._counters["replayed"] += len(entries)
+        return len(entries)
+
+    def start(self, replay: bool = True):
+        """
+        Start the background flusher, optionally replaying the spool first
+        """
+        if self._task is not None:
+            return
+        if replay:
+            self.replay()
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Flush what is queued and stop the background flusher
+        """
+        self._stopping = True
+        if self._task is not None:
+            self._wakeup.set()
+            await self._task
+            self._task = None
+
+    async def flush(self):
+        """
+        Write everything that is queued right now, or stop at the first batch
+        Supabase could not be reached for and leave the rest queued
+        """
+        while self._pending:
+            batch = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+            unwritten = await self._write_batch(batch)
+            if unwritten:
+                self._pending[:0] = unwritten
+                return
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._counters, "queued": len(self._pending), "unacked": self._unacked,
+                "outage_backoff_seconds": self._outage_backoff}
+
+    # ------------- FLUSHING -------------
+    def _enqueue(self, entries: List[Dict[str, Any]]):
+        # Callers have already counted the entries in _unacked
+        self._pending.extend(entries)
+        if self._wakeup is not None and len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                await self.flush()
+            except Exception as e:
+                self.logger.error(f"Unexpected error flushing payment records: {str(e)}", exc_info=True)
+
+            if self._stopping and (not self._pending or self._outage_backoff):
+                # Rows Supabase could not take stay in the spool for the next start's replay
+                return
+            if self._outage_backoff:
+                await asyncio.sleep(self._outage_backoff)
+
+    def _insert_rows(self, rows: List[Dict[str, Any]]):
+        # payment_id is unique, so a replayed row that did land before a crash is skipped
+        response = self.supabase.table(self.table_name) \
+            .upsert(rows, on_conflict="payment_id", ignore_duplicates=True) \
+            .execute()
+        if hasattr(response, 'error') and response.error is not None:
+            raise Exception(f"Failed to store payment records: {response.error}")
+
+    async def _write_batch(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Write batch; returns the entries left unwritten because Supabase could not be reached
+        """
+        rows = [entry["record"] for entry in batch]
+        for attempt in range(self.max_retries):
+            try:
+                with self.guard.guarded():
+                    await asyncio.to_thread(self._insert_rows, rows)
+            except Exception as e:
+                if _is_outage(e):
+                    self._back_off(e, len(batch))
+                    return batch
+                self._counters["retries"] += 1
+                delay = self.retry_backoff * (2 ** attempt)
+                self.logger.warning(
+                    f"Batch insert of {len(batch)} payment records failed "
+                    f"(attempt {attempt + 1}/{self.max_retries}): {str(e)}; retrying in {delay:.1f}s"
+                )
+                await asyncio.sleep(delay)
+                continue
+
+            self._outage_backoff = 0.0
+            await self._acknowledge(batch)
+            self._counters["batches"] += 1
+            self._counters["written"] += len(batch)
+            self.logger.info(f"Stored {len(batch)} payment records in one batch")
+            return []
+
+        if len(batch) > 1:
+            # Isolate the rows the database keeps rejecting
+            middle = len(batch) // 2
+            unwritten = await self._write_batch(batch[:middle])
+            if unwritten:
+                return unwritten + batch[middle:]
+            return await self._write_batch(batch[middle:])
+
+        self.logger.error(f"Moving payment record {batch[0]['spool_id']} to {self.dead_letter_path}")
+        await asyncio.to_thread(self._append_lines, self.dead_letter_path, batch)
+        await self._acknowledge(batch)
+        self._counters["dead_lettered"] += 1
+        return []
+
+    def _back_off(self, error: Exception, size: int):
+        self._counters["deferred_batches"] += 1
+        if isinstance(error, DependencyUnavailableError):
+            delay = error.retry_after
+        else:
+            delay = max(self._outage_backoff * 2, self.retry_backoff)
+        self._outage_backoff = min(max(delay, self.retry_backoff, MIN_OUTAGE_BACKOFF_SECONDS), MAX_OUTAGE_BACKOFF_SECONDS)
+        self.logger.warning(
+            f"Supabase is unreachable, keeping {size} payment records spooled: {str(error)}; "
+            f"next attempt in {self._outage_backoff:.1f}s"
+        )
+
+    async def _acknowledge(self, batch: List[Dict[str, Any]]):
+        await asyncio.to_thread(self._append_lines, self.spool_path, [{"ack": [entry["spool_id"] for entry in batch]}])
+        self._unacked -= len(batch)
+        self._acked_since_compaction += len(batch)
+        if self._unacked == 0 or self._acked_since_compaction >= self.compact_after:
+            self._acked_since_compaction = 0
+            self._counters["compactions"] += 1
+            await asyncio.to_thread(self._compact_spool)
@@ -0,0 +1,253 @@
+import asyncio
+import json
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Set
+
+import psycopg2
+import psycopg2.extensions
+
+# supabase/migrations/20250508000000_request_status_notify.sql
+STATUS_CHANNEL = "request_status"
+
+# Pushed to every subscriber after the listener reconnects; notifications
+# sent while it was away are gone, so streams re-read the status instead
+RESYNC_EVENT: Dict[str, Any] = {"type": "resync"}
+
+
+class SubscriberLimitError(Exception):
+    """
+    Raised when a process already holds as many status streams as it allows
+    """
+
+
+class StatusSubscription:
+    """
+    One open status stream. Holds at most queue_size undelivered events;
+    when a slow client falls behind the oldest are dropped, since only the
+    latest status matters to it.
+    """
+    __slots__ = ("request_id", "dropped", "_events", "_ready")
+
+    def __init__(self, request_id: str, queue_size: int):
+        self.request_id = request_id
+        self.dropped = 0
+        self._events: Deque[Dict[str, Any]] = deque(maxlen=queue_size)
+        self._ready = asyncio.Event()
+
+    def push(self, event: Dict[str, Any]):
+        if len(self._events) == self._events.maxlen:
+            self.dropped += 1
+        self._events.append(event)
+        self._ready.set()
+
+    async def next(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        The next event, or None when none arrives within timeout seconds
+        """
+        if not self._events:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self._events.popleft()
+
+
+class RequestStatusHub:
+    """
+    Fans request status notifications out to the streams subscribed to them.
+
+    Subscriptions are indexed by request ID, so a notification costs one
+    dict lookup plus one push per stream watching that request, however many
+    streams are open. Memory is bounded by max_subscribers streams of at
+    most queue_size events each.
+    """
+    def __init__(self, max_subscribers: int = 10000, queue_size: int = 8):
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        # Whether a listener is currently delivering notifications
+        self.live = False
+        self.logger = logging.getLogger(__name__)
+
+        self._subscriptions: Dict[str, Set[StatusSubscription]] = {}
+        self._count = 0
+        self._counters = {
+            "subscribed": 0,
+            "rejected": 0,
+            "published": 0,
+            "delivered": 0,
+            "dropped": 0,
+        }
+
+    def subscribe(self, request_id: str) -> StatusSubscription:
+        if self._count >= self.max_subscribers:
+            self._counters["rejected"] += 1
+            raise SubscriberLimitError(f"Too many open request status streams ({self.max_subscribers})")
+        subscription = StatusSubscription(request_id, self.queue_size)
+        self._subscriptions.setdefault(request_id, set()).add(subscription)
+        self._count += 1
+        self._counters["subscribed"] += 1
+        return subscription
+
+    def unsubscribe(self, subscription: StatusSubscription):
+        subscriptions = self._subscriptions.get(subscription.request_id)
+        if not subscriptions or subscription not in subscriptions:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self._subscriptions[subscription.request_id]
+        self._count -= 1
+        self._counters["dropped"] += subscription.dropped
+
+    def publish(self, event: Dict[str, Any]) -> int:
+        """
+        Deliver a status notification to the streams watching its request;
+        returns how many there were
+        """
+        self._counters["published"] += 1
+        subscriptions = self._subscriptions.get(str(event.get("id")))
+        if not subscriptions:
+            return 0
+        for subscription in subscriptions:
+            subscription.push(event)
+        self._counters["delivered"] += len(subscriptions)
+        return len(subscriptions)
+
+    def resync(self):
+        """
+        Tell every stream to re-read its request, after notifications may have been missed
+        """
+        for subscriptions in self._subscriptions.values():
+            for subscription in subscriptions:
+                subscription.push(RESYNC_EVENT)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._counters, "open": self._count, "requests": len(self._subscriptions), "live": self.live}
+
+
+class PostgresStatusListener:
+    """
+    Holds the process's single LISTEN connection and feeds the hub.
+
+    The psycopg2 connection runs in autocommit mode and its
+    socket is registered with the event loop, so notifications are read as
+    they arrive without a thread or a polling loop. A dropped connection is
+    re-opened with backoff, after which every stream is told to resync.
+    """
+    def __init__(self,
+                 hub: RequestStatusHub,
+                 dsn: str,
+                 channel: str = STATUS_CHANNEL,
+                 reconnect_delay: float = 1.0,
+                 max_reconnect_delay: float = 30.0):
+        self.hub = hub
+        self.dsn = dsn
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.logger = logging.getLogger(__name__)
+
+        self._connection = None
+        self._lost: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._counters = {
+            "connects": 0,
+            "connect_errors": 0,
+            "notifications": 0,
+            "malformed": 0,
+        }
+
+    def start(self):
+        """
+        Connect and start listening in the background
+        """
+        if self._task is not None:
+            return
+        self._stopping = False
+        self._lost = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._stopping = True
+        if self._task is not None:
+            self._lost.set()
+            await self._task
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._counters, "channel": self.channel, "connected": self._connection is not None}
+
+    def _connect(self):
+        connection = psycopg2.connect(self.dsn)
+        connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {self.channel};")
+        return connection
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        delay = self.reconnect_delay
+        while not self._stopping:
+            self._lost.clear()
+            try:
+                self._connection = await loop.run_in_executor(None, self._connect)
+            except Exception as e:
+                self._counters["connect_errors"] += 1
+                self.logger.error(f"Could not listen on {self.channel}, retrying in {delay:.0f}s: {str(e)}")
+                await self._wait(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+                continue
+
+            if self._stopping:
+                self._close(loop)
+                break
+            self._counters["connects"] += 1
+            delay = self.reconnect_delay
+            loop.add_reader(self._connection.fileno(), self._drain)
+            self.hub.live = True
+            if self._counters["connects"] > 1:
+                self.hub.resync()
+            self.logger.info(f"Listening for request status changes on {self.channel}")
+
+            await self._lost.wait()
+            self.hub.live = False
+            self._close(loop)
+
+    async def _wait(self, delay: float):
+        try:
+            await asyncio.wait_for(self._lost.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    def _drain(self):
+        connection = self._connection
+        try:
+            connection.poll()
+        except Exception as e:
+            self.logger.error(f"Lost the {self.channel} listener connection: {str(e)}")
+            self._lost.set()
+            return
+        while connection.notifies:
+            notification = connection.notifies.pop(0)
+            self._counters["notifications"] += 1
+            try:
+                event = json.loads(notification.payload)
+            except ValueError:
+                self._counters["malformed"] += 1
+                continue
+            self.hub.publish(event)
+
+    def _close(self, loop: asyncio.AbstractEventLoop):
+        connection, self._connection = self._connection, None
+        if connection is None:
+            return
+        try:
+            loop.remove_reader(connection.fileno())
+        except Exception:
+            pass
+        try:
+            connection.close()
+        except Exception:
+            pass
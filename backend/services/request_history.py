@@ -0,0 +1,87 @@
+import base64
+import hashlib
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Columns a caller may ask for with fields=; the bulky JSON columns only when named
+HISTORY_COLUMNS = (
+    "id", "team_id", "request_type", "requested_by", "status", "item_id",
+    "player_id", "old_value", "new_value", "tournament_id", "league_id", "season",
+    "payment_reference", "last_error", "processing_attempts",
+    "created_at", "updated_at", "metadata", "webhook_data",
+)
+DEFAULT_HISTORY_FIELDS = tuple(column for column in HISTORY_COLUMNS if column not in ("metadata", "webhook_data"))
+# The keyset; always selected so the next cursor can be built from the last row
+CURSOR_COLUMNS = ("created_at", "id")
+
+
+def history_select(fields: Optional[str]) -> Tuple[str, ...]:
+    """
+    The columns to select for a comma-separated fields= value; raises ValueError for unknown columns
+    """
+    if not fields:
+        return DEFAULT_HISTORY_FIELDS
+    requested = tuple(dict.fromkeys(column.strip() for column in fields.split(",") if column.strip()))
+    unknown = [column for column in requested if column not in HISTORY_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return requested + tuple(column for column in CURSOR_COLUMNS if column not in requested)
+
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    """
+    Opaque cursor pointing just past a row in (created_at, id) descending order
+    """
+    raw = json.dumps([row["created_at"], row["id"]], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """
+    The (created_at, id) a cursor points past; raises ValueError for a malformed cursor
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, request_id = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(created_at, str) or not isinstance(request_id, str):
+        raise ValueError("Invalid cursor")
+    return created_at, request_id
+
+
+def keyset_filter(cursor: str) -> str:
+    """
+    PostgREST or= condition for the rows after a cursor, newest first
+    """
+    created_at, request_id = decode_cursor(cursor)
+    # Quoted: timestamps contain the periods and colons PostgREST treats as syntax
+    return f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt."{request_id}")'
+
+
+def history_etag(body: bytes, next_cursor: Optional[str]) -> str:
+    """
+    Strong ETag for a serialized history page and where it continues
+    """
+    digest = hashlib.blake2b(body, digest_size=16)
+    digest.update((next_cursor or "").encode("ascii"))
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Whether an If-None-Match header already names this ETag
+    """
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def split_page(rows: Sequence[Dict[str, Any]], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Trim a limit + 1 fetch to the page and the cursor for the next one, if any
+    """
+    page = list(rows[:limit])
+    next_cursor = encode_cursor(page[-1]) if len(rows) > limit and page else None
+    return page, next_cursor
@@ -1,59 +1,71 @@
-from supabase import Client as SupabaseClient
 import logging
 from datetime import datetime
 import uuid
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Sequence, Tuple, Union
+
+from pydantic import ValidationError
+
+from models.change_requests import ChangeRequestBase, parse_change_request, validation_messages
 
 # Import other services
+from .outbound_guard import OutboundGuard, DependencyUnavailableError, get_guard
+from .payment_metadata import prepare_payment_row
 from .payment_service import PaymentService
+from .request_history import history_select, keyset_filter, split_page
+from .request_types import REQUEST_TYPES, get_request_type
+from .request_status import TRANSITION_FUNCTION, parse_transition_response, transition_params
+from .request_states import FAILED, PAYMENT_COMPLETE, PAYMENT_FAILED, PENDING, READY_FOR_EXECUTION
+from .supabase_data import SupabaseData
 
 class RequestService:
+    # Request types _execute_action has a handler for
+    ACTION_TYPES = tuple(REQUEST_TYPES)
+    
     def __init__(self, 
-                 supabase: SupabaseClient, 
-                 payment_service: PaymentService):
+                 supabase: SupabaseData, 
+                 payment_service: PaymentService,
+                 supabase_guard: Optional[OutboundGuard] = None,
+                 fast_path: bool = True):
         self.supabase = supabase
         self.payment_service = payment_service
+        self.supabase_guard = supabase_guard or get_guard("supabase")
+        # Write rows once in their final status when the outcome is known up front
+        self.fast_path = fast_path
         self.logger = logging.getLogger(__name__)
         
-    async def process_request(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
+    async def process_request(self, request: Union[ChangeRequestBase, Dict[str, Any]]) -> Dict[str, Any]:
         """
-        Central method to handle all types of requests with a consistent workflow
+        Central method to handle all types of requests with a consistent workflow.
+        Takes a parsed change request model; a plain dict is validated against it first.
         """
+        request_data = self._request_data(request)
+        
+        # Turn away work up front while a dependency it needs is failing or saturated
+        self.supabase_guard.check()
+        if request_data.get("requires_payment", False):
+            self.payment_service.payment_engine.guard.check()
+        
+        # Status of the row this call wrote, if any; only a pending row is left for the failure handler
+        written_status = None
         try:
-            # Generate request ID if not provided
-            request_id = request_data.get("request_id", str(uuid.uuid4()))
-            request_data["request_id"] = request_id
-            
+            request_id = request_data["request_id"]
             self.logger.info(f"Processing {request_data['request_type']} request with ID: {request_id}")
             
-            # Validate request data
-            self._validate_request_data(request_data)
-            
-            # Create initial request record with pending status
-            self.logger.info(f"Creating request record for {request_data['request_type']}")
-            await self._create_request_record(request_data)
-            
-            # Process payment if needed
-            payment_result = None
-            if request_data.get("requires_payment", False):
-                self.logger.info(f"Request requires payment, processing payment for request {request_id}")
-                try:
-                    payment_result = await self._process_payment(request_data)
-                    self.logger.info(f"Payment successful for request {request_id}, setting status to payment_complete.")
-                    # Update status to indicate payment is done, ready for async execution
-                    # Pass payment_result as part of the metadata update
-                    await self._update_request_status(request_id, "payment_complete", {"payment_details": payment_result})
-                    final_status = "payment_complete"
-                except Exception as e:
-                    self.logger.error(f"Payment processing error for request {request_id}: {str(e)}", exc_info=True)
-                    # Ensure status is updated to payment_failed before raising
-                    await self._update_request_status(request_id, "payment_failed", {"error": str(e)})
-                    raise Exception(f"Payment failed: {str(e)}")
+            requires_payment = request_data.get("requires_payment", False)
+            
+            if self.fast_path and not requires_payment:
+                # Nothing to wait for: insert the row straight into ready_for_execution
+                self.logger.info(f"No payment required for request {request_id}, creating it as ready_for_execution.")
+                await self._create_request_record(request_data, status=READY_FOR_EXECUTION)
+                written_status = final_status = READY_FOR_EXECUTION
+            
             else:
-                # No payment required, set status to ready for execution
-                self.logger.info(f"No payment required for request {request_id}, setting status to ready_for_execution.")
-                await self._update_request_status(request_id, "ready_for_execution")
-                final_status = "ready_for_execution"
+                # Multi-step path: record the request as pending, then move it on. A charge is
+                # only taken once its row exists, so money never moves without a durable record
+                self.logger.info(f"Creating request record for {request_data['request_type']}")
+                await self._create_request_record(request_data)
+                written_status = PENDING
+                final_status = await self._advance_pending_request(request_data)
 
             # Action execution is now handled asynchronously by the DB trigger/Edge Function
             # Return success indicating the request was accepted and is being processed
@@ -69,64 +81,188 @@ class RequestService:
             self.logger.error(f"Request processing error: {str(e)}", exc_info=True)
             
             # Update request record with failed status
-            if "request_id" in request_data:
+            if written_status == PENDING:
+                # Only requests this call still owns; one the webhook already moved on is left alone
                 await self._update_request_status(
                     request_data["request_id"], 
-                    "failed", 
-                    {"error": str(e)}
+                    FAILED, 
+                    {"error": str(e)},
+                    expected_status=[PENDING, PAYMENT_FAILED],
+                    last_error=str(e)
                 )
                 
             raise
-    
-    def _validate_request_data(self, request_data: Dict[str, Any]):
+
+    async def process_requests_bulk(self,
+                                    requests: List[Union[ChangeRequestBase, Dict[str, Any]]],
+                                    atomic: bool = False) -> Dict[str, Any]:
         """
-        Validate the request data based on the request type
+        Validate many requests in one pass and insert the valid ones with a single
+        multi-row statement.
+
+        Each item gets a result at its index: "created" (with the status it was
+        written in), "invalid" (with the errors; it never blocks the others),
+        "not_attempted" (atomic batch with an invalid item, so nothing was written)
+        or "failed" (the insert was rejected; the statement is all-or-nothing, so
+        every valid item shares the error). Payments are not taken here: a request
+        that requires payment goes through its own endpoint.
         """
-        required_fields = ["request_type", "requested_by", "team_id"]
+        self.supabase_guard.check()
         
-        for field in required_fields:
-            if field not in request_data:
-                raise ValueError(f"Missing required field: {field}")
-                
-        # Validate additional fields based on request type
-        request_type = request_data["request_type"]
-        
-        if request_type == "team_transfer":
-            if "new_captain_id" not in request_data:
-                raise ValueError("Missing new_captain_id for team transfer request")
-                
-        elif request_type == "roster_change":
-            if "player_id" not in request_data or "new_role" not in request_data:
-                raise ValueError("Missing player_id or new_role for roster change request")
-                
-        elif request_type in ["tournament_registration", "league_registration"]:
-            if "event_id" not in request_data or "player_ids" not in request_data:
-                raise ValueError("Missing event_id or player_ids for registration request")
+        results: List[Dict[str, Any]] = []
+        records: List[Dict[str, Any]] = []
+        seen_ids = set()
+        for index, request in enumerate(requests):
+            result = {"index": index, "request_id": None}
+            try:
+                request_data = self._request_data(request)
+                request_id = result["request_id"] = request_data["request_id"]
+                if request_id in seen_ids:
+                    raise ValueError(f"Duplicate request_id in batch: {request_id}")
+                if request_data.get("requires_payment", False):
+                    raise ValueError("Requests that require payment cannot be submitted in bulk")
+            except ValidationError as e:
+                result.update(status="invalid", errors=validation_messages(e))
+            except ValueError as e:
+                result.update(status="invalid", errors=[str(e)])
+            else:
+                seen_ids.add(request_id)
+                result.update(status="created", request_status=READY_FOR_EXECUTION)
+                records.append(self._build_request_record(request_data, status=READY_FOR_EXECUTION))
+            results.append(result)
+        
+        valid = [result for result in results if result["status"] == "created"]
+        invalid_count = len(results) - len(valid)
+        
+        if atomic and invalid_count:
+            self.logger.info(f"Bulk request submission rejected: {invalid_count} of {len(results)} requests are invalid")
+            for result in valid:
+                result.update(status="not_attempted", request_status=None)
+            records = []
+        
+        if records:
+            self.logger.info(f"Inserting {len(records)} request records in one statement")
+            try:
+                with self.supabase_guard.guarded():
+                    response = await self.supabase.table("team_change_requests").insert(records).execute()
+                if hasattr(response, 'error') and response.error is not None:
+                    raise Exception(f"Failed to create request records: {response.error}")
+            except DependencyUnavailableError:
+                raise
+            except Exception as e:
+                self.logger.error(f"Bulk request insert failed: {str(e)}", exc_info=True)
+                for result in valid:
+                    result.update(status="failed", request_status=None, errors=[str(e)])
         
-        elif request_type == "league_registration":
-            if "season" not in request_data:
-                raise ValueError("Missing season for registration request")        
-                
-        elif request_type == "team_rebrand":
-            if "new_name" not in request_data:
-                raise ValueError("Missing new_name for team rebrand request")
-                
-        elif request_type == "online_id_change":
-            if "player_id" not in request_data or "new_online_id" not in request_data or "platform" not in request_data:
-                raise ValueError("Missing player_id, new_online_id, or platform for online ID change request")
-                
-        elif request_type == "team_creation":
-            if "team_name" not in request_data or "captain_id" not in request_data:
-                raise ValueError("Missing team_name or captain_id for team creation request")
+        return self.summarize_bulk_results(results)
     
-    async def _create_request_record(self, request_data: Dict[str, Any]):
+    @staticmethod
+    def summarize_bulk_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
-        Create a request record in the database
+        Bulk submission response: per-request results plus counts by status
+        """
+        counts = {status: 0 for status in ("created", "invalid", "not_attempted", "failed")}
+        for result in results:
+            counts[result["status"]] += 1
+        return {
+            "success": counts["created"] == len(results),
+            "summary": {"total": len(results), **counts},
+            "results": results
+        }
+
+    async def _advance_pending_request(self, request_data: Dict[str, Any]) -> str:
+        """
+        Move a freshly created pending request on; returns the status it reached
+        """
+        request_id = request_data["request_id"]
+        if not request_data.get("requires_payment", False):
+            # No payment required, set status to ready for execution
+            self.logger.info(f"No payment required for request {request_id}, setting status to ready_for_execution.")
+            await self._update_request_status(request_id, READY_FOR_EXECUTION, expected_status=[PENDING])
+            return READY_FOR_EXECUTION
+        
+        self.logger.info(f"Request requires payment, processing payment for request {request_id}")
+        try:
+            payment_result = await self._process_payment(request_data)
+        except Exception as e:
+            self.logger.error(f"Payment processing error for request {request_id}: {str(e)}", exc_info=True)
+            # Ensure status is updated to payment_failed before raising
+            await self._update_request_status(request_id, PAYMENT_FAILED, {"error": str(e)}, expected_status=[PENDING])
+            if isinstance(e, DependencyUnavailableError):
+                raise
+            raise Exception(f"Payment failed: {str(e)}")
+        
+        if payment_result.get("status") == "pending":
+            # No card yet: the buyer pays at payment_url and the webhook settles the request
+            self.logger.info(f"Payment for request {request_id} is pending, leaving the request pending.")
+            return PENDING
+        
+        self.logger.info(f"Payment successful for request {request_id}, setting status to payment_complete.")
+        # Update status to indicate payment is done, ready for async execution
+        # Pass payment_result as part of the metadata update
+        outcome = await self._update_request_status(request_id, PAYMENT_COMPLETE, {"payment_details": payment_result}, expected_status=[PENDING])
+        if outcome is None:
+            # The charge went through: the row stays pending and the payment webhook settles it
+            self.logger.error(f"Payment {payment_result.get('id')} was taken but request {request_id} is still pending")
+            return PENDING
+        if not outcome.get("transitioned"):
+            # The row left pending while the card was charged (cancelled, failed, settled by the webhook)
+            previous_status = outcome.get("previous_status")
+            self.logger.error(f"Payment {payment_result.get('id')} was taken but request {request_id} is '{previous_status}'")
+            return previous_status
+        return PAYMENT_COMPLETE
+    
+    @staticmethod
+    def _request_data(request: Union[ChangeRequestBase, Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        The validated request as the dict the rest of the service works on, with its ID
+        """
+        if not isinstance(request, ChangeRequestBase):
+            request = parse_change_request(request)
+        request_data = request.to_request_data()
+        request_data["request_id"] = request_data.get("request_id") or str(uuid.uuid4())
+        return request_data
+    
+    async def _create_request_record(self,
+                                     request_data: Dict[str, Any],
+                                     status: str = PENDING,
+                                     result: Optional[Dict[str, Any]] = None,
+                                     last_error: Optional[str] = None):
+        """
+        Create a request record in the database, by default as pending
         """
         self.logger.info(f"Creating request record for {request_data['request_type']} with ID: {request_data['request_id']}")
+        request_record = self._build_request_record(request_data, status, result, last_error)
         
+        # Insert into team_change_requests table
+        try:
+            self.logger.info(f"Inserting request record: {request_record}")
+            
+            insert_query = self.supabase.table("team_change_requests").insert(request_record)
+            with self.supabase_guard.guarded():
+                response = await insert_query.execute()
+            
+            # Check for errors in the response
+            if hasattr(response, 'error') and response.error is not None:
+                self.logger.error(f"Failed to create request record: {response.error}")
+                raise Exception(f"Failed to create request record: {response.error}")
+            
+            self.logger.info(f"Successfully created request record with ID: {request_data['request_id']}")
+            return response
+        except Exception as e:
+            self.logger.error(f"Error creating request record: {str(e)}", exc_info=True)
+            raise
+    
+    def _build_request_record(self,
+                              request_data: Dict[str, Any],
+                              status: str = PENDING,
+                              result: Optional[Dict[str, Any]] = None,
+                              last_error: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Build the team_change_requests row for a request
+        """
         # Prepare metadata with all relevant fields
-        metadata = request_data.get("metadata", {})
+        metadata = dict(request_data.get("metadata") or {})
         
         # Include all request-specific fields in metadata for easier retrieval later
         for key, value in request_data.items():
@@ -138,75 +274,58 @@ class RequestService:
             "team_id": request_data["team_id"],
             "request_type": request_data["request_type"],
             "requested_by": request_data["requested_by"],
-            "status": "pending",
+            "status": status,
             "created_at": datetime.now().isoformat(),
             "metadata": metadata
         }
         
+        # Written in its final status: record the outcome the same way a transition would
+        if result:
+            metadata["result"] = result
+        if last_error:
+            request_record["last_error"] = last_error
+        
         # Add item_id if provided
         if "item_id" in request_data:
             self.logger.info(f"Request includes item_id: {request_data['item_id']}")
             request_record["item_id"] = request_data["item_id"]
         else:
-            self.logger.warning(f"Request missing item_id, which may be required: {request_data['request_id']}")
+            self.logger.debug(f"Request missing item_id, which may be required: {request_data['request_id']}")
         
         # Add type-specific fields
-        if request_data["request_type"] == "team_rebrand":
-            request_record["old_value"] = request_data.get("old_name", "")
-            request_record["new_value"] = request_data.get("new_name", "")
-        
-        elif request_data["request_type"] == "online_id_change":
-            request_record["player_id"] = request_data.get("player_id", "")
-            request_record["old_value"] = request_data.get("old_online_id", "")
-            request_record["new_value"] = request_data.get("new_online_id", "")
-        
-        elif request_data["request_type"] == "team_creation":
-            request_record["new_value"] = request_data.get("team_name", "")
-            if request_data.get("league_id"):
-                request_record["league_id"] = request_data["league_id"]
-        
-        elif request_data["request_type"] == "team_transfer":
-            request_record["old_value"] = request_data.get("old_captain_id", "")
-            request_record["new_value"] = request_data.get("new_captain_id", "")
-        
-        elif request_data["request_type"] == "roster_change":
-            request_record["player_id"] = request_data.get("player_id", "")
-            request_record["new_value"] = request_data.get("new_role", "")
-        
-        elif request_data["request_type"] == "tournament_registration":
-            request_record["tournament_id"] = request_data.get("tournament_id", "")
-        
-        elif request_data["request_type"] == "league_registration":
-            request_record["league_id"] = request_data.get("league_id", "")
-            request_record["season"] = request_data.get("season", 1)
+        request_record.update(get_request_type(request_data["request_type"]).record_columns(request_data))
 
-        
-        # Insert into team_change_requests table
-        try:
-            self.logger.info(f"Inserting request record: {request_record}")
-            
-            # Create the query but don't await it
-            insert_query = self.supabase.table("team_change_requests").insert(request_record)
-            
-            # Execute the query without awaiting it
-            response = insert_query.execute()
-            
-            # Check for errors in the response
-            if hasattr(response, 'error') and response.error is not None:
-                self.logger.error(f"Failed to create request record: {response.error}")
-                raise Exception(f"Failed to create request record: {response.error}")
-            
-            self.logger.info(f"Successfully created request record with ID: {request_data['request_id']}")
-            return response
-        except Exception as e:
-            self.logger.error(f"Error creating request record: {str(e)}", exc_info=True)
-            raise
+        return request_record
+    
+    @staticmethod
+    def request_data_from_record(record: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Rebuild the request data _execute_action expects from a stored row
+        """
+        # _build_request_record keeps every submitted field in metadata
+        request_data = {key: value for key, value in (record.get("metadata") or {}).items()
+                        if key not in ("result", "last_transition", "action_result")}
+        request_data.update({
+            "request_id": record["id"],
+            "request_type": record["request_type"],
+            "team_id": record.get("team_id"),
+            "requested_by": record.get("requested_by"),
+        })
+        if record.get("item_id") is not None:
+            request_data["item_id"] = record["item_id"]
+        # Rows from older clients only have the columns or camelCase metadata keys
+        spec = REQUEST_TYPES.get(record["request_type"])
+        if spec is not None:
+            for field, value in spec.rehydrate(record).items():
+                if request_data.get(field) is None:
+                    request_data[field] = value
+        return request_data
     
     async def _process_payment(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Process payment for requests that require payment
         """
-        if "payment_data" not in request_data:
+        if not request_data.get("payment_data"):
             raise ValueError("Payment data is required for requests that require payment")
             
         payment_data = request_data["payment_data"]
@@ -221,17 +340,8 @@ class RequestService:
         }
         
         # Add descriptive note based on request type
-        request_type_names = {
-            "team_transfer": "Team Ownership Transfer",
-            "roster_change": "Team Roster Change",
-            "tournament_registration": "Tournament Registration",
-            "league_registration": "League Registration",
-            "team_rebrand": "Team Name Change",
-            "online_id_change": "Online ID Update",
-            "team_creation": "New Team Creation"
-        }
-        
-        payment_data["note"] = f"{request_type_names.get(request_data['request_type'], 'Team Action')} - ID: {request_data['request_id'][:8]}"
+        spec = REQUEST_TYPES.get(request_data["request_type"])
+        payment_data["note"] = f"{spec.label if spec else 'Team Action'} - ID: {request_data['request_id'][:8]}"
         
         # Log payment data for debugging
         self.logger.info(f"Processing payment for request {request_data['request_id']} with reference_id: {payment_data['reference_id']}")
@@ -261,7 +371,7 @@ class RequestService:
                     "metadata": payment_data.get("metadata", {})
                 }
                 
-                result = self.supabase.table("payments").insert(payment_record).execute()
+                result = await self.supabase.table("payments").insert(prepare_payment_row(payment_record)).execute()
                 
                 if hasattr(result, 'error') and result.error is not None:
                     self.logger.error(f"Failed to create payment record: {result.error}")
@@ -286,29 +396,7 @@ class RequestService:
         if request_data.get("requires_payment", False) and (payment_result is None or not payment_result.get("success", False)):
             raise Exception("Payment failed, cannot execute action")
         
-        if request_type == "team_transfer":
-            return await self._transfer_team_ownership(request_data)
-            
-        elif request_type == "roster_change":
-            return await self._update_roster(request_data)
-            
-        elif request_type == "tournament_registration":
-            return await self._register_for_tournament(request_data)
-            
-        elif request_type == "league_registration":
-            return await self._register_for_league(request_data)
-            
-        elif request_type == "team_rebrand":
-            return await self._rebrand_team(request_data)
-            
-        elif request_type == "online_id_change":
-            return await self._update_online_id(request_data)
-            
-        elif request_type == "team_creation":
-            return await self._create_team(request_data)
-            
-        else:
-            raise ValueError(f"Unknown request type: {request_type}")
+        return await getattr(self, get_request_type(request_type).executor)(request_data)
     
     async def _transfer_team_ownership(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -447,7 +535,7 @@ class RequestService:
         try:
             # Get current team info for verification
             team_query = self.supabase.table("teams").select("name").eq("id", team_id)
-            team_response = team_query.execute()
+            team_response = await team_query.execute()
             
             if not team_response.data:
                 raise Exception(f"Team with ID {team_id} not found")
@@ -461,7 +549,7 @@ class RequestService:
                 "updated_at": datetime.now().isoformat()
             }).eq("id", team_id)
             
-            update_response = update_query.execute()
+            update_response = await update_query.execute()
             
             if hasattr(update_response, 'error') and update_response.error is not None:
                 raise Exception(f"Failed to rebrand team: {update_response.error}")
@@ -477,7 +565,7 @@ class RequestService:
                     "logo_url": logo_url
                 }).eq("id", team_id)
                 
-                logo_update_response = logo_update_query.execute()
+                logo_update_response = await logo_update_query.execute()
                 
                 if hasattr(logo_update_response, 'error') and logo_update_response.error is not None:
                     self.logger.warning(f"Failed to update team logo: {logo_update_response.error}")
@@ -593,51 +681,47 @@ class RequestService:
             "captain_id": captain_id
         }
     
-    async def _update_request_status(self, request_id: str, status: str, result: Dict[str, Any] = None):
+    async def transition_status(self,
+                                request_id: str,
+                                status: str,
+                                expected_status: Optional[Sequence[str]] = None,
+                                result: Dict[str, Any] = None,
+                                **fields) -> Optional[Dict[str, Any]]:
         """
-        Update request status in the database
+        Move a request to a new status in one atomic call.
+
+        The status, timestamps and result are merged into the row server-side;
+        with expected_status the row is only changed while its current status
+        is one of those. Returns {"transitioned", "previous_status", "request"},
+        or None when there is no such request.
         """
         self.logger.info(f"Updating request {request_id} status to '{status}'")
-        
+        query = self.supabase.rpc(
+            TRANSITION_FUNCTION,
+            transition_params(request_id, status, expected_status=expected_status, result=result, **fields)
+        )
+        with self.supabase_guard.guarded():
+            response = await query.execute()
+        return parse_transition_response(request_id, response)
+
+    async def _update_request_status(self,
+                                     request_id: str,
+                                     status: str,
+                                     result: Dict[str, Any] = None,
+                                     expected_status: Optional[Sequence[str]] = None,
+                                     **fields) -> Optional[Dict[str, Any]]:
+        """
+        Update request status in the database
+        """
         try:
-            update_data = {
-                "status": status,
-                "updated_at": datetime.now().isoformat()
-            }
-            
-            if status in ["completed", "processing"]:
-                update_data["processed_at"] = datetime.now().isoformat()
-            
-            if result:
-                self.logger.debug(f"Adding result data to request {request_id}")
-                
-                # Use existing metadata and add result to it
-                # Get the current metadata
-                select_query = self.supabase.table("team_change_requests").select("metadata").eq("id", request_id)
-                current_data = select_query.execute()
-                
-                current_metadata = {}
-                if current_data.data and len(current_data.data) > 0:
-                    current_metadata = current_data.data[0].get("metadata", {}) or {}
-                
-                # Combine existing metadata with result
-                update_data["metadata"] = {
-                    **(current_metadata or {}),
-                    "result": result
-                }
-            
-            # Update team_change_requests table
-            update_query = self.supabase.table("team_change_requests").update(update_data).eq("id", request_id)
-            response = update_query.execute()
-            
-            if hasattr(response, 'error') and response.error is not None:
-                self.logger.error(f"Failed to update request status: {response.error}")
-                # Don't raise exception here as this is usually called from catch blocks
-            else:
+            outcome = await self.transition_status(request_id, status, expected_status=expected_status, result=result, **fields)
+            if outcome and outcome.get("transitioned"):
                 self.logger.info(f"Successfully updated request {request_id} status to '{status}'")
+            return outcome
         except Exception as e:
             self.logger.error(f"Error updating request status: {str(e)}", exc_info=True)
             # Don't raise exception here as this is usually called from catch blocks
+            return None
     
     async def get_request(self, request_id: str) -> Optional[Dict[str, Any]]:
         """
@@ -647,7 +731,8 @@ class RequestService:
         
         try:
             query = self.supabase.table("team_change_requests").select("*").eq("id", request_id)
-            result = query.execute()
+            with self.supabase_guard.guarded():
+                result = await query.execute()
             
             if hasattr(result, 'error') and result.error is not None:
                 self.logger.error(f"Failed to get request: {result.error}")
@@ -659,6 +744,36 @@ class RequestService:
             
             self.logger.info(f"Successfully retrieved request with ID: {request_id}")
             return result.data[0]
+        except DependencyUnavailableError:
+            # Not the same as "no such request"; let the route answer 503
+            raise
         except Exception as e:
             self.logger.error(f"Error retrieving request: {str(e)}", exc_info=True)
-            return None 
\ No newline at end of file
+            return None
+
+    async def list_team_requests(self,
+                                 team_id: str,
+                                 status: Optional[str] = None,
+                                 limit: int = 50,
+                                 cursor: Optional[str] = None,
+                                 fields: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        One page of a team's requests, newest first, and the cursor for the next page.
+        Raises ValueError for unknown fields or a malformed cursor.
+        """
+        columns = history_select(fields)
+        query = self.supabase.table("team_change_requests").select(",".join(columns)).eq("team_id", team_id)
+        if status:
+            query = query.eq("status", status)
+        if cursor:
+            query = query.or_(keyset_filter(cursor))
+
+        # One extra row says whether there is a next page
+        query = query.order("created_at", desc=True).order("id", desc=True).limit(limit + 1)
+        with self.supabase_guard.guarded():
+            result = await query.execute()
+
+        if hasattr(result, 'error') and result.error is not None:
+            raise Exception(f"Failed to get team requests: {result.error}")
+
+        return split_page(result.data or [], limit) 
\ No newline at end of file
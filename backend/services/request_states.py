@@ -0,0 +1,82 @@
+from typing import Dict, FrozenSet, Iterable, Tuple
+
+# ------------- STATUSES -------------
+PENDING = "pending"
+PAYMENT_COMPLETE = "payment_complete"
+PAYMENT_FAILED = "payment_failed"
+READY_FOR_EXECUTION = "ready_for_execution"
+APPROVED = "approved"
+PROCESSING = "processing"
+COMPLETED = "completed"
+FAILED = "failed"
+REJECTED = "rejected"
+
+# ------------- TRANSITIONS -------------
+# Every legal move of team_change_requests.status, and the only place they
+# are written down. A request starts in pending. Payment (inline or by
+# webhook) or an admin approval moves it on; the database trigger picks it
+# up in processing and finishes it in completed or failed. Failed requests
+# can be retried by the admin scripts; completed and rejected are final.
+REQUEST_TRANSITIONS: Dict[str, FrozenSet[str]] = {
+    PENDING: frozenset({PAYMENT_COMPLETE, PAYMENT_FAILED, READY_FOR_EXECUTION, APPROVED, PROCESSING, FAILED, REJECTED}),
+    PAYMENT_COMPLETE: frozenset({PROCESSING, COMPLETED, FAILED}),
+    READY_FOR_EXECUTION: frozenset({PROCESSING, COMPLETED, FAILED}),
+    APPROVED: frozenset({PROCESSING, COMPLETED, FAILED}),
+    PAYMENT_FAILED: frozenset({FAILED}),
+    PROCESSING: frozenset({COMPLETED, FAILED}),
+    FAILED: frozenset({PROCESSING}),
+    COMPLETED: frozenset(),
+    REJECTED: frozenset(),
+}
+
+REQUEST_STATUSES: FrozenSet[str] = frozenset(REQUEST_TRANSITIONS)
+TERMINAL_STATUSES: FrozenSet[str] = frozenset(status for status, targets in REQUEST_TRANSITIONS.items() if not targets)
+
+# Lookup tables built once, so checks are a single set or dict probe
+_LEGAL_TRANSITIONS: FrozenSet[Tuple[str, str]] = frozenset(
+    (source, target) for source, targets in REQUEST_TRANSITIONS.items() for target in targets
+)
+_SOURCES: Dict[str, Tuple[str, ...]] = {
+    target: tuple(sorted(source for source, targets in REQUEST_TRANSITIONS.items() if target in targets))
+    for target in REQUEST_STATUSES
+}
+
+
+class IllegalTransitionError(ValueError):
+    """
+    Raised when a request is asked to make a move the state machine does not allow
+    """
+    def __init__(self, current_status: str, status: str):
+        self.current_status = current_status
+        self.status = status
+        super().__init__(f"Illegal request status transition: '{current_status}' -> '{status}'")
+
+
+def can_transition(current_status: str, status: str) -> bool:
+    return (current_status, status) in _LEGAL_TRANSITIONS
+
+
+def check_transition(current_status: str, status: str):
+    if (current_status, status) not in _LEGAL_TRANSITIONS:
+        raise IllegalTransitionError(current_status, status)
+
+
+def sources_for(status: str) -> Tuple[str, ...]:
+    """
+    Statuses a request may be in to move to status; used as the expected-status guard
+    """
+    try:
+        return _SOURCES[status]
+    except KeyError:
+        raise ValueError(f"Unknown request status: {status}") from None
+
+
+def narrow_sources(status: str, expected_status: Iterable[str]) -> Tuple[str, ...]:
+    """
+    The caller's expected statuses, minus those the state machine would not allow
+    """
+    allowed = _SOURCES.get(status, ())
+    narrowed = tuple(source for source in expected_status if source in allowed)
+    if not narrowed:
+        raise IllegalTransitionError("|".join(expected_status), status)
+    return narrowed
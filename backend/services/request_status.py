@@ -0,0 +1,131 @@
+import logging
+from typing import Dict, Any, Iterable, List, Optional, Sequence
+
+from .request_states import check_transition, narrow_sources, sources_for
+
+logger = logging.getLogger(__name__)
+
+# supabase/migrations/20250503000000_transition_request_status.sql
+TRANSITION_FUNCTION = "transition_request_status"
+# supabase/migrations/20250504000000_request_state_machine.sql
+BULK_TRANSITION_FUNCTION = "transition_request_statuses"
+
+
+def transition_params(request_id: str,
+                      status: str,
+                      expected_status: Optional[Sequence[str]] = None,
+                      result: Optional[Dict[str, Any]] = None,
+                      metadata: Optional[Dict[str, Any]] = None,
+                      payment_reference: Optional[str] = None,
+                      webhook_data: Optional[Dict[str, Any]] = None,
+                      last_error: Optional[str] = None,
+                      increment_attempts: bool = False) -> Dict[str, Any]:
+    """
+    Build the RPC arguments for one status transition.
+
+    The expected-status guard defaults to every status the state machine
+    allows a move to status from, and an explicit guard is narrowed to
+    those, so the database never applies an illegal jump. result is stored
+    under metadata.result like before; metadata keys are merged into the
+    row's metadata as they are. Fields left as None keep their current value.
+    """
+    expected_status = sources_for(status) if expected_status is None else narrow_sources(status, expected_status)
+    merged_metadata = dict(metadata or {})
+    if result:
+        merged_metadata["result"] = result
+
+    return {
+        "p_request_id": request_id,
+        "p_status": status,
+        "p_expected_status": list(expected_status),
+        "p_metadata": merged_metadata or None,
+        "p_payment_reference": payment_reference,
+        "p_webhook_data": webhook_data,
+        "p_last_error": last_error,
+        "p_increment_attempts": increment_attempts,
+    }
+
+
+def parse_transition_response(request_id: str, response: Any) -> Optional[Dict[str, Any]]:
+    """
+    Unpack the RPC response; None means there is no such request
+    """
+    if hasattr(response, 'error') and response.error is not None:
+        raise Exception(f"Failed to transition request {request_id}: {response.error}")
+
+    outcome = response.data
+    if isinstance(outcome, list):
+        outcome = outcome[0] if outcome else None
+    if not outcome:
+        logger.warning(f"No request found with ID: {request_id}")
+        return None
+
+    if not outcome.get("transitioned"):
+        logger.info(f"Request {request_id} left in '{outcome.get('previous_status')}': it was not in an expected status")
+    return outcome
+
+
+def transition_request_status(supabase, request_id: str, status: str, **kwargs) -> Optional[Dict[str, Any]]:
+    """
+    Move a request to a new status in one atomic round trip (synchronous Supabase client)
+    """
+    response = supabase.rpc(TRANSITION_FUNCTION, transition_params(request_id, status, **kwargs)).execute()
+    return parse_transition_response(request_id, response)
+
+
+# ------------- BULK TRANSITIONS -------------
+def bulk_transition_params(transitions: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Build the RPC arguments for moving many requests in one statement.
+
+    Each transition is {"id", "status"} plus optional "expected_status",
+    "current_status", "metadata", "payment_reference" and "last_error". A
+    known current_status is checked against the state machine here, so an
+    illegal jump fails before anything is sent. When an ID appears more than
+    once the last transition wins.
+    """
+    rows: Dict[str, Dict[str, Any]] = {}
+    for transition in transitions:
+        status = transition["status"]
+        if transition.get("current_status") is not None:
+            check_transition(transition["current_status"], status)
+        expected_status = transition.get("expected_status")
+        rows[str(transition["id"])] = {
+            "id": str(transition["id"]),
+            "status": status,
+            "expected_status": list(sources_for(status) if expected_status is None else narrow_sources(status, expected_status)),
+            "metadata": transition.get("metadata"),
+            "payment_reference": transition.get("payment_reference"),
+            "last_error": transition.get("last_error"),
+        }
+    return {"p_transitions": list(rows.values())}
+
+
+def parse_bulk_transition_response(response: Any) -> List[Dict[str, Any]]:
+    """
+    The requests that moved, as [{"id", "previous_status", "status"}]
+    """
+    if hasattr(response, 'error') and response.error is not None:
+        raise Exception(f"Failed to transition requests: {response.error}")
+    return response.data or []
+
+
+def transition_request_statuses(supabase,
+                                transitions: Iterable[Dict[str, Any]],
+                                batch_size: int = 500) -> Dict[str, Any]:
+    """
+    Apply many transitions with one statement per batch (synchronous Supabase client).
+    Requests whose current status fails their guard are skipped, not overwritten.
+    """
+    rows = bulk_transition_params(transitions)["p_transitions"]
+    moved: List[Dict[str, Any]] = []
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        response = supabase.rpc(BULK_TRANSITION_FUNCTION, {"p_transitions": batch}).execute()
+        moved.extend(parse_bulk_transition_response(response))
+
+    moved_ids = {row["id"] for row in moved}
+    skipped = [row["id"] for row in rows if row["id"] not in moved_ids]
+    if skipped:
+        logger.info(f"Skipped {len(skipped)} of {len(rows)} request transitions whose status had moved on")
+    return {"transitioned": moved, "skipped": skipped}
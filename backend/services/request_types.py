@@ -0,0 +1,174 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+def _compile_sources(columns: Sequence[str], metadata: Sequence[str]) -> Tuple[Tuple[bool, str], ...]:
+    """
+    Flatten a field's lookups into (from_metadata, key) pairs, columns first
+    """
+    return tuple((False, key) for key in columns) + tuple((True, key) for key in metadata)
+
+
+class StoredField:
+    """
+    Where a request field can be found on a stored team_change_requests row:
+    the columns first, then the metadata keys (snake_case, then the camelCase
+    older clients wrote), falling back to the default
+    """
+    __slots__ = ("name", "sources", "default")
+
+    def __init__(self,
+                 name: str,
+                 columns: Sequence[str] = (),
+                 metadata: Sequence[str] = (),
+                 default: Any = None):
+        self.name = name
+        self.sources = _compile_sources(columns, metadata)
+        self.default = default
+
+
+class RequestTypeSpec:
+    """
+    Everything that differs per request type, declared once.
+
+    columns maps request fields onto team_change_requests columns when the
+    row is written; fields says how to rebuild those request fields from a
+    stored row; required lists the fields execution cannot do without; and
+    executor names the RequestService method that carries the request out.
+    The lookups are compiled into flat tuples when the spec is created, so
+    record_columns() and rehydrate() are plain loops on the hot path.
+    """
+    def __init__(self,
+                 name: str,
+                 label: str,
+                 executor: str,
+                 columns: Sequence[Tuple[str, str, Any]] = (),
+                 fields: Sequence[StoredField] = (),
+                 required: Sequence[str] = ()):
+        self.name = name
+        self.label = label
+        self.executor = executor
+        # (column, field, default); a None default leaves the column out when the field is empty
+        self.columns = tuple(columns)
+        self.fields = tuple((field.name, field.sources, field.default) for field in fields)
+        self.required = ("team_id", *required)
+
+    def record_columns(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        The type-specific team_change_requests columns for a request
+        """
+        record = {}
+        for column, field, default in self.columns:
+            if default is None:
+                value = request_data.get(field)
+                if value:
+                    record[column] = value
+            else:
+                record[column] = request_data.get(field, default)
+        return record
+
+    def rehydrate(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Rebuild the request data for a stored row, trying each field's sources in order
+        """
+        metadata = row.get("metadata") or {}
+        request_data = {
+            "request_id": row.get("id"),
+            "request_type": self.name,
+            "team_id": row.get("team_id"),
+            "requested_by": row.get("requested_by"),
+        }
+        for name, sources, default in self.fields:
+            value = None
+            for from_metadata, key in sources:
+                value = metadata.get(key) if from_metadata else row.get(key)
+                if value:
+                    break
+            request_data[name] = value or default
+        return request_data
+
+    def missing(self, request_data: Dict[str, Any]) -> List[str]:
+        """
+        Required fields that are empty in the request data
+        """
+        return [field for field in self.required if not request_data.get(field)]
+
+
+REQUEST_TYPES: Dict[str, RequestTypeSpec] = {spec.name: spec for spec in (
+    RequestTypeSpec(
+        "team_transfer", "Team Ownership Transfer", "_transfer_team_ownership",
+        columns=(("old_value", "old_captain_id", ""), ("new_value", "new_captain_id", "")),
+        fields=(
+            StoredField("new_captain_id", ("new_value",), ("new_captain_id", "newCaptainId")),
+            StoredField("old_captain_id", ("old_value",), ("old_captain_id", "oldCaptainId")),
+        ),
+        required=("new_captain_id",),
+    ),
+    RequestTypeSpec(
+        "roster_change", "Team Roster Change", "_update_roster",
+        columns=(("player_id", "player_id", ""), ("new_value", "new_role", "")),
+        fields=(
+            StoredField("player_id", ("player_id",), ("player_id", "playerId")),
+            StoredField("new_role", ("new_value",), ("new_role", "role"), default="player"),
+            StoredField("operation", metadata=("operation",), default="add"),
+        ),
+        required=("player_id",),
+    ),
+    RequestTypeSpec(
+        "tournament_registration", "Tournament Registration", "_register_for_tournament",
+        columns=(("tournament_id", "tournament_id", ""),),
+        fields=(
+            StoredField("tournament_id", ("tournament_id",), ("tournament_id", "tournamentId")),
+            StoredField("player_ids", metadata=("player_ids", "playersIds"), default=()),
+        ),
+        required=("tournament_id",),
+    ),
+    RequestTypeSpec(
+        "league_registration", "League Registration", "_register_for_league",
+        columns=(("league_id", "league_id", ""), ("season", "season", 1)),
+        fields=(
+            StoredField("league_id", ("league_id",), ("league_id", "leagueId")),
+            StoredField("season", metadata=("season",), default=1),
+            StoredField("player_ids", metadata=("player_ids", "playersIds"), default=()),
+        ),
+        required=("league_id",),
+    ),
+    RequestTypeSpec(
+        "team_rebrand", "Team Name Change", "_rebrand_team",
+        columns=(("old_value", "old_name", ""), ("new_value", "new_name", "")),
+        fields=(
+            StoredField("old_name", ("old_value",), ("old_name", "oldName")),
+            StoredField("new_name", ("new_value",), ("new_name", "newName")),
+        ),
+        required=("new_name",),
+    ),
+    RequestTypeSpec(
+        "online_id_change", "Online ID Update", "_update_online_id",
+        columns=(("player_id", "player_id", ""), ("old_value", "old_online_id", ""), ("new_value", "new_online_id", "")),
+        fields=(
+            StoredField("player_id", ("player_id",), ("player_id", "playerId")),
+            StoredField("old_online_id", ("old_value",), ("old_online_id", "oldOnlineId")),
+            StoredField("new_online_id", ("new_value",), ("new_online_id", "newOnlineId")),
+            StoredField("platform", metadata=("platform",), default="psn"),
+        ),
+        required=("player_id", "new_online_id"),
+    ),
+    RequestTypeSpec(
+        "team_creation", "New Team Creation", "_create_team",
+        columns=(("new_value", "team_name", ""), ("league_id", "league_id", None)),
+        fields=(
+            StoredField("team_name", ("new_value",), ("team_name", "teamName")),
+            StoredField("captain_id", ("requested_by",), ("captain_id", "captainId")),
+            StoredField("league_id", ("league_id",), ("league_id", "leagueId")),
+        ),
+        required=("team_name", "captain_id"),
+    ),
+)}
+
+
+def get_request_type(request_type: Optional[str]) -> RequestTypeSpec:
+    """
+    Look up the spec for a request type; raises ValueError for unknown types
+    """
+    spec = REQUEST_TYPES.get(request_type)
+    if spec is None:
+        raise ValueError(f"Unknown request type: {request_type}")
+    return spec
@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from typing import Dict, Any, List, Optional, Set
+
+from .outbound_guard import OutboundGuard, get_guard
+from .request_service import RequestService
+from .request_states import COMPLETED, FAILED, PROCESSING
+from .supabase_data import SupabaseData
+
+# supabase/migrations/20250506000000_request_execution_claims.sql
+CLAIM_FUNCTION = "claim_requests"
+EXECUTOR_FUNCTION = "request_executor"
+# request_executor() value under which the status triggers stand down
+WORKER_EXECUTOR = "worker"
+
+
+class ExecutorModeError(Exception):
+    """
+    Raised when the database still executes requests from its status triggers,
+    so a worker would execute every request it claims a second time
+    """
+
+
+class RequestExecutionWorker:
+    """
+    Executes payment_complete and ready_for_execution requests in-process.
+
+    Each poll claims a batch of rows through claim_requests, which locks
+    candidates with FOR UPDATE SKIP LOCKED and moves them to processing, so
+    any number of worker processes can share the table without claiming the
+    same request twice. Claimed requests run through the
+    RequestService._execute_action handlers concurrently, at most
+    type_limits[request_type] (default_limit otherwise) per type at a time;
+    a poll only asks for as many rows of a type as there are free slots.
+    Each request ends in completed or failed.
+
+    A claim is a lease of lease_seconds. When a worker dies mid-request the
+    row is claimed again once the lease runs out, up to max_attempts times;
+    the lease must be longer than the slowest action.
+
+    The worker only claims while request_executor() is 'worker'. It checks
+    on start and stops without claiming anything otherwise.
+    """
+    def __init__(self,
+                 supabase: SupabaseData,
+                 request_service: RequestService,
+                 worker_id: Optional[str] = None,
+                 request_types: Optional[List[str]] = None,
+                 type_limits: Optional[Dict[str, int]] = None,
+                 default_limit: int = 4,
+                 poll_interval: float = 1.0,
+                 lease_seconds: int = 300,
+                 max_attempts: int = 3,
+                 guard: Optional[OutboundGuard] = None):
+        self.supabase = supabase
+        self.request_service = request_service
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.request_types = request_types or list(RequestService.ACTION_TYPES)
+        self.type_limits = {request_type: (type_limits or {}).get(request_type, default_limit)
+                            for request_type in self.request_types}
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.guard = guard or get_guard("supabase")
+        self.logger = logging.getLogger(__name__)
+
+        self._in_flight: Dict[str, int] = {request_type: 0 for request_type in self.request_types}
+        self._tasks: Set[asyncio.Task] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._counters = {
+            "polls": 0,
+            "claimed": 0,
+            "completed": 0,
+            "failed": 0,
+            "claim_errors": 0,
+        }
+
+    def start(self):
+        """
+        Start polling for requests in the background
+        """
+        if self._task is not None:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stop claiming and wait for the requests already claimed to finish
+        """
+        self._stopping = True
+        if self._task is not None:
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._counters, "worker_id": self.worker_id, "in_flight": dict(self._in_flight)}
+
+    async def check_executor_mode(self):
+        """
+        Raise ExecutorModeError unless the database hands request execution to workers
+        """
+        with self.guard.guarded():
+            response = await self.supabase.rpc(EXECUTOR_FUNCTION, {}).execute()
+        if hasattr(response, 'error') and response.error is not None:
+            raise Exception(f"Failed to read the request executor mode: {response.error}")
+        if response.data != WORKER_EXECUTOR:
+            raise ExecutorModeError(
+                f"request_executor() is {response.data!r}: the status triggers still execute requests. "
+                f"Run: alter database postgres set app.settings.request_executor = '{WORKER_EXECUTOR}';"
+            )
+
+    # ------------- CLAIMING -------------
+    def free_slots(self) -> Dict[str, int]:
+        return {request_type: limit - self._in_flight[request_type]
+                for request_type, limit in self.type_limits.items()
+                if limit > self._in_flight[request_type]}
+
+    async def _claim_rows(self, type_limits: Dict[str, int]) -> List[Dict[str, Any]]:
+        response = await self.supabase.rpc(CLAIM_FUNCTION, {
+            "p_worker_id": self.worker_id,
+            "p_type_limits": type_limits,
+            "p_lease_seconds": self.lease_seconds,
+            "p_max_attempts": self.max_attempts,
+        }).execute()
+        if hasattr(response, 'error') and response.error is not None:
+            raise Exception(f"Failed to claim requests: {response.error}")
+        return response.data or []
+
+    async def poll_once(self) -> int:
+        """
+        Claim as many requests as there are free slots and start executing them;
+        returns how many were claimed
+        """
+        slots = self.free_slots()
+        if not slots:
+            return 0
+        self._counters["polls"] += 1
+        with self.guard.guarded():
+            rows = await self._claim_rows(slots)
+
+        for row in rows:
+            request_type = row["request_type"]
+            self._in_flight[request_type] = self._in_flight.get(request_type, 0) + 1
+            task = asyncio.create_task(self._execute(row))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        self._counters["claimed"] += len(rows)
+        if rows:
+            self.logger.info(f"Worker {self.worker_id} claimed {len(rows)} requests")
+        return len(rows)
+
+    async def _run(self):
+        try:
+            await self.check_executor_mode()
+        except Exception as e:
+            self.logger.error(f"Worker {self.worker_id} will not claim requests: {str(e)}")
+            self._stopping = True
+            return
+        while not self._stopping:
+            try:
+                await self.poll_once()
+            except Exception as e:
+                self._counters["claim_errors"] += 1
+                self.logger.error(f"Error claiming requests: {str(e)}")
+
+            # Poll again as soon as a request finishes and frees its slot, or after poll_interval
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    # ------------- EXECUTION -------------
+    async def _execute(self, row: Dict[str, Any]):
+        request_id = row["id"]
+        request_type = row["request_type"]
+        try:
+            request_data = RequestService.request_data_from_record(row)
+            payment_result = None
+            if request_data.get("requires_payment", False):
+                # Only paid requests reach payment_complete, whichever path settled the payment
+                payment_details = ((row.get("metadata") or {}).get("result") or {}).get("payment_details") or {}
+                payment_result = {**payment_details, "success": True}
+
+            action_result = await self.request_service._execute_action(request_data, payment_result)
+            # Under action_result like the trigger wrote it, leaving metadata.result (the payment) alone
+            await self.request_service._update_request_status(
+                request_id, COMPLETED, expected_status=[PROCESSING], metadata={"action_result": action_result}
+            )
+            self._counters["completed"] += 1
+            self.logger.info(f"Executed {request_type} request {request_id}")
+        except Exception as e:
+            self.logger.error(f"Error executing {request_type} request {request_id}: {str(e)}", exc_info=True)
+            await self.request_service._update_request_status(
+                request_id, FAILED, expected_status=[PROCESSING], last_error=str(e),
+                metadata={"action_result": {"success": False, "error": str(e)}}
+            )
+            self._counters["failed"] += 1
+        finally:
+            self._in_flight[request_type] -= 1
+            if self._wakeup is not None:
+                self._wakeup.set()
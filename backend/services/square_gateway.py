@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import os
+import threading
+from typing import Dict, Any, Optional
+
+import httpx
+
+SQUARE_BASE_URLS = {
+    "sandbox": "https://connect.squareupsandbox.com",
+    "production": "https://connect.squareup.com",
+}
+
+# Pinned to the API version of the squareup SDK in requirements.txt
+DEFAULT_SQUARE_VERSION = "2025-03-19"
+
+
+class SquareAPIError(Exception):
+    """
+    Raised when Square answers a call with an error payload
+    """
+    def __init__(self, status_code: int, errors: list):
+        self.status_code = status_code
+        self.errors = errors or []
+        details = [f"{error.get('category')}: {error.get('detail')}" for error in self.errors]
+        super().__init__(f"Square API error ({status_code}): {', '.join(details) or 'unknown error'}")
+
+
+class SquareGateway:
+    """
+    Awaitable client for the Square REST API.
+
+    All calls share one pooled httpx.AsyncClient, so connections (and their
+    TLS sessions) stay warm between charges instead of blocking the event
+    loop on the synchronous SDK. Blocking callers get their own pooled
+    httpx.Client through the *_sync methods.
+    """
+    def __init__(self,
+                 access_token: str,
+                 environment: str = "sandbox",
+                 base_url: Optional[str] = None,
+                 timeout: float = 10.0,
+                 connect_timeout: float = 3.0,
+                 max_connections: int = 50,
+                 max_keepalive_connections: int = 20,
+                 square_version: str = DEFAULT_SQUARE_VERSION,
+                 transport: Optional[httpx.AsyncBaseTransport] = None,
+                 sync_transport: Optional[httpx.BaseTransport] = None):
+        self.access_token = access_token
+        self.environment = environment
+        self.base_url = (base_url or SQUARE_BASE_URLS.get(environment, SQUARE_BASE_URLS["sandbox"])).rstrip("/")
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections
+        )
+        self.square_version = square_version
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_lock = asyncio.Lock()
+        self._sync_transport = sync_transport
+        self._sync_client: Optional[httpx.Client] = None
+        self._sync_client_lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    @classmethod
+    def from_env(cls, **overrides) -> "SquareGateway":
+        """
+        Build a gateway from the SQUARE_* environment variables
+        """
+        settings = {
+            "access_token": os.environ.get("SQUARE_ACCESS_TOKEN"),
+            "environment": os.environ.get("SQUARE_ENVIRONMENT", "sandbox"),
+            "base_url": os.environ.get("SQUARE_BASE_URL"),
+            "timeout": float(os.environ.get("SQUARE_TIMEOUT_SECONDS", "10")),
+        }
+        settings.update(overrides)
+        return cls(**settings)
+
+    def _client_options(self) -> Dict[str, Any]:
+        return {
+            "base_url": self.base_url,
+            "headers": {
+                "Authorization": f"Bearer {self.access_token}",
+                "Square-Version": self.square_version,
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+            },
+            "timeout": self.timeout,
+            "limits": self.limits,
+        }
+
+    async def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            async with self._client_lock:
+                if self._client is None:
+                    self._client = httpx.AsyncClient(transport=self._transport, **self._client_options())
+        return self._client
+
+    def _get_sync_client(self) -> httpx.Client:
+        if self._sync_client is None:
+            with self._sync_client_lock:
+                if self._sync_client is None:
+                    self._sync_client = httpx.Client(transport=self._sync_transport, **self._client_options())
+        return self._sync_client
+
+    def _request_kwargs(self, timeout: Optional[float], kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        if timeout is not None:
+            kwargs["timeout"] = httpx.Timeout(timeout, connect=self.timeout.connect)
+        return kwargs
+
+    def _parse_response(self, method: str, path: str, response: httpx.Response) -> Dict[str, Any]:
+        try:
+            body = response.json() if response.content else {}
+        except ValueError:
+            body = {}
+
+        if response.is_error or body.get("errors"):
+            errors = body.get("errors") or [{"category": "API_ERROR", "detail": response.text[:200]}]
+            self.logger.error(f"Square {method} {path} failed with status {response.status_code}: {errors}")
+            raise SquareAPIError(response.status_code, errors)
+
+        return body
+
+    async def _request(self, method: str, path: str, timeout: Optional[float] = None, **kwargs) -> Dict[str, Any]:
+        client = await self._get_client()
+        response = await client.request(method, path, **self._request_kwargs(timeout, kwargs))
+        return self._parse_response(method, path, response)
+
+    def _request_sync(self, method: str, path: str, timeout: Optional[float] = None, **kwargs) -> Dict[str, Any]:
+        client = self._get_sync_client()
+        response = client.request(method, path, **self._request_kwargs(timeout, kwargs))
+        return self._parse_response(method, path, response)
+
+    async def create_payment(self, body: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Create a payment and return the Square payment object
+        """
+        result = await self._request("POST", "/v2/payments", json=body, timeout=timeout)
+        return result.get("payment", {})
+
+    def create_payment_sync(self, body: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Blocking variant of create_payment for scripts and other sync callers
+        """
+        result = self._request_sync("POST", "/v2/payments", json=body, timeout=timeout)
+        return result.get("payment", {})
+
+    async def get_payment(self, payment_id: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Retrieve a single payment by ID
+        """
+        result = await self._request("GET", f"/v2/payments/{payment_id}", timeout=timeout)
+        return result.get("payment", {})
+
+    async def list_payments(self,
+                            begin_time: Optional[str] = None,
+                            end_time: Optional[str] = None,
+                            cursor: Optional[str] = None,
+                            limit: int = 100,
+                            sort_order: str = "ASC",
+                            timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Fetch one page of ListPayments; the result holds "payments" and, if there are more, "cursor"
+        """
+        params = {"sort_order": sort_order, "limit": limit}
+        if begin_time:
+            params["begin_time"] = begin_time
+        if end_time:
+            params["end_time"] = end_time
+        if cursor:
+            params["cursor"] = cursor
+        return await self._request("GET", "/v2/payments", params=params, timeout=timeout)
+
+    async def refund_payment(self, body: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Refund a payment and return the Square refund object
+        """
+        result = await self._request("POST", "/v2/refunds", json=body, timeout=timeout)
+        return result.get("refund", {})
+
+    async def get_refund(self, refund_id: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Retrieve a single refund by ID
+        """
+        result = await self._request("GET", f"/v2/refunds/{refund_id}", timeout=timeout)
+        return result.get("refund", {})
+
+    async def aclose(self):
+        """
+        Close the pooled connections
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self.close_sync()
+
+    def close_sync(self):
+        """
+        Close the pooled connections used by the blocking calls
+        """
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
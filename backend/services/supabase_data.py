@@ -0,0 +1,89 @@
+import logging
+import os
+from typing import Dict, Any, Optional
+
+import httpx
+from postgrest import AsyncPostgrestClient, AsyncRequestBuilder, AsyncRPCFilterRequestBuilder
+
+
+class _PooledPostgrestClient(AsyncPostgrestClient):
+    """
+    postgrest's async client on a session we own. Upstream's constructor
+    runs as usual; only create_session is overridden to hand it that session.
+    """
+    def __init__(self, session: httpx.AsyncClient, schema: str):
+        self._shared_session = session
+        super().__init__(str(session.base_url), schema=schema, headers=dict(session.headers), timeout=session.timeout)
+        self.session = session
+
+    def create_session(self, *args, **kwargs) -> httpx.AsyncClient:
+        return self._shared_session
+
+
+class SupabaseData:
+    """
+    Awaitable PostgREST table and RPC access to Supabase.
+
+    Every query goes through one pooled httpx.AsyncClient, so concurrent
+    requests overlap their database round trips on the event loop instead
+    of blocking it inside the synchronous supabase client. table() and rpc()
+    return postgrest's async builders, used as
+    `await data.table("teams").select("*").eq("id", team_id).execute()`.
+    Errors from PostgREST are raised as postgrest.APIError.
+    """
+    def __init__(self,
+                 url: str,
+                 key: str,
+                 schema: str = "public",
+                 timeout: float = 10.0,
+                 connect_timeout: float = 3.0,
+                 max_connections: int = 50,
+                 max_keepalive_connections: int = 20,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.url = url.rstrip("/")
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections
+        )
+        self._client = httpx.AsyncClient(
+            base_url=f"{self.url}/rest/v1",
+            headers={
+                "apikey": key,
+                "Authorization": f"Bearer {key}",
+                "Accept": "application/json",
+                "Content-Type": "application/json",
+                "Accept-Profile": schema,
+                "Content-Profile": schema,
+            },
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=self.limits,
+            transport=transport,
+            follow_redirects=True
+        )
+        self._postgrest = _PooledPostgrestClient(self._client, schema)
+        self.logger = logging.getLogger(__name__)
+
+    @classmethod
+    def from_env(cls, url: str, key: str, **overrides) -> "SupabaseData":
+        """
+        Build a data client with the pool sizes from the SUPABASE_* environment variables
+        """
+        settings = {
+            "timeout": float(os.environ.get("SUPABASE_TIMEOUT_SECONDS", "10")),
+            "max_connections": int(os.environ.get("SUPABASE_MAX_CONNECTIONS", "50")),
+            "max_keepalive_connections": int(os.environ.get("SUPABASE_MAX_KEEPALIVE_CONNECTIONS", "20")),
+        }
+        settings.update(overrides)
+        return cls(url, key, **settings)
+
+    def table(self, name: str) -> AsyncRequestBuilder:
+        return self._postgrest.from_(name)
+
+    def rpc(self, function: str, params: Optional[Dict[str, Any]] = None) -> AsyncRPCFilterRequestBuilder:
+        return self._postgrest.rpc(function, params or {})
+
+    async def aclose(self):
+        """
+        Release the pooled connections
+        """
+        await self._client.aclose()
@@ -0,0 +1,132 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from .outbound_guard import OutboundGuard, get_guard
+from .supabase_data import SupabaseData
+
+# supabase/migrations/20250510000000_webhook_seen_events.sql
+RECORD_FUNCTION = "record_webhook_event"
+PURGE_FUNCTION = "purge_expired_webhook_seen_events"
+
+
+class WebhookEventDeduper:
+    """
+    Drops redelivered webhook events by event_id before they are processed.
+
+    Each event_id belongs to the inbox row that first carried it; retries
+    of that row go through, any other row with the same event_id is a
+    duplicate. A bounded in-process LRU answers repeats without a round
+    trip. Otherwise record_webhook_event settles ownership in the
+    webhook_seen_events table, so workers in other processes agree. Both
+    forget an event after ttl_seconds. When the table cannot be reached
+    the event is let through: the request status transitions are guarded,
+    so processing a duplicate is wasted work, not a wrong result.
+    """
+    def __init__(self,
+                 supabase: Optional[SupabaseData],
+                 max_entries: int = 10000,
+                 ttl_seconds: int = 7 * 24 * 60 * 60,
+                 purge_interval: float = 3600.0,
+                 guard: Optional[OutboundGuard] = None):
+        self.supabase = supabase
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.purge_interval = purge_interval
+        self.guard = guard or get_guard("supabase")
+        self.logger = logging.getLogger(__name__)
+
+        # event_id -> (expires_at, inbox_id)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._last_purge = time.monotonic()
+        self._counters = {
+            "first_seen": 0,
+            "local_duplicates": 0,
+            "durable_duplicates": 0,
+            "evictions": 0,
+            "durable_errors": 0,
+            "purged": 0,
+        }
+
+    async def first_sighting(self, event_id: str, inbox_id: str) -> bool:
+        """
+        Whether inbox_id owns event_id and should be processed; False for a duplicate
+        """
+        owner = self._get_local(event_id)
+        if owner is not None:
+            if owner != inbox_id:
+                self._counters["local_duplicates"] += 1
+                return False
+            return True
+
+        # Claimed locally before the round trip, so a copy in the same batch is dropped here
+        self._put_local(event_id, inbox_id)
+        if self.supabase is None:
+            self._counters["first_seen"] += 1
+            return True
+
+        try:
+            with self.guard.guarded():
+                response = await self.supabase.rpc(RECORD_FUNCTION, {
+                    "p_event_id": event_id,
+                    "p_inbox_id": inbox_id,
+                    "p_ttl_seconds": self.ttl_seconds,
+                }).execute()
+        except Exception as e:
+            self._counters["durable_errors"] += 1
+            self.logger.error(f"Could not record webhook event {event_id}, processing it anyway: {str(e)}")
+            return True
+
+        if response.data is False:
+            # Another row owns it; remember that, not this row
+            self._entries.pop(event_id, None)
+            self._counters["durable_duplicates"] += 1
+            return False
+        self._counters["first_seen"] += 1
+        return True
+
+    async def purge_expired(self) -> int:
+        """
+        Delete expired seen events, at most once per purge_interval
+        """
+        if self.supabase is None or time.monotonic() - self._last_purge < self.purge_interval:
+            return 0
+        self._last_purge = time.monotonic()
+        try:
+            response = await self.supabase.rpc(PURGE_FUNCTION, {}).execute()
+        except Exception as e:
+            self._counters["durable_errors"] += 1
+            self.logger.error(f"Could not purge expired webhook events: {str(e)}")
+            return 0
+        purged = response.data or 0
+        self._counters["purged"] += purged
+        return purged
+
+    def _get_local(self, event_id: str) -> Optional[str]:
+        entry = self._entries.get(event_id)
+        if entry is None:
+            return None
+        expires_at, inbox_id = entry
+        if expires_at <= time.monotonic():
+            del self._entries[event_id]
+            return None
+        self._entries.move_to_end(event_id)
+        return inbox_id
+
+    def _put_local(self, event_id: str, inbox_id: str):
+        self._entries[event_id] = (time.monotonic() + self.ttl_seconds, inbox_id)
+        self._entries.move_to_end(event_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Snapshot of the dedupe counters
+        """
+        return {
+            **self._counters,
+            "duplicates_dropped": self._counters["local_duplicates"] + self._counters["durable_duplicates"],
+            "entries": len(self._entries),
+        }
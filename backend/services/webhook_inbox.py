@@ -0,0 +1,272 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .outbound_guard import OutboundGuard, get_guard
+from .supabase_data import SupabaseData
+from .webhook_dedupe import WebhookEventDeduper
+from .webhook_payload import loads
+
+# supabase/migrations/20250509000000_webhook_inbox.sql, 20250511000000_enqueue_webhook_event.sql
+INBOX_TABLE = "webhook_inbox"
+ENQUEUE_FUNCTION = "enqueue_webhook_event"
+CLAIM_FUNCTION = "claim_webhook_events"
+COMPLETE_FUNCTION = "complete_webhook_events"
+LAG_FUNCTION = "webhook_inbox_lag"
+
+# ------------- EVENT STATUSES -------------
+RECEIVED = "received"
+PROCESSING = "processing"
+PROCESSED = "processed"
+RETRY = "retry"
+DEAD = "dead"
+DUPLICATE = "duplicate"
+
+
+class WebhookInbox:
+    """
+    The durable webhook_inbox table: the endpoint appends, workers claim and complete
+    """
+    def __init__(self, supabase: SupabaseData, guard: Optional[OutboundGuard] = None):
+        self.supabase = supabase
+        self.guard = guard or get_guard("supabase")
+        self.logger = logging.getLogger(__name__)
+
+    async def append(self, body: bytes, source: str = "square") -> str:
+        """
+        Store a webhook body exactly as received; returns the inbox ID.
+        The table is closed to the API's key, so this goes through a definer function.
+        """
+        query = self.supabase.rpc(ENQUEUE_FUNCTION, {
+            "p_body": body.decode("utf-8", errors="replace"),
+            "p_source": source,
+        })
+        with self.guard.guarded():
+            response = await query.execute()
+        if hasattr(response, 'error') and response.error is not None:
+            raise Exception(f"Failed to store webhook: {response.error}")
+        if not response.data:
+            raise Exception("Failed to store webhook: no inbox ID returned")
+        return str(response.data)
+
+    async def claim(self, worker_id: str, limit: int, lease_seconds: int, max_attempts: int) -> List[Dict[str, Any]]:
+        response = await self.supabase.rpc(CLAIM_FUNCTION, {
+            "p_worker_id": worker_id,
+            "p_limit": limit,
+            "p_lease_seconds": lease_seconds,
+            "p_max_attempts": max_attempts,
+        }).execute()
+        if hasattr(response, 'error') and response.error is not None:
+            raise Exception(f"Failed to claim webhook events: {response.error}")
+        return response.data or []
+
+    async def complete(self, results: List[Dict[str, Any]]) -> int:
+        response = await self.supabase.rpc(COMPLETE_FUNCTION, {"p_results": results}).execute()
+        if hasattr(response, 'error') and response.error is not None:
+            raise Exception(f"Failed to record webhook outcomes: {response.error}")
+        return response.data or 0
+
+    async def lag(self) -> Dict[str, Any]:
+        """
+        Backlog size, age of the oldest waiting event and dead events
+        """
+        response = await self.supabase.rpc(LAG_FUNCTION, {}).execute()
+        if hasattr(response, 'error') and response.error is not None:
+            raise Exception(f"Failed to read webhook inbox lag: {response.error}")
+        return response.data or {}
+
+
+def _age_seconds(received_at: Optional[str], now: datetime) -> float:
+    if not received_at:
+        return 0.0
+    try:
+        received = datetime.fromisoformat(received_at.replace("Z", "+00:00"))
+    except ValueError:
+        return 0.0
+    if received.tzinfo is None:
+        received = received.replace(tzinfo=timezone.utc)
+    return max((now - received).total_seconds(), 0.0)
+
+
+class WebhookInboxWorker:
+    """
+    Drains the webhook inbox in batches.
+
+    Each poll claims up to batch_size events (FOR UPDATE SKIP LOCKED, so
+    workers in any number of processes share the inbox) and hands each
+    parsed body to handler, at most concurrency at a time. The outcomes of
+    the batch are written back in one call: processed, retry (after
+    retry_base_seconds doubled per attempt) or dead once max_attempts is
+    used up or the body is not JSON. An event whose worker dies is claimed
+    again when its lease_seconds lease runs out. With a deduper, a
+    redelivered copy of an event already taken by another inbox row is
+    marked duplicate without being handled.
+
+    stats() reports throughput counters and how far behind the inbox is:
+    the age of the oldest event in the last batch and, every
+    lag_interval seconds, the backlog from webhook_inbox_lag().
+    """
+    def __init__(self,
+                 inbox: WebhookInbox,
+                 handler: Callable[[Dict[str, Any]], Awaitable[Optional[Dict[str, Any]]]],
+                 worker_id: Optional[str] = None,
+                 batch_size: int = 50,
+                 concurrency: int = 8,
+                 poll_interval: float = 1.0,
+                 lease_seconds: int = 120,
+                 max_attempts: int = 5,
+                 retry_base_seconds: int = 5,
+                 lag_interval: float = 30.0,
+                 deduper: Optional[WebhookEventDeduper] = None):
+        self.inbox = inbox
+        self.handler = handler
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.lag_interval = lag_interval
+        self.deduper = deduper
+        self.logger = logging.getLogger(__name__)
+
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._last_lag_check = 0.0
+        self._lag: Dict[str, Any] = {}
+        self._counters = {
+            "polls": 0,
+            "claimed": 0,
+            "processed": 0,
+            "retried": 0,
+            "dead": 0,
+            "duplicates": 0,
+            "claim_errors": 0,
+            "complete_errors": 0,
+        }
+        self._batch_lag_seconds = 0.0
+
+    def start(self):
+        """
+        Start draining the inbox in the background
+        """
+        if self._task is not None:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stop claiming and wait for the batch in hand to finish
+        """
+        self._stopping = True
+        if self._task is not None:
+            self._wakeup.set()
+            await self._task
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._counters,
+            "worker_id": self.worker_id,
+            "batch_lag_seconds": round(self._batch_lag_seconds, 3),
+            "inbox": dict(self._lag),
+            "dedupe": self.deduper.stats() if self.deduper else None,
+        }
+
+    async def poll_once(self) -> int:
+        """
+        Claim one batch, process it and record the outcomes; returns how many events were claimed
+        """
+        self._counters["polls"] += 1
+        with self.inbox.guard.guarded():
+            events = await self.inbox.claim(self.worker_id, self.batch_size, self.lease_seconds, self.max_attempts)
+        if not events:
+            self._batch_lag_seconds = 0.0
+            return 0
+        self._counters["claimed"] += len(events)
+
+        now = datetime.now(timezone.utc)
+        self._batch_lag_seconds = max(_age_seconds(event.get("received_at"), now) for event in events)
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*(self._process(event) for event in events))
+
+        try:
+            with self.inbox.guard.guarded():
+                await self.inbox.complete(results)
+        except Exception as e:
+            # The leases run out and the batch is claimed again
+            self._counters["complete_errors"] += 1
+            self.logger.error(f"Webhook worker {self.worker_id} could not record {len(results)} outcomes: {str(e)}")
+        return len(events)
+
+    async def _process(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        outcome = {"id": event["id"], "status": PROCESSED, "last_error": None, "retry_in_seconds": None, "result": None}
+        try:
+            payload = loads(event["body"])
+        except (TypeError, ValueError) as e:
+            self._counters["dead"] += 1
+            outcome.update(status=DEAD, last_error=f"Malformed webhook body: {str(e)}")
+            return outcome
+
+        async with self._semaphore:
+            event_id = payload.get("event_id") if isinstance(payload, dict) else None
+            if self.deduper is not None and event_id and not await self.deduper.first_sighting(event_id, event["id"]):
+                self._counters["duplicates"] += 1
+                outcome.update(status=DUPLICATE, result={"duplicate_event_id": event_id})
+                return outcome
+            try:
+                outcome["result"] = await self.handler(payload)
+                self._counters["processed"] += 1
+            except Exception as e:
+                attempts = event.get("attempts") or 1
+                outcome["last_error"] = str(e)
+                if attempts >= self.max_attempts:
+                    self._counters["dead"] += 1
+                    outcome["status"] = DEAD
+                    self.logger.error(f"Webhook event {event['id']} failed for good after {attempts} attempts: {str(e)}")
+                else:
+                    self._counters["retried"] += 1
+                    outcome["status"] = RETRY
+                    outcome["retry_in_seconds"] = self.retry_base_seconds * 2 ** (attempts - 1)
+                    self.logger.warning(f"Webhook event {event['id']} failed (attempt {attempts}), retrying: {str(e)}")
+        return outcome
+
+    async def _check_lag(self):
+        if time.monotonic() - self._last_lag_check < self.lag_interval:
+            return
+        self._last_lag_check = time.monotonic()
+        try:
+            self._lag = await self.inbox.lag()
+        except Exception as e:
+            self.logger.error(f"Could not read webhook inbox lag: {str(e)}")
+        if self.deduper is not None:
+            await self.deduper.purge_expired()
+
+    async def _run(self):
+        while not self._stopping:
+            claimed = 0
+            try:
+                claimed = await self.poll_once()
+            except Exception as e:
+                self._counters["claim_errors"] += 1
+                self.logger.error(f"Webhook worker {self.worker_id} poll failed: {str(e)}")
+            await self._check_lag()
+            if claimed >= self.batch_size or self._stopping:
+                # A full batch means more are likely waiting
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,71 @@
+import json
+import re
+from typing import Any, Iterable, NamedTuple, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # pinned in requirements.txt; only a partial install falls back to json
+    orjson = None
+
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+# Square event types dispatch_square_event acts on
+HANDLED_EVENT_TYPES = ("payment.updated",)
+_HANDLED_NEEDLES = tuple(f'"{event_type}"'.encode("utf-8") for event_type in HANDLED_EVENT_TYPES)
+
+# Event types always contain a dot ("payment.updated"); the nested object types
+# that share the "type" key ("payment", "refund") never do
+_EVENT_TYPE_RE = re.compile(rb'"type"\s*:\s*"([a-z0-9_]+\.[a-z0-9_.]+)"')
+_EVENT_ID_RE = re.compile(rb'"event_id"\s*:\s*"([^"\\]*)"')
+_REFERENCE_ID_RE = re.compile(rb'"reference_id"\s*:\s*"([^"\\]*)"')
+# Any \u escape could spell a handled type without its literal bytes being present
+_UNICODE_ESCAPE = b"\\u"
+
+
+class EventSummary(NamedTuple):
+    type: Optional[str]
+    event_id: Optional[str]
+    reference_id: Optional[str]
+
+
+def loads(body: Union[str, bytes]) -> Any:
+    """
+    Parse a JSON body with orjson (json when it is missing); raises ValueError on malformed JSON
+    """
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def _as_bytes(body: Union[str, bytes]) -> bytes:
+    return body.encode("utf-8") if isinstance(body, str) else body
+
+
+def may_be_handled(body: Union[str, bytes], handled_types: Optional[Iterable[str]] = None) -> bool:
+    """
+    False only when body certainly is not one of handled_types (default
+    HANDLED_EVENT_TYPES), decided by a substring scan without parsing it.
+    True means it has to be parsed to know.
+    """
+    raw = _as_bytes(body)
+    if _UNICODE_ESCAPE in raw:
+        return True
+    needles = _HANDLED_NEEDLES if handled_types is None else [f'"{t}"'.encode("utf-8") for t in handled_types]
+    for needle in needles:
+        if needle in raw:
+            return True
+    return False
+
+
+def peek_event(body: Union[str, bytes]) -> EventSummary:
+    """
+    The event type, event ID and payment reference read straight from the raw
+    body, for logging events that are not parsed. Any may be None.
+    """
+    raw = _as_bytes(body)
+    return EventSummary(_first(_EVENT_TYPE_RE, raw), _first(_EVENT_ID_RE, raw), _first(_REFERENCE_ID_RE, raw))
+
+
+def _first(pattern: "re.Pattern", raw: bytes) -> Optional[str]:
+    match = pattern.search(raw)
+    return match.group(1).decode("utf-8", errors="replace") if match is not None else None
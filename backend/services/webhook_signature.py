@@ -0,0 +1,131 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import logging
+import os
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+SIGNATURE_HEADER = "x-square-hmacsha256-signature"
+# base64 of a 32-byte SHA-256 digest
+SIGNATURE_LENGTH = 44
+# Development-only opt-out: accept unsigned webhooks when no signature key is set
+ALLOW_UNSIGNED_ENV = "SQUARE_WEBHOOK_ALLOW_UNSIGNED"
+
+
+def unsigned_webhooks_allowed() -> bool:
+    """
+    Whether SQUARE_WEBHOOK_ALLOW_UNSIGNED=true lets webhooks through unchecked; never when SQUARE_ENVIRONMENT is production
+    """
+    if os.getenv("SQUARE_ENVIRONMENT", "sandbox").strip().lower() == "production":
+        return False
+    return os.getenv(ALLOW_UNSIGNED_ENV, "").strip().lower() in ("1", "true", "yes")
+
+
+class WebhookSignatureVerifier:
+    """
+    Checks Square's webhook signature, base64(HMAC-SHA256(key, url + body)),
+    against the raw body before anything parses it.
+
+    Cheap checks come first: a missing or wrongly sized header or an
+    oversized body is rejected without hashing. The HMAC seeded with each
+    key and notification URL is computed once and cached (at most
+    max_cached_states), so a request only copies that state and feeds it
+    the body, with no url + body concatenation. Digests are compared with
+    hmac.compare_digest.
+
+    Several keys can be active at once while Square's signature key is
+    rotated. The key that verified most recently is tried first, so after
+    a rotation the new key costs one HMAC per request and the old one is
+    only tried for stragglers.
+    """
+    def __init__(self,
+                 signature_keys: Sequence[str],
+                 notification_url: Optional[str] = None,
+                 max_body_bytes: int = 256 * 1024,
+                 max_cached_states: int = 32):
+        keys = [key.strip() for key in signature_keys if key and key.strip()]
+        if not keys:
+            raise ValueError("At least one webhook signature key is required")
+        self._keys: List[bytes] = [key.encode("utf-8") for key in keys]
+        self.notification_url = notification_url
+        self.max_body_bytes = max_body_bytes
+        self.max_cached_states = max_cached_states
+        self.logger = logging.getLogger(__name__)
+
+        self._preferred = 0
+        # (key index, notification URL) -> HMAC that has already consumed the URL
+        self._states: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._counters = {
+            "verified": 0,
+            "verified_with_older_key": 0,
+            "missing_signature": 0,
+            "malformed_signature": 0,
+            "oversized": 0,
+            "mismatched": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> Optional["WebhookSignatureVerifier"]:
+        """
+        Build from SQUARE_WEBHOOK_SIGNATURE_KEY (comma-separated during a key
+        rotation, newest first) and SQUARE_WEBHOOK_NOTIFICATION_URL; None when no key is set
+        """
+        keys = [key for key in os.getenv("SQUARE_WEBHOOK_SIGNATURE_KEY", "").split(",") if key.strip()]
+        if not keys:
+            return None
+        return cls(
+            keys,
+            notification_url=os.getenv("SQUARE_WEBHOOK_NOTIFICATION_URL") or None,
+            max_body_bytes=int(os.getenv("SQUARE_WEBHOOK_MAX_BODY_BYTES", str(256 * 1024)))
+        )
+
+    def verify(self, signature: Optional[str], body: bytes, url: Optional[str] = None) -> bool:
+        """
+        Whether signature is Square's signature of body sent to url (or the configured notification URL)
+        """
+        if not signature:
+            self._counters["missing_signature"] += 1
+            return False
+        if len(signature) != SIGNATURE_LENGTH:
+            self._counters["malformed_signature"] += 1
+            return False
+        if len(body) > self.max_body_bytes:
+            self._counters["oversized"] += 1
+            return False
+        try:
+            expected = base64.b64decode(signature, validate=True)
+        except (binascii.Error, ValueError):
+            self._counters["malformed_signature"] += 1
+            return False
+
+        url = self.notification_url or url or ""
+        preferred = self._preferred
+        for index in (preferred, *(i for i in range(len(self._keys)) if i != preferred)):
+            digest = self._state(index, url)
+            digest.update(body)
+            if hmac.compare_digest(digest.digest(), expected):
+                if index != preferred:
+                    self._preferred = index
+                if index != 0:
+                    self._counters["verified_with_older_key"] += 1
+                self._counters["verified"] += 1
+                return True
+        self._counters["mismatched"] += 1
+        return False
+
+    def _state(self, index: int, url: str):
+        cache_key = (index, url)
+        state = self._states.get(cache_key)
+        if state is None:
+            state = hmac.new(self._keys[index], url.encode("utf-8"), hashlib.sha256)
+            self._states[cache_key] = state
+            while len(self._states) > self.max_cached_states:
+                self._states.popitem(last=False)
+        else:
+            self._states.move_to_end(cache_key)
+        return state.copy()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._counters, "keys": len(self._keys), "cached_states": len(self._states)}
@@ -9,16 +9,17 @@ This module provides functionality to:
 Based on testing, the payments table in Supabase accepts payments with null metadata.
 """
 
-from square.client import Client
-from square.http.auth.o_auth_2 import BearerAuthCredentials
 import os
 import json
-import uuid
 import requests
 import logging
 from datetime import datetime
 from dotenv import load_dotenv
 
+from services.payment_engine import get_payment_engine
+from services.payment_metadata import prepare_payment_row
+from services.square_gateway import SquareAPIError
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -34,23 +35,23 @@ class SquarePaymentHandler:
     
     def __init__(self):
         """Initialize with configuration from environment variables."""
-        # Square configuration
-        self.square_access_token = os.getenv('SQUARE_ACCESS_TOKEN')
-        self.square_location_id = os.getenv('SQUARE_LOCATION_ID')
-        self.square_environment = os.getenv('SQUARE_ENVIRONMENT', 'sandbox')
-        self.bearer_auth_credentials = BearerAuthCredentials(
-            access_token=self.square_access_token
-        )
+        # Square calls go through the shared payment engine
+        self.payment_engine = get_payment_engine()
+        self.square_location_id = self.payment_engine.config.location_id
+        self.square_environment = self.payment_engine.config.environment
         
         # Supabase configuration
         self.supabase_url = os.getenv('SUPABASE_URL')
         self.supabase_key = os.getenv('SUPABASE_ANON_KEY')
         
-        # Initialize Square client
-        self.square_client = Client(
-            bearer_auth_credentials=self.bearer_auth_credentials,
-            environment=self.square_environment
-        )
+        # Reuse one keep-alive session for every Supabase REST call
+        self.supabase_session = requests.Session()
+        self.supabase_session.headers.update({
+            'apikey': self.supabase_key,
+            'Authorization': f'Bearer {self.supabase_key}',
+            'Content-Type': 'application/json',
+            'Prefer': 'return=representation'
+        })
         
         logger.info(f"Initialized with Square environment: {self.square_environment}")
         logger.info(f"Using Square location ID: {self.square_location_id}")
@@ -72,46 +73,24 @@ class SquarePaymentHandler:
             dict: The payment data if successful, None otherwise
         """
         try:
-            # Generate idempotency key if not provided
-            if not idempotency_key:
-                idempotency_key = str(uuid.uuid4())
-            
             logger.info(f"Creating payment of {amount} {currency}")
-            logger.info(f"Using idempotency key: {idempotency_key}")
-            
-            # Convert amount to cents (integer)
-            amount_in_cents = int(amount * 100)
-            
-            # Create payment request body
-            payment_body = {
-                "source_id": source_id,
-                "amount_money": {
-                    "amount": amount_in_cents,
-                    "currency": currency
-                },
-                "idempotency_key": idempotency_key,
-                "location_id": self.square_location_id
-            }
-            
-            # Add optional fields if provided
-            if note:
-                payment_body["note"] = note
-            if reference_id:
-                payment_body["reference_id"] = reference_id
-            
-            logger.info(f"Sending payment request to Square: {json.dumps(payment_body, default=str)}")
             
             # Call Square API
-            result = self.square_client.payments.create_payment(payment_body)
-            
-            if result.is_success():
-                payment = result.body.get("payment", {})
-                logger.info(f"Payment successful! ID: {payment.get('id')}")
-                return payment
-            elif result.is_error():
-                errors = result.errors
-                logger.error(f"Square API Error: {errors}")
+            try:
+                payment = self.payment_engine.charge_sync(
+                    source_id,
+                    amount,
+                    idempotency_key=idempotency_key,
+                    note=note,
+                    reference_id=reference_id,
+                    currency=currency
+                )
+            except SquareAPIError as api_error:
+                logger.error(f"Square API Error: {api_error.errors}")
                 return None
+            
+            logger.info(f"Payment successful! ID: {payment.get('id')}")
+            return payment
                 
         except Exception as e:
             logger.exception(f"Error creating payment: {e}")
@@ -155,30 +134,22 @@ class SquarePaymentHandler:
                 
             description = " - ".join(description_parts)
             
-            # Try to build valid metadata structure if possible
-            # Based on the database validation requirements, we need:
-            # - transaction_details.processor_response
-            # - transaction_details.authorization_code
-            # - payment_method.type
-            # - payment_method.last_four
-            metadata = None
-            
             # Extract card details if available
             card_details = payment_data.get('card_details', {})
             card = card_details.get('card', {})
             card_brand = card.get('card_brand', '')
             last_4 = card.get('last_4', '')
             
-            # Only create metadata if we have sufficient card details
+            # Only create metadata if we have sufficient card details; NULL metadata passes validation
+            metadata = None
             if card_brand and last_4:
-                # Create properly structured metadata that will pass validation
                 metadata = {
                     "transaction_details": {
                         "processor_response": payment_data.get('receipt_number', payment_id),
                         "authorization_code": payment_data.get('id', '')
                     },
                     "payment_method": {
-                        "type": card_brand.lower() if card_brand else "square",
+                        "type": card_brand.lower(),
                         "last_four": last_4
                     },
                     # Add additional fields that won't affect validation
@@ -187,11 +158,6 @@ class SquarePaymentHandler:
                     "event_id": event_id,
                     "team_id": team_id
                 }
-                logger.info("Created structured metadata that should pass validation")
-            else:
-                # Use NULL metadata which passes validation
-                logger.info("Using NULL metadata (insufficient card details available)")
-                metadata = None
             
             # Create payment record
             payment_record = {
@@ -202,22 +168,18 @@ class SquarePaymentHandler:
                 'payment_method': 'square',
                 'payment_id': payment_id,
                 'description': description,
-                'metadata': metadata  # Could be structured or NULL
+                'metadata': metadata
             }
             
+            # Check the metadata against the database rules before sending anything,
+            # so a bad structure becomes NULL metadata instead of a rejected insert and a retry
+            payment_record = prepare_payment_row(payment_record)
+            
             logger.info(f"Storing payment in database: {json.dumps(payment_record, default=str)}")
             
             # Using direct REST API call to Supabase
-            headers = {
-                'apikey': self.supabase_key,
-                'Authorization': f'Bearer {self.supabase_key}',
-                'Content-Type': 'application/json',
-                'Prefer': 'return=representation'
-            }
-            
-            response = requests.post(
+            response = self.supabase_session.post(
                 f"{self.supabase_url}/rest/v1/payments",
-                headers=headers,
                 json=payment_record
             )
             
@@ -225,28 +187,9 @@ class SquarePaymentHandler:
                 data = response.json()
                 logger.info(f"Payment successfully stored in database! ID: {data[0].get('id') if data else 'Unknown'}")
                 return True
-            else:
-                logger.error(f"Failed to store payment in database: {response.status_code}, {response.text}")
-                
-                # If we tried to use structured metadata and it failed, try again with NULL
-                if metadata is not None:
-                    logger.info("Structured metadata failed validation, retrying with NULL metadata")
-                    payment_record['metadata'] = None
-                    
-                    retry_response = requests.post(
-                        f"{self.supabase_url}/rest/v1/payments",
-                        headers=headers,
-                        json=payment_record
-                    )
-                    
-                    if retry_response.status_code in (200, 201):
-                        retry_data = retry_response.json()
-                        logger.info(f"Payment successfully stored with NULL metadata! ID: {retry_data[0].get('id') if retry_data else 'Unknown'}")
-                        return True
-                    else:
-                        logger.error(f"Retry with NULL metadata also failed: {retry_response.status_code}, {retry_response.text}")
-                
-                return False
+            
+            logger.error(f"Failed to store payment in database: {response.status_code}, {response.text}")
+            return False
                 
         except Exception as e:
             logger.exception(f"Database error: {e}")
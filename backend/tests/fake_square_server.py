@@ -0,0 +1,356 @@
+#!/usr/bin/env python
+"""
+Local stand-in for the Square Payments API.
+
+Implements enough of CreatePayment, GetPayment, ListPayments, RefundPayment
+and GetPaymentRefund for the backend to run its payment flow offline, with
+configurable latency, error rates and decline codes. Payment and refund
+events can be posted to a webhook URL, signed the same way Square signs them.
+
+Point the backend at it with:
+    SQUARE_BASE_URL=http://127.0.0.1:8090
+
+Run standalone with:
+    python -m tests.fake_square_server --port 8090 --latency-ms 150 --latency-jitter-ms 50 --error-rate 0.01
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import random
+import uuid
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+# Square sandbox test nonces and the decline codes they produce
+SANDBOX_DECLINE_NONCES = {
+    "cnon:card-nonce-declined": "CARD_DECLINED",
+    "cnon:card-nonce-rejected-cvv": "CVV_FAILURE",
+    "cnon:card-nonce-rejected-postalcode": "ADDRESS_VERIFICATION_FAILURE",
+    "cnon:card-nonce-rejected-expiration": "INVALID_EXPIRATION",
+    "cnon:card-nonce-insufficient-funds": "INSUFFICIENT_FUNDS",
+}
+
+@dataclass
+class FakeSquareConfig:
+    """Knobs for the fake server; all latencies are in milliseconds"""
+    latency_distribution: str = "fixed"  # "fixed", "uniform", "normal" or "lognormal"
+    latency_ms: float = 0.0
+    latency_jitter_ms: float = 0.0
+    error_rate: float = 0.0  # share of calls answered with a 5xx
+    decline_rate: float = 0.0  # share of card charges declined at random
+    random_decline_codes: List[str] = field(default_factory=lambda: ["CARD_DECLINED", "INSUFFICIENT_FUNDS", "GENERIC_DECLINE"])
+    decline_codes: Dict[str, str] = field(default_factory=lambda: dict(SANDBOX_DECLINE_NONCES))
+    webhook_url: Optional[str] = None
+    webhook_signature_key: str = "fake-signature-key"
+    webhook_delay_ms: float = 0.0
+    seed: Optional[int] = None
+
+
+def square_error(status_code: int, category: str, code: str, detail: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={"errors": [{"category": category, "code": code, "detail": detail}]}
+    )
+
+
+def sign_webhook(signature_key: str, notification_url: str, body: bytes) -> str:
+    """Square's webhook signature: base64(HMAC-SHA256(key, url + body))"""
+    digest = hmac.new(signature_key.encode("utf-8"), notification_url.encode("utf-8") + body, hashlib.sha256).digest()
+    return base64.b64encode(digest).decode("ascii")
+
+
+class FakeSquareState:
+    """In-memory payments, refunds and call counters"""
+    def __init__(self, config: FakeSquareConfig):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.payments: Dict[str, Dict[str, Any]] = {}
+        self.payment_order: List[str] = []
+        self.refunds: Dict[str, Dict[str, Any]] = {}
+        self.idempotency: Dict[str, str] = {}
+        self.webhooks_sent: List[Dict[str, Any]] = []
+        self.calls: Dict[str, int] = {}
+
+    def latency_seconds(self) -> float:
+        config = self.config
+        if config.latency_distribution == "uniform":
+            value = self.random.uniform(config.latency_ms - config.latency_jitter_ms, config.latency_ms + config.latency_jitter_ms)
+        elif config.latency_distribution == "normal":
+            value = self.random.gauss(config.latency_ms, config.latency_jitter_ms)
+        elif config.latency_distribution == "lognormal" and config.latency_ms > 0:
+            # latency_ms is the median, latency_jitter_ms widens the tail
+            sigma = config.latency_jitter_ms / config.latency_ms if config.latency_jitter_ms else 0.0
+            value = self.random.lognormvariate(0.0, sigma) * config.latency_ms
+        else:
+            value = config.latency_ms
+        return max(value, 0.0) / 1000
+
+    def should_fail(self) -> bool:
+        return self.config.error_rate > 0 and self.random.random() < self.config.error_rate
+
+    def decline_code(self, source_id: str) -> Optional[str]:
+        if source_id in self.config.decline_codes:
+            return self.config.decline_codes[source_id]
+        if self.config.decline_rate > 0 and self.random.random() < self.config.decline_rate:
+            return self.random.choice(self.config.random_decline_codes)
+        return None
+
+
+def call_name(request: Request) -> str:
+    # Collapse IDs so the counters stay bounded: "GET /v2/payments/{id}"
+    parts = request.url.path.rstrip("/").split("/")
+    if len(parts) > 3:
+        parts = parts[:3] + ["{id}"]
+    return f"{request.method} {'/'.join(parts)}"
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def create_fake_square_app(config: Optional[FakeSquareConfig] = None) -> FastAPI:
+    """
+    Build the fake Square API; app.state.fake holds its state and config
+    """
+    state = FakeSquareState(config or FakeSquareConfig())
+    app = FastAPI(title="Fake Square API")
+    app.state.fake = state
+    webhook_client: Dict[str, httpx.AsyncClient] = {}
+    webhook_tasks = set()
+
+    def schedule_webhook(event_type: str, object_type: str, obj: Dict[str, Any]):
+        # Keep a reference so the task isn't garbage collected mid-delivery
+        task = asyncio.create_task(emit_webhook(event_type, object_type, dict(obj)))
+        webhook_tasks.add(task)
+        task.add_done_callback(webhook_tasks.discard)
+
+    async def emit_webhook(event_type: str, object_type: str, obj: Dict[str, Any]):
+        url = state.config.webhook_url
+        if not url:
+            return
+        event = {
+            "merchant_id": "FAKE_MERCHANT",
+            "type": event_type,
+            "event_id": str(uuid.uuid4()),
+            "created_at": now_iso(),
+            "data": {"type": object_type, "id": obj["id"], "object": {object_type: obj}}
+        }
+        body = json.dumps(event).encode("utf-8")
+        headers = {
+            "Content-Type": "application/json",
+            "x-square-hmacsha256-signature": sign_webhook(state.config.webhook_signature_key, url, body)
+        }
+        if state.config.webhook_delay_ms:
+            await asyncio.sleep(state.config.webhook_delay_ms / 1000)
+        try:
+            if "client" not in webhook_client:
+                webhook_client["client"] = httpx.AsyncClient(timeout=10.0)
+            await webhook_client["client"].post(url, content=body, headers=headers)
+            state.webhooks_sent.append(event)
+        except Exception as e:
+            logger.error(f"Failed to deliver fake webhook {event_type}: {str(e)}")
+
+    @app.middleware("http")
+    async def inject_faults(request: Request, call_next):
+        if request.url.path.startswith("/_fake"):
+            return await call_next(request)
+
+        state.calls[call_name(request)] = state.calls.get(call_name(request), 0) + 1
+
+        delay = state.latency_seconds()
+        if delay:
+            await asyncio.sleep(delay)
+        if state.should_fail():
+            return square_error(503, "API_ERROR", "SERVICE_UNAVAILABLE", "Injected failure from the fake Square server")
+        return await call_next(request)
+
+    @app.post("/v2/payments")
+    async def create_payment(request: Request):
+        body = await request.json()
+        idempotency_key = body.get("idempotency_key")
+        if not idempotency_key or not body.get("source_id") or not body.get("amount_money"):
+            return square_error(400, "INVALID_REQUEST_ERROR", "MISSING_REQUIRED_PARAMETER", "source_id, amount_money and idempotency_key are required")
+
+        if idempotency_key in state.idempotency:
+            return {"payment": state.payments[state.idempotency[idempotency_key]]}
+
+        decline_code = state.decline_code(body["source_id"])
+        if decline_code:
+            return square_error(400, "PAYMENT_METHOD_ERROR", decline_code, f"Card was declined ({decline_code})")
+
+        payment_id = uuid.uuid4().hex[:22].upper()
+        created_at = now_iso()
+        payment = {
+            "id": payment_id,
+            "created_at": created_at,
+            "updated_at": created_at,
+            "amount_money": body["amount_money"],
+            "total_money": body["amount_money"],
+            "status": "COMPLETED" if body.get("autocomplete", True) else "APPROVED",
+            "source_type": "CARD",
+            "source_id": body["source_id"],
+            "card_details": {
+                "status": "CAPTURED",
+                "card": {"card_brand": "VISA", "last_4": "1111", "exp_month": 12, "exp_year": 2030},
+                "entry_method": "KEYED"
+            },
+            "location_id": body.get("location_id") or "FAKE_LOCATION",
+            "order_id": uuid.uuid4().hex[:24].upper(),
+            "reference_id": body.get("reference_id"),
+            "note": body.get("note"),
+            "receipt_number": payment_id[:4],
+            "receipt_url": f"https://squareupsandbox.com/receipt/preview/{payment_id}",
+            "version_token": uuid.uuid4().hex,
+        }
+        state.payments[payment_id] = payment
+        state.payment_order.append(payment_id)
+        state.idempotency[idempotency_key] = payment_id
+
+        schedule_webhook("payment.created", "payment", payment)
+        schedule_webhook("payment.updated", "payment", payment)
+        return {"payment": payment}
+
+    @app.get("/v2/payments/{payment_id}")
+    async def get_payment(payment_id: str):
+        payment = state.payments.get(payment_id)
+        if not payment:
+            return square_error(404, "INVALID_REQUEST_ERROR", "NOT_FOUND", f"Payment {payment_id} not found")
+        return {"payment": payment}
+
+    @app.get("/v2/payments")
+    async def list_payments(begin_time: Optional[str] = None,
+                            end_time: Optional[str] = None,
+                            sort_order: str = "DESC",
+                            cursor: Optional[str] = None,
+                            limit: int = 100):
+        payments = [state.payments[payment_id] for payment_id in state.payment_order]
+        if begin_time:
+            payments = [p for p in payments if p["created_at"] >= begin_time]
+        if end_time:
+            payments = [p for p in payments if p["created_at"] < end_time]
+        if sort_order.upper() == "DESC":
+            payments = list(reversed(payments))
+
+        offset = int(cursor) if cursor else 0
+        limit = max(1, min(limit, 100))
+        page = payments[offset:offset + limit]
+        result: Dict[str, Any] = {"payments": page} if page else {}
+        if offset + limit < len(payments):
+            result["cursor"] = str(offset + limit)
+        return result
+
+    @app.post("/v2/refunds")
+    async def refund_payment(request: Request):
+        body = await request.json()
+        payment = state.payments.get(body.get("payment_id"))
+        if not payment:
+            return square_error(404, "INVALID_REQUEST_ERROR", "NOT_FOUND", "Payment not found")
+
+        idempotency_key = body.get("idempotency_key")
+        refund_key = f"refund:{idempotency_key}"
+        if refund_key in state.idempotency:
+            return {"refund": state.refunds[state.idempotency[refund_key]]}
+
+        refunded = payment.get("refunded_money", {}).get("amount", 0)
+        amount = body.get("amount_money", {}).get("amount", 0)
+        if amount <= 0 or refunded + amount > payment["amount_money"]["amount"]:
+            return square_error(400, "INVALID_REQUEST_ERROR", "REFUND_AMOUNT_INVALID", "Refund amount is invalid")
+
+        refund_id = f"{payment['id']}_{uuid.uuid4().hex[:12].upper()}"
+        refund = {
+            "id": refund_id,
+            "status": "COMPLETED",
+            "amount_money": body["amount_money"],
+            "payment_id": payment["id"],
+            "location_id": payment["location_id"],
+            "reason": body.get("reason"),
+            "created_at": now_iso(),
+            "updated_at": now_iso(),
+        }
+        state.refunds[refund_id] = refund
+        state.idempotency[refund_key] = refund_id
+        payment["refunded_money"] = {"amount": refunded + amount, "currency": payment["amount_money"]["currency"]}
+        payment["refund_ids"] = payment.get("refund_ids", []) + [refund_id]
+        payment["updated_at"] = now_iso()
+
+        schedule_webhook("refund.created", "refund", refund)
+        schedule_webhook("payment.updated", "payment", payment)
+        return {"refund": refund}
+
+    @app.get("/v2/refunds/{refund_id}")
+    async def get_refund(refund_id: str):
+        refund = state.refunds.get(refund_id)
+        if not refund:
+            return square_error(404, "INVALID_REQUEST_ERROR", "NOT_FOUND", f"Refund {refund_id} not found")
+        return {"refund": refund}
+
+    # ------------- CONTROL ENDPOINTS -------------
+    @app.get("/_fake/state")
+    async def fake_state():
+        return {
+            "config": asdict(state.config),
+            "payments": len(state.payments),
+            "refunds": len(state.refunds),
+            "webhooks_sent": len(state.webhooks_sent),
+            "calls": state.calls,
+        }
+
+    @app.post("/_fake/config")
+    async def update_config(request: Request):
+        updates = await request.json()
+        for key, value in updates.items():
+            if hasattr(state.config, key):
+                setattr(state.config, key, value)
+        return {"config": asdict(state.config)}
+
+    @app.on_event("shutdown")
+    async def close_webhook_client():
+        if "client" in webhook_client:
+            await webhook_client["client"].aclose()
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the fake Square API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-distribution", default="fixed", choices=["fixed", "uniform", "normal", "lognormal"])
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--latency-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--decline-rate", type=float, default=0.0)
+    parser.add_argument("--webhook-url", default=None)
+    parser.add_argument("--webhook-signature-key", default="fake-signature-key")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = FakeSquareConfig(
+        latency_distribution=args.latency_distribution,
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        error_rate=args.error_rate,
+        decline_rate=args.decline_rate,
+        webhook_url=args.webhook_url,
+        webhook_signature_key=args.webhook_signature_key,
+        seed=args.seed,
+    )
+    uvicorn.run(create_fake_square_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+#!/usr/bin/env python
+"""
+Local stand-in for the Supabase REST (PostgREST) API.
+
+Keeps tables in memory and understands the subset of PostgREST the backend
+uses: select with column lists, eq/neq/gt/gte/lt/lte/in/is filters and
+or=/and= groups of them, order,
+limit and offset, single and multi-row inserts, upserts with on_conflict,
+update, delete and rpc calls. Tables the migrations put behind row-level
+security with no policy refuse direct access, as they do for the API's key;
+their definer functions are built in. Latency and errors can be injected the
+same way as in tests/fake_square_server.py.
+
+Point the backend at it with:
+    SUPABASE_URL=http://127.0.0.1:8091
+
+Run standalone with:
+    python -m tests.fake_supabase_server --port 8091 --latency-ms 5
+"""
+
+import argparse
+import asyncio
+import copy
+import logging
+import random
+import time
+import uuid
+from dataclasses import dataclass, asdict, field
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Callable
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+logger = logging.getLogger(__name__)
+
+# A syntactically valid JWT; supabase-py checks the key's shape before use
+FAKE_SUPABASE_KEY = (
+    "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9."
+    "eyJyb2xlIjoiYW5vbiIsImlzcyI6ImZha2Utc3VwYWJhc2UifQ."
+    "ZmFrZS1zaWduYXR1cmU"
+)
+
+# Tables our migrations lock down to definer functions (row-level security, no policy)
+RLS_TABLES = ("webhook_inbox", "webhook_seen_events", "payment_idempotency_keys")
+
+@dataclass
+class FakeSupabaseConfig:
+    """Knobs for the fake server; all latencies are in milliseconds"""
+    latency_ms: float = 0.0
+    latency_jitter_ms: float = 0.0
+    error_rate: float = 0.0  # share of calls answered with a 5xx
+    seed: Optional[int] = None
+    # Tables with row-level security and no policy: the API's key can only reach them through rpc
+    rls_tables: List[str] = field(default_factory=lambda: list(RLS_TABLES))
+
+
+def postgrest_error(status_code: int, code: str, message: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={"code": code, "message": message, "details": None, "hint": None}
+    )
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _coerce(value: Any, raw: str) -> Any:
+    # Compare filter values with the stored value's type where we can
+    if isinstance(value, bool):
+        return raw.lower() == "true"
+    if isinstance(value, (int, float)):
+        try:
+            return type(value)(raw)
+        except ValueError:
+            return raw
+    return raw
+
+
+def _matches(row: Dict[str, Any], column: str, expression: str) -> bool:
+    operator, _, raw = expression.partition(".")
+    value = row.get(column)
+
+    if operator == "is":
+        if raw == "null":
+            return value is None
+        return value is (raw == "true")
+    if operator == "in":
+        options = [option.strip().strip('"') for option in raw.strip("()").split(",")]
+        return value is not None and str(value) in options
+    if value is None:
+        return operator == "neq"
+
+    if isinstance(value, (dict, list)):
+        value = str(value)
+    target = _coerce(value, raw)
+    if operator == "eq":
+        return str(value) == str(target) if isinstance(target, str) else value == target
+    if operator == "neq":
+        return str(value) != str(target) if isinstance(target, str) else value != target
+    if operator in ("gt", "gte", "lt", "lte"):
+        left, right = (str(value), target) if isinstance(target, str) else (value, target)
+        return {
+            "gt": left > right,
+            "gte": left >= right,
+            "lt": left < right,
+            "lte": left <= right,
+        }[operator]
+
+    raise ValueError(f"Unsupported filter operator: {operator}")
+
+
+def _split_conditions(text: str) -> List[str]:
+    # Split a logic group on its top-level commas, leaving nested groups and quoted values whole
+    parts, depth, quoted, current = [], 0, False, ""
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and char == ",":
+            parts.append(current)
+            current = ""
+            continue
+        current += char
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _matches_filter(row: Dict[str, Any], key: str, expression: str) -> bool:
+    # or=(a.eq.1,and(b.lt.2,c.is.null)) as well as plain column=op.value filters
+    if key not in ("or", "and"):
+        return _matches(row, key, expression)
+    results = []
+    for condition in _split_conditions(expression.strip()[1:-1]):
+        if condition.startswith(("or(", "and(")):
+            name, _, group = condition.partition("(")
+            results.append(_matches_filter(row, name, "(" + group))
+        else:
+            column, _, rest = condition.partition(".")
+            operator, _, raw = rest.partition(".")
+            raw = raw.strip('"')
+            results.append(_matches(row, column, f"{operator}.{raw}"))
+    return any(results) if key == "or" else all(results)
+
+
+class FakeSupabaseState:
+    """In-memory tables, rpc handlers and call counters"""
+    def __init__(self, config: FakeSupabaseConfig):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.rpc_handlers: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+            "enqueue_webhook_event": self.enqueue_webhook_event,
+            "get_payment_idempotency_key": self.get_payment_idempotency_key,
+            "record_payment_idempotency_key": self.record_payment_idempotency_key,
+        }
+        self.calls: Dict[str, int] = {}
+
+    def latency_seconds(self) -> float:
+        config = self.config
+        if config.latency_jitter_ms:
+            delay = self.random.uniform(config.latency_ms - config.latency_jitter_ms, config.latency_ms + config.latency_jitter_ms)
+        else:
+            delay = config.latency_ms
+        return max(delay, 0.0) / 1000.0
+
+    def should_fail(self) -> bool:
+        return self.config.error_rate > 0 and self.random.random() < self.config.error_rate
+
+    def table(self, name: str) -> List[Dict[str, Any]]:
+        return self.tables.setdefault(name, [])
+
+    def seed(self, tables: Dict[str, List[Dict[str, Any]]]):
+        for name, rows in tables.items():
+            for row in rows:
+                self.table(name).append(self.with_defaults(row))
+
+    def enqueue_webhook_event(self, params: Dict[str, Any]) -> str:
+        """supabase/migrations/20250511000000_enqueue_webhook_event.sql"""
+        row = self.with_defaults({"source": params.get("p_source") or "square", "body": params["p_body"], "status": "received"})
+        self.table("webhook_inbox").append(row)
+        return row["id"]
+
+    def get_payment_idempotency_key(self, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """supabase/migrations/20250512000000_payment_idempotency_functions.sql"""
+        for row in self.table("payment_idempotency_keys"):
+            if row["idempotency_key"] == params["p_key"] and row["expires_at"] > time.time():
+                return {"fingerprint": row["fingerprint"], "result": row["result"]}
+        return None
+
+    def record_payment_idempotency_key(self, params: Dict[str, Any]) -> bool:
+        """First live record for a key wins; an expired one is replaced"""
+        rows = self.table("payment_idempotency_keys")
+        existing = [row for row in rows if row["idempotency_key"] == params["p_key"]]
+        if existing and existing[0]["expires_at"] > time.time():
+            return False
+        for row in existing:
+            rows.remove(row)
+        rows.append({"idempotency_key": params["p_key"], "fingerprint": params["p_fingerprint"], "result": params["p_result"],
+                     "expires_at": time.time() + params.get("p_ttl_seconds", 86400)})
+        return True
+
+    @staticmethod
+    def with_defaults(row: Dict[str, Any]) -> Dict[str, Any]:
+        row = copy.deepcopy(row)
+        row.setdefault("id", str(uuid.uuid4()))
+        row.setdefault("created_at", now_iso())
+        return row
+
+
+def parse_query(params) -> Dict[str, Any]:
+    """Split PostgREST query parameters into filters and modifiers"""
+    query = {"select": None, "order": [], "limit": None, "offset": 0, "on_conflict": None, "filters": []}
+    for key, value in params.multi_items():
+        if key == "select":
+            query["select"] = None if value.strip() == "*" else [column.strip() for column in value.split(",") if column.strip()]
+        elif key == "order":
+            for part in value.split(","):
+                column, _, direction = part.partition(".")
+                query["order"].append((column, direction.startswith("desc")))
+        elif key == "limit":
+            query["limit"] = int(value)
+        elif key == "offset":
+            query["offset"] = int(value)
+        elif key == "on_conflict":
+            query["on_conflict"] = [column.strip() for column in value.split(",")]
+        elif key == "columns":
+            continue
+        else:
+            query["filters"].append((key, value))
+    return query
+
+
+def apply_query(rows: List[Dict[str, Any]], query: Dict[str, Any]) -> List[Dict[str, Any]]:
+    selected = [row for row in rows if all(_matches_filter(row, column, expression) for column, expression in query["filters"])]
+    for column, descending in reversed(query["order"]):
+        selected.sort(key=lambda row: (row.get(column) is None, str(row.get(column))), reverse=descending)
+    selected = selected[query["offset"]:]
+    if query["limit"] is not None:
+        selected = selected[:query["limit"]]
+    return selected
+
+
+def project(rows: List[Dict[str, Any]], columns: Optional[List[str]]) -> List[Dict[str, Any]]:
+    if not columns:
+        return [copy.deepcopy(row) for row in rows]
+    return [{column: copy.deepcopy(row.get(column)) for column in columns} for row in rows]
+
+
+def create_fake_supabase_app(config: Optional[FakeSupabaseConfig] = None) -> FastAPI:
+    """
+    Build the fake PostgREST app; its state is exposed on app.state.fake
+    """
+    state = FakeSupabaseState(config or FakeSupabaseConfig())
+    app = FastAPI(title="Fake Supabase REST API")
+    app.state.fake = state
+
+    @app.middleware("http")
+    async def inject_faults(request: Request, call_next):
+        if request.url.path.startswith("/_fake"):
+            return await call_next(request)
+
+        name = f"{request.method} {request.url.path}"
+        state.calls[name] = state.calls.get(name, 0) + 1
+        delay = state.latency_seconds()
+        if delay:
+            await asyncio.sleep(delay)
+        if state.should_fail():
+            return postgrest_error(503, "PGRST000", "Injected failure from fake Supabase")
+        table = request.url.path[len("/rest/v1/"):] if request.url.path.startswith("/rest/v1/") else None
+        if table in state.config.rls_tables:
+            if request.method == "GET":
+                # Row-level security without a policy hides every row rather than failing
+                return JSONResponse(content=[], headers={"Content-Range": "*/0"})
+            return postgrest_error(401, "42501", f'new row violates row-level security policy for table "{table}"')
+        return await call_next(request)
+
+    def respond(rows: List[Dict[str, Any]], request: Request, status_code: int = 200) -> Response:
+        prefer = request.headers.get("prefer", "")
+        if request.method != "GET" and "return=representation" not in prefer:
+            return Response(status_code=204 if status_code == 200 else status_code)
+        headers = {"Content-Range": f"0-{max(len(rows) - 1, 0)}/{len(rows) if 'count=' in prefer else '*'}"}
+        return JSONResponse(content=rows, status_code=status_code, headers=headers)
+
+    @app.get("/rest/v1/{table}")
+    async def select_rows(table: str, request: Request):
+        try:
+            query = parse_query(request.query_params)
+            rows = apply_query(state.table(table), query)
+        except ValueError as e:
+            return postgrest_error(400, "PGRST100", str(e))
+        return respond(project(rows, query["select"]), request)
+
+    @app.post("/rest/v1/{table}")
+    async def insert_rows(table: str, request: Request):
+        query = parse_query(request.query_params)
+        body = await request.json()
+        incoming = body if isinstance(body, list) else [body]
+        prefer = request.headers.get("prefer", "")
+        rows = state.table(table)
+
+        written = []
+        for record in incoming:
+            conflict_columns = query["on_conflict"] or (["id"] if "resolution=" in prefer else None)
+            existing = None
+            if conflict_columns and all(record.get(column) is not None for column in conflict_columns):
+                existing = next(
+                    (row for row in rows if all(str(row.get(column)) == str(record[column]) for column in conflict_columns)),
+                    None
+                )
+            elif "id" in record:
+                existing = next((row for row in rows if str(row.get("id")) == str(record["id"])), None)
+
+            if existing is not None:
+                if "resolution=ignore-duplicates" in prefer:
+                    continue
+                if "resolution=merge-duplicates" in prefer:
+                    existing.update(copy.deepcopy(record))
+                    written.append(existing)
+                    continue
+                return postgrest_error(409, "23505", f"duplicate key value violates unique constraint on {table}")
+
+            row = state.with_defaults(record)
+            rows.append(row)
+            written.append(row)
+
+        return respond(project(written, query["select"]), request, status_code=201)
+
+    @app.patch("/rest/v1/{table}")
+    async def update_rows(table: str, request: Request):
+        query = parse_query(request.query_params)
+        changes = await request.json()
+        rows = apply_query(state.table(table), {**query, "order": [], "limit": None, "offset": 0})
+        for row in rows:
+            row.update(copy.deepcopy(changes))
+        return respond(project(rows, query["select"]), request)
+
+    @app.delete("/rest/v1/{table}")
+    async def delete_rows(table: str, request: Request):
+        query = parse_query(request.query_params)
+        doomed = apply_query(state.table(table), {**query, "order": [], "limit": None, "offset": 0})
+        doomed_ids = {id(row) for row in doomed}
+        state.tables[table] = [row for row in state.table(table) if id(row) not in doomed_ids]
+        return respond(project(doomed, query["select"]), request)
+
+    @app.post("/rest/v1/rpc/{function}")
+    async def call_rpc(function: str, request: Request):
+        params = await request.json() if await request.body() else {}
+        handler = state.rpc_handlers.get(function)
+        result = handler(params) if handler else None
+        return JSONResponse(content=result)
+
+    @app.get("/_fake/state")
+    async def fake_state():
+        return {
+            "config": asdict(state.config),
+            "tables": {name: len(rows) for name, rows in state.tables.items()},
+            "calls": state.calls,
+        }
+
+    @app.post("/_fake/seed")
+    async def seed(request: Request):
+        state.seed(await request.json())
+        return {name: len(rows) for name, rows in state.tables.items()}
+
+    @app.post("/_fake/config")
+    async def update_config(request: Request):
+        for key, value in (await request.json()).items():
+            if hasattr(state.config, key):
+                setattr(state.config, key, value)
+        return asdict(state.config)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the fake Supabase REST server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8091)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--latency-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = FakeSupabaseConfig(
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    uvicorn.run(create_fake_supabase_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
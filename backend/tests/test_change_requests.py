@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""
+Test module for the typed change-request models.
+"""
+
+import json
+from unittest.mock import AsyncMock, MagicMock
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from pydantic import ValidationError
+
+from dependencies import get_request_service
+from models.change_requests import OnlineIdChangeRequest, TeamTransferRequest, parse_change_request, validation_messages
+from routes import requests as request_routes
+
+TRANSFER = {
+    "request_type": "team_transfer",
+    "team_id": "team-1",
+    "requested_by": "user-1",
+    "new_captain_id": "user-2",
+    "old_captain_id": "user-1",
+    "item_id": "1002"
+}
+
+def test_request_type_selects_the_model():
+    """The same parse gives the model for the request_type, from raw JSON or a dict"""
+    assert isinstance(parse_change_request(json.dumps(TRANSFER).encode()), TeamTransferRequest)
+    online_id = parse_change_request({"request_type": "online_id_change", "team_id": "team-1", "requested_by": "user-1",
+                                      "player_id": "user-1", "new_online_id": "new-id", "platform": "psn"})
+    assert isinstance(online_id, OnlineIdChangeRequest)
+
+def test_invalid_requests_report_every_problem():
+    """Missing fields are named per field; an unknown request_type is rejected outright"""
+    with pytest.raises(ValidationError) as missing:
+        parse_change_request({**TRANSFER, "new_captain_id": None, "item_id": None})
+    assert sorted(message.split(":")[0] for message in validation_messages(missing.value)) == [
+        "team_transfer.item_id", "team_transfer.new_captain_id"
+    ]
+
+    with pytest.raises(ValidationError):
+        parse_change_request({**TRANSFER, "request_type": "unknown"})
+
+@pytest.mark.asyncio
+async def test_generic_endpoint_passes_the_typed_request_on():
+    """POST /api/requests parses the body once and hands the model to the service"""
+    service = MagicMock()
+    service.process_request = AsyncMock(return_value={"success": True, "request_id": "r-1", "status": "ready_for_execution"})
+    app = FastAPI()
+    app.include_router(request_routes.router, prefix="/api")
+    app.dependency_overrides[get_request_service] = lambda: service
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        accepted = await client.post("/api/requests", json=TRANSFER)
+        rejected = await client.post("/api/requests", json={**TRANSFER, "request_type": "unknown"})
+
+    assert accepted.status_code == 200
+    assert isinstance(service.process_request.call_args.args[0], TeamTransferRequest)
+    assert rejected.status_code == 422
+    service.process_request.assert_called_once()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+Test module for the fake Square server, driven through the real gateway.
+"""
+
+import httpx
+import pytest
+
+from services.square_gateway import SquareGateway, SquareAPIError
+from tests.fake_square_server import FakeSquareConfig, create_fake_square_app
+
+def create_gateway(config=None):
+    app = create_fake_square_app(config or FakeSquareConfig(seed=7))
+    gateway = SquareGateway(
+        access_token="fake-token",
+        base_url="http://fake-square",
+        transport=httpx.ASGITransport(app=app)
+    )
+    return app, gateway
+
+def payment_body(source_id="cnon:card-nonce-ok", key="key-1", amount=1500):
+    return {
+        "source_id": source_id,
+        "idempotency_key": key,
+        "amount_money": {"amount": amount, "currency": "USD"},
+        "reference_id": "1002-5eaab34540354536a5d2938926a8b4da"
+    }
+
+@pytest.mark.asyncio
+async def test_create_get_and_refund_payment():
+    """Payments can be created, fetched, listed and refunded"""
+    app, gateway = create_gateway()
+
+    payment = await gateway.create_payment(payment_body())
+    assert payment["status"] == "COMPLETED"
+    assert (await gateway.create_payment(payment_body()))["id"] == payment["id"]
+    assert (await gateway.get_payment(payment["id"]))["reference_id"] == payment["reference_id"]
+
+    refund = await gateway.refund_payment({
+        "payment_id": payment["id"],
+        "idempotency_key": "refund-1",
+        "amount_money": {"amount": 500, "currency": "USD"}
+    })
+    assert (await gateway.get_refund(refund["id"]))["status"] == "COMPLETED"
+    assert (await gateway.get_payment(payment["id"]))["refunded_money"]["amount"] == 500
+    await gateway.aclose()
+
+@pytest.mark.asyncio
+async def test_list_payments_pages_with_cursor():
+    """ListPayments returns cursors until the last page"""
+    app, gateway = create_gateway()
+    for i in range(5):
+        await gateway.create_payment(payment_body(key=f"key-{i}"))
+
+    seen, cursor = [], None
+    while True:
+        page = await gateway.list_payments(cursor=cursor, limit=2)
+        seen.extend(payment["id"] for payment in page.get("payments", []))
+        cursor = page.get("cursor")
+        if not cursor:
+            break
+
+    assert len(seen) == len(set(seen)) == 5
+    await gateway.aclose()
+
+@pytest.mark.asyncio
+async def test_declines_and_injected_errors():
+    """Test nonces decline with their codes and error_rate produces 5xx responses"""
+    app, gateway = create_gateway()
+    with pytest.raises(SquareAPIError) as declined:
+        await gateway.create_payment(payment_body(source_id="cnon:card-nonce-declined"))
+    assert declined.value.errors[0]["code"] == "CARD_DECLINED"
+
+    app.state.fake.config.error_rate = 1.0
+    with pytest.raises(SquareAPIError) as failed:
+        await gateway.create_payment(payment_body(key="key-2"))
+    assert failed.value.status_code == 503
+    await gateway.aclose()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+Test module for the fake Supabase REST server.
+"""
+
+import httpx
+import pytest
+
+from tests.fake_supabase_server import FakeSupabaseConfig, create_fake_supabase_app
+
+REPRESENTATION = {"Prefer": "return=representation"}
+
+def create_client():
+    app = create_fake_supabase_app(FakeSupabaseConfig(seed=3))
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://fake-supabase")
+    return app, client
+
+@pytest.mark.asyncio
+async def test_insert_select_update_delete():
+    """Rows round-trip through the PostgREST verbs with filters and ordering"""
+    app, client = create_client()
+    rows = [
+        {"id": "a", "team_id": "t1", "status": "pending", "created_at": "2025-01-01"},
+        {"id": "b", "team_id": "t1", "status": "completed", "created_at": "2025-01-02"},
+        {"id": "c", "team_id": "t2", "status": "pending", "created_at": "2025-01-03"},
+    ]
+    response = await client.post("/rest/v1/team_change_requests", json=rows, headers=REPRESENTATION)
+    assert response.status_code == 201 and len(response.json()) == 3
+
+    response = await client.get("/rest/v1/team_change_requests", params={
+        "select": "id,status", "team_id": "eq.t1", "order": "created_at.desc"
+    })
+    assert response.json() == [{"id": "b", "status": "completed"}, {"id": "a", "status": "pending"}]
+
+    response = await client.patch("/rest/v1/team_change_requests", params={"id": "eq.a"},
+                                  json={"status": "processing"}, headers=REPRESENTATION)
+    assert response.json()[0]["status"] == "processing"
+
+    response = await client.get("/rest/v1/team_change_requests", params={"status": "in.(processing,completed)"})
+    assert {row["id"] for row in response.json()} == {"a", "b"}
+
+    await client.delete("/rest/v1/team_change_requests", params={"team_id": "eq.t2"})
+    assert app.state.fake.tables["team_change_requests"][-1]["id"] == "b"
+    await client.aclose()
+
+@pytest.mark.asyncio
+async def test_upsert_ignores_duplicates_and_rpc_handlers():
+    """on_conflict upserts skip existing rows and rpc calls reach registered handlers"""
+    app, client = create_client()
+    headers = {"Prefer": "return=representation,resolution=ignore-duplicates"}
+    await client.post("/rest/v1/payments", params={"on_conflict": "payment_id"},
+                      json=[{"payment_id": "p1", "amount": 10}], headers=headers)
+    response = await client.post("/rest/v1/payments", params={"on_conflict": "payment_id"},
+                                 json=[{"payment_id": "p1", "amount": 99}, {"payment_id": "p2", "amount": 5}],
+                                 headers=headers)
+    assert [row["payment_id"] for row in response.json()] == ["p2"]
+    assert app.state.fake.tables["payments"][0]["amount"] == 10
+
+    app.state.fake.rpc_handlers["add"] = lambda params: params["a"] + params["b"]
+    response = await client.post("/rest/v1/rpc/add", json={"a": 2, "b": 3})
+    assert response.json() == 5
+    await client.aclose()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""
+Test module for the payment idempotency store.
+"""
+
+import asyncio
+import httpx
+import pytest
+from postgrest.exceptions import APIError
+
+from services.idempotency_store import IdempotencyStore, IdempotencyKeyReusedError
+from services.outbound_guard import OutboundGuard
+from services.supabase_data import SupabaseData
+from tests.fake_supabase_server import FakeSupabaseConfig, create_fake_supabase_app
+
+@pytest.mark.asyncio
+async def test_repeat_submission_returns_recorded_result():
+    """A second submission with the same key does not run the operation again"""
+    store = IdempotencyStore(supabase=None)
+    calls = []
+
+    async def charge():
+        calls.append(1)
+        return {"id": "pay-1", "status": "COMPLETED"}
+
+    first = await store.run("key-1", "fp", charge)
+    second = await store.run("key-1", "fp", charge)
+
+    assert first == second
+    assert len(calls) == 1
+    assert store.stats()["hits"] == 1
+    assert store.stats()["misses"] == 1
+
+@pytest.mark.asyncio
+async def test_concurrent_submission_waits_on_first_attempt():
+    """A submission that arrives mid-flight shares the first attempt's result"""
+    store = IdempotencyStore(supabase=None)
+    release = asyncio.Event()
+    calls = []
+
+    async def charge():
+        calls.append(1)
+        await release.wait()
+        return {"id": "pay-2"}
+
+    first = asyncio.create_task(store.run("key-2", "fp", charge))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(store.run("key-2", "fp", charge))
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await first == await second == {"id": "pay-2"}
+    assert len(calls) == 1
+    assert store.stats()["in_flight_waits"] == 1
+
+@pytest.mark.asyncio
+async def test_failures_are_not_recorded():
+    """A failed attempt can be retried with the same key"""
+    store = IdempotencyStore(supabase=None)
+
+    async def declined():
+        raise Exception("Square payment failed")
+
+    async def approved():
+        return {"id": "pay-3"}
+
+    with pytest.raises(Exception):
+        await store.run("key-3", "fp", declined)
+    assert await store.run("key-3", "fp", approved) == {"id": "pay-3"}
+
+@pytest.mark.asyncio
+async def test_eviction_ttl_and_fingerprint():
+    """The LRU is bounded, entries expire, and reused keys must match"""
+    store = IdempotencyStore(supabase=None, max_entries=2)
+
+    async def charge():
+        return {"id": "pay"}
+
+    for key in ("a", "b", "c"):
+        await store.run(key, "fp", charge)
+    assert store.stats()["entries"] == 2
+    assert store.stats()["evictions"] == 1
+
+    with pytest.raises(IdempotencyKeyReusedError):
+        await store.run("c", "other-fp", charge)
+
+    expiring = IdempotencyStore(supabase=None, ttl_seconds=0)
+    await expiring.run("k", "fp", charge)
+    await expiring.run("k", "fp", charge)
+    assert expiring.stats()["expirations"] == 1
+    assert expiring.stats()["misses"] == 2
+
+@pytest.mark.asyncio
+async def test_keys_are_shared_across_processes_through_definer_functions():
+    """A second worker replays the first worker's result from the table it cannot touch directly"""
+    app = create_fake_supabase_app(FakeSupabaseConfig(seed=5))
+    data = SupabaseData("http://fake-supabase", "fake-key", transport=httpx.ASGITransport(app=app))
+    first = IdempotencyStore(data, guard=OutboundGuard("supabase"))
+    second = IdempotencyStore(data, guard=OutboundGuard("supabase"))
+    calls = []
+
+    async def charge():
+        calls.append(1)
+        return {"id": "pay-4", "status": "COMPLETED"}
+
+    with pytest.raises(APIError):
+        await data.table("payment_idempotency_keys").insert({"idempotency_key": "key-4"}).execute()
+
+    assert await first.run("key-4", "fp", charge) == {"id": "pay-4", "status": "COMPLETED"}
+    assert await second.run("key-4", "fp", charge) == {"id": "pay-4", "status": "COMPLETED"}
+    with pytest.raises(IdempotencyKeyReusedError):
+        await IdempotencyStore(data, guard=OutboundGuard("supabase")).run("key-4", "other-fp", charge)
+
+    assert len(calls) == 1
+    assert second.stats()["durable_hits"] == 1
+    assert first.stats()["durable_errors"] == second.stats()["durable_errors"] == 0
+    await data.aclose()
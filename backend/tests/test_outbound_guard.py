@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Test module for the outbound circuit breaker and concurrency limiter.
+"""
+
+import pytest
+
+from services.outbound_guard import OutboundGuard, DependencyUnavailableError
+from services.square_gateway import SquareAPIError
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def fail(guard):
+    with pytest.raises(RuntimeError):
+        with guard.guarded():
+            raise RuntimeError("connection reset")
+
+def test_breaker_opens_probes_and_closes():
+    """Consecutive failures open the circuit; one successful probe closes it"""
+    clock = FakeClock()
+    guard = OutboundGuard("square", failure_threshold=3, open_seconds=10, clock=clock)
+
+    for _ in range(3):
+        fail(guard)
+    assert guard.state == "open"
+    with pytest.raises(DependencyUnavailableError) as rejected:
+        guard.guarded()
+    assert rejected.value.reason == "circuit_open" and rejected.value.retry_after == 10
+
+    clock.now = 11
+    probe = guard.guarded()
+    with pytest.raises(DependencyUnavailableError):
+        guard.guarded()  # only one probe at a time
+    with probe:
+        pass
+    assert guard.state == "closed"
+    assert guard.stats()["opened"] == 1
+
+def test_failed_probe_reopens():
+    """A failed half-open probe re-opens the circuit for another full window"""
+    clock = FakeClock()
+    guard = OutboundGuard("supabase", failure_threshold=1, open_seconds=5, clock=clock)
+    fail(guard)
+    clock.now = 6
+    fail(guard)
+    assert guard.state == "open"
+    assert guard.stats()["retry_after_seconds"] == 5
+
+def test_declines_do_not_count_as_failures():
+    """is_failure filters out errors that mean the dependency answered"""
+    guard = OutboundGuard("square", failure_threshold=1, is_failure=lambda e: getattr(e, "status_code", 500) >= 500)
+    with pytest.raises(SquareAPIError):
+        with guard.guarded():
+            raise SquareAPIError(400, [{"category": "PAYMENT_METHOD_ERROR", "detail": "declined"}])
+    assert guard.state == "closed"
+
+def test_concurrency_limit_adapts_to_latency():
+    """Calls over the limit are rejected; fast calls grow the limit and slow ones shrink it"""
+    guard = OutboundGuard("square", initial_limit=2, max_limit=4, latency_target_ms=50)
+
+    first, second = guard.guarded(), guard.guarded()
+    with pytest.raises(DependencyUnavailableError) as rejected:
+        guard.guarded()
+    assert rejected.value.reason == "concurrency_limit"
+
+    for permit in (first, second):
+        with permit:
+            pass
+    for _ in range(10):
+        with guard.guarded():
+            pass
+    assert guard.stats()["limit"] == 4
+
+    permit = guard.guarded()
+    permit.__enter__()
+    permit.started -= 1.0  # pretend the call took a second
+    permit.__exit__(None, None, None)
+    assert guard.stats()["limit"] == 3
+    assert guard.stats()["slow"] == 1
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+Test module for batch charges against the fake Square server.
+"""
+
+import asyncio
+from unittest.mock import MagicMock
+
+import httpx
+import pytest
+from pydantic import ValidationError
+
+from routes.payments import BatchPaymentRequest, PAYMENT_BATCH_CONCURRENCY
+from services.payment_engine import PaymentConfig, PaymentEngine
+from services.payment_service import PaymentService
+from services.outbound_guard import OutboundGuard
+from services.square_gateway import SquareGateway
+from tests.fake_square_server import FakeSquareConfig, create_fake_square_app
+
+def create_service(latency_ms=0.0):
+    app = create_fake_square_app(FakeSquareConfig(seed=3, latency_ms=latency_ms))
+    gateway = SquareGateway(access_token="fake", base_url="http://fake-square", transport=httpx.ASGITransport(app=app))
+    engine = PaymentEngine(PaymentConfig("fake", "sandbox", "LOC", "app"), gateway=gateway, guard=OutboundGuard("square"))
+    supabase = MagicMock()
+    supabase.table.return_value.upsert.return_value.execute.return_value = MagicMock(error=None)
+    return PaymentService(engine, supabase), supabase
+
+def charge(index, source_id="cnon:card-nonce-ok"):
+    return {"source_id": source_id, "amount": 25.0, "reference_id": f"1006-team{index}", "metadata": {"team_id": f"team{index}"}}
+
+@pytest.mark.asyncio
+async def test_batch_streams_results_and_stores_rows_once():
+    """Every charge reports back, declines included, and the rows go out in one insert"""
+    service, supabase = create_service()
+    charges = [charge(index) for index in range(5)] + [charge(5, "cnon:card-nonce-declined")]
+
+    items = [item async for item in service.process_payment_batch(charges, max_concurrency=3)]
+
+    results, summary = items[:-1], items[-1]["summary"]
+    assert sorted(item["index"] for item in results) == list(range(6))
+    assert [item["index"] for item in results if not item["success"]] == [5]
+    assert summary["succeeded"] == 5 and summary["failed"] == 1 and summary["stored"] == 5
+
+    supabase.table.return_value.upsert.assert_called_once()
+    rows = supabase.table.return_value.upsert.call_args.args[0]
+    assert {row["metadata"]["team_id"] for row in rows} == {f"team{index}" for index in range(5)}
+    await service.payment_engine.aclose()
+
+@pytest.mark.asyncio
+async def test_batch_bounds_charges_in_flight():
+    """No more than max_concurrency charges are with Square at once"""
+    service, _ = create_service(latency_ms=5)
+    in_flight = peak = 0
+    charge_with_engine = service.payment_engine.charge
+
+    async def counting_charge(*args, **kwargs):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        try:
+            return await charge_with_engine(*args, **kwargs)
+        finally:
+            in_flight -= 1
+    service.payment_engine.charge = counting_charge
+
+    items = [item async for item in service.process_payment_batch([charge(index) for index in range(12)], max_concurrency=4)]
+
+    assert items[-1]["summary"]["succeeded"] == 12
+    assert peak == 4
+    await service.payment_engine.aclose()
+
+@pytest.mark.asyncio
+async def test_batch_finishes_when_reader_stops_early():
+    """Charges already started are still stored if the client goes away"""
+    service, supabase = create_service(latency_ms=2)
+
+    async for _ in service.process_payment_batch([charge(index) for index in range(4)], max_concurrency=2):
+        break
+    await asyncio.gather(*service._batch_tasks)
+
+    assert len(supabase.table.return_value.upsert.call_args.args[0]) == 4
+    await service.payment_engine.aclose()
+
+@pytest.mark.parametrize("max_concurrency", [0, -1, PAYMENT_BATCH_CONCURRENCY + 1])
+def test_batch_rejects_out_of_range_concurrency(max_concurrency):
+    """A concurrency outside 1..PAYMENT_BATCH_CONCURRENCY is a 422, not silently rewritten"""
+    body = {"charges": [{"sourceId": "cnon:card-nonce-ok", "amount": 25.0}], "maxConcurrency": max_concurrency}
+    with pytest.raises(ValidationError):
+        BatchPaymentRequest(**body)
+    assert BatchPaymentRequest(**{**body, "maxConcurrency": PAYMENT_BATCH_CONCURRENCY}).maxConcurrency == PAYMENT_BATCH_CONCURRENCY
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""
+Test module for the shared payment engine.
+"""
+
+import httpx
+import pytest
+
+from services.payment_engine import PaymentConfig, PaymentEngine
+from services.square_gateway import SquareGateway, SquareAPIError
+
+TEST_CONFIG = PaymentConfig(
+    access_token="test-token",
+    environment="sandbox",
+    location_id="TEST_LOCATION",
+    app_id="sandbox-test-app"
+)
+
+def square_handler(request: httpx.Request):
+    if b"card-nonce-declined" in request.content:
+        return httpx.Response(400, json={"errors": [{"category": "PAYMENT_METHOD_ERROR", "code": "CARD_DECLINED"}]})
+    return httpx.Response(200, json={"payment": {"id": "pay-1", "status": "COMPLETED"}})
+
+def create_engine():
+    transport = httpx.MockTransport(square_handler)
+    gateway = SquareGateway(
+        access_token=TEST_CONFIG.access_token,
+        transport=transport,
+        sync_transport=transport
+    )
+    return PaymentEngine(TEST_CONFIG, gateway=gateway)
+
+def test_build_payment_body():
+    """Amounts are converted to cents without float truncation"""
+    engine = create_engine()
+    body = engine.build_payment_body("cnon:card-nonce-ok", 19.99, note="Team Rebrand", reference_id="1002-abc")
+
+    assert body["amount_money"] == {"amount": 1999, "currency": "USD"}
+    assert body["location_id"] == "TEST_LOCATION"
+    assert body["idempotency_key"]
+    assert body["note"] == "Team Rebrand"
+    assert body["reference_id"] == "1002-abc"
+
+@pytest.mark.asyncio
+async def test_charge_records_stats():
+    """Async and sync charges share the same counters"""
+    engine = create_engine()
+    await engine.charge("cnon:card-nonce-ok", 15.0)
+    engine.charge_sync("cnon:card-nonce-ok", 15.0)
+    with pytest.raises(SquareAPIError):
+        await engine.charge("cnon:card-nonce-declined", 15.0)
+    await engine.aclose()
+
+    stats = engine.stats()
+    assert stats["charges"] == 3
+    assert stats["succeeded"] == 2
+    assert stats["declined"] == 1
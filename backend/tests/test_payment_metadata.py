@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""
+Test module for the client-side payments metadata validator.
+"""
+
+import os
+import re
+
+from services.payment_metadata import (
+    PAYMENT_METADATA_RULES,
+    validate_payment_metadata,
+    prepare_payment_row,
+)
+
+MIGRATION = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..",
+    "supabase", "migrations", "20250308180601_violet_haze.sql"
+)
+
+VALID_METADATA = {
+    "transaction_details": {"processor_response": "pay-1", "authorization_code": "auth-1"},
+    "payment_method": {"type": "visa", "last_four": "1111"},
+    "team_id": "team-1",
+}
+
+def test_valid_and_null_metadata_pass():
+    assert validate_payment_metadata(VALID_METADATA) == ()
+    assert validate_payment_metadata(None) == ()
+
+def test_violations_are_reported():
+    assert validate_payment_metadata([]) == ("metadata must be an object",)
+    assert validate_payment_metadata({"payment_method": "visa"}) == (
+        "transaction_details must be an object",
+        "payment_method must be an object",
+    )
+    assert validate_payment_metadata({
+        "transaction_details": {"processor_response": "pay-1"},
+        "payment_method": {"type": "visa", "last_four": None},
+    }) == ("transaction_details is missing authorization_code",)
+
+def test_prepare_payment_row_nulls_invalid_metadata():
+    row = {"payment_id": "pay-1", "metadata": {"team_id": "team-1"}}
+    assert prepare_payment_row(row)["metadata"] is None
+    assert row["metadata"] == {"team_id": "team-1"}  # the caller's row is left alone
+    assert prepare_payment_row({"payment_id": "pay-2", "metadata": VALID_METADATA})["metadata"] is VALID_METADATA
+
+def test_rules_match_the_migration():
+    """Every key the database trigger checks for is in the client-side rules, and nothing more"""
+    with open(MIGRATION, "r", encoding="utf-8") as migration:
+        sql = migration.read()
+
+    trigger = sql[sql.index("CREATE OR REPLACE FUNCTION validate_payment_metadata"):sql.index("$$ LANGUAGE plpgsql")]
+    nested = set(re.findall(r"NEW\.metadata->'(\w+)' \? '(\w+)'", trigger))
+    sections = set(re.findall(r"NEW\.metadata \? '(\w+)'", trigger))
+
+    assert sections == set(PAYMENT_METADATA_RULES)
+    assert nested == {(section, key) for section, keys in PAYMENT_METADATA_RULES.items() for key in keys}
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+"""
+Test module for bulk payment reconciliation against the fake Square server.
+"""
+
+import uuid
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+import httpx
+import pytest
+
+from services.payment_engine import PaymentConfig, PaymentEngine
+from services.payment_reconciler import PaymentReconciler
+from services.outbound_guard import OutboundGuard
+from services.square_gateway import SquareGateway
+from tests.fake_square_server import FakeSquareConfig, create_fake_square_app
+
+class RecordingSupabase:
+    """Just enough of the Supabase client for the reconciler, recording every write"""
+    def __init__(self, tables):
+        self.tables = tables
+        self.selects = []
+        self.upserts = []
+        self.rpcs = []
+
+    def table(self, name):
+        assert name != "reconciliation_state", "row-level security closes reconciliation_state to direct access"
+        client = self
+        query = MagicMock()
+
+        def select(columns):
+            selection = MagicMock()
+
+            def in_(column, values):
+                client.selects.append((name, column, len(values)))
+                rows = [row for row in client.tables.get(name, []) if row.get(column) in values]
+                selection.execute.return_value = MagicMock(data=rows, error=None)
+                return selection
+
+            def eq(column, value):
+                rows = [row for row in client.tables.get(name, []) if row.get(column) == value]
+                selection.execute.return_value = MagicMock(data=rows, error=None)
+                return selection
+
+            selection.in_ = in_
+            selection.eq = eq
+            return selection
+
+        def upsert(rows, **kwargs):
+            client.upserts.append((name, rows))
+            return MagicMock(execute=MagicMock(return_value=MagicMock(data=[], error=None)))
+
+        query.select = select
+        query.upsert = upsert
+        return query
+
+    def rpc(self, name, params):
+        # reconciliation_state is only reachable through its definer functions
+        if name == "get_reconciliation_high_water_mark":
+            marks = [row["high_water_mark"] for row in self.tables.get("reconciliation_state", []) if row["name"] == params["p_name"]]
+            return MagicMock(execute=MagicMock(return_value=MagicMock(data=marks[0] if marks else None, error=None)))
+        if name == "save_reconciliation_high_water_mark":
+            self.tables["reconciliation_state"] = [{"name": params["p_name"], "high_water_mark": params["p_high_water_mark"]}]
+            return MagicMock(execute=MagicMock(return_value=MagicMock(data=None, error=None)))
+        if name == "transition_request_statuses":
+            rows = params["p_transitions"]
+            self.rpcs.append((name, rows))
+            moved = [{"id": row["id"], "previous_status": "pending", "status": row["status"]} for row in rows]
+            return MagicMock(execute=MagicMock(return_value=MagicMock(data=moved, error=None)))
+        self.rpcs.append((name, params["p_corrections"]))
+        return MagicMock(execute=MagicMock(return_value=MagicMock(data=len(params["p_corrections"]), error=None)))
+
+def reference_for(request_id):
+    return f"1001-{request_id.replace('-', '')}"
+
+async def create_square_payment(gateway, reference_id):
+    return await gateway.create_payment({
+        "source_id": "cnon:card-nonce-ok",
+        "idempotency_key": str(uuid.uuid4()),
+        "amount_money": {"amount": 1500, "currency": "USD"},
+        "reference_id": reference_id
+    })
+
+@pytest.mark.asyncio
+async def test_reconcile_window_and_store_high_water_mark():
+    """Missed payments settle pending requests, backfill rows and fix statuses in batches"""
+    app = create_fake_square_app(FakeSquareConfig(seed=11))
+    gateway = SquareGateway(access_token="fake", base_url="http://fake-square", transport=httpx.ASGITransport(app=app))
+    engine = PaymentEngine(PaymentConfig("fake", "sandbox", "LOC", "app"), gateway=gateway, guard=OutboundGuard("square"))
+
+    paid_request, failed_request, recorded_request = (str(uuid.uuid4()) for _ in range(3))
+    paid = await create_square_payment(gateway, reference_for(paid_request))
+    failed = await create_square_payment(gateway, reference_for(failed_request))
+    app.state.fake.payments[failed["id"]]["status"] = "FAILED"
+    recorded = await create_square_payment(gateway, reference_for(recorded_request))
+    await create_square_payment(gateway, "not-one-of-ours")
+
+    def request_row(request_id, status="pending"):
+        return {"id": request_id, "status": status, "request_type": "team_transfer",
+                "requested_by": str(uuid.uuid4()), "payment_reference": None}
+
+    supabase = RecordingSupabase({
+        "team_change_requests": [request_row(paid_request), request_row(failed_request), request_row(recorded_request, "completed")],
+        "payments": [{"payment_id": recorded["id"], "status": "APPROVED"}],
+    })
+    reconciler = PaymentReconciler(supabase, engine, page_size=2)
+
+    end_time = datetime.now(timezone.utc) + timedelta(minutes=1)
+    stats = await reconciler.run(end_time=end_time)
+
+    assert stats["pages"] == 2 and stats["square_payments"] == 4
+    assert stats["payments_inserted"] == 1
+    assert stats["payment_statuses_corrected"] == 1
+    assert stats["requests_paid"] == 1 and stats["requests_failed"] == 1
+    assert stats["unmatched_payments"] == 1
+
+    # Bulk loads, not one query per payment
+    assert len(supabase.selects) == 3
+    inserted = dict(supabase.upserts)["payments"]
+    assert inserted[0]["payment_id"] == paid["id"] and inserted[0]["user_id"]
+    # Both request corrections go out in one bulk transition, guarded on pending
+    transitions = [params for name, params in supabase.rpcs if name == "transition_request_statuses"]
+    assert len(transitions) == 1
+    assert {row["id"]: row["status"] for row in transitions[0]} == {paid_request: "payment_complete", failed_request: "failed"}
+    assert all(row["expected_status"] == ["pending"] for row in transitions[0])
+
+    assert reconciler.get_high_water_mark() == end_time
+    await gateway.aclose()
+
+@pytest.mark.asyncio
+async def test_incremental_run_starts_before_high_water_mark():
+    """A run without begin_time resumes from the stored mark minus the overlap"""
+    high_water_mark = datetime(2025, 5, 1, 12, 0, tzinfo=timezone.utc)
+    supabase = RecordingSupabase({"reconciliation_state": [{"name": "square_payments", "high_water_mark": high_water_mark.isoformat()}]})
+    engine = MagicMock()
+    engine.guard = OutboundGuard("square")
+
+    async def list_payments(**kwargs):
+        engine.listed = kwargs
+        return {}
+    engine.gateway.list_payments = list_payments
+
+    reconciler = PaymentReconciler(supabase, engine, overlap_seconds=600)
+    stats = await reconciler.run(end_time=high_water_mark + timedelta(hours=1))
+
+    assert engine.listed["begin_time"] == "2025-05-01T11:50:00Z"
+    assert stats["square_payments"] == 0
+    assert reconciler.get_high_water_mark() == high_water_mark + timedelta(hours=1)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+"""
+Test module for the payment reference codec.
+"""
+
+import uuid
+from datetime import date
+
+import pytest
+
+from services.payment_reference import (
+    ITEM_FORMAT, LEGACY_DATE_FORMAT, UUID_FORMAT,
+    decode_reference, decode_references, encode_reference, extract_request_id_from_reference, find_request_id_in_note
+)
+
+REQUEST_ID = "98ddd206-fe9b-46c7-9e56-2625080a86fb"
+
+def test_every_reference_format_decodes():
+    """Item references round-trip; bare UUIDs are normalized; legacy references keep their date but no request"""
+    reference_id = encode_reference("1002", REQUEST_ID)
+    assert reference_id == "1002-98ddd206fe9b46c79e562625080a86fb"
+    assert decode_reference(reference_id) == (ITEM_FORMAT, REQUEST_ID, "1002", None)
+
+    for bare in (REQUEST_ID.upper(), REQUEST_ID.replace("-", ""), f"{{{REQUEST_ID}}}"):
+        assert decode_reference(bare) == (UUID_FORMAT, REQUEST_ID, None, None)
+
+    legacy = decode_reference("03222025-1002-aab75524-ecac78cd-98ddd206")
+    assert legacy == (LEGACY_DATE_FORMAT, None, "1002", date(2025, 3, 22))
+
+    for other in (None, "", "backend-test-with-nonce", "1006-team1", "13452025-1002-aab75524-ecac78cd-98ddd206"):
+        assert decode_reference(other) is None and extract_request_id_from_reference(other) is None
+
+    with pytest.raises(ValueError):
+        encode_reference("10-02", REQUEST_ID)
+    with pytest.raises(ValueError):
+        encode_reference("1002", "not-a-uuid")
+
+def test_batch_decode_and_note_fallback():
+    """A page of references decodes once per distinct reference; notes yield their first UUID"""
+    other = str(uuid.uuid4())
+    page = [encode_reference("1002", REQUEST_ID), None, encode_reference("1001", other), encode_reference("1002", REQUEST_ID)]
+
+    assert decode_references(page) == {page[0]: REQUEST_ID, page[2]: other}
+    assert find_request_id_in_note(f"Team Rebrand {REQUEST_ID.upper()} / {other}") == REQUEST_ID
+    assert find_request_id_in_note("Team Rebrand") is None
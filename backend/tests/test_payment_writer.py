@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+"""
+Test module for the write-behind payment record writer.
+"""
+
+import asyncio
+import json
+import os
+import httpx
+import pytest
+from unittest.mock import MagicMock
+
+from services.outbound_guard import DependencyUnavailableError
+from services.payment_writer import PaymentRecordWriter
+
+def create_mocked_supabase(fail_times=0, reject_payment_ids=(), outages=()):
+    """Supabase mock that records every upserted batch; outages are raised first, one per call"""
+    batches = []
+    state = {"failures": 0}
+    outages = list(outages)
+
+    def upsert(rows, **kwargs):
+        query = MagicMock()
+
+        def execute():
+            if outages:
+                raise outages.pop(0)
+            if state["failures"] < fail_times:
+                state["failures"] += 1
+                raise Exception("connection reset")
+            if any(row["payment_id"] in reject_payment_ids for row in rows):
+                raise Exception("violates check constraint")
+            batches.append(rows)
+            result = MagicMock()
+            result.error = None
+            return result
+
+        query.execute = execute
+        return query
+
+    supabase = MagicMock()
+    supabase.table.return_value.upsert = upsert
+    supabase.batches = batches
+    return supabase
+
+def create_writer(tmp_path, supabase, **kwargs):
+    return PaymentRecordWriter(
+        supabase,
+        spool_path=str(tmp_path / "payments.jsonl"),
+        retry_backoff=0,
+        fsync=False,
+        **kwargs
+    )
+
+@pytest.mark.asyncio
+async def test_rows_are_written_in_batches(tmp_path):
+    """Queued rows go out as multi-row inserts and the spool is compacted"""
+    supabase = create_mocked_supabase()
+    writer = create_writer(tmp_path, supabase, batch_size=3)
+
+    for i in range(5):
+        await writer.submit({"payment_id": f"pay-{i}"})
+    await writer.flush()
+
+    assert [len(batch) for batch in supabase.batches] == [3, 2]
+    assert writer.stats()["unacked"] == 0
+    assert (tmp_path / f"payments.{os.getpid()}.jsonl").read_text() == ""
+
+@pytest.mark.asyncio
+async def test_unacknowledged_rows_are_replayed(tmp_path):
+    """Rows spooled before a crash are written by the next writer"""
+    crashed = create_writer(tmp_path, create_mocked_supabase())
+    await crashed.submit({"payment_id": "pay-1"})
+    await crashed.submit({"payment_id": "pay-2"})
+
+    supabase = create_mocked_supabase()
+    writer = create_writer(tmp_path, supabase)
+    assert writer.replay() == 2
+    await writer.flush()
+
+    assert [row["payment_id"] for row in supabase.batches[0]] == ["pay-1", "pay-2"]
+
+@pytest.mark.asyncio
+async def test_failed_batches_are_retried(tmp_path):
+    """Transient failures are retried rather than dropped"""
+    supabase = create_mocked_supabase(fail_times=2)
+    writer = create_writer(tmp_path, supabase, max_retries=3)
+    await writer.submit({"payment_id": "pay-1"})
+    await writer.flush()
+
+    assert writer.stats()["written"] == 1
+    assert writer.stats()["retries"] == 2
+
+@pytest.mark.asyncio
+async def test_rejected_rows_are_dead_lettered(tmp_path):
+    """A row the database keeps rejecting doesn't block the rest of its batch"""
+    supabase = create_mocked_supabase(reject_payment_ids={"bad"})
+    writer = create_writer(tmp_path, supabase, max_retries=1)
+    for payment_id in ("good-1", "bad", "good-2"):
+        await writer.submit({"payment_id": payment_id})
+    await writer.flush()
+
+    written = [row["payment_id"] for batch in supabase.batches for row in batch]
+    assert sorted(written) == ["good-1", "good-2"]
+    dead = [json.loads(line) for line in (tmp_path / f"payments.{os.getpid()}.dead.jsonl").read_text().splitlines()]
+    assert dead[0]["record"]["payment_id"] == "bad"
+
+@pytest.mark.asyncio
+async def test_workers_keep_separate_spools(tmp_path):
+    """A worker compacts only its own spool and replays only those of workers that are gone"""
+    dead_pid = 2 ** 22 + 1
+    crashed = create_writer(tmp_path, create_mocked_supabase(), pid=dead_pid)
+    await crashed.submit({"payment_id": "pay-orphan"})
+    sibling = create_writer(tmp_path, create_mocked_supabase(), pid=1)
+    await sibling.submit({"payment_id": "pay-sibling"})
+
+    supabase = create_mocked_supabase()
+    writer = create_writer(tmp_path, supabase)
+    await writer.submit({"payment_id": "pay-own"})
+    await writer.flush()
+    assert (tmp_path / "payments.1.jsonl").read_text() != ""
+
+    # The crashed worker's spool is claimed once; the running sibling's is left alone
+    assert writer.replay() == 1
+    await writer.flush()
+    assert create_writer(tmp_path, create_mocked_supabase(), pid=dead_pid + 1).replay() == 0
+
+    assert [row["payment_id"] for batch in supabase.batches for row in batch] == ["pay-own", "pay-orphan"]
+    assert not (tmp_path / f"payments.{dead_pid}.jsonl").exists()
+    assert sibling.stats()["unacked"] == 1
+
+@pytest.mark.asyncio
+async def test_spool_is_compacted_while_rows_are_outstanding(tmp_path):
+    """Acknowledged rows and ack lines are dropped even when the spool never fully drains"""
+    writer = create_writer(tmp_path, create_mocked_supabase(), batch_size=1, compact_after=2)
+    for i in range(3):
+        await writer.submit({"payment_id": f"pay-{i}"})
+    held = writer._pending.pop()
+    await writer.flush()
+
+    spool = tmp_path / f"payments.{os.getpid()}.jsonl"
+    lines = [json.loads(line) for line in spool.read_text().splitlines()]
+    assert lines == [held]
+    assert writer.stats()["unacked"] == 1 and writer.stats()["compactions"] == 1
+    assert create_writer(tmp_path, create_mocked_supabase()).replay() == 1
+
+@pytest.mark.asyncio
+async def test_outage_keeps_rows_spooled_instead_of_dead_lettering(tmp_path):
+    """Unreachable Supabase defers the batch untouched; only rejected rows are split and dead-lettered"""
+    supabase = create_mocked_supabase(outages=[
+        httpx.ConnectError("connection refused"),
+        DependencyUnavailableError("supabase", "circuit_open", 0),
+    ])
+    writer = create_writer(tmp_path, supabase, batch_size=2, max_retries=1)
+    for i in range(4):
+        await writer.submit({"payment_id": f"pay-{i}"})
+
+    await writer.flush()
+    await writer.flush()
+    stats = writer.stats()
+    assert (stats["deferred_batches"], stats["queued"], stats["unacked"]) == (2, 4, 4)
+    assert stats["retries"] == 0 and stats["dead_lettered"] == 0
+    assert stats["outage_backoff_seconds"] > 0
+
+    await writer.flush()
+    assert [len(batch) for batch in supabase.batches] == [2, 2]
+    assert writer.stats()["outage_backoff_seconds"] == 0
+    assert not (tmp_path / f"payments.{os.getpid()}.dead.jsonl").exists()
+
+@pytest.mark.asyncio
+async def test_stop_during_an_outage_leaves_rows_for_replay(tmp_path):
+    """Shutdown does not wait for Supabase to come back; the spool still holds the rows"""
+    writer = create_writer(tmp_path, create_mocked_supabase(outages=[httpx.ConnectError("connection refused")] * 10))
+    writer.start(replay=False)
+    await writer.submit({"payment_id": "pay-1"})
+    await asyncio.wait_for(writer.stop(), timeout=5)
+
+    assert writer.stats()["unacked"] == 1
+    assert create_writer(tmp_path, create_mocked_supabase()).replay() == 1
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""
+Test module for bulk change-request submission.
+"""
+
+import uuid
+from unittest.mock import AsyncMock, MagicMock
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from dependencies import get_request_service
+from routes import requests as request_routes
+from services.outbound_guard import OutboundGuard
+from services.request_service import RequestService
+
+def create_service(insert_error=None):
+    supabase = MagicMock()
+    supabase.table.return_value.insert.return_value.execute = AsyncMock(return_value=MagicMock(data=[], error=insert_error))
+    return RequestService(supabase, MagicMock(), supabase_guard=OutboundGuard("supabase")), supabase
+
+def create_client(service):
+    app = FastAPI()
+    app.include_router(request_routes.router, prefix="/api")
+    app.dependency_overrides[get_request_service] = lambda: service
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+def rebrand(**extra):
+    return {
+        "request_type": "team_rebrand",
+        "requested_by": str(uuid.uuid4()),
+        "team_id": str(uuid.uuid4()),
+        "item_id": "1002",
+        "old_name": "Old Name",
+        "new_name": "New Name",
+        **extra
+    }
+
+def online_id_change():
+    return {
+        "request_type": "online_id_change",
+        "requested_by": str(uuid.uuid4()),
+        "team_id": str(uuid.uuid4()),
+        "player_id": str(uuid.uuid4()),
+        "new_online_id": "new-id",
+        "platform": "psn"
+    }
+
+@pytest.mark.asyncio
+async def test_bulk_inserts_valid_requests_in_one_statement():
+    """Mixed types go out in one insert; invalid items are reported without blocking the rest"""
+    service, supabase = create_service()
+    body = {"requests": [rebrand(), {"request_type": "team_rebrand", "team_id": "t"}, online_id_change(),
+                         {"request_type": "unknown"}, rebrand(requires_payment=True)]}
+
+    async with create_client(service) as client:
+        response = await client.post("/api/requests/bulk", json=body)
+
+    assert response.status_code == 200
+    outcome = response.json()
+    assert [result["status"] for result in outcome["results"]] == ["created", "invalid", "created", "invalid", "invalid"]
+    assert outcome["summary"] == {"total": 5, "created": 2, "invalid": 3, "not_attempted": 0, "failed": 0}
+    assert not outcome["success"]
+
+    supabase.table.return_value.insert.assert_called_once()
+    rows = supabase.table.return_value.insert.call_args.args[0]
+    assert [row["request_type"] for row in rows] == ["team_rebrand", "online_id_change"]
+    assert {row["status"] for row in rows} == {"ready_for_execution"}
+    assert [row["id"] for row in rows] == [outcome["results"][0]["request_id"], outcome["results"][2]["request_id"]]
+
+@pytest.mark.asyncio
+async def test_atomic_bulk_writes_nothing_when_one_request_is_invalid():
+    """With atomic=true a single invalid request keeps the whole batch out"""
+    service, supabase = create_service()
+    body = {"atomic": True, "requests": [rebrand(), {"request_type": "unknown"}]}
+
+    async with create_client(service) as client:
+        outcome = (await client.post("/api/requests/bulk", json=body)).json()
+
+    assert [result["status"] for result in outcome["results"]] == ["not_attempted", "invalid"]
+    supabase.table.return_value.insert.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_failed_insert_fails_every_valid_request():
+    """The insert is all-or-nothing, so its error is reported for each request in it"""
+    service, _ = create_service(insert_error="duplicate key value violates unique constraint")
+
+    outcome = await service.process_requests_bulk([rebrand(), rebrand(), {"request_type": "team_rebrand"}])
+
+    assert [result["status"] for result in outcome["results"]] == ["failed", "failed", "invalid"]
+    assert "duplicate key" in outcome["results"][0]["errors"][0]
+
+@pytest.mark.asyncio
+async def test_bulk_rejects_oversized_submission(monkeypatch):
+    """More than REQUEST_BULK_MAX_ITEMS requests is refused before anything is validated"""
+    service, supabase = create_service()
+    monkeypatch.setattr(request_routes, "REQUEST_BULK_MAX_ITEMS", 2)
+
+    async with create_client(service) as client:
+        response = await client.post("/api/requests/bulk", json={"requests": [rebrand() for _ in range(3)]})
+
+    assert response.status_code == 413
+    supabase.table.assert_not_called()
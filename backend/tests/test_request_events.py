@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+Test module for request status streaming.
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from dependencies import get_request_service, get_request_status_hub
+from routes import requests as request_routes
+from services.request_events import PostgresStatusListener, RequestStatusHub, SubscriberLimitError
+
+@pytest.mark.asyncio
+async def test_hub_bounds_streams_and_their_backlog():
+    """Only subscribers of a request get its events; a slow one keeps just the newest"""
+    hub = RequestStatusHub(max_subscribers=2, queue_size=2)
+    watching, other = hub.subscribe("r-1"), hub.subscribe("r-2")
+    with pytest.raises(SubscriberLimitError):
+        hub.subscribe("r-3")
+
+    for status in ("payment_complete", "processing", "completed"):
+        assert hub.publish({"id": "r-1", "status": status}) == 1
+
+    assert (await watching.next(0.1))["status"] == "processing"
+    assert (await watching.next(0.1))["status"] == "completed"
+    assert await other.next(0.01) is None
+
+    hub.unsubscribe(watching)
+    hub.unsubscribe(watching)
+    assert hub.stats()["open"] == 1 and hub.stats()["dropped"] == 1
+    assert hub.publish({"id": "r-1", "status": "completed"}) == 0
+
+@pytest.mark.asyncio
+async def test_stream_sends_current_status_then_changes_until_final():
+    """The stream opens with the stored status and closes after the final one"""
+    hub = RequestStatusHub()
+    hub.live = True
+    service = MagicMock()
+    service.get_request = AsyncMock(return_value={"id": "r-1", "status": "pending"})
+    app = FastAPI()
+    app.include_router(request_routes.router, prefix="/api")
+    app.dependency_overrides[get_request_service] = lambda: service
+    app.dependency_overrides[get_request_status_hub] = lambda: hub
+
+    async def notify():
+        while not hub.stats()["open"]:
+            await asyncio.sleep(0.01)
+        hub.publish({"id": "r-2", "status": "completed"})
+        hub.publish({"id": "r-1", "status": "processing", "previous_status": "pending"})
+        hub.publish({"id": "r-1", "status": "completed", "previous_status": "processing"})
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response, _ = await asyncio.wait_for(
+            asyncio.gather(client.get("/api/requests/r-1/events"), notify()), timeout=5)
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    statuses = [json.loads(line[len("data: "):])["status"]
+                for line in response.text.splitlines() if line.startswith("data: ")]
+    assert statuses == ["pending", "processing", "completed"]
+    assert hub.stats()["open"] == 0
+
+def test_listener_drains_notifications_into_the_hub():
+    """Each NOTIFY payload is published once; a malformed one is counted and skipped"""
+    hub = MagicMock()
+    listener = PostgresStatusListener(hub, "postgresql://unused")
+    listener._connection = SimpleNamespace(poll=lambda: None, notifies=[
+        SimpleNamespace(payload=json.dumps({"id": "r-1", "status": "completed"})),
+        SimpleNamespace(payload="not json"),
+    ])
+
+    listener._drain()
+
+    hub.publish.assert_called_once_with({"id": "r-1", "status": "completed"})
+    assert listener.stats()["notifications"] == 2 and listener.stats()["malformed"] == 1
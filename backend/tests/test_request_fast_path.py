@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""
+Test module for the single-write fast path in RequestService.process_request.
+"""
+
+import uuid
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from services.outbound_guard import OutboundGuard
+from services.request_service import RequestService
+
+def create_service(payment_result=None, payment_error=None, transition_error=None, row_status="pending"):
+    supabase = MagicMock()
+    supabase.table.return_value.insert.return_value.execute = AsyncMock(return_value=MagicMock(data=[{}], error=None))
+    transitioned = row_status == "pending"
+    supabase.rpc.return_value.execute = AsyncMock(
+        return_value=MagicMock(data={"transitioned": transitioned, "previous_status": row_status, "request": {}}, error=None),
+        side_effect=transition_error
+    )
+    payment_service = MagicMock()
+    payment_service.payment_engine.guard = OutboundGuard("square")
+    payment_service.process_payment = AsyncMock(return_value=payment_result, side_effect=payment_error)
+    return RequestService(supabase, payment_service, supabase_guard=OutboundGuard("supabase")), supabase
+
+def rebrand_request(**extra):
+    return {
+        "request_type": "team_rebrand",
+        "requested_by": str(uuid.uuid4()),
+        "team_id": str(uuid.uuid4()),
+        "item_id": "1002",
+        "old_name": "Old Name",
+        "new_name": "New Name",
+        **extra
+    }
+
+def inserted_row(supabase):
+    supabase.table.return_value.insert.assert_called_once()
+    return supabase.table.return_value.insert.call_args.args[0]
+
+@pytest.mark.asyncio
+async def test_request_without_payment_is_written_once():
+    """The row is inserted as ready_for_execution; no follow-up update"""
+    service, supabase = create_service()
+
+    result = await service.process_request(rebrand_request())
+
+    assert result["status"] == "ready_for_execution"
+    assert inserted_row(supabase)["status"] == "ready_for_execution"
+    supabase.rpc.assert_not_called()
+
+def transitions(supabase):
+    return [call.args[1]["p_status"] for call in supabase.rpc.call_args_list]
+
+@pytest.mark.asyncio
+async def test_paid_request_is_recorded_before_the_charge():
+    """The pending row exists before any money moves; the charge then moves it to payment_complete"""
+    service, supabase = create_service()
+    rows_at_charge = []
+
+    async def charge(*args, **kwargs):
+        rows_at_charge.append(inserted_row(supabase)["status"])
+        return {"id": "pay-1", "status": "COMPLETED"}
+    service.payment_service.process_payment = AsyncMock(side_effect=charge)
+
+    result = await service.process_request(rebrand_request(
+        requires_payment=True,
+        payment_data={"source_id": "cnon:card-nonce-ok", "amount": 5.0}
+    ))
+
+    assert rows_at_charge == ["pending"]
+    assert result["status"] == "payment_complete"
+    assert transitions(supabase) == ["payment_complete"]
+    assert supabase.rpc.call_args.args[1]["p_metadata"] == {"result": {"payment_details": {"id": "pay-1", "status": "COMPLETED"}}}
+
+@pytest.mark.asyncio
+async def test_taken_payment_is_not_marked_failed_when_the_transition_fails():
+    """The row stays pending for the payment webhook rather than being failed after a charge"""
+    service, supabase = create_service(payment_result={"id": "pay-2", "status": "COMPLETED"},
+                                       transition_error=Exception("connection reset"))
+
+    result = await service.process_request(rebrand_request(
+        requires_payment=True,
+        payment_data={"source_id": "cnon:card-nonce-ok", "amount": 5.0}
+    ))
+
+    assert result["status"] == "pending"
+    assert inserted_row(supabase)["status"] == "pending"
+    assert transitions(supabase) == ["payment_complete"]
+
+@pytest.mark.asyncio
+async def test_charge_reports_the_status_of_a_row_that_moved_on():
+    """A row cancelled while its card was charged is reported as it is, not as payment_complete"""
+    service, supabase = create_service(payment_result={"id": "pay-3", "status": "COMPLETED"}, row_status="rejected")
+
+    result = await service.process_request(rebrand_request(
+        requires_payment=True,
+        payment_data={"source_id": "cnon:card-nonce-ok", "amount": 5.0}
+    ))
+
+    assert result["status"] == "rejected"
+    assert transitions(supabase) == ["payment_complete"]
+
+@pytest.mark.asyncio
+async def test_declined_request_ends_failed():
+    """A declined charge moves the pending row to failed with its error"""
+    service, supabase = create_service(payment_error=Exception("Square payment failed: CARD_DECLINED"))
+
+    with pytest.raises(Exception, match="Payment failed"):
+        await service.process_request(rebrand_request(
+            requires_payment=True,
+            payment_data={"source_id": "cnon:card-nonce-declined", "amount": 5.0}
+        ))
+
+    assert inserted_row(supabase)["status"] == "pending"
+    assert transitions(supabase) == ["payment_failed", "failed"]
+    assert "CARD_DECLINED" in supabase.rpc.call_args.args[1]["p_last_error"]
+
+@pytest.mark.asyncio
+async def test_payment_without_card_waits_as_pending():
+    """Without a card the outcome is not known yet, so the request stays pending"""
+    service, supabase = create_service(payment_result={"success": True, "status": "pending"})
+    service._process_payment = AsyncMock(return_value={"success": True, "status": "pending"})
+
+    result = await service.process_request(rebrand_request(requires_payment=True, payment_data={"amount": 5.0}))
+
+    assert result["status"] == "pending"
+    assert inserted_row(supabase)["status"] == "pending"
+    supabase.rpc.assert_not_called()
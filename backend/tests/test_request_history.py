@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Test module for the paginated team request history endpoint.
+"""
+
+from unittest.mock import MagicMock
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from dependencies import get_request_service
+from routes import requests as request_routes
+from services.outbound_guard import OutboundGuard
+from services.request_service import RequestService
+from services.supabase_data import SupabaseData
+from tests.fake_supabase_server import FakeSupabaseConfig, create_fake_supabase_app
+
+TEAM_ID = "team-1"
+
+def history_rows():
+    # Two rows share each timestamp, so only the id breaks the tie between them
+    rows = []
+    for index in range(7):
+        rows.append({
+            "id": f"00000000-0000-0000-0000-{index:012d}",
+            "team_id": TEAM_ID,
+            "request_type": "team_rebrand",
+            "status": "completed",
+            "created_at": f"2025-05-0{index // 2 + 1}T12:00:00.123456+00:00",
+            "metadata": {"new_name": f"Name {index}"},
+            "webhook_data": {"payload": "x" * 100},
+        })
+    rows.append({**rows[0], "id": "other-team-row", "team_id": "team-2"})
+    return rows
+
+def create_client():
+    supabase_app = create_fake_supabase_app(FakeSupabaseConfig(seed=7))
+    supabase_app.state.fake.seed({"team_change_requests": history_rows()})
+    data = SupabaseData("http://fake-supabase", "fake-key", transport=httpx.ASGITransport(app=supabase_app))
+    service = RequestService(data, MagicMock(), supabase_guard=OutboundGuard("supabase"))
+
+    app = FastAPI()
+    app.include_router(request_routes.router, prefix="/api")
+    app.dependency_overrides[get_request_service] = lambda: service
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test"), data
+
+@pytest.mark.asyncio
+async def test_pages_walk_the_history_newest_first_without_gaps():
+    """Following X-Next-Cursor returns every row once, in (created_at, id) order"""
+    client, data = create_client()
+    seen, cursor = [], None
+    async with client:
+        while True:
+            params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+            response = await client.get(f"/api/team/{TEAM_ID}/requests", params=params)
+            assert response.status_code == 200
+            page = response.json()
+            assert len(page) <= 3
+            assert all("metadata" not in row and "webhook_data" not in row for row in page)
+            seen.extend(row["id"] for row in page)
+            cursor = response.headers.get("x-next-cursor")
+            if not cursor:
+                break
+        assert (await client.get(f"/api/team/{TEAM_ID}/requests", params={"cursor": "not-a-cursor"})).status_code == 400
+    await data.aclose()
+
+    expected = sorted((row for row in history_rows() if row["team_id"] == TEAM_ID),
+                      key=lambda row: (row["created_at"], row["id"]), reverse=True)
+    assert seen == [row["id"] for row in expected]
+
+@pytest.mark.asyncio
+async def test_fields_projection_and_etag_revalidation():
+    """fields= picks the columns; an unchanged page answers 304 to its own ETag"""
+    client, data = create_client()
+    url = f"/api/team/{TEAM_ID}/requests"
+    async with client:
+        projected = await client.get(url, params={"fields": "status,metadata", "limit": 2})
+        assert set(projected.json()[0]) == {"status", "metadata", "created_at", "id"}
+        assert (await client.get(url, params={"fields": "status,password"})).status_code == 400
+
+        first = await client.get(url, params={"limit": 2})
+        repeat = await client.get(url, params={"limit": 2}, headers={"If-None-Match": first.headers["etag"]})
+        assert repeat.status_code == 304 and repeat.content == b""
+        assert repeat.headers["x-next-cursor"] == first.headers["x-next-cursor"]
+
+        other_page = await client.get(url, params={"limit": 3}, headers={"If-None-Match": first.headers["etag"]})
+        assert other_page.status_code == 200
+    await data.aclose()
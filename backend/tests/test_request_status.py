@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+Test module for atomic request status transitions.
+"""
+
+import uuid
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from services.outbound_guard import OutboundGuard
+from services.request_service import RequestService
+from services.request_states import IllegalTransitionError, can_transition, check_transition, sources_for
+from services.request_status import (
+    BULK_TRANSITION_FUNCTION,
+    TRANSITION_FUNCTION,
+    bulk_transition_params,
+    transition_params,
+    transition_request_statuses
+)
+
+def create_service(transitioned=True, previous_status="pending", fast_path=True):
+    supabase = MagicMock()
+    supabase.table.return_value.insert.return_value.execute = AsyncMock(return_value=MagicMock(data=[{}], error=None))
+    supabase.rpc.return_value.execute = AsyncMock(return_value=MagicMock(
+        data={"transitioned": transitioned, "previous_status": previous_status, "request": {}},
+        error=None
+    ))
+    payment_service = MagicMock()
+    payment_service.payment_engine.guard = OutboundGuard("square")
+    return RequestService(supabase, payment_service, supabase_guard=OutboundGuard("supabase"), fast_path=fast_path), supabase
+
+def test_transition_params_nest_result_under_metadata():
+    """The result is merged as metadata.result; unset fields are left to the database"""
+    params = transition_params("req-1", "failed", expected_status=("pending",), result={"error": "boom"}, last_error="boom")
+
+    assert params["p_metadata"] == {"result": {"error": "boom"}}
+    assert params["p_expected_status"] == ["pending"]
+    assert params["p_last_error"] == "boom"
+    assert params["p_payment_reference"] is None and params["p_webhook_data"] is None
+    assert transition_params("req-1", "completed")["p_metadata"] is None
+
+@pytest.mark.asyncio
+async def test_process_request_changes_status_in_one_call():
+    """No read-modify-write: the status change is a single guarded RPC"""
+    service, supabase = create_service(fast_path=False)
+    request = {
+        "request_id": str(uuid.uuid4()),
+        "request_type": "team_rebrand",
+        "requested_by": str(uuid.uuid4()),
+        "team_id": str(uuid.uuid4()),
+        "item_id": "1002",
+        "old_name": "Old Name",
+        "new_name": "New Name"
+    }
+
+    result = await service.process_request(request)
+
+    assert result["status"] == "ready_for_execution"
+    supabase.rpc.assert_called_once()
+    name, params = supabase.rpc.call_args.args
+    assert name == TRANSITION_FUNCTION
+    assert params["p_status"] == "ready_for_execution" and params["p_expected_status"] == ["pending"]
+    supabase.table.return_value.select.assert_not_called()
+    supabase.table.return_value.update.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_update_request_status_reports_guard_miss():
+    """A request already moved on is reported back, not overwritten"""
+    service, _ = create_service(transitioned=False, previous_status="completed")
+
+    outcome = await service._update_request_status("req-1", "failed", {"error": "late"}, expected_status=["pending"])
+
+    assert outcome["transitioned"] is False and outcome["previous_status"] == "completed"
+
+def test_state_machine_rejects_illegal_jumps():
+    """Finished requests stay finished; guards only list legal source statuses"""
+    assert can_transition("pending", "payment_complete")
+    assert not can_transition("completed", "failed")
+    with pytest.raises(IllegalTransitionError):
+        check_transition("completed", "pending")
+
+    assert "completed" not in sources_for("failed")
+    with pytest.raises(IllegalTransitionError):
+        transition_params("req-1", "approved", expected_status=["completed"])
+    assert transition_params("req-1", "failed")["p_expected_status"] == list(sources_for("failed"))
+
+def test_bulk_transitions_go_out_in_one_statement():
+    """Many requests move with one RPC; the last transition for an ID wins and misses are reported"""
+    supabase = MagicMock()
+    supabase.rpc.return_value.execute.return_value = MagicMock(
+        data=[{"id": "req-1", "previous_status": "pending", "status": "failed"}],
+        error=None
+    )
+
+    outcome = transition_request_statuses(supabase, [
+        {"id": "req-1", "status": "approved"},
+        {"id": "req-1", "status": "failed", "last_error": "cancelled"},
+        {"id": "req-2", "status": "failed", "current_status": "processing"},
+    ])
+
+    supabase.rpc.assert_called_once()
+    name, params = supabase.rpc.call_args.args
+    assert name == BULK_TRANSITION_FUNCTION
+    assert [(row["id"], row["status"]) for row in params["p_transitions"]] == [("req-1", "failed"), ("req-2", "failed")]
+    assert outcome["skipped"] == ["req-2"]
+
+    with pytest.raises(IllegalTransitionError):
+        bulk_transition_params([{"id": "req-3", "status": "pending", "current_status": "completed"}])
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""
+Test module for the request-type registry.
+"""
+
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from services.outbound_guard import OutboundGuard
+from services.request_service import RequestService
+from services.request_types import REQUEST_TYPES, get_request_type
+
+def test_every_type_maps_columns_and_has_an_executor():
+    """Each registered type writes its columns and names a RequestService method"""
+    assert RequestService.ACTION_TYPES == tuple(REQUEST_TYPES)
+    for spec in REQUEST_TYPES.values():
+        assert callable(getattr(RequestService, spec.executor))
+
+    online_id = get_request_type("online_id_change").record_columns(
+        {"player_id": "p1", "old_online_id": None, "new_online_id": "new-id"})
+    assert online_id == {"player_id": "p1", "old_value": None, "new_value": "new-id"}
+    assert get_request_type("team_creation").record_columns({"team_name": "New Team"}) == {"new_value": "New Team"}
+
+    with pytest.raises(ValueError):
+        get_request_type("unknown")
+
+def test_rehydrate_prefers_columns_then_metadata_keys():
+    """Stored rows come back as request data, whichever shape the submitting client used"""
+    spec = get_request_type("online_id_change")
+    row = {
+        "id": "r-1", "request_type": "online_id_change", "team_id": "t-1", "requested_by": "u-1",
+        "player_id": None, "new_value": "new-id",
+        "metadata": {"playerId": "p-1", "new_online_id": "ignored"}
+    }
+
+    request_data = spec.rehydrate(row)
+
+    assert request_data == {
+        "request_id": "r-1", "request_type": "online_id_change", "team_id": "t-1", "requested_by": "u-1",
+        "player_id": "p-1", "old_online_id": None, "new_online_id": "new-id", "platform": "psn"
+    }
+    assert spec.missing(request_data) == []
+    assert spec.missing({**request_data, "new_online_id": None}) == ["new_online_id"]
+
+@pytest.mark.asyncio
+async def test_execute_action_dispatches_through_the_registry():
+    """_execute_action calls the executor the spec names"""
+    service = RequestService(MagicMock(), MagicMock(), supabase_guard=OutboundGuard("supabase"))
+    service._rebrand_team = AsyncMock(return_value={"success": True})
+
+    result = await service._execute_action({"request_type": "team_rebrand", "new_name": "New"}, None)
+
+    assert result == {"success": True}
+    service._rebrand_team.assert_awaited_once()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+"""
+Test module for the request execution worker.
+"""
+
+import asyncio
+import uuid
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from services.outbound_guard import OutboundGuard
+from services.request_service import RequestService
+from services.request_status import TRANSITION_FUNCTION
+from services.request_worker import CLAIM_FUNCTION, EXECUTOR_FUNCTION, ExecutorModeError, RequestExecutionWorker
+
+class FakeClaims:
+    """Hands out queued rows like claim_requests: at most the requested slots per type"""
+    def __init__(self, rows, executor="worker"):
+        self.rows = list(rows)
+        self.executor = executor
+        self.claims = []
+        self.transitions = []
+
+    def rpc(self, name, params):
+        query = MagicMock()
+        if name == EXECUTOR_FUNCTION:
+            query.execute = AsyncMock(return_value=MagicMock(data=self.executor, error=None))
+        elif name == CLAIM_FUNCTION:
+            self.claims.append(dict(params["p_type_limits"]))
+            claimed = []
+            for request_type, slots in params["p_type_limits"].items():
+                matching = [row for row in self.rows if row["request_type"] == request_type][:slots]
+                claimed.extend(matching)
+            self.rows = [row for row in self.rows if row not in claimed]
+            query.execute = AsyncMock(return_value=MagicMock(data=claimed, error=None))
+        elif name == TRANSITION_FUNCTION:
+            self.transitions.append(params)
+            query.execute = AsyncMock(return_value=MagicMock(
+                data={"transitioned": True, "previous_status": "processing", "request": {}}, error=None
+            ))
+        return query
+
+def claimed_row(request_type="team_rebrand", **metadata):
+    return {
+        "id": str(uuid.uuid4()),
+        "request_type": request_type,
+        "team_id": str(uuid.uuid4()),
+        "requested_by": str(uuid.uuid4()),
+        "item_id": "1002",
+        "status": "processing",
+        "metadata": {"new_name": "New Name", **metadata}
+    }
+
+def create_worker(rows, action, executor="worker", **kwargs):
+    supabase = FakeClaims(rows, executor)
+    request_service = RequestService(supabase, MagicMock(), supabase_guard=OutboundGuard("supabase"))
+    request_service._execute_action = action
+    worker = RequestExecutionWorker(supabase, request_service, worker_id="worker-1",
+                                    guard=OutboundGuard("supabase"), poll_interval=0.01, **kwargs)
+    return worker, supabase
+
+async def run_until_idle(worker, supabase):
+    worker.start()
+    for _ in range(200):
+        await asyncio.sleep(0.01)
+        if not supabase.rows and not worker._tasks:
+            break
+    await worker.stop()
+
+@pytest.mark.asyncio
+async def test_worker_executes_claimed_requests_and_records_outcome():
+    """Each claimed request ends completed with its action result, or failed with the error"""
+    ok, broken = claimed_row(), claimed_row(new_name="Taken")
+
+    async def action(request_data, payment_result):
+        if request_data["new_name"] == "Taken":
+            raise Exception("Team name already taken")
+        return {"success": True, "team_id": request_data["team_id"]}
+
+    worker, supabase = create_worker([ok, broken], action)
+    await run_until_idle(worker, supabase)
+
+    outcomes = {params["p_request_id"]: params for params in supabase.transitions}
+    assert outcomes[ok["id"]]["p_status"] == "completed"
+    assert outcomes[ok["id"]]["p_expected_status"] == ["processing"]
+    assert outcomes[ok["id"]]["p_metadata"]["action_result"]["team_id"] == ok["team_id"]
+    assert outcomes[broken["id"]]["p_status"] == "failed"
+    assert outcomes[broken["id"]]["p_last_error"] == "Team name already taken"
+    assert worker.stats()["completed"] == 1 and worker.stats()["failed"] == 1
+
+@pytest.mark.asyncio
+async def test_worker_caps_concurrency_per_request_type():
+    """A type never has more than its limit in flight, and only free slots are claimed"""
+    rows = [claimed_row("team_rebrand") for _ in range(6)] + [claimed_row("online_id_change") for _ in range(3)]
+    in_flight = {"team_rebrand": 0, "online_id_change": 0}
+    peak = dict(in_flight)
+
+    async def action(request_data, payment_result):
+        request_type = request_data["request_type"]
+        in_flight[request_type] += 1
+        peak[request_type] = max(peak[request_type], in_flight[request_type])
+        await asyncio.sleep(0.02)
+        in_flight[request_type] -= 1
+        return {"success": True}
+
+    worker, supabase = create_worker(rows, AsyncMock(side_effect=action),
+                                     request_types=["team_rebrand", "online_id_change"],
+                                     type_limits={"team_rebrand": 2}, default_limit=1)
+    await run_until_idle(worker, supabase)
+
+    assert peak == {"team_rebrand": 2, "online_id_change": 1}
+    assert supabase.claims[0] == {"team_rebrand": 2, "online_id_change": 1}
+    assert all(limits.get("team_rebrand", 0) <= 2 for limits in supabase.claims)
+    assert worker.stats()["completed"] == 9
+
+@pytest.mark.asyncio
+async def test_worker_refuses_to_claim_while_triggers_execute():
+    """In trigger mode every claim would run a second time, so nothing is claimed"""
+    action = AsyncMock(return_value={"success": True})
+    worker, supabase = create_worker([claimed_row()], action, executor="trigger")
+
+    with pytest.raises(ExecutorModeError):
+        await worker.check_executor_mode()
+    worker.start()
+    await asyncio.sleep(0.05)
+    await worker.stop()
+
+    assert supabase.claims == [] and len(supabase.rows) == 1
+    action.assert_not_awaited()
+
+def test_request_data_from_record_restores_submitted_fields():
+    """Fields kept in metadata come back; stored results do not"""
+    row = claimed_row("team_transfer", new_captain_id="c2", result={"payment_details": {}}, requires_payment=True)
+
+    request_data = RequestService.request_data_from_record(row)
+
+    assert request_data["request_id"] == row["id"]
+    assert request_data["new_captain_id"] == "c2" and request_data["requires_payment"] is True
+    assert "result" not in request_data
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""
+Test module for the async Square gateway.
+Uses an in-memory httpx transport so no request leaves the process.
+"""
+
+import json
+import httpx
+import pytest
+
+from services.square_gateway import SquareGateway, SquareAPIError
+
+def create_gateway(handler):
+    return SquareGateway(
+        access_token="test-token",
+        environment="sandbox",
+        transport=httpx.MockTransport(handler)
+    )
+
+@pytest.mark.asyncio
+async def test_create_payment_returns_payment():
+    """A successful CreatePayment call returns the payment object"""
+    seen = {}
+
+    def handler(request: httpx.Request):
+        seen["path"] = request.url.path
+        seen["auth"] = request.headers["Authorization"]
+        seen["body"] = json.loads(request.content)
+        return httpx.Response(200, json={"payment": {"id": "pay-1", "status": "COMPLETED"}})
+
+    gateway = create_gateway(handler)
+    payment = await gateway.create_payment({"source_id": "cnon:card-nonce-ok", "idempotency_key": "key-1"})
+    await gateway.aclose()
+
+    assert payment["id"] == "pay-1"
+    assert seen["path"] == "/v2/payments"
+    assert seen["auth"] == "Bearer test-token"
+    assert seen["body"]["idempotency_key"] == "key-1"
+
+@pytest.mark.asyncio
+async def test_create_payment_raises_on_square_errors():
+    """Square error payloads surface as SquareAPIError"""
+    def handler(request: httpx.Request):
+        return httpx.Response(400, json={"errors": [{"category": "PAYMENT_METHOD_ERROR", "code": "CARD_DECLINED", "detail": "Declined"}]})
+
+    gateway = create_gateway(handler)
+    with pytest.raises(SquareAPIError) as exc_info:
+        await gateway.create_payment({"source_id": "cnon:card-nonce-declined"})
+    await gateway.aclose()
+
+    assert exc_info.value.status_code == 400
+    assert exc_info.value.errors[0]["code"] == "CARD_DECLINED"
+
+@pytest.mark.asyncio
+async def test_connections_are_reused():
+    """Every call goes through the same pooled client"""
+    gateway = create_gateway(lambda request: httpx.Response(200, json={"payment": {"id": "pay-2"}}))
+    await gateway.get_payment("pay-2")
+    first_client = gateway._client
+    await gateway.get_payment("pay-2")
+
+    assert gateway._client is first_client
+    await gateway.aclose()
+    assert gateway._client is None
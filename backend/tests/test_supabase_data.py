@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""
+Test module for the async Supabase data layer against the fake Supabase server.
+"""
+
+import asyncio
+import time
+import uuid
+from unittest.mock import MagicMock
+
+import httpx
+import pytest
+from postgrest import APIError
+
+from services.outbound_guard import OutboundGuard
+from services.request_service import RequestService
+from services.supabase_data import SupabaseData
+from tests.fake_supabase_server import FakeSupabaseConfig, create_fake_supabase_app
+
+def create_data(latency_ms=0.0):
+    app = create_fake_supabase_app(FakeSupabaseConfig(seed=5, latency_ms=latency_ms))
+    return SupabaseData("http://fake-supabase", "fake-key", transport=httpx.ASGITransport(app=app)), app
+
+@pytest.mark.asyncio
+async def test_tables_and_rpc_round_trip():
+    """Queries and RPCs are awaitable; PostgREST errors are raised"""
+    data, app = create_data()
+    app.state.fake.rpc_handlers["echo"] = lambda params: {"echo": params}
+
+    await data.table("teams").insert({"id": "t1", "name": "Old"}).execute()
+    await data.table("teams").update({"name": "New"}).eq("id", "t1").execute()
+    response = await data.table("teams").select("name").eq("id", "t1").execute()
+    assert response.data == [{"name": "New"}]
+
+    assert (await data.rpc("echo", {"a": 1}).execute()).data == {"echo": {"a": 1}}
+
+    with pytest.raises(APIError):
+        await data.table("teams").insert({"id": "t1", "name": "Again"}).execute()
+    await data.aclose()
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_overlap_their_round_trips():
+    """Requests processed together share the pool instead of queueing behind each other"""
+    data, app = create_data(latency_ms=50)
+    service = RequestService(data, MagicMock(), supabase_guard=OutboundGuard("supabase"))
+
+    def rebrand():
+        return {"request_type": "team_rebrand", "requested_by": str(uuid.uuid4()), "team_id": str(uuid.uuid4()),
+                "item_id": "1002", "old_name": "Old Name", "new_name": "New Name"}
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(service.process_request(rebrand()) for _ in range(10)))
+    elapsed = time.perf_counter() - started
+
+    assert {result["status"] for result in results} == {"ready_for_execution"}
+    assert len(app.state.fake.tables["team_change_requests"]) == 10
+    # Ten sequential 50ms inserts would take at least 500ms
+    assert elapsed < 0.3
+    await data.aclose()
+
+@pytest.mark.asyncio
+async def test_postgrest_client_is_fully_initialised_on_the_shared_pool():
+    """postgrest's own constructor runs, but its queries go through our pooled session"""
+    data, _ = create_data()
+
+    assert data._postgrest.session is data._client
+    assert data._postgrest.session.headers["Accept-Profile"] == "public"
+    assert data._postgrest.session.headers["apikey"] == "fake-key"
+    await data.aclose()
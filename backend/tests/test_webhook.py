@@ -9,11 +9,16 @@ import json
 import logging
 import uuid
 import pytest
-from fastapi import Request, BackgroundTasks
+from fastapi import HTTPException, Request
 from unittest.mock import AsyncMock, MagicMock, patch
 
-from routes.webhooks import handle_square_webhook, process_request_update
+from routes.webhooks import dispatch_square_event, handle_square_webhook, process_request_update
+from services.outbound_guard import OutboundGuard
+from services.request_status import TRANSITION_FUNCTION
 from services.request_service import RequestService
+from services.webhook_inbox import WebhookInbox
+from services.webhook_signature import SIGNATURE_HEADER, WebhookSignatureVerifier
+from tests.fake_square_server import sign_webhook
 
 # Configure logging
 logging.basicConfig(
@@ -53,11 +58,18 @@ SAMPLE_PAYMENT_WEBHOOK = {
     }
 }
 
-# Utility function to create a mocked request with the webhook payload
-async def create_mocked_request():
+WEBHOOK_SIGNATURE_KEY = "test-signature-key"
+WEBHOOK_URL = "https://api.example.com/api/webhook/square"
+WEBHOOK_VERIFIER = WebhookSignatureVerifier([WEBHOOK_SIGNATURE_KEY], notification_url=WEBHOOK_URL)
+
+# Utility function to create a mocked request with the webhook payload, signed like Square does
+async def create_mocked_request(signature=None):
+    body = json.dumps(SAMPLE_PAYMENT_WEBHOOK).encode('utf-8')
     request = MagicMock(spec=Request)
-    request.body = AsyncMock(return_value=json.dumps(SAMPLE_PAYMENT_WEBHOOK).encode('utf-8'))
+    request.body = AsyncMock(return_value=body)
     request.json = AsyncMock(return_value=SAMPLE_PAYMENT_WEBHOOK)
+    request.url = WEBHOOK_URL
+    request.headers = {SIGNATURE_HEADER: sign_webhook(WEBHOOK_SIGNATURE_KEY, WEBHOOK_URL, body) if signature is None else signature}
     return request
 
 # Utility function to create a mocked Request Service
@@ -118,42 +130,123 @@ def create_mocked_request_service():
     
     supabase_mock.table = custom_table
     
+    # The status transition RPC hands back the row as it was before the call
+    transition_mock_result = MagicMock()
+    transition_mock_result.data = {"transitioned": True, "previous_status": "pending", "request": team_change_request}
+    transition_mock_result.error = None
+    
     # Set up rpc mock
-    supabase_mock.rpc = MagicMock()
-    supabase_mock.rpc.return_value.execute = AsyncMock(return_value=rpc_mock_result)
+    def custom_rpc(function_name, params):
+        rpc_mock = MagicMock()
+        result = transition_mock_result if function_name == TRANSITION_FUNCTION else rpc_mock_result
+        rpc_mock.execute = AsyncMock(return_value=result)
+        return rpc_mock
     
-    # Create RequestService mock
-    request_service = MagicMock(spec=RequestService)
-    request_service.supabase = supabase_mock
+    supabase_mock.rpc = MagicMock(side_effect=custom_rpc)
+    
+    # A real RequestService, so actions run through the request-type registry
+    request_service = RequestService(supabase_mock, MagicMock(), supabase_guard=OutboundGuard("supabase"))
     request_service.update_calls = update_calls  # Store update calls for testing
     
     return request_service
 
 @pytest.mark.asyncio
 async def test_webhook_handler():
-    """Test the Square webhook handler for team transfers"""
+    """The Square webhook endpoint stores the raw body in the inbox and acknowledges"""
     # Arrange
     request = await create_mocked_request()
-    background_tasks = MagicMock(spec=BackgroundTasks)
+    inbox = MagicMock(spec=WebhookInbox)
+    inbox.append = AsyncMock(return_value="inbox-id-1")
+    
+    # Act
+    result = await handle_square_webhook(request, inbox, WEBHOOK_VERIFIER)
+    
+    # Assert
+    assert result["status"] == "success"
+    assert result["inbox_id"] == "inbox-id-1"
+    inbox.append.assert_awaited_once_with(json.dumps(SAMPLE_PAYMENT_WEBHOOK).encode('utf-8'))
+
+@pytest.mark.asyncio
+async def test_webhook_handler_rejects_when_not_stored():
+    """A webhook the inbox could not store is answered with an error, so Square sends it again"""
+    request = await create_mocked_request()
+    inbox = MagicMock(spec=WebhookInbox)
+    inbox.append = AsyncMock(side_effect=Exception("connection refused"))
+    
+    with pytest.raises(HTTPException) as error:
+        await handle_square_webhook(request, inbox, WEBHOOK_VERIFIER)
+    assert error.value.status_code == 503
+
+@pytest.mark.asyncio
+async def test_webhook_handler_rejects_bad_signatures():
+    """Unsigned, forged and garbage signatures are refused before anything is stored"""
+    inbox = MagicMock(spec=WebhookInbox)
+    inbox.append = AsyncMock(return_value="inbox-id-1")
+    forged = sign_webhook("someone-else", WEBHOOK_URL, json.dumps(SAMPLE_PAYMENT_WEBHOOK).encode('utf-8'))
+    
+    for signature in ("", forged, "not base64 at all, but exactly 44 chars long"):
+        request = await create_mocked_request(signature)
+        with pytest.raises(HTTPException) as error:
+            await handle_square_webhook(request, inbox, WEBHOOK_VERIFIER)
+        assert error.value.status_code == 401
+    inbox.append.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_webhook_handler_fails_closed_without_a_key(monkeypatch):
+    """With no signature key only the development opt-out accepts a webhook, and never in production"""
+    inbox = MagicMock(spec=WebhookInbox)
+    inbox.append = AsyncMock(return_value="inbox-id-1")
+    monkeypatch.delenv("SQUARE_WEBHOOK_ALLOW_UNSIGNED", raising=False)
+    monkeypatch.setenv("SQUARE_ENVIRONMENT", "sandbox")
+    
+    with pytest.raises(HTTPException) as error:
+        await handle_square_webhook(await create_mocked_request(), inbox, None)
+    assert error.value.status_code == 401
+    
+    monkeypatch.setenv("SQUARE_ENVIRONMENT", "production")
+    monkeypatch.setenv("SQUARE_WEBHOOK_ALLOW_UNSIGNED", "true")
+    with pytest.raises(HTTPException) as error:
+        await handle_square_webhook(await create_mocked_request(), inbox, None)
+    assert error.value.status_code == 401
+    inbox.append.assert_not_awaited()
+    
+    monkeypatch.setenv("SQUARE_ENVIRONMENT", "sandbox")
+    result = await handle_square_webhook(await create_mocked_request(), inbox, None)
+    assert result["inbox_id"] == "inbox-id-1"
+
+@pytest.mark.asyncio
+async def test_webhook_handler_acknowledges_unhandled_events_without_storing():
+    """Event types nothing acts on are answered straight away and never reach the inbox"""
+    body = json.dumps({**SAMPLE_PAYMENT_WEBHOOK, "type": "customer.created", "event_id": "evt-customer"}).encode('utf-8')
+    request = await create_mocked_request(sign_webhook(WEBHOOK_SIGNATURE_KEY, WEBHOOK_URL, body))
+    request.body = AsyncMock(return_value=body)
+    inbox = MagicMock(spec=WebhookInbox)
+    inbox.append = AsyncMock(return_value="inbox-id-1")
+    
+    result = await handle_square_webhook(request, inbox, WEBHOOK_VERIFIER)
+    
+    assert result["status"] == "success" and "inbox_id" not in result
+    inbox.append.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_dispatch_square_event():
+    """An inbox event for a completed payment approves the request it references"""
+    # Arrange
     request_service = create_mocked_request_service()
     
     # Act
-    result = await handle_square_webhook(request, background_tasks, request_service)
+    with patch("routes.webhooks.process_request_update", new=AsyncMock()) as process:
+        result = await dispatch_square_event(SAMPLE_PAYMENT_WEBHOOK, request_service)
     
     # Assert
     assert result["status"] == "success"
-    assert "processing request" in result["message"]
-    assert background_tasks.add_task.called
-    
-    # Verify the correct task was queued
-    args, kwargs = background_tasks.add_task.call_args
-    assert args[0] == process_request_update
-    assert args[1] == "5eaab345-4035-4536-a5d2-938926a8b4da"
-    assert args[2] == "approved"
+    args = process.call_args.args
+    assert args[0] == "5eaab345-4035-4536-a5d2-938926a8b4da"
+    assert args[1] == "approved"
 
 @pytest.mark.asyncio
 async def test_process_request_update():
-    """Test the process_request_update function for team transfers"""
+    """An approved payment executes the request through its registry executor and completes it"""
     # Arrange
     request_id = "5eaab345-4035-4536-a5d2-938926a8b4da"
     status = "approved"
@@ -169,7 +262,17 @@ async def test_process_request_update():
     
     # Check if admin_transfer_team_ownership was called
     admin_transfer_calls = [call for call in rpc_calls if call[1][0] == 'admin_transfer_team_ownership']
-    assert len(admin_transfer_calls) > 0, "admin_transfer_team_ownership was not called"
+    assert len(admin_transfer_calls) == 1, "admin_transfer_team_ownership was not called once"
+    assert admin_transfer_calls[0][1][1]["p_team_id"] == "test-team-id-123"
+    assert admin_transfer_calls[0][1][1]["p_new_captain_id"] == "test-new-captain-id-123"
+    
+    # Status changes go through the guarded transition RPC: pending -> approved -> completed
+    transitions = [call[1][1] for call in rpc_calls if call[1][0] == TRANSITION_FUNCTION]
+    assert [(params["p_status"], params["p_expected_status"]) for params in transitions] == [
+        ("approved", ["pending"]),
+        ("completed", ["approved"])
+    ]
+    assert request_service.update_calls == [], "team_change_requests should not be updated directly"
 
 if __name__ == "__main__":
     print("Running webhook tests...")
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""
+Test module for dropping redelivered webhook events by event_id.
+"""
+
+import json
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from services.outbound_guard import OutboundGuard
+from services.webhook_dedupe import WebhookEventDeduper
+from services.webhook_inbox import DUPLICATE, PROCESSED, WebhookInboxWorker
+from tests.test_webhook_inbox import FakeInbox
+
+def fake_supabase(*results):
+    """A client whose record_webhook_event calls answer with results in turn"""
+    supabase = MagicMock()
+    supabase.rpc.return_value.execute = AsyncMock(side_effect=list(results))
+    return supabase
+
+def square_event(inbox_id, event_id):
+    return {"id": inbox_id, "body": json.dumps({"event_id": event_id, "type": "payment.updated"}), "attempts": 1}
+
+@pytest.mark.asyncio
+async def test_owner_row_passes_and_copies_are_dropped():
+    """Only the inbox row that first carried an event_id is processed, however often it is retried"""
+    supabase = fake_supabase(SimpleNamespace(data=True), SimpleNamespace(data=False))
+    deduper = WebhookEventDeduper(supabase, guard=OutboundGuard("supabase"))
+
+    assert await deduper.first_sighting("evt-1", "row-1") is True
+    assert await deduper.first_sighting("evt-1", "row-1") is True
+    assert await deduper.first_sighting("evt-1", "row-2") is False
+    # Another process already recorded evt-2 for a different row
+    assert await deduper.first_sighting("evt-2", "row-3") is False
+
+    assert supabase.rpc.call_count == 2
+    stats = deduper.stats()
+    assert (stats["first_seen"], stats["local_duplicates"], stats["durable_duplicates"]) == (1, 1, 1)
+    assert stats["duplicates_dropped"] == 2
+
+@pytest.mark.asyncio
+async def test_unreachable_table_lets_events_through_and_lru_is_bounded():
+    """A failed record call processes the event anyway; the oldest IDs are evicted past max_entries"""
+    supabase = fake_supabase(Exception("Supabase unavailable"), SimpleNamespace(data=True), SimpleNamespace(data=True))
+    deduper = WebhookEventDeduper(supabase, max_entries=2, guard=OutboundGuard("supabase"))
+
+    assert await deduper.first_sighting("evt-1", "row-1") is True
+    await deduper.first_sighting("evt-2", "row-2")
+    await deduper.first_sighting("evt-3", "row-3")
+
+    stats = deduper.stats()
+    assert (stats["durable_errors"], stats["evictions"], stats["entries"]) == (1, 1, 2)
+
+@pytest.mark.asyncio
+async def test_worker_marks_redeliveries_duplicate_without_handling_them():
+    """A redelivered copy in the same batch never reaches the handler"""
+    inbox = FakeInbox([square_event("row-1", "evt-1"), square_event("row-2", "evt-1"), square_event("row-3", "evt-2")])
+    handler = AsyncMock(return_value={"status": "success"})
+    worker = WebhookInboxWorker(inbox, handler, worker_id="worker-1", concurrency=1,
+                                deduper=WebhookEventDeduper(None))
+
+    assert await worker.poll_once() == 3
+
+    outcomes = {result["id"]: result for result in inbox.completed}
+    assert outcomes["row-1"]["status"] == PROCESSED and outcomes["row-3"]["status"] == PROCESSED
+    assert outcomes["row-2"]["status"] == DUPLICATE and outcomes["row-2"]["result"] == {"duplicate_event_id": "evt-1"}
+    assert handler.await_count == 2
+
+    stats = worker.stats()
+    assert stats["duplicates"] == 1 and stats["dedupe"]["duplicates_dropped"] == 1
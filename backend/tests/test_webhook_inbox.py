@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+Test module for the durable webhook inbox and its worker.
+"""
+
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, MagicMock
+
+import httpx
+import pytest
+from fastapi import Request
+from postgrest.exceptions import APIError
+
+from services.outbound_guard import OutboundGuard
+from services.supabase_data import SupabaseData
+from routes.webhooks import handle_square_webhook
+from services.webhook_signature import SIGNATURE_HEADER, WebhookSignatureVerifier
+from services.webhook_inbox import DEAD, PROCESSED, RECEIVED, RETRY, WebhookInbox, WebhookInboxWorker
+from tests.fake_square_server import sign_webhook
+from tests.fake_supabase_server import FakeSupabaseConfig, create_fake_supabase_app
+
+class FakeInbox:
+    """Hands out stored events like claim_webhook_events and keeps the reported outcomes"""
+    def __init__(self, events):
+        self.events = list(events)
+        self.completed = []
+        self.guard = OutboundGuard("supabase")
+
+    async def claim(self, worker_id, limit, lease_seconds, max_attempts):
+        claimed, self.events = self.events[:limit], self.events[limit:]
+        return claimed
+
+    async def complete(self, results):
+        self.completed.extend(results)
+        return len(results)
+
+    async def lag(self):
+        return {"backlog": len(self.events), "lag_seconds": 0}
+
+def stored_event(body, attempts=1, age_seconds=0):
+    received_at = datetime.now(timezone.utc) - timedelta(seconds=age_seconds)
+    return {"id": f"event-{body['n'] if isinstance(body, dict) else 'bad'}",
+            "body": json.dumps(body) if isinstance(body, dict) else body,
+            "attempts": attempts, "received_at": received_at.isoformat()}
+
+@pytest.mark.asyncio
+async def test_endpoint_stores_the_raw_body():
+    """A signed webhook lands in the inbox through enqueue_webhook_event, ready to be claimed"""
+    app = create_fake_supabase_app(FakeSupabaseConfig(seed=3))
+    data = SupabaseData("http://fake-supabase", "fake-key", transport=httpx.ASGITransport(app=app))
+    inbox = WebhookInbox(data, guard=OutboundGuard("supabase"))
+    body = b'{"type": "payment.updated", "event_id": "evt-1", "data": {}}'
+    url = "https://api.example.com/api/webhook/square"
+    request = MagicMock(spec=Request)
+    request.body = AsyncMock(return_value=body)
+    request.url = url
+    request.headers = {SIGNATURE_HEADER: sign_webhook("key-1", url, body)}
+
+    # The table itself is closed to the API's key, as row-level security leaves it
+    with pytest.raises(APIError):
+        await data.table("webhook_inbox").insert({"body": "{}"}).execute()
+
+    result = await handle_square_webhook(request, inbox, WebhookSignatureVerifier(["key-1"], notification_url=url))
+
+    [row] = app.state.fake.tables["webhook_inbox"]
+    assert row["id"] == result["inbox_id"] and row["body"] == body.decode() and row["status"] == RECEIVED
+    await data.aclose()
+
+@pytest.mark.asyncio
+async def test_worker_records_an_outcome_per_event():
+    """Handled events are processed; failures retry with backoff until they are dead"""
+    inbox = FakeInbox([
+        stored_event({"n": 1}, age_seconds=30),
+        stored_event({"n": 2, "fail": True}, attempts=2),
+        stored_event({"n": 3, "fail": True}, attempts=5),
+        stored_event("not json"),
+    ])
+
+    async def handler(payload):
+        if payload.get("fail"):
+            raise Exception("Supabase unavailable")
+        return {"status": "success"}
+
+    worker = WebhookInboxWorker(inbox, handler, worker_id="worker-1", max_attempts=5, retry_base_seconds=5)
+    assert await worker.poll_once() == 4
+
+    outcomes = {result["id"]: result for result in inbox.completed}
+    assert outcomes["event-1"]["status"] == PROCESSED and outcomes["event-1"]["result"] == {"status": "success"}
+    assert outcomes["event-2"]["status"] == RETRY and outcomes["event-2"]["retry_in_seconds"] == 10
+    assert outcomes["event-3"]["status"] == DEAD and outcomes["event-3"]["last_error"] == "Supabase unavailable"
+    assert outcomes["event-bad"]["status"] == DEAD
+
+    stats = worker.stats()
+    assert (stats["processed"], stats["retried"], stats["dead"]) == (1, 1, 2)
+    assert stats["batch_lag_seconds"] >= 30
+
+@pytest.mark.asyncio
+async def test_worker_drains_in_batches_until_empty():
+    """A full batch is followed straight away by the next one"""
+    inbox = FakeInbox([stored_event({"n": n}) for n in range(7)])
+    handler = AsyncMock(return_value=None)
+    worker = WebhookInboxWorker(inbox, handler, batch_size=3, poll_interval=5.0, lag_interval=0)
+
+    worker.start()
+    for _ in range(100):
+        if len(inbox.completed) == 7:
+            break
+        await asyncio.sleep(0.01)
+    await worker.stop()
+
+    assert [result["status"] for result in inbox.completed] == [PROCESSED] * 7
+    assert worker.stats()["inbox"] == {"backlog": 0, "lag_seconds": 0}
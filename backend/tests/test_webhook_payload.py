@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""
+Test module for the webhook body fast path.
+"""
+
+import json
+
+import pytest
+
+from services import webhook_payload
+from services.webhook_payload import EventSummary, loads, may_be_handled, peek_event
+
+PAYMENT_UPDATED = {
+    "merchant_id": "MLDE92SSPPR26",
+    "type": "payment.updated",
+    "event_id": "evt-1",
+    "data": {"type": "payment", "id": "pay-1", "object": {"payment": {
+        "id": "pay-1", "status": "COMPLETED", "reference_id": "1002-98ddd206fe9b46c79e562625080a86fb"
+    }}},
+}
+
+def test_unhandled_events_are_recognized_without_parsing():
+    """Only bodies that cannot be a handled event are ruled out; peek reads the top-level fields"""
+    refund = {**PAYMENT_UPDATED, "type": "refund.created", "data": {"type": "refund", "id": "ref-1"}}
+    escaped = json.dumps(PAYMENT_UPDATED).replace("payment.updated", "payment\\u002eupdated")
+
+    assert may_be_handled(json.dumps(PAYMENT_UPDATED).encode("utf-8")) is True
+    assert may_be_handled(json.dumps(refund)) is False
+    assert may_be_handled(escaped) is True
+    assert may_be_handled(b"not json") is False
+
+    assert peek_event(json.dumps(refund, indent=2)) == EventSummary("refund.created", "evt-1", None)
+    assert peek_event(json.dumps(PAYMENT_UPDATED)) == EventSummary(
+        "payment.updated", "evt-1", "1002-98ddd206fe9b46c79e562625080a86fb"
+    )
+    assert peek_event(b"{}") == EventSummary(None, None, None)
+
+@pytest.mark.parametrize("backend", ["orjson", "json"])
+def test_loads_falls_back_to_the_standard_library(monkeypatch, backend):
+    """Both parsers give the same payload and raise ValueError on malformed bodies"""
+    if backend == "json":
+        monkeypatch.setattr(webhook_payload, "orjson", None)
+    elif webhook_payload.orjson is None:
+        pytest.skip("orjson is not installed")
+
+    body = json.dumps(PAYMENT_UPDATED)
+    assert loads(body) == loads(body.encode("utf-8")) == PAYMENT_UPDATED
+    with pytest.raises(ValueError):
+        loads("{not json")
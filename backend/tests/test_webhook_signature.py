@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""
+Test module for Square webhook signature verification.
+"""
+
+import pytest
+
+from services.webhook_signature import WebhookSignatureVerifier
+from tests.fake_square_server import sign_webhook
+
+URL = "https://api.example.com/api/webhook/square"
+BODY = b'{"type": "payment.updated", "event_id": "evt-1"}'
+
+def test_signatures_are_checked_against_the_raw_body():
+    """Only the exact body signed for the notification URL verifies; cheap rejections skip the HMAC"""
+    verifier = WebhookSignatureVerifier(["key-1"], notification_url=URL, max_body_bytes=1024)
+    signature = sign_webhook("key-1", URL, BODY)
+
+    assert verifier.verify(signature, BODY) is True
+    # The configured URL wins over the address the request arrived on (behind a proxy)
+    assert verifier.verify(signature, BODY, "http://10.0.0.5:8000/api/webhook/square") is True
+    assert verifier.verify(signature, BODY + b" ") is False
+    assert verifier.verify(sign_webhook("key-1", "https://other.example.com/hook", BODY), BODY) is False
+    assert verifier.verify(None, BODY) is False
+    assert verifier.verify(signature[:-2], BODY) is False
+    assert verifier.verify("!" * 44, BODY) is False
+    assert verifier.verify(sign_webhook("key-1", URL, b"x" * 2048), b"x" * 2048) is False
+
+    stats = verifier.stats()
+    assert (stats["verified"], stats["mismatched"], stats["missing_signature"]) == (2, 2, 1)
+    assert (stats["malformed_signature"], stats["oversized"]) == (2, 1)
+
+def test_old_and_new_keys_verify_during_rotation():
+    """Both keys are accepted while Square switches over; the one that last verified is tried first"""
+    verifier = WebhookSignatureVerifier(["new-key", "old-key"], notification_url=URL)
+
+    assert verifier.verify(sign_webhook("old-key", URL, BODY), BODY) is True
+    assert verifier.verify(sign_webhook("old-key", URL, BODY), BODY) is True
+    assert verifier.verify(sign_webhook("new-key", URL, BODY), BODY) is True
+    assert verifier.verify(sign_webhook("retired-key", URL, BODY), BODY) is False
+
+    stats = verifier.stats()
+    assert (stats["verified"], stats["verified_with_older_key"]) == (3, 2)
+    assert stats["cached_states"] == 2
+
+    with pytest.raises(ValueError):
+        WebhookSignatureVerifier([" ", ""])
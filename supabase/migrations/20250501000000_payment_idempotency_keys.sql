@@ -0,0 +1,52 @@
+/*
+  # Payment idempotency keys
+
+  1. New Tables
+    - `payment_idempotency_keys`
+      - `idempotency_key` (text, primary key)
+      - `fingerprint` (text) - hash of source_id, amount and reference_id
+      - `result` (jsonb) - the payment result returned to the client
+      - `created_at` (timestamptz)
+      - `expires_at` (timestamptz)
+
+  2. Maintenance
+    - `purge_expired_payment_idempotency_keys()` deletes expired rows
+
+  3. Permissions
+    - `purge_expired_payment_idempotency_keys` bypasses row-level security, so
+      execute is revoked from public, anon and authenticated and granted to
+      service_role only
+*/
+
+create table if not exists public.payment_idempotency_keys (
+  idempotency_key text primary key,
+  fingerprint text not null,
+  result jsonb not null,
+  created_at timestamptz not null default now(),
+  expires_at timestamptz not null default (now() + interval '24 hours')
+);
+
+create index if not exists idx_payment_idempotency_keys_expires_at
+  on public.payment_idempotency_keys (expires_at);
+
+-- Only the backend (service role) reads and writes this table
+alter table public.payment_idempotency_keys enable row level security;
+
+create or replace function public.purge_expired_payment_idempotency_keys()
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_deleted integer;
+begin
+  delete from public.payment_idempotency_keys where expires_at <= now();
+  get diagnostics v_deleted = row_count;
+  return v_deleted;
+end;
+$$;
+
+-- A definer function bypasses row-level security: only the backend's service role may call it
+revoke execute on function public.purge_expired_payment_idempotency_keys() from public, anon, authenticated;
+grant execute on function public.purge_expired_payment_idempotency_keys() to service_role;
@@ -0,0 +1,90 @@
+/*
+  # Payment reconciliation
+
+  1. New Tables
+    - `reconciliation_state`
+      - `name` (text, primary key) - which reconciliation job the row belongs to
+      - `high_water_mark` (timestamptz) - end of the last window that was fully reconciled
+      - `last_run_at` (timestamptz)
+      - `last_run_stats` (jsonb) - counters from the last run
+
+  2. Functions
+    - `apply_request_payment_corrections(p_corrections jsonb)` moves many
+      team_change_requests to their reconciled status in one statement; a row
+      is only touched while it still has the expected status
+    - `apply_payment_status_corrections(p_corrections jsonb)` updates the
+      status of many payments rows in one statement
+
+  3. Permissions
+    - `apply_request_payment_corrections`, `apply_payment_status_corrections`
+      bypass row-level security, so execute is revoked from public, anon and
+      authenticated and granted to service_role only
+*/
+
+create table if not exists public.reconciliation_state (
+  name text primary key,
+  high_water_mark timestamptz,
+  last_run_at timestamptz,
+  last_run_stats jsonb
+);
+
+-- Only the backend (service role) reads and writes this table
+alter table public.reconciliation_state enable row level security;
+
+create index if not exists idx_team_change_requests_payment_reference
+  on public.team_change_requests (payment_reference)
+  where payment_reference is not null;
+
+-- p_corrections: [{"id": uuid, "status": text, "expected_status": text, "payment_reference": text, "details": {...}}]
+create or replace function public.apply_request_payment_corrections(p_corrections jsonb)
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_updated integer;
+begin
+  update public.team_change_requests r
+  set
+    status = c.status,
+    payment_reference = coalesce(r.payment_reference, c.payment_reference),
+    updated_at = now(),
+    metadata = coalesce(r.metadata, '{}'::jsonb) || jsonb_build_object('reconciliation', c.details)
+  from jsonb_to_recordset(p_corrections) as c(id uuid, status text, expected_status text, payment_reference text, details jsonb)
+  where r.id = c.id
+    and r.status = c.expected_status;
+
+  get diagnostics v_updated = row_count;
+  return v_updated;
+end;
+$$;
+
+-- p_corrections: [{"payment_id": text, "status": text}]
+create or replace function public.apply_payment_status_corrections(p_corrections jsonb)
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_updated integer;
+begin
+  update public.payments p
+  set
+    status = c.status,
+    updated_at = now()
+  from jsonb_to_recordset(p_corrections) as c(payment_id text, status text)
+  where p.payment_id = c.payment_id
+    and p.status is distinct from c.status;
+
+  get diagnostics v_updated = row_count;
+  return v_updated;
+end;
+$$;
+
+-- Definer functions bypass row-level security: only the backend's service role may call them
+revoke execute on function public.apply_request_payment_corrections(jsonb) from public, anon, authenticated;
+revoke execute on function public.apply_payment_status_corrections(jsonb) from public, anon, authenticated;
+grant execute on function public.apply_request_payment_corrections(jsonb) to service_role;
+grant execute on function public.apply_payment_status_corrections(jsonb) to service_role;
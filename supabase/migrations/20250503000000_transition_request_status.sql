@@ -0,0 +1,91 @@
+/*
+  # Atomic request status transitions
+
+  1. Functions
+    - `transition_request_status(...)` moves one team_change_requests row to a
+      new status in a single call: it locks the row, checks the optional
+      expected-status guard, and sets the status, timestamps and error fields
+      while merging the given keys into `metadata` server-side. Callers no
+      longer read the metadata back to merge it in the client, so a status
+      change is one round trip and concurrent webhook and API updates cannot
+      overwrite each other's metadata.
+
+  2. Result (jsonb)
+    - null when there is no such request
+    - `transitioned` - false when the guard did not match; nothing was changed
+    - `previous_status` - the status the row had before the call
+    - `request` - the row as it is after the call
+
+  3. Permissions
+    - The function bypasses row-level security, so execute is revoked from
+      public, anon and authenticated and granted to service_role only
+*/
+
+create or replace function public.transition_request_status(
+  p_request_id uuid,
+  p_status text,
+  p_expected_status text[] default null,
+  p_metadata jsonb default null,
+  p_payment_reference text default null,
+  p_webhook_data jsonb default null,
+  p_last_error text default null,
+  p_increment_attempts boolean default false
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_previous_status text;
+  v_request public.team_change_requests;
+begin
+  select status into v_previous_status
+  from public.team_change_requests
+  where id = p_request_id
+  for update;
+
+  if not found then
+    return null;
+  end if;
+
+  if p_expected_status is not null
+     and (v_previous_status is null or not (v_previous_status = any(p_expected_status))) then
+    select * into v_request from public.team_change_requests where id = p_request_id;
+    return jsonb_build_object(
+      'transitioned', false,
+      'previous_status', v_previous_status,
+      'request', to_jsonb(v_request)
+    );
+  end if;
+
+  update public.team_change_requests
+  set
+    status = p_status,
+    updated_at = now(),
+    processed_at = case when p_status in ('completed', 'processing') then now() else processed_at end,
+    metadata = coalesce(metadata, '{}'::jsonb)
+      || coalesce(p_metadata, '{}'::jsonb)
+      || jsonb_build_object('last_transition', jsonb_build_object(
+           'from', v_previous_status,
+           'to', p_status,
+           'at', now()
+         )),
+    payment_reference = coalesce(p_payment_reference, payment_reference),
+    webhook_data = coalesce(p_webhook_data, webhook_data),
+    last_error = coalesce(p_last_error, last_error),
+    processing_attempts = coalesce(processing_attempts, 0) + case when p_increment_attempts then 1 else 0 end
+  where id = p_request_id
+  returning * into v_request;
+
+  return jsonb_build_object(
+    'transitioned', true,
+    'previous_status', v_previous_status,
+    'request', to_jsonb(v_request)
+  );
+end;
+$$;
+
+-- A definer function bypasses row-level security: only the backend's service role may call it
+revoke execute on function public.transition_request_status(uuid, text, text[], jsonb, text, jsonb, text, boolean) from public, anon, authenticated;
+grant execute on function public.transition_request_status(uuid, text, text[], jsonb, text, jsonb, text, boolean) to service_role;
@@ -0,0 +1,97 @@
+/*
+  # Request state machine
+
+  The legal status transitions are defined once, in
+  backend/services/request_states.py. The backend turns each transition
+  into an expected-status guard, and these functions apply it.
+
+  1. Constraints
+    - `team_change_requests_status_check` now allows every status in the
+      state machine: payment_complete, payment_failed and ready_for_execution
+      are written by the backend but were missing from the list
+
+  2. Functions
+    - `transition_request_statuses(p_transitions jsonb)` moves many
+      team_change_requests in one statement. Each row is only moved while
+      its current status is one of its expected statuses; the others are left
+      alone. Returns the moved rows as [{"id", "previous_status", "status"}].
+      The payment reconciler uses it instead of apply_request_payment_corrections
+
+  3. Removed
+    - `apply_request_payment_corrections(p_corrections jsonb)`: nothing calls
+      it any more, and it moved rows without the state machine's guards
+
+  4. Permissions
+    - `transition_request_statuses` bypasses row-level security, so execute
+      is revoked from public, anon and authenticated and granted to
+      service_role only
+*/
+
+alter table public.team_change_requests
+  drop constraint if exists team_change_requests_status_check;
+
+alter table public.team_change_requests
+  add constraint team_change_requests_status_check check (status = any (array[
+    'pending', 'payment_complete', 'payment_failed', 'ready_for_execution',
+    'approved', 'processing', 'completed', 'failed', 'rejected'
+  ]));
+
+-- p_transitions: [{"id": uuid, "status": text, "expected_status": [text], "metadata": {...}, "payment_reference": text, "last_error": text}]
+create or replace function public.transition_request_statuses(p_transitions jsonb)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_moved jsonb;
+begin
+  with t as (
+    select *
+    from jsonb_to_recordset(p_transitions)
+      as t(id uuid, status text, expected_status text[], metadata jsonb, payment_reference text, last_error text)
+  ),
+  locked as (
+    select r.id, r.status as previous_status
+    from public.team_change_requests r
+    join t on t.id = r.id
+    for update of r
+  ),
+  moved as (
+    update public.team_change_requests r
+    set
+      status = t.status,
+      updated_at = now(),
+      processed_at = case when t.status in ('completed', 'processing') then now() else r.processed_at end,
+      metadata = coalesce(r.metadata, '{}'::jsonb)
+        || coalesce(t.metadata, '{}'::jsonb)
+        || jsonb_build_object('last_transition', jsonb_build_object(
+             'from', l.previous_status,
+             'to', t.status,
+             'at', now()
+           )),
+      payment_reference = coalesce(t.payment_reference, r.payment_reference),
+      last_error = coalesce(t.last_error, r.last_error)
+    from t
+    join locked l on l.id = t.id
+    where r.id = t.id
+      and (t.expected_status is null or l.previous_status = any(t.expected_status))
+    returning r.id, l.previous_status, r.status
+  )
+  select coalesce(jsonb_agg(jsonb_build_object(
+    'id', moved.id,
+    'previous_status', moved.previous_status,
+    'status', moved.status
+  )), '[]'::jsonb)
+  into v_moved
+  from moved;
+
+  return v_moved;
+end;
+$$;
+
+drop function if exists public.apply_request_payment_corrections(jsonb);
+
+-- A definer function bypasses row-level security: only the backend's service role may call it
+revoke execute on function public.transition_request_statuses(jsonb) from public, anon, authenticated;
+grant execute on function public.transition_request_statuses(jsonb) to service_role;
@@ -0,0 +1,24 @@
+/*
+  # Fire request execution on insert
+
+  RequestService.process_request now writes a request straight into its
+  final status when the outcome is already known (ready_for_execution when
+  no payment is needed, payment_complete once the inline charge went
+  through). It no longer inserts the row as pending and then updates it. The
+  status triggers are AFTER UPDATE only and would never see those rows, so
+  this adds the matching AFTER INSERT trigger.
+
+  1. Triggers
+    - `on_request_status_insert_trigger` runs handle_request_status_update()
+      for rows inserted in a status the update triggers dispatch on. The
+      function only reads NEW and decides per status itself, so it behaves
+      the same for an insert as for an update
+*/
+
+drop trigger if exists on_request_status_insert_trigger on public.team_change_requests;
+
+create trigger on_request_status_insert_trigger
+after insert on public.team_change_requests
+for each row
+when (new.status in ('payment_complete', 'ready_for_execution', 'processing'))
+execute function public.handle_request_status_update();
@@ -0,0 +1,147 @@
+/*
+  # Request execution claims
+
+  Requests in payment_complete or ready_for_execution can be executed by
+  backend worker processes (backend/scripts/run_request_worker.py) instead
+  of by the status triggers, whose pg_net call is lost when it fails or
+  times out. Workers claim rows in batches, so adding worker processes
+  adds execution capacity.
+
+  1. Columns
+    - `claimed_by` - ID of the worker executing the request
+    - `claim_expires_at` - end of the worker's lease; a processing request
+      whose lease ran out (the worker died) can be claimed again
+
+  2. Functions
+    - `request_executor()` - 'trigger' (default) or 'worker', read from the
+      app.settings.request_executor setting. In worker mode the status
+      triggers no longer execute requests, so nothing runs twice:
+        alter database postgres set app.settings.request_executor = 'worker';
+    - `claim_requests(p_worker_id, p_type_limits, p_lease_seconds, p_max_attempts)`
+      claims up to p_type_limits->>request_type executable requests of each
+      type with FOR UPDATE SKIP LOCKED, so concurrent workers never claim
+      the same row and never wait on each other. Claimed rows move to
+      processing and are returned. Expired leases that used up
+      p_max_attempts are failed instead of claimed again
+
+  3. Triggers
+    - The execution triggers only fire while request_executor() is 'trigger'
+
+  4. Indexes
+    - `team_change_requests_executable_idx` keeps claims cheap on a large table
+
+  5. Permissions
+    - `claim_requests` bypasses row-level security, so execute is revoked from
+      public, anon and authenticated and granted to service_role only
+*/
+
+alter table public.team_change_requests
+  add column if not exists claimed_by text,
+  add column if not exists claim_expires_at timestamptz;
+
+create index if not exists team_change_requests_executable_idx
+  on public.team_change_requests (request_type, updated_at)
+  where status in ('payment_complete', 'ready_for_execution', 'processing');
+
+create or replace function public.request_executor()
+returns text
+language sql
+stable
+as $$
+  select coalesce(nullif(current_setting('app.settings.request_executor', true), ''), 'trigger');
+$$;
+
+drop trigger if exists on_request_status_update_trigger on public.team_change_requests;
+create trigger on_request_status_update_trigger
+after update on public.team_change_requests
+for each row
+when (old.status is distinct from new.status
+      and new.status in ('payment_complete', 'ready_for_execution')
+      and public.request_executor() = 'trigger')
+execute function public.handle_request_status_update();
+
+drop trigger if exists on_request_status_insert_trigger on public.team_change_requests;
+create trigger on_request_status_insert_trigger
+after insert on public.team_change_requests
+for each row
+when (new.status in ('payment_complete', 'ready_for_execution', 'processing')
+      and public.request_executor() = 'trigger')
+execute function public.handle_request_status_update();
+
+drop trigger if exists team_change_requests_status_trigger on public.team_change_requests;
+create trigger team_change_requests_status_trigger
+after update of status on public.team_change_requests
+for each row
+when (old.status <> 'processing' and new.status = 'processing'
+      and public.request_executor() = 'trigger')
+execute function public.handle_request_status_update();
+
+-- p_type_limits: {"team_rebrand": 4, "team_transfer": 2, ...}; types left out are not claimed
+create or replace function public.claim_requests(
+  p_worker_id text,
+  p_type_limits jsonb,
+  p_lease_seconds integer default 300,
+  p_max_attempts integer default 3
+)
+returns setof public.team_change_requests
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+  -- Requests whose worker died too often are not retried forever
+  update public.team_change_requests r
+  set
+    status = 'failed',
+    updated_at = now(),
+    claimed_by = null,
+    claim_expires_at = null,
+    last_error = 'Execution lease expired after ' || r.processing_attempts || ' attempts'
+  where r.id in (
+    select e.id
+    from public.team_change_requests e
+    where e.status = 'processing'
+      and e.claim_expires_at < now()
+      and coalesce(e.processing_attempts, 0) >= p_max_attempts
+    for update skip locked
+  );
+
+  return query
+  with candidates as (
+    select c.id, c.status as previous_status
+    from jsonb_each_text(p_type_limits) as l(request_type, slots)
+    cross join lateral (
+      select r.id, r.status
+      from public.team_change_requests r
+      where r.request_type = l.request_type
+        and (
+          r.status in ('payment_complete', 'ready_for_execution')
+          or (r.status = 'processing' and r.claim_expires_at < now())
+        )
+      order by r.updated_at
+      limit greatest(l.slots::integer, 0)
+      for update skip locked
+    ) c
+  )
+  update public.team_change_requests r
+  set
+    status = 'processing',
+    updated_at = now(),
+    claimed_by = p_worker_id,
+    claim_expires_at = now() + make_interval(secs => p_lease_seconds),
+    processing_attempts = coalesce(r.processing_attempts, 0) + 1,
+    metadata = coalesce(r.metadata, '{}'::jsonb)
+      || jsonb_build_object('last_transition', jsonb_build_object(
+           'from', c.previous_status,
+           'to', 'processing',
+           'at', now()
+         ))
+  from candidates c
+  where r.id = c.id
+  returning r.*;
+end;
+$$;
+
+-- A definer function bypasses row-level security: only the backend's service role may call it
+revoke execute on function public.claim_requests(text, jsonb, integer, integer) from public, anon, authenticated;
+grant execute on function public.claim_requests(text, jsonb, integer, integer) to service_role;
@@ -0,0 +1,12 @@
+/*
+  # Team request history index
+
+  1. Indexes
+    - `team_change_requests_team_history_idx` on (team_id, created_at desc, id desc)
+      serves GET /api/team/{team_id}/requests: the keyset
+      (created_at, id) < (cursor) walks the index in order and stops after
+      one page instead of sorting the team's whole history
+*/
+
+create index if not exists team_change_requests_team_history_idx
+  on public.team_change_requests (team_id, created_at desc, id desc);
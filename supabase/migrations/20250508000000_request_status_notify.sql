@@ -0,0 +1,48 @@
+/*
+  # Notify request status changes
+
+  The backend streams request status to the browser over server-sent events
+  instead of having it poll GET /api/requests/{id}. Each API process holds
+  one LISTEN connection on the `request_status` channel and fans the
+  notifications out to its open streams.
+
+  1. Functions
+    - `notify_request_status()` sends {id, team_id, status, previous_status,
+      updated_at, last_error} on `request_status`. last_error is cut to 500
+      characters to stay well under the 8000 byte NOTIFY payload limit
+
+  2. Triggers
+    - `on_request_status_notify_insert` for new rows
+    - `on_request_status_notify_update` when status actually changes
+*/
+
+create or replace function public.notify_request_status()
+returns trigger
+language plpgsql
+as $$
+begin
+  perform pg_notify('request_status', json_build_object(
+    'id', new.id,
+    'team_id', new.team_id,
+    'status', new.status,
+    'previous_status', case when tg_op = 'UPDATE' then old.status end,
+    'updated_at', new.updated_at,
+    'last_error', left(new.last_error, 500)
+  )::text);
+  return null;
+end;
+$$;
+
+drop trigger if exists on_request_status_notify_insert on public.team_change_requests;
+drop trigger if exists on_request_status_notify_update on public.team_change_requests;
+
+create trigger on_request_status_notify_insert
+after insert on public.team_change_requests
+for each row
+execute function public.notify_request_status();
+
+create trigger on_request_status_notify_update
+after update of status on public.team_change_requests
+for each row
+when (old.status is distinct from new.status)
+execute function public.notify_request_status();
@@ -0,0 +1,159 @@
+/*
+  # Webhook inbox
+
+  The Square webhook endpoint no longer processes events in the API
+  process. It appends the raw body to webhook_inbox and acknowledges at
+  once. Worker processes (backend/scripts/run_webhook_worker.py) drain the
+  inbox in batches. An event that arrived survives a restart, and a burst
+  of events no longer competes with API traffic.
+
+  1. New Tables
+    - `webhook_inbox`
+      - `id` (uuid, primary key)
+      - `source` (text) - who sent the event, 'square'
+      - `body` (text) - the request body exactly as received
+      - `status` (text) - received, processing, processed, retry or dead
+      - `attempts` (integer) - claims so far
+      - `last_error` (text)
+      - `result` (jsonb) - what processing the event did
+      - `received_at` (timestamptz)
+      - `available_at` (timestamptz) - earliest time the event may be claimed (retry backoff)
+      - `claimed_by` (text), `claim_expires_at` (timestamptz) - the worker's lease
+      - `processed_at` (timestamptz)
+
+  2. Functions
+    - `claim_webhook_events(p_worker_id, p_limit, p_lease_seconds, p_max_attempts)`
+      claims up to p_limit available events, oldest first, with FOR UPDATE
+      SKIP LOCKED and moves them to processing. Expired leases are claimed
+      again; those that used up p_max_attempts become dead instead
+    - `complete_webhook_events(p_results jsonb)` records the outcome of a
+      whole batch in one statement
+    - `webhook_inbox_lag()` - backlog size, age of the oldest waiting
+      event and number of dead events
+
+  3. Indexes
+    - `webhook_inbox_ready_idx` keeps claims cheap once processed events pile up
+
+  4. Permissions
+    - These functions bypass row-level security, so execute is revoked from
+      public, anon and authenticated and granted to service_role only
+*/
+
+create table if not exists public.webhook_inbox (
+  id uuid primary key default gen_random_uuid(),
+  source text not null default 'square',
+  body text not null,
+  status text not null default 'received'
+    check (status in ('received', 'processing', 'processed', 'retry', 'dead')),
+  attempts integer not null default 0,
+  last_error text,
+  result jsonb,
+  received_at timestamptz not null default now(),
+  available_at timestamptz not null default now(),
+  claimed_by text,
+  claim_expires_at timestamptz,
+  processed_at timestamptz
+);
+
+-- Only the backend (service role) reads and writes this table
+alter table public.webhook_inbox enable row level security;
+
+create index if not exists webhook_inbox_ready_idx
+  on public.webhook_inbox (available_at)
+  where status in ('received', 'retry', 'processing');
+
+create or replace function public.claim_webhook_events(
+  p_worker_id text,
+  p_limit integer default 50,
+  p_lease_seconds integer default 120,
+  p_max_attempts integer default 5
+)
+returns setof public.webhook_inbox
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+  -- Events whose worker died too often are set aside rather than retried forever
+  update public.webhook_inbox w
+  set
+    status = 'dead',
+    claimed_by = null,
+    claim_expires_at = null,
+    last_error = coalesce(w.last_error, 'Processing lease expired after ' || w.attempts || ' attempts')
+  where w.status = 'processing'
+    and w.claim_expires_at < now()
+    and w.attempts >= p_max_attempts;
+
+  return query
+  update public.webhook_inbox w
+  set
+    status = 'processing',
+    claimed_by = p_worker_id,
+    claim_expires_at = now() + make_interval(secs => p_lease_seconds),
+    attempts = w.attempts + 1
+  where w.id in (
+    select c.id
+    from public.webhook_inbox c
+    where (c.status in ('received', 'retry') and c.available_at <= now())
+       or (c.status = 'processing' and c.claim_expires_at < now())
+    order by c.available_at
+    limit p_limit
+    for update skip locked
+  )
+  returning w.*;
+end;
+$$;
+
+-- p_results: [{"id": uuid, "status": "processed"|"retry"|"dead", "last_error": text, "retry_in_seconds": int, "result": {...}}]
+create or replace function public.complete_webhook_events(p_results jsonb)
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_count integer;
+begin
+  update public.webhook_inbox w
+  set
+    status = r.status,
+    last_error = r.last_error,
+    result = coalesce(r.result, w.result),
+    available_at = now() + make_interval(secs => coalesce(r.retry_in_seconds, 0)),
+    processed_at = case when r.status = 'processed' then now() else w.processed_at end,
+    claimed_by = null,
+    claim_expires_at = null
+  from jsonb_to_recordset(p_results) as r(id uuid, status text, last_error text, retry_in_seconds integer, result jsonb)
+  where w.id = r.id
+    and w.status = 'processing';
+
+  get diagnostics v_count = row_count;
+  return v_count;
+end;
+$$;
+
+create or replace function public.webhook_inbox_lag()
+returns jsonb
+language sql
+stable
+security definer
+set search_path = public
+as $$
+  select jsonb_build_object(
+    'backlog', count(*),
+    'oldest_received_at', min(received_at),
+    'lag_seconds', coalesce(extract(epoch from now() - min(received_at)), 0),
+    'dead', (select count(*) from public.webhook_inbox where status = 'dead')
+  )
+  from public.webhook_inbox
+  where status in ('received', 'retry', 'processing');
+$$;
+
+-- Definer functions bypass row-level security: only the backend's service role may call them
+revoke execute on function public.claim_webhook_events(text, integer, integer, integer) from public, anon, authenticated;
+revoke execute on function public.complete_webhook_events(jsonb) from public, anon, authenticated;
+revoke execute on function public.webhook_inbox_lag() from public, anon, authenticated;
+grant execute on function public.claim_webhook_events(text, integer, integer, integer) to service_role;
+grant execute on function public.complete_webhook_events(jsonb) to service_role;
+grant execute on function public.webhook_inbox_lag() to service_role;
@@ -0,0 +1,101 @@
+/*
+  # Webhook event deduplication
+
+  Square redelivers events, each time as a new webhook_inbox row with the
+  same event_id. The inbox workers now remember which inbox row first
+  carried each event_id and drop later copies before processing them.
+
+  1. New Tables
+    - `webhook_seen_events`
+      - `event_id` (text, primary key) - Square's event_id
+      - `inbox_id` (uuid) - the inbox row that carries the event; retries of
+        that row are not duplicates
+      - `first_seen_at` (timestamptz)
+      - `expires_at` (timestamptz) - after this the event_id may be seen afresh
+
+  2. Columns
+    - `webhook_inbox.status` gains 'duplicate'
+
+  3. Functions
+    - `record_webhook_event(p_event_id, p_inbox_id, p_ttl_seconds)` returns
+      true when p_inbox_id is the row that owns the event_id (first sighting,
+      a retry of the same row, or the earlier sighting expired) and false for
+      a duplicate. One statement, so concurrent workers agree
+    - `purge_expired_webhook_seen_events()` deletes expired rows
+
+  4. Permissions
+    - `record_webhook_event`, `purge_expired_webhook_seen_events` bypass row-
+      level security, so execute is revoked from public, anon and
+      authenticated and granted to service_role only
+*/
+
+create table if not exists public.webhook_seen_events (
+  event_id text primary key,
+  inbox_id uuid not null,
+  first_seen_at timestamptz not null default now(),
+  expires_at timestamptz not null
+);
+
+create index if not exists idx_webhook_seen_events_expires_at
+  on public.webhook_seen_events (expires_at);
+
+-- Only the backend (service role) reads and writes this table
+alter table public.webhook_seen_events enable row level security;
+
+alter table public.webhook_inbox
+  drop constraint if exists webhook_inbox_status_check;
+
+alter table public.webhook_inbox
+  add constraint webhook_inbox_status_check
+  check (status in ('received', 'processing', 'processed', 'retry', 'dead', 'duplicate'));
+
+create or replace function public.record_webhook_event(
+  p_event_id text,
+  p_inbox_id uuid,
+  p_ttl_seconds integer default 604800
+)
+returns boolean
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_owner uuid;
+begin
+  insert into public.webhook_seen_events as s (event_id, inbox_id, expires_at)
+  values (p_event_id, p_inbox_id, now() + make_interval(secs => p_ttl_seconds))
+  on conflict (event_id) do update
+    set inbox_id = excluded.inbox_id,
+        first_seen_at = now(),
+        expires_at = excluded.expires_at
+    where s.expires_at <= now()
+  returning s.inbox_id into v_owner;
+
+  if v_owner is null then
+    select inbox_id into v_owner from public.webhook_seen_events where event_id = p_event_id;
+  end if;
+
+  return v_owner = p_inbox_id;
+end;
+$$;
+
+create or replace function public.purge_expired_webhook_seen_events()
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_deleted integer;
+begin
+  delete from public.webhook_seen_events where expires_at <= now();
+  get diagnostics v_deleted = row_count;
+  return v_deleted;
+end;
+$$;
+
+-- Definer functions bypass row-level security: only the backend's service role may call them
+revoke execute on function public.record_webhook_event(text, uuid, integer) from public, anon, authenticated;
+revoke execute on function public.purge_expired_webhook_seen_events() from public, anon, authenticated;
+grant execute on function public.record_webhook_event(text, uuid, integer) to service_role;
+grant execute on function public.purge_expired_webhook_seen_events() to service_role;
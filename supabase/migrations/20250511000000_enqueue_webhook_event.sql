@@ -0,0 +1,40 @@
+/*
+  # Enqueue webhook events through a definer function
+
+  webhook_inbox has row-level security and no policy, so the API's
+  anon-key client could not insert into it and every Square webhook was
+  answered with 503. The endpoint now appends through this function, the
+  same way the workers already claim and complete events.
+
+  1. Functions
+    - `enqueue_webhook_event(p_body, p_source)` stores one body exactly as
+      received with status 'received' and returns its inbox ID
+
+  2. Permissions
+    - The function bypasses row-level security, so execute is revoked from
+      public, anon and authenticated and granted to service_role only
+*/
+
+create or replace function public.enqueue_webhook_event(
+  p_body text,
+  p_source text default 'square'
+)
+returns uuid
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_id uuid;
+begin
+  insert into public.webhook_inbox (source, body, status)
+  values (coalesce(p_source, 'square'), p_body, 'received')
+  returning id into v_id;
+
+  return v_id;
+end;
+$$;
+
+-- A definer function bypasses row-level security: only the backend's service role may call it
+revoke execute on function public.enqueue_webhook_event(text, text) from public, anon, authenticated;
+grant execute on function public.enqueue_webhook_event(text, text) to service_role;
@@ -0,0 +1,67 @@
+/*
+  # Payment idempotency keys through definer functions
+
+  payment_idempotency_keys has row-level security and no policy, so the
+  API's anon-key client could neither read nor write it and idempotency
+  keys were only remembered per process. The API now goes through these
+  functions.
+
+  1. Functions
+    - `get_payment_idempotency_key(p_key)` returns {fingerprint, result}
+      for a key that has not expired, or null
+    - `record_payment_idempotency_key(p_key, p_fingerprint, p_result, p_ttl_seconds)`
+      records a result. The first live record for a key wins; an expired
+      one is replaced. Returns whether this call's record was kept
+
+  2. Permissions
+    - `get_payment_idempotency_key`, `record_payment_idempotency_key` bypass
+      row-level security, so execute is revoked from public, anon and
+      authenticated and granted to service_role only
+*/
+
+create or replace function public.get_payment_idempotency_key(p_key text)
+returns jsonb
+language sql
+stable
+security definer
+set search_path = public
+as $$
+  select jsonb_build_object('fingerprint', k.fingerprint, 'result', k.result)
+  from public.payment_idempotency_keys k
+  where k.idempotency_key = p_key
+    and k.expires_at > now();
+$$;
+
+create or replace function public.record_payment_idempotency_key(
+  p_key text,
+  p_fingerprint text,
+  p_result jsonb,
+  p_ttl_seconds integer default 86400
+)
+returns boolean
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_count integer;
+begin
+  insert into public.payment_idempotency_keys (idempotency_key, fingerprint, result, expires_at)
+  values (p_key, p_fingerprint, p_result, now() + make_interval(secs => p_ttl_seconds))
+  on conflict (idempotency_key) do update
+    set fingerprint = excluded.fingerprint,
+        result = excluded.result,
+        created_at = now(),
+        expires_at = excluded.expires_at
+    where public.payment_idempotency_keys.expires_at <= now();
+
+  get diagnostics v_count = row_count;
+  return v_count > 0;
+end;
+$$;
+
+-- Definer functions bypass row-level security: only the backend's service role may call them
+revoke execute on function public.get_payment_idempotency_key(text) from public, anon, authenticated;
+revoke execute on function public.record_payment_idempotency_key(text, text, jsonb, integer) from public, anon, authenticated;
+grant execute on function public.get_payment_idempotency_key(text) to service_role;
+grant execute on function public.record_payment_idempotency_key(text, text, jsonb, integer) to service_role;
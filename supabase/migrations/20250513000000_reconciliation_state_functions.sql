@@ -0,0 +1,56 @@
+/*
+  # Reconciliation high-water mark through definer functions
+
+  reconciliation_state has row-level security and no policy, so without the
+  service role key the reconciler read no high-water mark (every run went
+  back the full initial lookback) and failed to store it. It now goes
+  through these functions, which only the service role may execute.
+
+  1. Functions
+    - `get_reconciliation_high_water_mark(p_name)` returns the end of the
+      last fully reconciled window for a job, or null
+    - `save_reconciliation_high_water_mark(p_name, p_high_water_mark, p_stats)`
+      stores the window end and the counters of the run that reached it
+
+  2. Permissions
+    - `get_reconciliation_high_water_mark`,
+      `save_reconciliation_high_water_mark` bypass row-level security, so
+      execute is revoked from public, anon and authenticated and granted to
+      service_role only
+*/
+
+create or replace function public.get_reconciliation_high_water_mark(p_name text)
+returns timestamptz
+language sql
+stable
+security definer
+set search_path = public
+as $$
+  select s.high_water_mark
+  from public.reconciliation_state s
+  where s.name = p_name;
+$$;
+
+create or replace function public.save_reconciliation_high_water_mark(
+  p_name text,
+  p_high_water_mark timestamptz,
+  p_stats jsonb default null
+)
+returns void
+language sql
+security definer
+set search_path = public
+as $$
+  insert into public.reconciliation_state (name, high_water_mark, last_run_at, last_run_stats)
+  values (p_name, p_high_water_mark, now(), p_stats)
+  on conflict (name) do update
+    set high_water_mark = excluded.high_water_mark,
+        last_run_at = excluded.last_run_at,
+        last_run_stats = excluded.last_run_stats;
+$$;
+
+-- Definer functions bypass row-level security: only the backend's service role may call them
+revoke execute on function public.get_reconciliation_high_water_mark(text) from public, anon, authenticated;
+revoke execute on function public.save_reconciliation_high_water_mark(text, timestamptz, jsonb) from public, anon, authenticated;
+grant execute on function public.get_reconciliation_high_water_mark(text) to service_role;
+grant execute on function public.save_reconciliation_high_water_mark(text, timestamptz, jsonb) to service_role;